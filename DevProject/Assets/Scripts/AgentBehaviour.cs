@@ -6,6 +6,7 @@ using Unity.MLAgents.Actuators;
 using Unity.MLAgents.Policies;
 using Unity.MLAgents.Demonstrations;
 using System;
+using System.Collections.Generic;
 using Unity.VisualScripting;
 using Unity.Burst.CompilerServices;
 
@@ -75,6 +76,31 @@ public class MAPFAgent : Agent
         dirToGo = Vector3.zero;
         dirToRotate = Vector3.zero;
         jump = new Vector3(0.0f, 1.0f, 0.0f);
+        ReadResetParameters();
+    }
+
+    /// <summary>
+    /// EnvironmentParameters sent from Python (PeekabooEnv.set_env_parameters) override the EnvSettings values,
+    /// the names are the ones of peekaboo_sim_env.ENV_PARAMETERS
+    /// </summary>
+    private void ReadResetParameters()
+    {
+        envSettings.agentMovingSpeed = m_ResetParams.GetWithDefault("agent_moving_speed", envSettings.agentMovingSpeed);
+        envSettings.agentRotationSpeed = m_ResetParams.GetWithDefault("agent_rotation_speed", envSettings.agentRotationSpeed);
+        envSettings.agentJumpForce = m_ResetParams.GetWithDefault("agent_jump_force", envSettings.agentJumpForce);
+        envSettings.agentFallingForce = m_ResetParams.GetWithDefault("agent_falling_force", envSettings.agentFallingForce);
+        envSettings.obstacleAvoidanceDistance = m_ResetParams.GetWithDefault("obstacle_avoidance_distance", envSettings.obstacleAvoidanceDistance);
+        envSettings.movableObstacleSpeed = m_ResetParams.GetWithDefault("movable_obstacle_speed", envSettings.movableObstacleSpeed);
+        //frames the action is repeated for (TakeActionsBetweenDecisions), one Python round trip per decision
+        var decisionRequester = GetComponent<DecisionRequester>();
+        if (decisionRequester != null)
+        {
+            decisionRequester.DecisionPeriod = Mathf.Max(1, (int)m_ResetParams.GetWithDefault("decision_period", decisionRequester.DecisionPeriod));
+        }
+        foreach (var gameEvent in new List<GameEvent>(envSettings.invdividualRewards.Keys))
+        {
+            envSettings.invdividualRewards[gameEvent] = m_ResetParams.GetWithDefault("reward/" + gameEvent.ToString(), envSettings.invdividualRewards[gameEvent]);
+        }
     }
     
     public void Start() {
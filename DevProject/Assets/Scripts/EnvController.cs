@@ -2,6 +2,7 @@ using System.Collections;
 using System.Collections.Generic;
 using UnityEngine;
 using Unity.MLAgents;
+using Unity.MLAgents.SideChannels;
 using System;
 using EnvironmentConfiguration;
 using MazeConfiguration;
@@ -114,6 +115,14 @@ public class EnvController : MonoBehaviour
 
     private SimpleMultiAgentGroup m_AgentGroup;
 
+    //maps pushed from Python, one channel for all areas of the scene, every area applies each map once
+    private static MapSideChannel mapChannel;
+    private int loadedMapVersion = 0;
+    //walls and goals left over by smaller swapped maps, reused by bigger ones
+    private List<ObstacleInfo> spareBlocks = new List<ObstacleInfo>();
+    private List<GoalInfo> spareGoals = new List<GoalInfo>();
+    private HashSet<(MAPFAgent, Obstacle)> subscriptions = new HashSet<(MAPFAgent, Obstacle)>();
+
     //spawn flags
     public bool RandomizeAgentPosition = true;
     public bool RandomizeAgentRotation = true;
@@ -204,6 +213,120 @@ public class EnvController : MonoBehaviour
 
     }
 
+    /// <summary>
+    /// Moves the scene to the layout of a map json (sent through MapSideChannel): the existing walls and goals
+    /// are reused, cloned when the map has more of them and disabled when it has fewer; the agents keep their objects
+    /// and take the spawns and teams of the map, so their number has to match. The area itself is not resized.
+    /// </summary>
+    /// <returns>MapSideChannel.MapLoaded or the reason the map was rejected</returns>
+    private string LoadSceneFromJson(string jsonString)
+    {
+        try
+        {
+            mazeBuilder.LoadMazeFromJson(jsonString);
+        }
+        catch (Exception e)
+        {
+            return $"unreadable map: {e.Message}";
+        }
+
+        if (mazeBuilder.Agents.Count != AgentsList.Count)
+            return $"the map has {mazeBuilder.Agents.Count} agents, the scene {AgentsList.Count}";
+        if (!mazeBuilder.Agents.Exists(item => item.Type == Team.Active.ToString()))
+            return "Should be at least one active agent";
+        if (mazeBuilder.Goals.Count == 0)
+            return "Should be at least one goal initialised";
+        if (mazeBuilder.Room.Count > 0 && BlocksList.Count + spareBlocks.Count == 0)
+            return "the scene has no wall to build the map from";
+
+        for (int i = 0; i < mazeBuilder.Room.Count; i++)
+        {
+            if (i == BlocksList.Count)
+            {
+                if (spareBlocks.Count > 0)
+                {
+                    BlocksList.Add(spareBlocks[spareBlocks.Count - 1]);
+                    spareBlocks.RemoveAt(spareBlocks.Count - 1);
+                }
+                else
+                {
+                    var clone = new ObstacleInfo();
+                    var original = BlocksList[0].obstacleElement;
+                    clone.obstacleElement = Instantiate(original, original.transform.parent);
+                    clone.obstacleElement.name = $"{original.name} ({i})";
+                    BlocksList.Add(clone);
+                }
+            }
+            var item = BlocksList[i];
+            item.obstacleElement.gameObject.SetActive(true);
+            item.StartingPos = mazeBuilder.Room[i].Position;
+            item.StartingRot = mazeBuilder.Room[i].Rotation;
+            if (Enum.TryParse(mazeBuilder.Room[i].Type, out ObstacleType obstacleType))
+                item.obstacleType = obstacleType;
+            item.obstacleElement.SetMovable(item.obstacleType == ObstacleType.Movable);
+        }
+        while (BlocksList.Count > mazeBuilder.Room.Count)
+        {
+            var item = BlocksList[BlocksList.Count - 1];
+            item.obstacleElement.gameObject.SetActive(false);
+            spareBlocks.Add(item);
+            BlocksList.RemoveAt(BlocksList.Count - 1);
+        }
+
+        for (int i = 0; i < mazeBuilder.Goals.Count; i++)
+        {
+            if (i == GoalsList.Count)
+            {
+                if (spareGoals.Count > 0)
+                {
+                    GoalsList.Add(spareGoals[spareGoals.Count - 1]);
+                    spareGoals.RemoveAt(spareGoals.Count - 1);
+                }
+                else
+                {
+                    var clone = new GoalInfo();
+                    var original = GoalsList[0].Goal;
+                    clone.Goal = Instantiate(original, original.transform.parent);
+                    GoalsList.Add(clone);
+                }
+            }
+            var item = GoalsList[i];
+            item.Goal.gameObject.SetActive(true);
+            item.StartingPos = mazeBuilder.Goals[i].Position;
+            item.StartingRot = mazeBuilder.Goals[i].Rotation;
+            if (Enum.TryParse(mazeBuilder.Goals[i].Type, out GoalType goalType))
+                item.goalType = goalType;
+        }
+        while (GoalsList.Count > mazeBuilder.Goals.Count)
+        {
+            var item = GoalsList[GoalsList.Count - 1];
+            item.Goal.gameObject.SetActive(false);
+            spareGoals.Add(item);
+            GoalsList.RemoveAt(GoalsList.Count - 1);
+        }
+
+        for (int i = 0; i < AgentsList.Count; i++)
+        {
+            var item = AgentsList[i];
+            item.StartingPos = mazeBuilder.Agents[i].Position;
+            item.StartingRot = mazeBuilder.Agents[i].Rotation;
+            if (Enum.TryParse(mazeBuilder.Agents[i].Type, out Team teamId) && teamId != item.teamId)
+            {
+                item.teamId = teamId;
+                item.Agent.isActive = teamId == Team.Active;
+                item.Agent.gameObject.tag = item.Agent.isActive ? "ActiveAgent" : "Agent";
+                item.Agent.GetComponent<Renderer>().material.color = item.Agent.isActive ? envSettings.activeAgentColour : envSettings.passiveAgentColour;
+            }
+        }
+        //roles and obstacle kinds may have changed, MovingRequestHandler only lets movable obstacles be pushed by active agents
+        foreach (var agent in AgentsList)
+        {
+            foreach (var item in BlocksList)
+                SubscribeAgentToObstacle(agent.Agent, item.obstacleElement);
+        }
+        return MapSideChannel.MapLoaded;
+    }
+
     public void DumpSceneToConfig(string destinationConfigFile)
     {
         mazeBuilder.SetMapSizes
@@ -267,11 +390,20 @@ public class EnvController : MonoBehaviour
         {   
             if (item.obstacleType ==  ObstacleType.Movable)
             {   
-                agent.OnMoveRequested += (sender, args) => { item.obstacleElement.MovingRequestHandler(args.ObjectID); };
+                SubscribeAgentToObstacle(agent, item.obstacleElement);
             }
         }
     }
 
+    private void SubscribeAgentToObstacle(MAPFAgent agent, Obstacle obstacle)
+    {
+        //once per pair, swapped maps subscribe everything again
+        if (subscriptions.Add((agent, obstacle)))
+        {
+            agent.OnMoveRequested += (sender, args) => { obstacle.MovingRequestHandler(args.ObjectID); };
+        }
+    }
+
     public void Start() 
     {      
         Clear();
@@ -373,9 +505,23 @@ public class EnvController : MonoBehaviour
         {
             this.DumpSceneToConfig(envSettings.backupConfigFile);
         }
+        if (mapChannel == null)
+        {
+            mapChannel = new MapSideChannel();
+            SideChannelManager.RegisterSideChannel(mapChannel);
+        }
         //mlagents to know reset func
         Academy.Instance.OnEnvironmentReset += ResetScene;  
     }
+
+    public void OnDestroy()
+    {
+        if (mapChannel != null && Academy.IsInitialized)
+        {
+            SideChannelManager.UnregisterSideChannel(mapChannel);
+        }
+        mapChannel = null;
+    }
     public void FixedUpdate() {
         // here episode termination is tracked
         resetTimer += 1;
@@ -442,6 +588,12 @@ public class EnvController : MonoBehaviour
 
         resetTimer = 0;
 
+        if (mapChannel != null && mapChannel.MapVersion != loadedMapVersion)
+        {
+            loadedMapVersion = mapChannel.MapVersion;
+            mapChannel.SendStatus(LoadSceneFromJson(mapChannel.MapJson));
+        }
+
         foreach (var item in BlocksList)
         {   
             var pos = item.StartingPos;
@@ -0,0 +1,36 @@
+using System;
+using Unity.MLAgents.SideChannels;
+
+/// <summary>
+/// Receives map jsons sent by Python (PeekabooEnv.load_map).
+/// Every EnvController applies the latest one at its next reset and answers with a status:
+/// "ok" or what went wrong.
+/// </summary>
+public class MapSideChannel : SideChannel
+{
+    public const string MapLoaded = "ok";
+
+    //incremented with every received map, so that each area knows whether it is up to date
+    public int MapVersion {get; private set;}
+    public string MapJson {get; private set;}
+
+    public MapSideChannel()
+    {
+        ChannelId = new Guid("0669b698-526e-43f4-a019-4be7780b8e12");
+    }
+
+    protected override void OnMessageReceived(IncomingMessage msg)
+    {
+        MapJson = msg.ReadString();
+        MapVersion++;
+    }
+
+    public void SendStatus(string status)
+    {
+        using (var msgOut = new OutgoingMessage())
+        {
+            msgOut.WriteString(status);
+            QueueMessageToSend(msgOut);
+        }
+    }
+}
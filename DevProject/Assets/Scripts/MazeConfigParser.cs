@@ -205,9 +205,13 @@ namespace MazeConfiguration
             return serializedList;
         }
         public void LoadMaze(string sourceFilename)
+        {
+            LoadMazeFromJson(File.ReadAllText(sourceFilename));
+        }
+
+        public void LoadMazeFromJson(string jsonString)
         {
             //fully overwrites a current maze data!
-            var jsonString = File.ReadAllText(sourceFilename);
             var config = JsonUtility.FromJson<ConfigStructureDecription>(jsonString);
 
             var map = config.Map;
@@ -26,6 +26,8 @@ public class Obstacle : MonoBehaviour
     
     private Collider obstacleCollider = null;
     private Rigidbody obstacleRigidbody = null;
+    private float baseMass;
+    private float baseDrag;
 
     // public bool IsMovable { get; set; }
     // public bool AllowedToMove { get; private set;}
@@ -48,7 +50,26 @@ public class Obstacle : MonoBehaviour
         envController = GetComponentInParent<EnvController>();
         envSettings = envController.envSettings;
 
+        baseMass = obstacleRigidbody.mass;
+        baseDrag = obstacleRigidbody.drag;
+        ApplyObstacleType();
+    }
+
+    /// <summary>
+    /// Switches the obstacle between the movable and immovable kinds, e.g. for a map swapped via MapSideChannel
+    /// </summary>
+    public void SetMovable(bool movable)
+    {
+        isMovable = movable;
+        if (obstacleRigidbody != null)
+            ApplyObstacleType();
+    }
+
+    private void ApplyObstacleType()
+    {
         this.gameObject.tag = "Obstacle";
+        obstacleRigidbody.mass = baseMass;
+        obstacleRigidbody.drag = baseDrag;
         Reset();
 
         if (isMovable)
@@ -0,0 +1,221 @@
+import numpy as np
+import torch
+
+#
+# GAE(lambda) and discounted returns of (T, ...) batches, e.g. (num_steps, num_envs, num_agents), for NumPy arrays and torch tensors.
+#
+# Conventions, index t is the step taken from state s_t:
+#   terminated[t] -- s_{t+1} is terminal, nothing is bootstrapped
+#   truncated[t]  -- the episode was cut after step t (time limit), the value of s_{t+1} is bootstrapped
+#   valid[t]      -- step t was collected, invalid steps get zeros and cut the chain
+#   next_values[t] = V(s_{t+1}); by default values[t+1], or `last_values` after the last valid step.
+#                    With auto-reset environments pass it for truncated steps, values[t+1] belongs to a new episode there.
+#
+# All estimates are linear recurrences x_t = b_t + g * cont_t * x_{t+1}, solved blockwise by _reverse_scan.
+
+# batch width (prod of non-time dims) from which the plain reverse loop is faster than the blockwise scan
+WIDE_BATCH: int = 1024
+
+
+def _is_torch(x) -> bool:
+    return isinstance(x, torch.Tensor)
+
+
+def _broadcast(x, like):
+    """
+    x as a float array/tensor of like's shape, dtype and device
+    """
+    if _is_torch(like):
+        return torch.as_tensor(x, device=like.device).to(like.dtype).expand(like.shape)
+    return np.broadcast_to(np.asarray(x, dtype=like.dtype), like.shape)
+
+
+def _zeros(like, shape):
+    return like.new_zeros(shape) if _is_torch(like) else np.zeros(shape, dtype=like.dtype)
+
+
+def _cat(items):
+    return torch.cat(items) if _is_torch(items[0]) else np.concatenate(items)
+
+
+def _reverse_scan(b, coefficients, block_size: int | None = None):
+    """
+    x_t = b_t + coefficients_t * x_{t+1}, x_T = 0 for (T, N) inputs.
+    Time is cut into blocks of ~sqrt(T) steps: all blocks are solved at once assuming a zero carry,
+    then carries are propagated block to block, 2 * sqrt(T) vectorized iterations instead of T
+    """
+    T, N = b.shape
+    if block_size is None:
+        #wide batches already amortise the per-step overhead, blocks would only add memory passes
+        block_size = T if N >= WIDE_BATCH else int(np.ceil(np.sqrt(T)))
+    if block_size >= T:
+        out = _zeros(b, (T, N))
+        acc = _zeros(b, (N,))
+        for t in reversed(range(T)):
+            acc = b[t] + coefficients[t] * acc
+            out[t] = acc
+        return out
+    num_blocks = -(-T // block_size)
+    padded = num_blocks * block_size
+
+    b_blocks = _zeros(b, (padded, N))
+    b_blocks[:T] = b
+    c_blocks = _zeros(b, (padded, N))
+    c_blocks[:T] = coefficients
+    b_blocks = b_blocks.reshape(num_blocks, block_size, N)
+    c_blocks = c_blocks.reshape(num_blocks, block_size, N)
+
+    #local solutions and products of coefficients up to the end of each block
+    local = _zeros(b, (num_blocks, block_size, N))
+    scale = _zeros(b, (num_blocks, block_size, N))
+    acc = _zeros(b, (num_blocks, N))
+    prod = _zeros(b, (num_blocks, N)) + 1
+    for t in reversed(range(block_size)):
+        acc = b_blocks[:, t] + c_blocks[:, t] * acc
+        prod = c_blocks[:, t] * prod
+        local[:, t] = acc
+        scale[:, t] = prod
+
+    #value at the first step of the following block
+    carries = _zeros(b, (num_blocks, 1, N))
+    carry = _zeros(b, (N,))
+    for block in reversed(range(num_blocks)):
+        carries[block, 0] = carry
+        carry = local[block, 0] + scale[block, 0] * carry
+    return (local + scale * carries).reshape(padded, N)[:T]
+
+
+def _links(rewards, terminated, truncated, last_values, valid):
+    """
+    (T, N) views of the inputs, chain links and the bootstrap value used after the last valid step
+    """
+    T = rewards.shape[0]
+    terminated = _broadcast(terminated, rewards).reshape(T, -1)
+    truncated = _broadcast(truncated, rewards).reshape(T, -1)
+    valid = _broadcast(1.0 if valid is None else valid, rewards).reshape(T, -1)
+    last_values = _broadcast(last_values, rewards[0]).reshape(1, -1)
+
+    next_valid = _cat([valid[1:], _zeros(valid, (1, valid.shape[1]))])
+    cont = valid * (1 - terminated) * (1 - truncated) * next_valid
+    return rewards.reshape(T, -1), terminated, valid, next_valid, cont, last_values
+
+
+def compute_gae(rewards, values, terminated, truncated, last_values, gamma: float, gae_lambda: float,
+                valid=None, next_values=None, block_size: int | None = None):
+    """
+    GAE(lambda) advantages shaped like `rewards` (T, ...), add `values` to get the lambda-returns.
+    `last_values` is V of the state after the last valid step, shaped like rewards[0]
+    """
+    shape = rewards.shape
+    rewards, terminated, valid, next_valid, cont, last_values = _links(rewards, terminated, truncated, last_values, valid)
+    values = values.reshape(rewards.shape)
+    if next_values is None:
+        next_values = next_valid * _cat([values[1:], last_values]) + (1 - next_valid) * last_values
+    else:
+        next_values = _broadcast(next_values, rewards)
+
+    deltas = (rewards + gamma * (1 - terminated) * next_values - values) * valid
+    return _reverse_scan(deltas, gamma * gae_lambda * cont, block_size).reshape(shape)
+
+
+def compute_returns(rewards, terminated, truncated, last_values, gamma: float,
+                    valid=None, next_values=None, block_size: int | None = None):
+    """
+    Discounted returns shaped like `rewards` (T, ...), bootstrapped with `last_values` after the last valid step.
+    Without `next_values` a truncation inside the rollout is not bootstrapped.
+    """
+    shape = rewards.shape
+    rewards, terminated, valid, next_valid, cont, last_values = _links(rewards, terminated, truncated, last_values, valid)
+    bootstrap = (1 - next_valid) * last_values
+    if next_values is not None:
+        bootstrap = bootstrap + next_valid * _broadcast(next_values, rewards)
+
+    #a step either continues to the next return or ends with a bootstrapped (or zero) value
+    targets = (rewards + gamma * (1 - terminated) * (1 - cont) * bootstrap) * valid
+    return _reverse_scan(targets, gamma * cont, block_size).reshape(shape)
+
+
+def compute_vtrace(rewards, values, terminated, truncated, last_values, log_rhos, gamma: float, gae_lambda: float = 1.0,
+                   rho_clip: float = 1.0, c_clip: float = 1.0, valid=None, next_values=None, block_size: int | None = None):
+    """
+    V-trace (IMPALA) for rollouts of a behaviour policy mu, log_rhos = log pi(a_t|s_t) - log mu(a_t|s_t).
+    Returns value targets vs_t and policy gradient advantages rho_t * (r_t + gamma * vs_{t+1} - V(s_t)), both shaped like `rewards`.
+    With log_rhos = 0 targets are GAE(gae_lambda) lambda-returns
+    """
+    shape = rewards.shape
+    rewards, terminated, valid, next_valid, cont, last_values = _links(rewards, terminated, truncated, last_values, valid)
+    values = values.reshape(rewards.shape)
+    if next_values is None:
+        next_values = next_valid * _cat([values[1:], last_values]) + (1 - next_valid) * last_values
+    else:
+        next_values = _broadcast(next_values, rewards)
+    rhos = log_rhos.reshape(rewards.shape)
+    rhos = rhos.exp() if _is_torch(rhos) else np.exp(rhos)
+    clipped_rhos = rhos.clamp(max=rho_clip) if _is_torch(rhos) else np.minimum(rhos, rho_clip)
+    cs = gae_lambda * (rhos.clamp(max=c_clip) if _is_torch(rhos) else np.minimum(rhos, c_clip))
+
+    deltas = clipped_rhos * (rewards + gamma * (1 - terminated) * next_values - values) * valid
+    corrections = _reverse_scan(deltas, gamma * cs * cont, block_size)
+    vs = values * valid + corrections
+
+    #vs_{t+1} where the chain goes on, the bootstrap value where it stops
+    next_vs = next_values + cont * _cat([corrections[1:], _zeros(corrections, (1, corrections.shape[1]))])
+    pg_advantages = clipped_rhos * (rewards + gamma * (1 - terminated) * next_vs - values) * valid
+    return vs.reshape(shape), pg_advantages.reshape(shape)
+
+
+def reference_gae(rewards, values, terminated, truncated, last_values, gamma: float, gae_lambda: float, valid=None):
+    """
+    Step by step loop over time with the same conventions, kept for tests and benchmarks
+    """
+    rewards, values = np.asarray(rewards, dtype=np.float64), np.asarray(values, dtype=np.float64)
+    terminated, truncated = np.broadcast_to(terminated, rewards.shape), np.broadcast_to(truncated, rewards.shape)
+    valid = np.ones(rewards.shape, dtype=bool) if valid is None else np.broadcast_to(valid, rewards.shape)
+    advantages = np.zeros_like(rewards)
+    lastgaelam = np.zeros_like(rewards[0])
+    for t in reversed(range(len(rewards))):
+        next_valid = valid[t + 1] if t + 1 < len(rewards) else np.zeros_like(valid[0])
+        next_values = np.where(next_valid, values[min(t + 1, len(rewards) - 1)], last_values)
+        nonterminal = 1.0 - terminated[t]
+        delta = rewards[t] + gamma * nonterminal * next_values - values[t]
+        cont = nonterminal * (1.0 - truncated[t]) * next_valid
+        lastgaelam = np.where(valid[t], delta + gamma * gae_lambda * cont * lastgaelam, 0.0)
+        advantages[t] = lastgaelam
+    return advantages
+
+
+def reference_returns(rewards, terminated, truncated, last_values, gamma: float, valid=None):
+    rewards = np.asarray(rewards, dtype=np.float64)
+    terminated, truncated = np.broadcast_to(terminated, rewards.shape), np.broadcast_to(truncated, rewards.shape)
+    valid = np.ones(rewards.shape, dtype=bool) if valid is None else np.broadcast_to(valid, rewards.shape)
+    returns = np.zeros_like(rewards)
+    next_return = np.zeros_like(rewards[0])
+    for t in reversed(range(len(rewards))):
+        next_valid = valid[t + 1] if t + 1 < len(rewards) else np.zeros_like(valid[0])
+        #truncated inside the rollout: nothing to bootstrap with
+        next_return = np.where(next_valid, next_return * (1.0 - truncated[t]), last_values)
+        returns[t] = next_return = np.where(valid[t], rewards[t] + gamma * (1.0 - terminated[t]) * next_return, 0.0)
+    return returns
+
+
+def reference_vtrace(rewards, values, terminated, truncated, last_values, log_rhos, gamma: float, gae_lambda: float = 1.0,
+                     rho_clip: float = 1.0, c_clip: float = 1.0, valid=None):
+    rewards, values = np.asarray(rewards, dtype=np.float64), np.asarray(values, dtype=np.float64)
+    terminated, truncated = np.broadcast_to(terminated, rewards.shape), np.broadcast_to(truncated, rewards.shape)
+    valid = np.ones(rewards.shape, dtype=bool) if valid is None else np.broadcast_to(valid, rewards.shape)
+    rhos = np.exp(np.asarray(log_rhos, dtype=np.float64))
+    vs, pg_advantages = np.zeros_like(rewards), np.zeros_like(rewards)
+    next_correction = np.zeros_like(rewards[0])
+    for t in reversed(range(len(rewards))):
+        next_valid = valid[t + 1] if t + 1 < len(rewards) else np.zeros_like(valid[0])
+        next_values = np.where(next_valid, values[min(t + 1, len(rewards) - 1)], last_values)
+        nonterminal = 1.0 - terminated[t]
+        cont = nonterminal * (1.0 - truncated[t]) * next_valid
+        clipped_rho = np.minimum(rhos[t], rho_clip)
+        delta = clipped_rho * (rewards[t] + gamma * nonterminal * next_values - values[t])
+        next_vs = next_values + cont * next_correction
+        correction = np.where(valid[t], delta + gamma * gae_lambda * np.minimum(rhos[t], c_clip) * cont * next_correction, 0.0)
+        vs[t] = np.where(valid[t], values[t] + correction, 0.0)
+        pg_advantages[t] = np.where(valid[t], clipped_rho * (rewards[t] + gamma * nonterminal * next_vs - values[t]), 0.0)
+        next_correction = correction
+    return vs, pg_advantages
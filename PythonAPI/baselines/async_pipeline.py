@@ -0,0 +1,158 @@
+import copy
+import queue
+import threading
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import torch.nn as nn
+
+#
+# Actor/learner pipeline: actor threads keep stepping their environments with the latest published policy
+# while the learner consumes completed rollouts from a bounded queue.
+# Threads are enough here: Unity steps wait on a socket and torch kernels release the GIL.
+
+
+@dataclass
+class Rollout:
+    buffer: Any #RolloutBuffer filled by the actor, returned to the pool with AsyncRollouts.release
+    next_obs: np.ndarray
+    episodic_return: np.ndarray
+    policy_version: int #version of the policy that collected it
+    actor_index: int
+
+
+class PolicyStore:
+    def __init__(self, policy: nn.Module) -> None:
+        """
+        Latest parameters published by the learner, actors pull them between rollouts
+        """
+        self._lock = threading.Lock()
+        self.version = 0
+        self._state = None
+        self.publish(policy)
+
+    def publish(self, policy: nn.Module) -> None:
+        state = {key: value.detach().clone() for key, value in policy.state_dict().items()}
+        with self._lock:
+            self._state = state
+            self.version += 1
+
+    def pull(self, policy: nn.Module, version: int) -> int:
+        """
+        Loads the latest parameters into `policy` if they are newer than `version`, returns the loaded version
+        """
+        with self._lock:
+            if self.version != version:
+                policy.load_state_dict(self._state)
+            return self.version
+
+
+class AsyncRollouts:
+    def __init__(self,
+                 collect_fn: Callable,
+                 policy: nn.Module,
+                 environments: list,
+                 buffers: list,
+                 queue_size: int) -> None:
+        """
+        One actor thread per environment, each with its own copy of `policy`.
+        `collect_fn(buffer, policy, environment) -> (next_obs, episodic_return)` fills a buffer with one rollout.
+
+        `buffers` are recycled: an actor takes a free one, fills it and puts it into a queue of `queue_size` rollouts,
+        so at most len(buffers) rollouts exist at once and actors block when the learner falls behind.
+        """
+        if len(buffers) < len(environments) + queue_size:
+            raise ValueError(f"{len(environments)} actors and a queue of {queue_size} need {len(environments) + queue_size} buffers, got {len(buffers)}")
+        self.store = PolicyStore(policy)
+        self._collect_fn = collect_fn
+        self._free = queue.Queue()
+        for buffer in buffers:
+            self._free.put(buffer)
+        self._full = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors: list[str] = []
+
+        self._start_time = perf_counter()
+        self._actor_busy = np.zeros(len(environments))
+        self._learner_busy = 0.0
+        self._threads = [
+            threading.Thread(target=self._actor, args=(index, environment, copy.deepcopy(policy)), daemon=True)
+            for index, environment in enumerate(environments)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def version(self) -> int:
+        return self.store.version
+
+    def _wait(self, operation: Callable, *args) -> Any:
+        #short timeouts so that blocked threads notice close() and actor failures
+        while not self._stop.is_set():
+            try:
+                return operation(*args, timeout=0.1)
+            except (queue.Empty, queue.Full):
+                continue
+        return None
+
+    def _actor(self, index: int, environment, policy: nn.Module) -> None:
+        version = 0
+        try:
+            while not self._stop.is_set():
+                buffer = self._wait(self._free.get)
+                if buffer is None:
+                    return
+                start = perf_counter()
+                version = self.store.pull(policy, version)
+                next_obs, episodic_return = self._collect_fn(buffer, policy, environment)
+                self._actor_busy[index] += perf_counter() - start
+                self._wait(self._full.put, Rollout(buffer, next_obs, episodic_return, version, index))
+        except Exception:
+            self._errors.append(traceback.format_exc())
+            self._stop.set()
+
+    def get(self) -> Rollout:
+        """
+        Next completed rollout, waits for the actors
+        """
+        rollout = self._wait(self._full.get)
+        if rollout is None:
+            raise RuntimeError("An actor failed:\n" + "\n".join(self._errors) if self._errors else "The pipeline is closed")
+        return rollout
+
+    def release(self, rollout: Rollout) -> None:
+        self._free.put(rollout.buffer)
+
+    def publish(self, policy: nn.Module) -> None:
+        self.store.publish(policy)
+
+    @contextmanager
+    def learning(self):
+        """
+        Time spent inside counts as learner work for utilization()
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._learner_busy += perf_counter() - start
+
+    def utilization(self) -> dict:
+        """
+        Fractions of the wall time since the start the actors (on average) and the learner were working
+        """
+        elapsed = perf_counter() - self._start_time
+        return {
+            "async/actor utilization": float(self._actor_busy.mean() / elapsed),
+            "async/learner utilization": self._learner_busy / elapsed,
+            "async/queued rollouts": self._full.qsize(),
+        }
+
+    def close(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,159 @@
+import torch
+import torch.nn as nn
+
+from distributions import MaskedMultiDiscrete
+
+#
+# Per-agent networks stacked into one module: parameters of agent i live at index i of every tensor,
+# so all agents are evaluated with a single batched matmul per layer instead of a Python loop over agents.
+# SharedActorCritic has the same interface (MultiAgentActorCritic) for one network shared by all agents.
+
+
+class BatchedLinear(nn.Module):
+    """
+    `num_members` independent linear layers, x (num_members, batch, in_features) -> (num_members, batch, out_features)
+    """
+    def __init__(self, num_members: int, in_features: int, out_features: int) -> None:
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(num_members, in_features, out_features))
+        self.bias = nn.Parameter(torch.zeros(num_members, 1, out_features))
+
+    @classmethod
+    def from_linears(cls, layers: list[nn.Linear]) -> "BatchedLinear":
+        batched = cls(len(layers), layers[0].in_features, layers[0].out_features)
+        with torch.no_grad():
+            batched.weight.copy_(torch.stack([layer.weight.T for layer in layers]))
+            batched.bias.copy_(torch.stack([layer.bias for layer in layers]).unsqueeze(1))
+        return batched.to(layers[0].weight.device)
+
+    def unstack_into(self, layers: list[nn.Linear]) -> None:
+        with torch.no_grad():
+            for i, layer in enumerate(layers):
+                layer.weight.copy_(self.weight[i].T)
+                layer.bias.copy_(self.bias[i, 0])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class BatchedSequential(nn.Sequential):
+    """
+    Stacks identically shaped nn.Sequential networks, linear layers are batched, other layers are shared
+    """
+    def __init__(self, networks: list[nn.Sequential]) -> None:
+        layers = []
+        for members in zip(*networks):
+            if isinstance(members[0], nn.Linear):
+                layers.append(BatchedLinear.from_linears(list(members)))
+            else:
+                layers.append(members[0])
+        super().__init__(*layers)
+
+    def unstack_into(self, networks: list[nn.Sequential]) -> None:
+        for batched, members in zip(self, zip(*networks)):
+            if isinstance(batched, BatchedLinear):
+                batched.unstack_into(list(members))
+
+
+class MultiAgentActorCritic(nn.Module):
+    def __init__(self, num_members: int, agent: nn.Module, actor_network: nn.Module, critic_network: nn.Module) -> None:
+        """
+        Actor and critic of all agents at once, states are shaped (num_agents, batch, ...), the action space and
+        shared_critic are those of the ActorCriticAgent `agent`. Action masks follow mlagents_envs: True marks an unavailable action.
+        """
+        super().__init__()
+        self.num_members = num_members
+        self.action_space = [int(n) for n in agent.actor_network.action_space]
+        self.shared_critic = agent.shared_critic
+        self.actor_network = actor_network
+        self.critic_network = critic_network
+
+    def _inputs(self, state: torch.Tensor) -> torch.Tensor:
+        #what the networks see of (num_agents, batch, dim) states
+        return state
+
+    def get_value(self, state: torch.Tensor, cent_state: torch.Tensor | None = None) -> torch.Tensor:
+        if self.shared_critic:
+            #every agent's critic sees the same centralised state, expand does not copy it
+            state = cent_state.unsqueeze(0).expand(self.num_members, *cent_state.shape)
+        return self.critic_network(self._inputs(state)).squeeze(-1)
+
+    def distribution(self, state: torch.Tensor, action_mask: torch.Tensor | None = None) -> MaskedMultiDiscrete:
+        return MaskedMultiDiscrete(self.actor_network(self._inputs(state)), self.action_space, action_mask)
+
+    def get_action(self, state: torch.Tensor, action_mask: torch.Tensor | None = None, action: torch.Tensor | None = None):
+        distribution = self.distribution(state, action_mask)
+        if action is None:
+            action = distribution.sample()
+        return action, distribution.log_prob(action), distribution.entropy()
+
+    def get_action_and_value(self, state: torch.Tensor,
+                                   cent_state: torch.Tensor | None = None,
+                                   action_mask: torch.Tensor | None = None,
+                                   action: torch.Tensor | None = None):
+        """
+        state (num_agents, batch, obs_dim) -> values, log-probs, entropies (num_agents, batch) and actions (num_agents, batch, branches)
+        """
+        value = self.get_value(state, cent_state)
+        action, logprob, entropy = self.get_action(state, action_mask=action_mask, action=action)
+        return value, action, logprob, entropy
+
+
+class BatchedActorCritic(MultiAgentActorCritic):
+    def __init__(self, agents: list[nn.Module]) -> None:
+        """
+        Stacked copy of a list of ActorCriticAgent
+        """
+        super().__init__(len(agents), agents[0],
+                         BatchedSequential([agent.actor_network.actor_network for agent in agents]),
+                         BatchedSequential([agent.critic_network.critic_network for agent in agents]))
+
+    def unstack_into(self, agents: list[nn.Module]) -> None:
+        """
+        Copies the trained parameters back into the per-agent modules
+        """
+        self.actor_network.unstack_into([agent.actor_network.actor_network for agent in agents])
+        self.critic_network.unstack_into([agent.critic_network.critic_network for agent in agents])
+
+    def member_grad_norms(self) -> torch.Tensor:
+        squares = [param.grad.detach().pow(2).reshape(self.num_members, -1).sum(1) for param in self.parameters() if param.grad is not None]
+        return torch.stack(squares).sum(0).sqrt()
+
+    def clip_grad_norm_(self, max_norm: float) -> torch.Tensor:
+        """
+        nn.utils.clip_grad_norm_ applied to every agent's slice separately, as if each agent had its own optimizer
+        """
+        norms = self.member_grad_norms()
+        scale = (max_norm / (norms + 1e-6)).clamp(max=1.0)
+        for param in self.parameters():
+            if param.grad is not None:
+                param.grad.mul_(scale.view(-1, *([1] * (param.grad.dim() - 1))))
+        return norms
+
+
+class SharedActorCritic(MultiAgentActorCritic):
+    def __init__(self, agent: nn.Module, teams: list[int] | torch.Tensor, embedding_dim: int) -> None:
+        """
+        One ActorCriticAgent for all agents (built with `embedding_dim` more inputs than the observations), in the layout
+        of BatchedActorCritic. Agent i sees its state next to the sum of learned embeddings of its index and of its team
+        teams[i] (1 for Active, 0 for Passive agents), so the agents of a batch share every parameter but the embeddings.
+        """
+        super().__init__(len(teams), agent, agent.actor_network.actor_network, agent.critic_network.critic_network)
+        self.agent_embedding = nn.Embedding(self.num_members, embedding_dim)
+        self.team_embedding = nn.Embedding(2, embedding_dim)
+        self.register_buffer("teams", torch.as_tensor(teams, dtype=torch.long))
+
+    def _inputs(self, state: torch.Tensor) -> torch.Tensor:
+        #(num_agents, batch, dim) -> (num_agents, batch, dim + embedding_dim)
+        embedding = self.agent_embedding.weight + self.team_embedding(self.teams)
+        return torch.cat([state, embedding.unsqueeze(1).expand(-1, state.shape[1], -1)], dim=-1)
+
+    def member_grad_norms(self) -> torch.Tensor:
+        """
+        Norm of the whole gradient, as a single member
+        """
+        squares = [param.grad.detach().pow(2).sum() for param in self.parameters() if param.grad is not None]
+        return torch.stack(squares).sum().sqrt().reshape(1)
+
+    def clip_grad_norm_(self, max_norm: float) -> torch.Tensor:
+        return nn.utils.clip_grad_norm_(self.parameters(), max_norm).reshape(1)
@@ -0,0 +1,62 @@
+import torch
+
+#
+# Masked MultiDiscrete distribution over all branches at once: flat logits (..., sum(nvec)) are gathered
+# into a padded (..., branches, max_actions) tensor, so sampling, log-probs and entropies are a few batched ops
+# instead of one Categorical per branch.
+# Masks follow mlagents_envs: True marks an unavailable action.
+
+# logit of unavailable actions, exp() of it underflows to an exact zero probability
+MASKED_LOGIT: float = -1e8
+# logit of padding slots, below MASKED_LOGIT: they keep zero probability when a whole branch is masked
+PADDING_LOGIT: float = 2 * MASKED_LOGIT
+
+# gather index of a branch layout per (nvec, device), built once
+_layouts: dict[tuple, torch.Tensor] = {}
+
+
+def branch_index(nvec, device: torch.device | str = "cpu") -> torch.Tensor:
+    """
+    Flat index (branches * max_actions) of every padded slot into the logits with an extra padding column appended,
+    padding slots point at that column
+    """
+    nvec = tuple(int(n) for n in nvec)
+    key = (nvec, str(device))
+    if key not in _layouts:
+        offsets = torch.tensor([0, *nvec[:-1]]).cumsum(0)
+        actions = torch.arange(max(nvec))
+        padding = actions[None, :] >= torch.tensor(nvec)[:, None]
+        _layouts[key] = torch.where(padding, sum(nvec), offsets[:, None] + actions[None, :]).flatten().to(device)
+    return _layouts[key]
+
+
+class MaskedMultiDiscrete:
+    def __init__(self, logits: torch.Tensor, nvec, action_mask: torch.Tensor | None = None) -> None:
+        """
+        logits (..., sum(nvec)), action_mask broadcastable to them, bool with True for unavailable actions.
+        Actions are shaped (..., branches), log-probs and entropies (...) are summed over branches.
+        """
+        index = branch_index(nvec, logits.device)
+        if action_mask is not None:
+            logits = logits.masked_fill(action_mask, MASKED_LOGIT)
+        logits = torch.cat([logits, logits.new_full((*logits.shape[:-1], 1), PADDING_LOGIT)], dim=-1)
+        padded = logits.index_select(-1, index).view(*logits.shape[:-1], len(nvec), -1)
+        self.log_probs = padded - padded.logsumexp(-1, keepdim=True)
+        #unavailable actions get exactly zero probability, so they add nothing to sums over actions
+        self.probs = self.log_probs.exp()
+
+    def sample(self) -> torch.Tensor:
+        #inverse CDF, one uniform per branch; the first slot whose CDF reaches it never has zero probability
+        cdf = self.probs.cumsum(-1)
+        uniform = torch.rand(cdf.shape[:-1] + (1,), dtype=cdf.dtype, device=cdf.device).clamp_(min=torch.finfo(cdf.dtype).tiny)
+        return (cdf < uniform * cdf[..., -1:]).sum(-1)
+
+    def mode(self) -> torch.Tensor:
+        #the most probable available action of every branch, for greedy evaluation
+        return self.log_probs.argmax(-1)
+
+    def log_prob(self, action: torch.Tensor) -> torch.Tensor:
+        return self.log_probs.gather(-1, action.long().unsqueeze(-1)).squeeze(-1).sum(-1)
+
+    def entropy(self) -> torch.Tensor:
+        return -(self.probs * self.log_probs).sum((-2, -1))
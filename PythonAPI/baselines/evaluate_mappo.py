@@ -0,0 +1,76 @@
+"""
+Evaluates MAPPO agents saved with checkpoint_path: episodes of every seed and map run concurrently on a pool of environments,
+the NumPy stand-in with --simulator (one map per --maps), Unity players of --executable otherwise (maps are loaded into them).
+Prints means and confidence intervals of return, success rate and episode length, overall and per map, and episodes per minute.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+import json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checkpoint", required=True)
+    parser.add_argument("--maps", nargs="+", default=["../../configs/maps/dev_map.json"])
+    parser.add_argument("--simulator", action="store_true", help="run the NumPy stand-in instead of --executable")
+    parser.add_argument("--executable", default="../../Executables/new_stable_dev/dev_release.x86_64")
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(range(8)))
+    parser.add_argument("--episodes", type=int, default=4, help="episodes per seed and map")
+    parser.add_argument("--num-envs", type=int, default=8, help="environments running at once")
+    parser.add_argument("--max-steps", type=int, default=None, help="step limit of an episode, the environment's own by default")
+    parser.add_argument("--sampled", action="store_true", help="sample actions instead of taking the most probable ones")
+    parser.add_argument("--base-worker-id", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--seed", type=int, default=0, help="torch seed of sampled actions")
+    parser.add_argument("--output", default=None, help="json file for the summaries")
+    args = parser.parse_args()
+
+    #imported once the arguments are parsed, --help doesn't wait for torch
+    import torch
+    from mappo import load_checkpoint
+    from evaluation import EvalTask, evaluate, summarize
+    from peekaboo_env_pool import EnvPool
+    from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+    from peekaboo_vec_env import PeekabooEnvFactory
+
+    torch.manual_seed(args.seed)
+    tasks = [EvalTask(seed, map_path, args.episodes) for seed in args.seeds for map_path in args.maps]
+    pool = EnvPool(base_worker_id=args.base_worker_id)
+    factory = PeekabooEnvFactory(args.executable, no_graphics=True, array_mode=True)
+
+    def acquire(task: EvalTask):
+        if args.simulator:
+            settings = SimSettings() if args.max_steps is None else SimSettings(max_environment_steps=args.max_steps)
+            return PeekabooSimEnv(task.map_path, seed=task.seed, settings=settings, array_mode=True)
+        lease = pool.lease(factory, task.seed)
+        lease.load_map(task.map_path)
+        return lease
+
+    with pool:
+        #the spaces of the first task's environment rebuild the networks, it goes back to the pool for the evaluation
+        probe = acquire(tasks[0])
+        policy, checkpoint = load_checkpoint(args.checkpoint, probe, args.device)
+        probe.close()
+        if not args.simulator:
+            pool.warm(factory, [seed for seed in sorted({task.seed for task in tasks}) if seed != tasks[0].seed][:args.num_envs - 1])
+        results, elapsed = evaluate(policy, tasks, acquire, num_envs=args.num_envs, stack_size=checkpoint["stack_size"],
+                                    deterministic=not args.sampled, max_steps=args.max_steps, device=args.device)
+
+    summaries = {"all": summarize(results, elapsed)}
+    for map_path in dict.fromkeys(args.maps):
+        summaries[map_path] = summarize([result for result in results if result.map_path == map_path], elapsed)
+    for name, summary in summaries.items():
+        print(f"{name}: {summary['episodes']} episodes, return {summary['return/mean']:.3f} "
+              f"[{summary['return/ci low']:.3f}, {summary['return/ci high']:.3f}], "
+              f"success {summary['success rate/mean']:.1%} [{summary['success rate/ci low']:.1%}, {summary['success rate/ci high']:.1%}], "
+              f"length {summary['episode length/mean']:.1f} [{summary['episode length/ci low']:.1f}, {summary['episode length/ci high']:.1f}]")
+    print(f"{summaries['all']['episodes per minute']:.1f} episodes/min on {args.num_envs} environments")
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(summaries, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Callable
+
+import numpy as np
+import torch
+
+sys.path.append("..")
+from peekaboo_frame_stack import FrameStack
+from peekaboo_vec_env import reset_arrays, step_arrays
+
+#
+# Evaluation of a trained policy on many environments at once: every environment runs the episodes of one (seed, map) task
+# at a time, all of them step together on a thread pool and their observations go through one batched forward pass
+# (agents x environments) without gradients. Results are aggregated with confidence intervals.
+
+
+@dataclass
+class EvalTask:
+    """
+    `episodes` episodes in a row on one environment launched with `seed`, on `map_path` (None keeps the environment's map)
+    """
+    seed: int | None
+    map_path: str | None
+    episodes: int
+
+
+@dataclass
+class EpisodeResult:
+    seed: int | None
+    map_path: str | None
+    team_return: float #summed over agents
+    length: int #steps
+    success: bool #all goals completed (terminated), not cut by the step limit
+
+
+class _Slot:
+    #an environment of the pool and the episode running on it
+    def __init__(self, task: EvalTask, env: Any) -> None:
+        self.task, self.env = task, env
+        self.episode = 0
+        self.frames: FrameStack | None = None
+        self.obs: np.ndarray | None = None
+        self.action_mask: np.ndarray | None = None
+        self.team_return, self.length = 0.0, 0
+
+
+def confidence_interval(values: np.ndarray, confidence: float = 0.95, resamples: int = 10000, seed: int = 0) -> tuple[float, float]:
+    """
+    Percentile bootstrap interval of the mean of `values`, nan without values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return np.nan, np.nan
+    means = np.random.default_rng(seed).choice(values, size=(resamples, len(values))).mean(1)
+    return tuple(float(bound) for bound in np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2]))
+
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> tuple[float, float]:
+    """
+    Wilson score interval of a success rate, which stays within [0, 1] and is not empty at 0 or 1 successes
+    """
+    if not trials:
+        return np.nan, np.nan
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = successes / trials
+    center = (rate + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    half_width = z * np.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / (1 + z ** 2 / trials)
+    #exact at the ends, where the two terms cancel up to rounding
+    low = 0.0 if successes == 0 else float(center - half_width)
+    high = 1.0 if successes == trials else float(center + half_width)
+    return low, high
+
+
+def summarize(results: list[EpisodeResult], elapsed: float, confidence: float = 0.95) -> dict[str, float]:
+    """
+    Means of return, success rate and episode length with their `confidence` intervals, and episodes per minute
+    """
+    returns = np.array([result.team_return for result in results])
+    lengths = np.array([result.length for result in results])
+    successes = sum(result.success for result in results)
+    summary = {"episodes": len(results), "episodes per minute": 60.0 * len(results) / elapsed if elapsed > 0 else np.nan}
+    for name, values in (("return", returns), ("episode length", lengths)):
+        low, high = confidence_interval(values, confidence)
+        summary.update({f"{name}/mean": float(values.mean()) if len(values) else np.nan, f"{name}/ci low": low, f"{name}/ci high": high})
+    low, high = wilson_interval(successes, len(results), confidence)
+    summary.update({"success rate/mean": successes / len(results) if results else np.nan,
+                    "success rate/ci low": low, "success rate/ci high": high})
+    return summary
+
+
+@torch.no_grad()
+def act(policy, obs: np.ndarray, action_masks: np.ndarray | None, deterministic: bool, device: torch.device | str = "cpu") -> np.ndarray:
+    """
+    Actions (envs, agents, branches) of a BatchedActorCritic (or SharedActorCritic) for stacked observations (envs, agents, obs_dim),
+    greedy with `deterministic`, sampled otherwise
+    """
+    obs = torch.from_numpy(obs).to(device).transpose(0, 1)
+    action_masks = None if action_masks is None else torch.from_numpy(action_masks).to(device).transpose(0, 1)
+    distribution = policy.distribution(obs, action_masks)
+    actions = distribution.mode() if deterministic else distribution.sample()
+    return actions.transpose(0, 1).cpu().numpy()
+
+
+def evaluate(policy, tasks: list[EvalTask], acquire: Callable[[EvalTask], Any], release: Callable[[Any], None] = lambda env: env.close(),
+             num_envs: int = 1, stack_size: int = 1, deterministic: bool = True, max_steps: int | None = None,
+             device: torch.device | str = "cpu") -> tuple[list[EpisodeResult], float]:
+    """
+    Runs `tasks` on up to `num_envs` environments at once and returns the episode results and the wall time in seconds.
+    `acquire(task)` gives an environment of either API for a task (e.g. an EnvPool lease with the task's seed and map),
+    `release(env)` hands it back when the task is done. Episodes longer than `max_steps` are cut (and not successes).
+    """
+    pending = queue.SimpleQueue()
+    for task in tasks:
+        pending.put(task)
+    results: list[EpisodeResult] = []
+
+    def reset(slot: _Slot) -> None:
+        obs, slot.action_mask = reset_arrays(slot.env)
+        if slot.frames is None:
+            slot.frames = FrameStack(obs.shape[0], obs.shape[-1], stack_size)
+        slot.obs = slot.frames.reset(obs)
+        slot.team_return, slot.length = 0.0, 0
+
+    def next_slot(slot: _Slot | None) -> _Slot | None:
+        if slot is not None:
+            release(slot.env)
+        while True:
+            try:
+                task = pending.get_nowait()
+            except queue.Empty:
+                return None
+            if task.episodes > 0:
+                break
+        slot = _Slot(task, acquire(task))
+        reset(slot)
+        return slot
+
+    def advance(slot: _Slot, actions: np.ndarray) -> _Slot | None:
+        obs, slot.action_mask, rewards, terminated, truncated = step_arrays(slot.env, actions)
+        slot.obs = slot.frames.push(obs)
+        slot.team_return += float(rewards.sum())
+        slot.length += 1
+        done = terminated.any() or truncated.any()
+        if not done and (max_steps is None or slot.length < max_steps):
+            return slot
+        results.append(EpisodeResult(slot.task.seed, slot.task.map_path, slot.team_return, slot.length,
+                                     bool(terminated.any() and not truncated.any())))
+        slot.episode += 1
+        if slot.episode < slot.task.episodes:
+            reset(slot)
+            return slot
+        return next_slot(slot)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, num_envs)) as executor:
+        slots = [slot for slot in executor.map(lambda _: next_slot(None), range(max(1, min(num_envs, len(tasks))))) if slot is not None]
+        while slots:
+            obs = np.stack([slot.obs for slot in slots])
+            masks = [slot.action_mask for slot in slots]
+            action_masks = None
+            if any(mask is not None for mask in masks):
+                width = next(mask for mask in masks if mask is not None).shape
+                action_masks = np.stack([np.zeros(width, dtype=bool) if mask is None else mask for mask in masks])
+            actions = act(policy, obs, action_masks, deterministic, device)
+            slots = [slot for slot in executor.map(advance, slots, actions) if slot is not None]
+    return results, time.perf_counter() - start
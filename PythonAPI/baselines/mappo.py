@@ -0,0 +1,876 @@
+import os
+import sys
+import time
+import copy
+import random
+import warnings
+from typing import TYPE_CHECKING, Callable, Iterable, Any
+from dataclasses import dataclass
+ 
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F 
+
+sys.path.append("..")
+#
+# MAPPOAgent, its networks and load_checkpoint. clean_mappo_baseline.py is the hydra entry point,
+# wandb and mlagents_envs (PeekabooEnv) are imported where they are used
+if TYPE_CHECKING:
+    from peekaboo_environment import PeekabooEnv
+from peekaboo_maps import load_map
+from peekaboo_vec_env import reset_arrays, step_arrays
+from peekaboo_frame_stack import FrameStack
+from peekaboo_obs_codec import RayObservationCodec
+from peekaboo_profiling import LatencyProfiler
+from batched_agents import BatchedActorCritic, MultiAgentActorCritic, SharedActorCritic
+from distributions import MaskedMultiDiscrete
+from rollout_buffer import RolloutBuffer
+from advantages import compute_gae, compute_returns, compute_vtrace
+from async_pipeline import AsyncRollouts
+from evaluation import EvalTask, evaluate, summarize
+from metrics import JsonlSink, MetricsAggregator
+
+def init_layer(layer: nn.Module, std: float=np.sqrt(2), bias_const: float=0.0):        
+    torch.nn.init.orthogonal_(layer.weight, std)
+    torch.nn.init.constant_(layer.bias, bias_const)
+    return layer
+
+def print_dict(d: dict) -> None:
+    for k,v  in d.items():
+        print(f"{k}: \t {v}")
+
+def dict_to_array(d: dict):
+    return np.array(list(d.values()))
+
+def array_to_dict(arr: np.ndarray, keys: Iterable):
+    assert len(arr) == len(keys)
+
+    return {
+        key: arr_el for key, arr_el in zip(keys, arr)
+    }
+
+def flatten_list(l: list) -> list:
+    return [item for sublist in l for item in sublist]
+
+def calc_grad_norm(parameters: Iterable):
+    grads = [
+        param.grad.detach().flatten()
+        for param in parameters
+        if param.grad is not None
+    ]
+    norm = torch.cat(grads).norm()
+    return norm.item()
+
+class CriticNetwork(nn.Module):
+    def __init__(self, state_dim: int, hidden_dim: int) -> None:
+        super().__init__()
+        self.critic_network = nn.Sequential(
+            init_layer(nn.Linear(state_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, 1), std=1)
+        )
+ 
+    def forward(self, state: torch.Tensor) -> torch.Tensor:
+        return self.critic_network(state)
+ 
+ 
+class MultiDiscreteActorNetwork(nn.Module):
+    """
+    An agent that works with MultiDiscrete action space
+    """
+    def __init__(self, state_dim: int, hidden_dim: int, action_space) -> None:
+        super().__init__()
+        self.action_space = action_space
+        self.actor_network = nn.Sequential(
+            init_layer(nn.Linear(state_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, self.action_space.sum()), std=1)
+        )
+
+ 
+    def forward(self, state: torch.Tensor, action_mask: torch.Tensor | None = None, action: torch.Tensor | None=None) -> torch.Tensor:
+        """
+        action_mask: bool (..., sum(branches)), True marks an unavailable action as in mlagents_envs.
+        Returns actions (..., branches), log-probs and entropies summed over branches
+        """
+        logits = self.actor_network(state)
+        distribution = MaskedMultiDiscrete(logits, self.action_space, action_mask)
+        if action is None:
+            action = distribution.sample()
+        return action, distribution.log_prob(action), distribution.entropy()
+
+class DiscreteActorNetwork(nn.Module):
+    """
+    An agent that works with MultiDiscrete action space
+    """
+    def __init__(self, state_dim: int, hidden_dim: int, action_space) -> None:
+        super().__init__()
+        self.action_space = action_space
+        self.actor_network = nn.Sequential(
+            init_layer(nn.Linear(state_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, hidden_dim)),
+            nn.ReLU(),
+            init_layer(nn.Linear(hidden_dim, self.action_space), std=1)
+        )
+
+ 
+    def forward(self, state: torch.Tensor, action_mask: torch.Tensor = None, action: torch.Tensor | None=None) -> torch.Tensor:
+        logits = self.actor_network(state)
+        categorical = torch.distributions.Categorical(logits=logits)
+        if action is None:
+            action = categorical.sample()
+        
+        # print(action.shape, multi_categoricals)
+        logprob = categorical.log_prob(action)
+        entropy = categorical.entropy()
+        return action.T, logprob.sum(0), entropy.sum(0)
+
+
+
+
+class ActorCriticAgent(nn.Module):
+    def __init__(self,
+                 agent_id: str,
+                 environment: "PeekabooEnv",
+                 hidden_dim: int,
+                 cent_critic_state_dim: int | None = None,
+                 stack_size: int = 1,
+                 embedding_dim: int = 0) -> None:
+        super().__init__()
+    
+        #embedding_dim more inputs take the agent embedding of SharedActorCritic
+        state_dim = environment.observation_space(agent=agent_id).shape[0] * stack_size + embedding_dim
+        action_dims = environment.action_space(agent=agent_id).nvec
+        self.actor_network = MultiDiscreteActorNetwork(state_dim=state_dim, hidden_dim=hidden_dim, action_space=action_dims)
+        
+        self.shared_critic = cent_critic_state_dim is not None
+        state_dim = cent_critic_state_dim + embedding_dim if self.shared_critic else state_dim
+        self.critic_network = CriticNetwork(state_dim=state_dim, hidden_dim=hidden_dim)
+
+    def get_value(self, state: torch.Tensor, cent_state: torch.Tensor | None = None):
+        return self.critic_network(state if not self.shared_critic else cent_state)
+
+    
+    def get_action(self, state: torch.Tensor,  action_mask: torch.Tensor | None = None, action: torch.Tensor | None=None):
+        env_action, logprob, entropy = self.actor_network(state, action_mask=action_mask, action=action)
+        return env_action, logprob, entropy
+    
+    def get_action_and_value(self, state: torch.Tensor, 
+                                   cent_state: torch.Tensor | None = None,
+                                   action_mask: torch.Tensor | None = None, 
+                                   action: torch.Tensor | None=None):
+        value = self.get_value(state, cent_state)
+        env_action, logprob, entropy = self.get_action(state, action_mask=action_mask, action=action)
+        return value, env_action, logprob, entropy
+
+
+def agent_teams(environment, team_map: str | None = None) -> list[int]:
+    """
+    1 for Active and 0 for Passive agents in possible_agents order: from the Types of the map json `team_map`,
+    of the stand-in's own map without one, all Passive when neither is known
+    """
+    if team_map is not None:
+        teams = [int(agent.type == "Active") for agent in load_map(team_map).agents]
+        if len(teams) != len(environment.possible_agents):
+            raise ValueError(f"{team_map} has {len(teams)} agents, the environment runs {len(environment.possible_agents)}")
+        return teams
+    active = getattr(environment, "agent_active", None)
+    if active is None:
+        warnings.warn("No team_map for the environment, every agent gets the Passive team embedding")
+        return [0] * len(environment.possible_agents)
+    return [int(agent_active) for agent_active in active]
+
+
+
+@dataclass
+class MAPPOAgent:
+    config: dict
+    agent_hidden_dim: int
+
+    environment: "PeekabooEnv" #not closed by learn/eval, it belongs to whoever made it (e.g. an EnvPool lease)
+    shared_critic: bool
+    shared_optimization: bool #one actor-critic for all agents (SharedActorCritic), one batch and one optimizer step per minibatch
+
+    ent_coeff: float 
+    vf_coeff: float 
+    clip_coeff: float 
+    gamma: float 
+    gae: bool 
+    gae_lambda: float
+    clip_vloss: bool 
+
+    batch_size: int 
+    num_minibatches: int 
+    stack_size: int #observations of the last stack_size steps are stacked for the networks, in Python (see peekaboo_frame_stack)
+
+    total_timesteps: int 
+    num_learning_epochs: int
+    num_steps: int 
+    num_eval_steps: int #step limit of evaluation episodes
+    num_estimations: int # not used
+
+    seed: int | None 
+    torch_deterministic: bool 
+
+    lr: float 
+    anneal_lr: bool 
+    device: str
+    max_grad_norm: float 
+    target_kl: float | None 
+
+    track_wandb: bool 
+    wandb_project_name: str | None = None
+    wandb_run_name: str | None = None
+
+    batched_agents: bool = False #evaluate all agents with one stacked forward pass instead of a loop
+    pin_memory: bool = False #keep the rollout buffer in page-locked host memory (CUDA only)
+
+    async_training: bool = False #actors step environments on background threads while the learner updates, see learn_async
+    num_actors: int = 1 #actor threads in async mode, one per environment
+    rollout_queue_size: int = 2 #completed rollouts waiting for the learner, actors block when it is full
+    max_policy_lag: int = 3 #rollouts collected more than this many updates ago are dropped
+    off_policy_correction: str = "ppo" #"ppo": clipped ratio to the behaviour policy, "vtrace": V-trace targets and advantages
+    vtrace_clip: float = 1.0 #rho and c truncation of V-trace
+    actor_environments: list | None = None #environments of the other num_actors - 1 actors, the first one steps `environment`
+
+    profile_latency: bool = False #latency histograms of environment and training phases, logged with every update
+    latency_report: str | None = None #json file the final latency summary is written to
+
+    num_eval_episodes: int = 10 #episodes of eval(), spread over `environment` and `actor_environments`
+    checkpoint_path: str | None = None #the trained agents are saved there at the end of learn(), see evaluate_mappo.py
+
+    agent_embedding_dim: int = 16 #shared_optimization: size of the learned agent id and team embeddings
+    team_map: str | None = None #shared_optimization: map json with the agents' Active/Passive Types, see agent_teams
+
+    log_window: int = 100 #steps (updates in async mode) whose metrics are reduced into one log, on a background thread
+    metrics_path: str | None = None #logs are appended there as json lines as well
+    observation_codec: str | None = None #"float16" or "uint8": rollout observations stored as RayObservationCodec codes
+
+
+    def __post_init__(self):
+        self.device = torch.device(self.device)
+        self.possible_agents = self.environment.possible_agents 
+        self.num_agents = len(self.possible_agents)
+
+        self.centralized_observation_shape = np.sum([self.environment.observation_space(agent_id).shape[0] for agent_id in self.possible_agents]) 
+        cent_critic_state_dim = self.centralized_observation_shape * self.stack_size if self.shared_critic else None
+        if self.shared_optimization:
+            #the batched code path with a single network, no per-agent networks are built
+            self.batched_agents = True
+            self.agents = []
+            self.teams = agent_teams(self.environment, self.team_map)
+            shared_agent = ActorCriticAgent(agent_id=self.possible_agents[0],
+                                            environment=self.environment,
+                                            hidden_dim=self.agent_hidden_dim,
+                                            cent_critic_state_dim=cent_critic_state_dim,
+                                            stack_size=self.stack_size,
+                                            embedding_dim=self.agent_embedding_dim)
+            self.batched_agent = SharedActorCritic(shared_agent, self.teams, self.agent_embedding_dim).to(self.device)
+            self.optimizers = [torch.optim.AdamW(self.batched_agent.parameters(), lr=self.lr, eps=1e-5)]
+        else:
+            self.agents = [
+                ActorCriticAgent(agent_id=agent_id, 
+                                 environment=self.environment, 
+                                 hidden_dim=self.agent_hidden_dim, 
+                                 cent_critic_state_dim=cent_critic_state_dim,
+                                 stack_size=self.stack_size).to(self.device) 
+                for agent_id in self.possible_agents
+                ]
+            self.optimizers = [torch.optim.AdamW(self.agents[i].parameters(), lr=self.lr, eps=1e-5) for i in range(self.num_agents)]
+        if self.batched_agents and not self.shared_optimization:
+            #AdamW is elementwise, so one optimizer over the stacked parameters steps every agent exactly like its own optimizer would
+            self.batched_agent = BatchedActorCritic(self.agents)
+            self.optimizers = [torch.optim.AdamW(self.batched_agent.parameters(), lr=self.lr, eps=1e-5)]
+
+        self.rollout_buffer = self._make_rollout_buffer()
+        if self.async_training and len(self.actor_environments or []) != self.num_actors - 1:
+            raise ValueError(f"num_actors = {self.num_actors} needs {self.num_actors - 1} actor_environments besides `environment`")
+        if self.off_policy_correction not in ("ppo", "vtrace"):
+            raise ValueError(f"Unknown off_policy_correction {self.off_policy_correction}, use 'ppo' or 'vtrace'")
+        self.profiler = self._enable_profiling() if self.profile_latency else None
+
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+        torch.manual_seed(self.seed)
+        torch.backends.cudnn.deterministic = self.torch_deterministic
+
+        if self.track_wandb:
+            import wandb
+            wandb.init(
+                            project=self.wandb_project_name,
+                            name=self.wandb_run_name,
+                            save_code=True,
+                            config=self.config
+                        )
+        #print_dict is looked up at every call, so that it can be replaced
+        sinks = [wandb.log] if self.track_wandb else [lambda logs: print_dict(logs)]
+        if self.metrics_path is not None:
+            sinks.append(JsonlSink(self.metrics_path))
+        self.metrics = MetricsAggregator(sinks, window=self.log_window)
+        self._metric_ids = self._register_metrics()
+
+    def _register_metrics(self) -> dict[str, int]:
+        """
+        Handles of the metrics recorded every step and every learning epoch, reduced over log_window steps
+        """
+        metrics = self.metrics
+        ids = {"episode length": metrics.scalar("episode length", "last"),
+               "episode return": metrics.vector("episode return", self.possible_agents, "last"),
+               "epoch": metrics.scalar("epoch", "last"),
+               "lr": metrics.scalar("lr", "last"),
+               "grad norm": metrics.scalar(f"grad norm/{self.possible_agents[-1]}"),
+               "losses/expalined var": metrics.scalar("losses/expalined var"),
+               "time per step": metrics.scalar("time per step", "last")}
+        for name in ("value loss", "pg loss", "entropy loss", "overall loss", "approx_kl"):
+            ids[f"losses/{name}"] = metrics.vector(f"losses/{name}", self.possible_agents)
+        return ids
+
+    def _enable_profiling(self) -> LatencyProfiler:
+        """
+        Times the phases of collection and updates, and the environments' own phases if they support it.
+        "/self" phases exclude nested ones: "mappo/collect/self" is tensor conversion and buffer writes,
+        "mappo/environment step/self" the conversion of the dict API outputs
+        """
+        profiler = LatencyProfiler()
+        for environment in [self.environment, *(self.actor_environments or [])]:
+            if hasattr(environment, "enable_profiling"):
+                environment.enable_profiling(profiler)
+        phases = {"_collect": "mappo/collect", "_act": "mappo/policy forward", "_step_environment": "mappo/environment step",
+                  "_compute_advantages": "mappo/advantages", "_update": "mappo/update"}
+        for name, phase in phases.items():
+            profiler.instrument(self, name, phase, self_time=name in ("_collect", "_step_environment"))
+        return profiler
+
+    def _report_latency(self) -> None:
+        if self.profiler is not None and self.latency_report is not None:
+            self.profiler.save_json(self.latency_report)
+
+    def _make_rollout_buffer(self) -> RolloutBuffer:
+        action_space = self.environment.action_space(self.possible_agents[0]).nvec
+        #the centralised state is the observations of all agents, a view of them instead of a copy
+        return RolloutBuffer(num_steps=self.num_steps,
+                             num_envs=1,
+                             num_agents=self.num_agents,
+                             obs_dim=self.environment.observation_space(self.possible_agents[0]).shape[0],
+                             cent_obs_dim=None,
+                             mask_dim=int(action_space.sum()),
+                             num_branches=len(action_space),
+                             device=self.device,
+                             pin_memory=self.pin_memory,
+                             stack_size=self.stack_size,
+                             obs_codec=None if self.observation_codec is None
+                                       else RayObservationCodec.for_environment(self.environment, self.observation_codec))
+
+    def _reset_environment(self, environment=None) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Observations (num_agents, obs_dim) and action masks (num_agents, sum(branches)) or None,
+        rows follow possible_agents whichever API the environment (self.environment by default) speaks
+        """
+        return reset_arrays(self.environment if environment is None else environment)
+
+    def _step_environment(self, actions: np.ndarray, environment=None) -> tuple[np.ndarray, np.ndarray | None, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        actions (num_agents, num_branches) -> observations, action masks, rewards, terminated, truncated.
+        Array mode environments reuse their output buffers, the dict API is converted here
+        """
+        return step_arrays(self.environment if environment is None else environment, actions)
+
+    def _policy(self):
+        """
+        The module(s) collection and updates run through: the stacked agents or the list of per-agent networks
+        """
+        return self.batched_agent if self.batched_agents else self.agents
+
+    def _unstack_agents(self) -> None:
+        #the per-agent networks take the parameters trained in their stacked copy, a SharedActorCritic is trained in place
+        policy = self._policy()
+        if isinstance(policy, BatchedActorCritic):
+            policy.unstack_into(self.agents)
+
+    def _cent_state(self, step_obs: torch.Tensor) -> torch.Tensor:
+        """
+        Stacked observations (num_agents, stack_size * obs_dim) -> centralised state (1, stack_size * cent_obs_dim),
+        the frames of all agents oldest first as in the rollout buffer
+        """
+        return step_obs.reshape(self.num_agents, self.stack_size, -1).transpose(0, 1).reshape(1, -1)
+
+    @torch.no_grad()
+    def _act(self, policy, step_obs: torch.Tensor, step_action_mask: torch.Tensor | None):
+        """
+        step_obs (num_agents, stack_size * obs_dim), step_action_mask (num_agents, 1, sum(branches)) ->
+        values, actions, log-probs and entropies of all agents
+        """
+        if self.batched_agents:
+            return policy.get_action_and_value(step_obs.unsqueeze(1),
+                                               cent_state=self._cent_state(step_obs) if self.shared_critic else None,
+                                               action_mask=step_action_mask)
+        step_outputs = [
+            policy[agent_ind].get_action_and_value(step_obs[agent_ind],
+                                                   cent_state=self._cent_state(step_obs).reshape(-1) if self.shared_critic else None,
+                                                   action_mask=None if step_action_mask is None else step_action_mask[agent_ind, 0])
+            for agent_ind in range(self.num_agents)
+        ]
+        return (torch.stack([output[i].flatten() for output in step_outputs]) for i in range(4))
+
+    @torch.no_grad()
+    def _values(self, policy, obs: torch.Tensor, cent_obs: torch.Tensor) -> torch.Tensor:
+        """
+        obs (T, num_agents, stack_size * obs_dim), cent_obs (T, stack_size * cent_dim) -> values (T, num_agents)
+        """
+        if self.batched_agents:
+            return policy.get_value(obs.transpose(0, 1), cent_state=cent_obs if self.shared_critic else None).transpose(0, 1)
+        return torch.stack(
+            [
+                policy[agent_ind].get_value(obs[:, agent_ind], cent_state=cent_obs if self.shared_critic else None).reshape(-1)
+                for agent_ind in range(self.num_agents)
+            ], dim=1
+        )
+
+    def _collect(self, rb: RolloutBuffer, policy, environment, log_steps: bool = True, update: int = 0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Resets `environment` and fills `rb` until num_steps or the end of the episode.
+        Returns the (stacked) observations after the last step and the episodic returns
+        """
+        episodic_return = np.zeros((self.num_agents))
+
+        next_obs, next_action_mask = self._reset_environment(environment)
+        #the policy sees stacks, the buffer stores frames
+        frames = FrameStack(self.num_agents, next_obs.shape[-1], self.stack_size)
+        next_stacked = frames.reset(next_obs)
+        rb.reset()
+        for collection_step in range(self.num_steps):
+            step_action_mask = None if next_action_mask is None else torch.from_numpy(next_action_mask).to(self.device).unsqueeze(1)
+            #copied (or encoded) out of the environment's array before it is overwritten, cent_obs is a view of obs
+            rb.insert(collection_step, obs=next_obs)
+            if step_action_mask is not None:
+                rb.insert(collection_step, action_masks=step_action_mask)
+
+            value, action, logprob, entropy = self._act(policy, torch.from_numpy(next_stacked).to(self.device), step_action_mask)
+            rb.insert(collection_step, values=value, actions=action, logprobs=logprob, entropies=entropy)
+
+            numpy_actions = action.reshape(self.num_agents, -1).cpu().numpy()
+            next_obs, next_action_mask, reward_arr, terminated, truncated = self._step_environment(numpy_actions, environment)
+            next_stacked = frames.push(next_obs)
+
+            rb.insert(collection_step, rewards=reward_arr)
+            episodic_return += reward_arr
+            #interrupted episodes hit the step limit, the value of their last state is bootstrapped
+            rb.insert(collection_step, terminations=terminated, truncations=truncated)
+
+            episode_length = collection_step + update
+            if terminated.any() or truncated.any():
+                break
+
+            if log_steps:
+                self.metrics.record(self._metric_ids["episode length"], episode_length)
+                self.metrics.record(self._metric_ids["episode return"], episodic_return)
+                self.metrics.step()
+        #array mode environments and the frame stack overwrite their outputs on the next reset
+        return next_stacked.copy(), episodic_return
+
+    @torch.no_grad()
+    def _compute_advantages(self, rb: RolloutBuffer, next_obs: np.ndarray, policy, refresh_values: bool = False,
+                            correction: str | None = None) -> None:
+        """
+        Fills rb.advantages and rb.returns, bootstrapping with the value of `next_obs` under `policy`.
+        Rollouts of an older policy (async mode) get the values of `policy` with `refresh_values`,
+        and with the "vtrace" correction V-trace targets and advantages, log-probs of `policy` become the PPO reference
+        """
+        length = rb.length
+        cent_obs = rb.sample_major("cent_obs", length)
+        last_cent_obs = rb.gather(cent_obs, [length - 1])
+        next_value = self._values(policy, torch.from_numpy(next_obs).to(self.device).unsqueeze(0), last_cent_obs)
+        next_value = next_value.reshape(1, -1).to(rb.storage_device)
+        if refresh_values:
+            values = self._values(policy, rb.gather(rb.agent_major("obs", length)).transpose(0, 1), rb.gather(cent_obs))
+            rb.values[:length, 0].copy_(values)
+
+        #steps after an early stop hold the previous rollout
+        valid = (torch.arange(self.num_steps, device=rb.storage_device) < length)[:, None, None]
+        if correction == "vtrace":
+            logprobs = self._logprobs(policy, rb)
+            log_rhos = torch.zeros_like(rb.logprobs)
+            log_rhos[:length] = logprobs - rb.logprobs[:length]
+            returns, advantages = compute_vtrace(rb.rewards, rb.values, rb.terminations, rb.truncations, next_value, log_rhos,
+                                                 self.gamma, self.gae_lambda if self.gae else 1.0,
+                                                 rho_clip=self.vtrace_clip, c_clip=self.vtrace_clip, valid=valid)
+            rb.logprobs[:length].copy_(logprobs)
+        elif self.gae:
+            advantages = compute_gae(rb.rewards, rb.values, rb.terminations, rb.truncations, next_value,
+                                     self.gamma, self.gae_lambda, valid=valid)
+            returns = advantages + rb.values
+        else:
+            returns = compute_returns(rb.rewards, rb.terminations, rb.truncations, next_value, self.gamma, valid=valid)
+            advantages = returns - rb.values
+        rb.advantages.copy_(advantages)
+        rb.returns.copy_(returns)
+
+    @torch.no_grad()
+    def _logprobs(self, policy, rb: RolloutBuffer) -> torch.Tensor:
+        """
+        Log-probs (length, 1, num_agents) of the stored actions under `policy`
+        """
+        length = rb.length
+        obs, actions = rb.gather(rb.agent_major("obs", length)), rb.agent_major("actions", length).to(self.device)
+        action_masks = rb.agent_major("action_masks", length).to(self.device) if rb.has_action_masks else None
+        if self.batched_agents:
+            _, logprobs, _ = policy.get_action(obs, action_mask=action_masks, action=actions)
+        else:
+            logprobs = torch.stack([
+                policy[agent_ind].get_action(obs[agent_ind], action_mask=None if action_masks is None else action_masks[agent_ind],
+                                             action=actions[agent_ind])[1]
+                for agent_ind in range(self.num_agents)
+            ])
+        return logprobs.transpose(0, 1).reshape(length, 1, self.num_agents).to(rb.storage_device)
+
+    def _log(self, logs: dict) -> None:
+        #a ready dict, passed to wandb or printed on the metrics thread
+        self.metrics.log(logs)
+
+    def _set_lr(self, update: int, num_updates: int) -> None:
+        if self.anneal_lr:
+            frac = 1.0 - (update - 1.0) / num_updates
+            lrnow = frac * self.lr
+
+            for optimizer in self.optimizers:
+                optimizer.param_groups[0]["lr"] = lrnow
+
+    def learn(self):
+        if self.async_training:
+            return self.learn_async()
+
+        start_time = time.time()
+        num_updates = self.total_timesteps
+        rb = self.rollout_buffer
+
+        for update in range(1, num_updates+1):
+            self._set_lr(update, num_updates)
+            next_obs, _ = self._collect(rb, self._policy(), self.environment, update=update)
+            self._compute_advantages(rb, next_obs, self._policy())
+            self._update(rb, start_time)
+            if self.profiler is not None:
+                self._log(self.profiler.logs())
+
+        self._unstack_agents()
+        self.metrics.flush()
+        self._report_latency()
+        if self.checkpoint_path is not None:
+            self.save_checkpoint(self.checkpoint_path)
+
+    def learn_async(self):
+        """
+        Actor threads, one per environment (`environment` and `actor_environments`), collect rollouts with the latest
+        published policy while the learner updates on completed ones taken from a bounded queue.
+        Rollouts more than max_policy_lag updates old are dropped, the rest is corrected with off_policy_correction:
+        "ppo" recomputes values and GAE with the current critic and clips the ratio to the behaviour policy,
+        "vtrace" trains on V-trace targets and advantages, clipping the ratio to the current policy.
+        """
+        start_time = time.time()
+        num_updates = self.total_timesteps
+        environments = [self.environment, *(self.actor_environments or [])]
+        #a Module, so the parameters can be published to the actors
+        policy = self.batched_agent if self.batched_agents else nn.ModuleList(self.agents)
+        buffers = [self.rollout_buffer] + [self._make_rollout_buffer() for _ in range(len(environments) + self.rollout_queue_size - 1)]
+        pipeline = AsyncRollouts(lambda rb, actor_policy, environment: self._collect(rb, actor_policy, environment, log_steps=False),
+                                 policy, environments, buffers, self.rollout_queue_size)
+
+        update, dropped = 0, 0
+        try:
+            while update < num_updates:
+                rollout = pipeline.get()
+                policy_lag = pipeline.version - rollout.policy_version
+                if policy_lag > self.max_policy_lag:
+                    dropped += 1
+                    pipeline.release(rollout)
+                    continue
+
+                update += 1
+                with pipeline.learning():
+                    self._set_lr(update, num_updates)
+                    self._compute_advantages(rollout.buffer, rollout.next_obs, policy, refresh_values=True,
+                                             correction=self.off_policy_correction)
+                    self._update(rollout.buffer, start_time)
+                    pipeline.publish(policy)
+                    self.metrics.step()
+                pipeline.release(rollout)
+
+                self._log({"episode length": rollout.buffer.length,
+                           "episode return": array_to_dict(rollout.episodic_return, self.possible_agents),
+                           "async/policy lag": policy_lag,
+                           "async/dropped rollouts": dropped,
+                           **pipeline.utilization(),
+                           **(self.profiler.logs() if self.profiler is not None else {})})
+        finally:
+            pipeline.close()
+
+        self._unstack_agents()
+        self.metrics.flush()
+        self._report_latency()
+        if self.checkpoint_path is not None:
+            self.save_checkpoint(self.checkpoint_path)
+
+    def _update(self, rb: RolloutBuffer, start_time: float) -> None:
+        """
+        num_learning_epochs of PPO over the collected part of `rb`
+        """
+        agent_ids = self.possible_agents
+        has_action_mask = rb.has_action_masks
+
+        #views of the buffer with one row per (step, agent) sample, minibatches gather rows out of them
+        num_collected = rb.length
+        b_obs = rb.sample_major("obs")
+        b_cent_obs = rb.sample_major("cent_obs")
+        b_action_masks = rb.sample_major("action_masks")
+
+        b_logprobs = rb.sample_major("logprobs")
+        b_actions = rb.sample_major("actions")
+
+        b_advantages = rb.sample_major("advantages")
+        b_returns = rb.sample_major("returns")
+        b_values = rb.sample_major("values")
+
+        # Optimizing the policy and value network
+        b_inds = np.arange(min(self.batch_size, len(b_obs)))
+        if self.batched_agents:
+            #(agents, steps, ...) layout, every agent is trained on its own samples, batch_size counts steps
+            batch = {key: rb.agent_major(key) for key in ("obs", "actions", "logprobs", "advantages", "returns", "values")}
+            batch["cent_obs"] = b_cent_obs
+            batch["action_masks"] = rb.agent_major("action_masks") if has_action_mask else None
+            b_inds = np.arange(min(self.batch_size, num_collected))
+        clipfracs = []
+        for learning_epoch in range(self.num_learning_epochs):
+            np.random.shuffle(b_inds)
+            
+            minibatch_size  = len(b_inds)//self.num_minibatches
+            policy_losses = np.zeros((self.num_minibatches+2, len(agent_ids)))
+            value_losses = np.zeros((self.num_minibatches+2, len(agent_ids)))
+            entropy_losses = np.zeros((self.num_minibatches+2, len(agent_ids)))
+            losses = np.zeros((self.num_minibatches+2, len(agent_ids)))
+            approx_kls = np.zeros((self.num_minibatches+2, len(agent_ids)))
+
+            clipfracs_per_agent = []
+            for start in range(0, len(b_inds), minibatch_size):
+                end = start + minibatch_size
+                mb_inds = b_inds[start:end]
+                minibatch_ind = start // minibatch_size
+
+                if self.batched_agents:
+                    minibatch_stats = self._batched_minibatch_update(rb, batch, mb_inds)
+                    policy_losses[minibatch_ind] = minibatch_stats["pg_loss"]
+                    value_losses[minibatch_ind] = minibatch_stats["v_loss"]
+                    entropy_losses[minibatch_ind] = minibatch_stats["entropy_loss"]
+                    losses[minibatch_ind] = minibatch_stats["loss"]
+                    approx_kls[minibatch_ind] = minibatch_stats["approx_kl"]
+                    clipfracs_per_agent += minibatch_stats["clipfrac"].tolist()
+                    approx_kl = minibatch_stats["approx_kl"].max()
+                    continue
+
+                mb_returns, mb_values = rb.gather(b_returns, mb_inds), rb.gather(b_values, mb_inds)
+                for agent_ind in range(self.num_agents):
+                    mb_action_mask = rb.gather(b_action_masks, mb_inds) if has_action_mask else None
+                    newvalue, _, newlogprob, entropy= self.agents[agent_ind].get_action_and_value(rb.gather(b_obs, mb_inds), 
+                                                                                                 cent_state=rb.gather(b_cent_obs, mb_inds // self.num_agents) if self.shared_critic else None,
+                                                                                                 action_mask=mb_action_mask, 
+                                                                                                 action=rb.gather(b_actions, mb_inds))
+                    logratio = newlogprob - rb.gather(b_logprobs, mb_inds)
+                    ratio = logratio.exp()
+
+                    with torch.no_grad():
+                        # calculate approx_kl http://joschu.net/blog/kl-approx.html
+                        # old_approx_kl = (-logratio).mean()
+                        approx_kl = ((ratio - 1) - logratio).mean()
+                        approx_kls[minibatch_ind][agent_ind] = approx_kl
+                        clipfracs_per_agent += [((ratio - 1.0).abs() > self.clip_coeff).float().mean().item()]
+                
+                    mb_advantages = rb.gather(b_advantages, mb_inds)
+                    mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
+
+                    # Policy loss
+            
+                    pg_loss1 = -mb_advantages * ratio
+                    pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - self.clip_coeff, 1 + self.clip_coeff)
+                    pg_loss = torch.max(pg_loss1, pg_loss2).mean()
+                    
+                    policy_losses[minibatch_ind][agent_ind] = pg_loss.item()
+                    # Value loss
+                    newvalue = newvalue.flatten()
+                    if self.clip_vloss:
+                        v_loss_unclipped = (newvalue - mb_returns) ** 2
+                        v_clipped = mb_values + torch.clamp(
+                            newvalue - mb_values,
+                            -self.clip_coeff,
+                            self.clip_coeff,
+                        )
+                        v_loss_clipped = (v_clipped - mb_returns) ** 2
+                        v_loss_max = torch.max(v_loss_unclipped, v_loss_clipped)
+                        v_loss = 0.5 * v_loss_max.mean()
+                    else:
+                        v_loss = 0.5 * ((newvalue - mb_returns) ** 2).mean()
+                    
+                    value_losses[minibatch_ind][agent_ind] =v_loss.item()
+
+                    entropy_loss = entropy.mean()
+                    entropy_losses[minibatch_ind][agent_ind] = entropy_loss.item()
+
+                    loss = pg_loss - self.ent_coeff * entropy_loss + v_loss * self.vf_coeff
+                    losses[minibatch_ind][agent_ind] = loss.item()
+
+                    self.optimizers[agent_ind].zero_grad()
+                    loss.backward()
+                    nn.utils.clip_grad_norm_(self.agents[agent_ind].parameters(), self.max_grad_norm)
+                    self.optimizers[agent_ind].step()
+            
+            clipfracs += clipfracs_per_agent
+            
+
+            y_pred, y_true = b_values.cpu().numpy(), b_returns.cpu().numpy()
+            var_y = np.var(y_true)
+            explained_var = np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
+
+            if self.batched_agents:
+                grad_norm = self.batched_agent.member_grad_norms()[-1].item()
+            else:
+                grad_norm = calc_grad_norm(self.agents[-1].parameters())
+            training_metrics = (
+                            ("epoch", learning_epoch),
+                            ("lr", self.optimizers[-1].param_groups[0]["lr"]),
+                            ("grad norm", grad_norm),
+                            ("losses/value loss", value_losses.mean(0)),
+                            ("losses/pg loss", policy_losses.mean(0)),
+                            ("losses/entropy loss", entropy_losses.mean(0)),
+                            ("losses/overall loss", losses.mean(0)),
+                            ("losses/approx_kl", approx_kls.mean(0)),
+                            ("losses/expalined var", explained_var),
+                            ("time per step", time.time() - start_time),
+                            )
+            for name, value in training_metrics:
+                self.metrics.record(self._metric_ids[name], value)
+
+            if self.target_kl is not None:
+                if approx_kl > self.target_kl:
+                    break
+
+    def _batched_minibatch_update(self, rb: RolloutBuffer, batch: dict, mb_inds: np.ndarray) -> dict:
+        """
+        One PPO step of all agents at once: the loss is the sum of per-agent losses,
+        so every agent's slice of the stacked parameters gets exactly its own gradient.
+        A shared network is trained on the mean over all samples instead, with advantages normalised over the whole minibatch
+        """
+        minibatch = {
+            key: None if view is None else rb.gather(view, mb_inds, dim=0 if key == "cent_obs" else 1)
+            for key, view in batch.items()
+        }
+        newvalue, _, newlogprob, entropy = self.batched_agent.get_action_and_value(minibatch["obs"],
+                                                                                   cent_state=minibatch["cent_obs"] if self.shared_critic else None,
+                                                                                   action_mask=minibatch["action_masks"],
+                                                                                   action=minibatch["actions"])
+        logratio = newlogprob - minibatch["logprobs"]
+        ratio = logratio.exp()
+
+        with torch.no_grad():
+            approx_kl = ((ratio - 1) - logratio).mean(1)
+            clipfrac = ((ratio - 1.0).abs() > self.clip_coeff).float().mean(1)
+
+        mb_advantages = minibatch["advantages"]
+        if self.shared_optimization:
+            mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
+        elif mb_advantages.shape[1] > 1: #short rollouts after an early stop can leave one step per minibatch
+            mb_advantages = (mb_advantages - mb_advantages.mean(1, keepdim=True)) / (mb_advantages.std(1, keepdim=True) + 1e-8)
+
+        pg_loss1 = -mb_advantages * ratio
+        pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - self.clip_coeff, 1 + self.clip_coeff)
+        pg_loss = torch.max(pg_loss1, pg_loss2).mean(1)
+
+        mb_returns, mb_values = minibatch["returns"], minibatch["values"]
+        if self.clip_vloss:
+            v_loss_unclipped = (newvalue - mb_returns) ** 2
+            v_clipped = mb_values + torch.clamp(newvalue - mb_values, -self.clip_coeff, self.clip_coeff)
+            v_loss_clipped = (v_clipped - mb_returns) ** 2
+            v_loss = 0.5 * torch.max(v_loss_unclipped, v_loss_clipped).mean(1)
+        else:
+            v_loss = 0.5 * ((newvalue - mb_returns) ** 2).mean(1)
+
+        entropy_loss = entropy.mean(1)
+        loss = pg_loss - self.ent_coeff * entropy_loss + v_loss * self.vf_coeff
+
+        self.optimizers[0].zero_grad()
+        (loss.mean() if self.shared_optimization else loss.sum()).backward()
+        self.batched_agent.clip_grad_norm_(self.max_grad_norm)
+        self.optimizers[0].step()
+
+        return {
+            "pg_loss": pg_loss.detach().cpu().numpy(),
+            "v_loss": v_loss.detach().cpu().numpy(),
+            "entropy_loss": entropy_loss.detach().cpu().numpy(),
+            "loss": loss.detach().cpu().numpy(),
+            "approx_kl": approx_kl.cpu().numpy(),
+            "clipfrac": clipfrac.cpu().numpy(),
+        }
+
+    def save_checkpoint(self, path: str) -> None:
+        """
+        Parameters of every agent (of the shared network with shared_optimization) and what it takes to rebuild them,
+        see load_checkpoint
+        """
+        checkpoint = {"agents": [agent.state_dict() for agent in self.agents],
+                      "possible_agents": list(self.possible_agents),
+                      "agent_hidden_dim": self.agent_hidden_dim,
+                      "shared_critic": self.shared_critic,
+                      "stack_size": self.stack_size}
+        if self.shared_optimization:
+            checkpoint.update({"shared_agent": self.batched_agent.state_dict(), "teams": list(self.teams),
+                               "agent_embedding_dim": self.agent_embedding_dim})
+        torch.save(checkpoint, path)
+
+    def eval(self, num_episodes: int | None = None, deterministic: bool = True) -> dict[str, float]:
+        """
+        `num_episodes` (num_eval_episodes by default) episodes of at most num_eval_steps steps, spread over `environment`
+        and `actor_environments` that step concurrently, with greedy (`deterministic`) or sampled actions.
+        The summary (means and confidence intervals of return, success rate and episode length, episodes per minute) is logged and returned
+        """
+        num_episodes = self.num_eval_episodes if num_episodes is None else num_episodes
+        environments = [self.environment, *(self.actor_environments or [])][:max(1, num_episodes)]
+        #the environments stay open, a task takes one of them and hands it back
+        tasks = [EvalTask(seed=None, map_path=None, episodes=len(range(i, num_episodes, len(environments)))) for i in range(len(environments))]
+        free = list(environments)
+        policy = self.batched_agent if self.batched_agents else BatchedActorCritic(self.agents)
+        results, elapsed = evaluate(policy, tasks, acquire=lambda task: free.pop(), release=free.append, num_envs=len(environments),
+                                    stack_size=self.stack_size, deterministic=deterministic, max_steps=self.num_eval_steps,
+                                    device=self.device)
+        summary = summarize(results, elapsed)
+        self._log({f"evaluation/{key}": value for key, value in summary.items()})
+        self.metrics.flush()
+        return summary
+
+
+def load_checkpoint(path: str, environment, device: torch.device | str = "cpu") -> tuple[MultiAgentActorCritic, dict]:
+    """
+    The agents saved by MAPPOAgent.save_checkpoint, stacked for batched inference (or the SharedActorCritic), and the checkpoint.
+    `environment` gives the observation and action spaces, it has to run as many agents
+    """
+    checkpoint = torch.load(path, map_location=device)
+    num_agents = len(checkpoint["possible_agents"])
+    if num_agents != len(environment.possible_agents):
+        raise ValueError(f"The checkpoint has {num_agents} agents, the environment runs {len(environment.possible_agents)}")
+    cent_dim = sum(environment.observation_space(agent_id).shape[0] for agent_id in environment.possible_agents) * checkpoint["stack_size"]
+    if "shared_agent" in checkpoint:
+        agent = ActorCriticAgent(agent_id=environment.possible_agents[0], environment=environment, hidden_dim=checkpoint["agent_hidden_dim"],
+                                 cent_critic_state_dim=cent_dim if checkpoint["shared_critic"] else None,
+                                 stack_size=checkpoint["stack_size"], embedding_dim=checkpoint["agent_embedding_dim"])
+        policy = SharedActorCritic(agent, checkpoint["teams"], checkpoint["agent_embedding_dim"])
+        policy.load_state_dict(checkpoint["shared_agent"])
+        return policy.to(device).eval(), checkpoint
+    agents = []
+    for agent_id, state in zip(environment.possible_agents, checkpoint["agents"]):
+        agent = ActorCriticAgent(agent_id=agent_id, environment=environment, hidden_dim=checkpoint["agent_hidden_dim"],
+                                 cent_critic_state_dim=cent_dim if checkpoint["shared_critic"] else None,
+                                 stack_size=checkpoint["stack_size"])
+        agent.load_state_dict(state)
+        agents.append(agent.to(device))
+    return BatchedActorCritic(agents).eval(), checkpoint
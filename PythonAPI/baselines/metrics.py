@@ -0,0 +1,193 @@
+import json
+import queue
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+#
+# Metrics of the hot loops, written into preallocated arrays and reduced per window of steps on a background thread:
+# recording a value is an array write, building dicts and calling wandb.log / print / json happens off the loop.
+
+REDUCTIONS: tuple[str, ...] = ("mean", "min", "max", "last")
+
+
+@dataclass
+class _Metric:
+    name: str
+    rows: slice #rows of the window arrays
+    keys: list | None #a vector metric is logged as {key: value}, like array_to_dict
+    reduction: str
+
+
+class _Window:
+    #values (rows, window) as a ring per metric, counts of the values recorded into each metric during the window
+    #(a list, Python ints are cheaper to update than NumPy scalars)
+    def __init__(self, num_rows: int, num_metrics: int, window: int) -> None:
+        self.values = np.zeros((num_rows, window))
+        self.counts = [0] * num_metrics
+
+
+class JsonlSink:
+    def __init__(self, path: str) -> None:
+        """
+        Appends every log to `path` as one json line
+        """
+        self._file = open(path, "a")
+
+    def __call__(self, logs: dict) -> None:
+        self._file.write(json.dumps(logs, default=float) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class MetricsAggregator:
+    def __init__(self, sinks: Iterable[Callable[[dict], None]], window: int = 100, num_buffers: int = 3) -> None:
+        """
+        Scalars and vectors registered once (scalar(), vector()) and recorded with record(), every `window` step() calls
+        the values recorded meanwhile are reduced (mean, min, max or last, at most the last `window` values of a metric)
+        and the resulting dict is passed to every sink, e.g. wandb.log, print_dict or a JsonlSink.
+        Sinks run on a background thread in the order logs were made, log() passes a ready dict along the same way.
+        `num_buffers` windows can wait for the thread before step() blocks.
+        Not thread-safe: record and step from one thread.
+        """
+        if window < 1:
+            raise ValueError(f"window has to be positive, got {window}")
+        self.sinks = list(sinks)
+        self.window = window
+        self.num_buffers = num_buffers
+        self._metrics: list[_Metric] = []
+        self._rows: list[int | slice] = [] #row index of a scalar, rows of a vector
+        self._num_rows = 0
+        self._steps = 0
+        self._active: _Window | None = None
+        self._free: queue.Queue[_Window] = queue.Queue()
+        self._pending: queue.Queue = queue.Queue()
+        self._errors: list[str] = []
+        self._thread: threading.Thread | None = None
+
+    def _register(self, name: str, size: int, keys: list | None, reduction: str) -> int:
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction {reduction}, use one of {REDUCTIONS}")
+        if self._active is not None:
+            raise RuntimeError("Metrics have to be registered before the first record")
+        self._metrics.append(_Metric(name, slice(self._num_rows, self._num_rows + size), keys, reduction))
+        self._rows.append(self._num_rows if keys is None else self._metrics[-1].rows)
+        self._num_rows += size
+        return len(self._metrics) - 1
+
+    def scalar(self, name: str, reduction: str = "mean") -> int:
+        """
+        Registers a scalar, returns its handle for record()
+        """
+        return self._register(name, 1, None, reduction)
+
+    def vector(self, name: str, keys: Iterable, reduction: str = "mean") -> int:
+        """
+        Registers a vector logged as {name: {key: value}} (e.g. one value per agent), returns its handle for record()
+        """
+        keys = list(keys)
+        return self._register(name, len(keys), keys, reduction)
+
+    def _start(self) -> None:
+        for _ in range(self.num_buffers):
+            self._free.put(_Window(self._num_rows, len(self._metrics), self.window))
+        self._active = self._free.get()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, metric: int, value: Any) -> None:
+        """
+        Writes a value (an array of the vector's size) of a registered metric into the current window
+        """
+        if self._active is None:
+            self._start()
+        active = self._active
+        count = active.counts[metric]
+        active.values[self._rows[metric], count % self.window] = value
+        active.counts[metric] = count + 1
+
+    def step(self) -> None:
+        """
+        Ends a step, every `window` steps the window is handed to the background thread
+        """
+        self._steps += 1
+        if self._steps % self.window == 0:
+            self._hand_over()
+
+    def _hand_over(self) -> None:
+        if self._active is None or not any(self._active.counts):
+            return
+        self._pending.put(self._active)
+        self._active = self._free.get()
+
+    def log(self, logs: dict) -> None:
+        """
+        Passes a dict to the sinks as it is, after the windows handed over before
+        """
+        if self._thread is None:
+            self._start()
+        self._pending.put(logs)
+
+    def _reduce(self, window: _Window) -> dict:
+        logs = {}
+        for metric, count in zip(self._metrics, window.counts):
+            if not count:
+                continue
+            values = window.values[metric.rows, :min(count, self.window)]
+            if metric.reduction == "last":
+                reduced = values[:, (count - 1) % self.window]
+            else:
+                reduced = getattr(values, metric.reduction)(axis=1)
+            logs[metric.name] = float(reduced[0]) if metric.keys is None else dict(zip(metric.keys, reduced.tolist()))
+        return logs
+
+    def _run(self) -> None:
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                if isinstance(item, _Window):
+                    logs = self._reduce(item)
+                    item.counts = [0] * len(item.counts)
+                    self._free.put(item)
+                else:
+                    logs = item
+                for sink in self.sinks:
+                    sink(logs)
+            except Exception:
+                self._errors.append(traceback.format_exc())
+            finally:
+                self._pending.task_done()
+
+    def flush(self) -> None:
+        """
+        Hands over the current (partial) window and waits until the sinks got everything logged so far
+        """
+        if self._thread is None:
+            return
+        self._hand_over()
+        self._pending.join()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise RuntimeError("A metrics sink failed:\n" + "\n".join(errors))
+
+    def close(self) -> None:
+        """
+        Flushes, stops the thread and closes the sinks that can be closed
+        """
+        try:
+            self.flush()
+        finally:
+            if self._thread is not None:
+                self._pending.put(None)
+                self._thread.join()
+                self._thread, self._active, self._free = None, None, queue.Queue()
+            for sink in self.sinks:
+                if hasattr(sink, "close"):
+                    sink.close()
@@ -3,7 +3,9 @@
 import sys 
 sys.path.append("..")
 
-from peekaboo_environment import PeekabooEnv
+from peekaboo_env_pool import default_pool
+from peekaboo_sim_env import PeekabooSimEnv
+from peekaboo_vec_env import PeekabooEnvFactory
 from time import time
 import numpy as np
 from dataclasses import dataclass
@@ -38,12 +40,16 @@ class ExperimentConfig:
     executable_path: str = "../../Executables/dev_release_fouroom.x86_64"
     render_env: bool = False
     seed = 1342
+    simulator_map: str | None = None #e.g. "../../configs/maps/dev_map.json" to run without the executable
 
 def run_experiment():
     config = ExperimentConfig()
-    environment = PeekabooEnv(config.executable_path, 
-                              seed=config.seed, 
-                              no_grahics=not config.render_env)
+    if config.simulator_map is not None:
+        environment = PeekabooSimEnv(config.simulator_map, seed=config.seed)
+    else:
+        #a warm player of the process' pool, close() hands it back
+        environment = default_pool().lease(PeekabooEnvFactory(config.executable_path, no_graphics=not config.render_env, array_mode=False),
+                                           seed=config.seed)
 
     print("Action space:", environment.action_spaces)
     print("Observation space:", environment.observation_spaces)
@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import torch
+
+#
+# Fixed-shape storage of one rollout, allocated once and overwritten in place by every update
+
+# observations stored as single frames, stacked when they are read, and encoded with an observation codec
+STACKED_KEYS: tuple[str, ...] = ("obs", "cent_obs")
+
+
+@dataclass
+class StackedView:
+    """
+    A view of frames with rows along `dim` and, for every row, the `stack_size` rows (rows, stack_size) its stacked
+    observation is made of, oldest first. RolloutBuffer.gather builds the stacks of the selected rows only
+    """
+    frames: torch.Tensor
+    frame_rows: torch.Tensor
+    dim: int
+    codec: Any = None #frames are codes of this codec
+
+    def __len__(self) -> int:
+        return len(self.frame_rows)
+
+
+@dataclass
+class EncodedView:
+    """
+    A view of observation codes, RolloutBuffer.gather decodes the selected rows on the training device
+    """
+    codes: torch.Tensor
+    codec: Any
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class RolloutBuffer:
+    def __init__(self,
+                 num_steps: int,
+                 num_envs: int,
+                 num_agents: int,
+                 obs_dim: int,
+                 cent_obs_dim: int | None,
+                 mask_dim: int,
+                 num_branches: int,
+                 device: torch.device | str = "cpu",
+                 pin_memory: bool = False,
+                 stack_size: int = 1,
+                 obs_codec: Any = None) -> None:
+        """
+        Tensors are shaped (num_steps, num_envs, num_agents, ...), the centralised state is stored once per step
+        (num_steps, num_envs, cent_obs_dim) and never repeated for every agent. With `cent_obs_dim` None the centralised
+        state is the observations of all agents, cent_obs is then a view (num_steps, num_envs, num_agents * obs_dim) of obs.
+
+        With `pin_memory` (and CUDA available) the storage stays in page-locked host memory,
+        so environment outputs are written without a device sync and minibatches are copied to `device` asynchronously.
+
+        With `stack_size` > 1 observations are still stored one frame per step, views of STACKED_KEYS are StackedView:
+        the stack of a step is made of the frames of the previous steps of its episode (the first one repeated before it),
+        assuming the rollout begins with an episode, and built by index when minibatches are gathered.
+        Stacked centralised states are the stacked frames of all agents, oldest first.
+
+        With an `obs_codec` (e.g. peekaboo_obs_codec.RayObservationCodec) STACKED_KEYS hold its codes: insert encodes them,
+        views of them are EncodedView (StackedView with the codec) and gather decodes the minibatch once it is on `device`.
+        """
+        self.num_steps, self.num_envs, self.num_agents = num_steps, num_envs, num_agents
+        self.stack_size = stack_size
+        self.device = torch.device(device)
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.storage_device = torch.device("cpu") if self.pin_memory else self.device
+
+        self.obs_codec = obs_codec
+        obs_dtype = torch.float32 if obs_codec is None else torch.uint8
+        if obs_codec is not None:
+            if obs_dim != obs_codec.obs_dim or (cent_obs_dim or 0) % obs_dim:
+                raise ValueError(f"A codec of {obs_codec.obs_dim} values encodes observations of that size (or multiples for the "
+                                 f"centralised state), got obs_dim {obs_dim} and cent_obs_dim {cent_obs_dim}")
+            obs_dim, cent_obs_dim = obs_codec.code_dim, None if cent_obs_dim is None else cent_obs_dim // obs_codec.obs_dim * obs_codec.code_dim
+
+        steps = (num_steps, num_envs, num_agents)
+        self.layout = {
+            "obs": ((*steps, obs_dim), obs_dtype),
+            "cent_obs": ((num_steps, num_envs, cent_obs_dim), obs_dtype),
+            "action_masks": ((*steps, mask_dim), torch.bool),
+            "actions": ((*steps, num_branches), torch.long),
+            "logprobs": (steps, torch.float32),
+            "entropies": (steps, torch.float32),
+            "values": (steps, torch.float32),
+            "rewards": (steps, torch.float32),
+            "terminations": (steps, torch.float32),
+            "truncations": (steps, torch.float32),
+            "advantages": (steps, torch.float32),
+            "returns": (steps, torch.float32),
+        }
+        if cent_obs_dim is None:
+            del self.layout["cent_obs"]
+        for key, (shape, dtype) in self.layout.items():
+            setattr(self, key, torch.zeros(shape, dtype=dtype, device=self.storage_device, pin_memory=self.pin_memory))
+        if cent_obs_dim is None:
+            self.cent_obs = self.obs.flatten(2)
+        self.length = 0
+        #whether the environment sent masks for this rollout
+        self.has_action_masks = False
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, key).nbytes for key in self.layout)
+
+    def reset(self) -> None:
+        """
+        Starts a new rollout, nothing is reallocated or cleared
+        """
+        self.length = 0
+        self.has_action_masks = False
+
+    def insert(self, step: int, **values: torch.Tensor | np.ndarray) -> None:
+        """
+        Writes values of one step in place, e.g. insert(t, obs=..., dones=...); (num_agents, ...) values fill the only env
+        """
+        for key, value in values.items():
+            target = getattr(self, key)[step]
+            if self.obs_codec is not None and key in STACKED_KEYS:
+                #NumPy values are encoded before they are copied, tensors where they are
+                value = self.obs_codec.encode(value) if isinstance(value, np.ndarray) else self.obs_codec.encode_tensor(value)
+            if isinstance(value, np.ndarray):
+                value = torch.from_numpy(value)
+            target.copy_(value.reshape(target.shape), non_blocking=True)
+        self.length = max(self.length, step + 1)
+        self.has_action_masks = self.has_action_masks or "action_masks" in values
+
+    def frame_steps(self, length: int | None = None) -> torch.Tensor:
+        """
+        (length, num_envs, stack_size) steps whose frames make up the stacked observation of every step, oldest first.
+        A step after the end of an episode (of any agent of the env) begins a new stack
+        """
+        length = length or self.length
+        steps = torch.arange(length, device=self.storage_device)
+        ended = torch.maximum(self.terminations[:length], self.truncations[:length]).amax(-1) > 0
+        starts = torch.zeros((length, self.num_envs), dtype=torch.long, device=self.storage_device)
+        starts[1:] = torch.where(ended[:-1], steps[1:, None], 0)
+        starts = starts.cummax(0).values
+        offsets = torch.arange(1 - self.stack_size, 1, device=self.storage_device)
+        return torch.maximum(steps[:, None, None] + offsets, starts[:, :, None])
+
+    def _stacked(self, view: torch.Tensor, length: int | None, per_agent: bool, dim: int) -> StackedView:
+        #rows of the steps' views are (step, env) or (step, env, agent)
+        envs = torch.arange(self.num_envs, device=self.storage_device)[None, :, None]
+        frame_rows = (self.frame_steps(length) * self.num_envs + envs).flatten(0, 1)
+        if per_agent:
+            agents = torch.arange(self.num_agents, device=self.storage_device)[None, :, None]
+            frame_rows = (frame_rows[:, None] * self.num_agents + agents).flatten(0, 1)
+        return StackedView(view, frame_rows, dim, self.obs_codec)
+
+    def _encoded(self, key: str, view: torch.Tensor) -> torch.Tensor | EncodedView:
+        return EncodedView(view, self.obs_codec) if self.obs_codec is not None and key in STACKED_KEYS else view
+
+    def sample_major(self, key: str, length: int | None = None) -> torch.Tensor | StackedView:
+        """
+        View of the first `length` steps with one row per (step, env, agent) sample, steps first
+        """
+        tensor = getattr(self, key)[:length or self.length]
+        view = tensor.flatten(0, 1 if key == "cent_obs" else 2)
+        if self.stack_size > 1 and key in STACKED_KEYS:
+            return self._stacked(view, length, per_agent=key != "cent_obs", dim=0)
+        return self._encoded(key, view)
+
+    def agent_major(self, key: str, length: int | None = None) -> torch.Tensor | StackedView:
+        """
+        View of the first `length` steps shaped (num_agents, steps * envs, ...)
+        """
+        view = getattr(self, key)[:length or self.length].flatten(0, 1).transpose(0, 1)
+        if self.stack_size > 1 and key in STACKED_KEYS:
+            return self._stacked(view, length, per_agent=False, dim=1)
+        return self._encoded(key, view)
+
+    def gather(self, tensor: torch.Tensor | StackedView | EncodedView, inds: np.ndarray | torch.Tensor | None = None,
+               dim: int = 0) -> torch.Tensor:
+        """
+        Minibatch rows of a view on the training device (all of them without `inds`), only the selected rows are copied.
+        Stacks of a StackedView are built from their frames here, along the dim of its rows, codes are decoded after the copy
+        """
+        if isinstance(tensor, EncodedView):
+            return tensor.codec.decode_tensor(self.gather(tensor.codes, inds, dim))
+        if isinstance(tensor, StackedView):
+            frame_rows = tensor.frame_rows if inds is None else tensor.frame_rows[torch.as_tensor(inds, device=tensor.frame_rows.device)]
+            stacked = tensor.frames.index_select(tensor.dim, frame_rows.flatten()).to(self.device, non_blocking=True)
+            if tensor.codec is not None:
+                stacked = tensor.codec.decode_tensor(stacked)
+            return stacked.reshape(*stacked.shape[:tensor.dim], len(frame_rows), -1)
+        if inds is None:
+            return tensor.to(self.device, non_blocking=True)
+        inds = torch.as_tensor(inds, device=tensor.device)
+        return tensor.index_select(dim, inds).to(self.device, non_blocking=True)
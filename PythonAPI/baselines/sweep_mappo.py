@@ -0,0 +1,434 @@
+"""
+Trains a grid of MAPPO configs concurrently on one machine, one process per run. Overrides are hydra's, a comma-separated
+value sweeps (agent.lr=1e-3,3e-3 agent.seed=range(0,4)). Every run gets its own range of worker ids (ports),
+a set of cores it and its players are pinned to, and as many torch threads as cores for the learner.
+A short probe of every config times the environment and the learner at several thread counts first. Every run gets the
+thread count giving the box the most samples per second with all runs of the sweep sharing its cores, and runs are packed
+onto them. Throughput per run and for the box is printed while they train, and written to --output as json lines.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+
+#config keys that change what is learned, not what a rollout costs: configs differing only in them share a probe
+COST_NEUTRAL_KEYS: tuple[str, ...] = ("agent.lr", "agent.anneal_lr", "agent.ent_coeff", "agent.vf_coeff", "agent.clip_coeff",
+                                      "agent.gamma", "agent.gae_lambda", "agent.seed", "environment.seed", "wandb.wandb_run_name",
+                                      "agent.checkpoint_path", "agent.metrics_path", "agent.latency_report", "environment.record_dir")
+#files and directories a run writes to, made per run so that concurrent runs don't overwrite each other
+PER_RUN_PATHS: tuple[str, ...] = ("agent.checkpoint_path", "agent.metrics_path", "agent.latency_report", "environment.record_dir")
+
+
+def expand_grid(overrides: list[str]) -> list[list[str]]:
+    """
+    Override lists of every combination of the swept values, in the order hydra's basic sweeper runs them
+    """
+    from hydra.core.override_parser.overrides_parser import OverridesParser
+    choices = []
+    for override in OverridesParser.create().parse_overrides(overrides):
+        key = override.get_key_element()
+        values = list(override.sweep_string_iterator()) if override.is_sweep_override() else [override.get_value_element_as_str()]
+        choices.append([f"{key}={value}" for value in values])
+    return [list(combination) for combination in itertools.product(*choices)]
+
+
+def _get(config: dict, key: str):
+    for part in key.split("."):
+        if not isinstance(config, dict) or part not in config:
+            return None
+        config = config[part]
+    return config
+
+
+def _set(config: dict, key: str, value) -> None:
+    *parents, name = key.split(".")
+    for part in parents:
+        config = config.setdefault(part, {})
+    config[name] = value
+
+
+def per_run_config(config: dict, index: int) -> dict:
+    """
+    A copy with the output paths of PER_RUN_PATHS made per run: "<dir>/run_<index>" for record_dir, "<name>_run<index><ext>" for files
+    """
+    config = json.loads(json.dumps(config))
+    for key in PER_RUN_PATHS:
+        path = _get(config, key)
+        if path is None:
+            continue
+        path = Path(path)
+        _set(config, key, str(path / f"run_{index}" if key == "environment.record_dir" else path.with_name(f"{path.stem}_run{index}{path.suffix}")))
+    return config
+
+
+def probe_key(config: dict) -> str:
+    config = json.loads(json.dumps(config))
+    for key in COST_NEUTRAL_KEYS:
+        _set(config, key, None)
+    return json.dumps(config, sort_keys=True)
+
+
+def player_cores(config: dict) -> int:
+    """
+    Cores the run's Unity players need besides the learner's: async actors step them while the learner updates,
+    a synchronous run waits for its player, which can share the learner's cores. The stand-in runs in the learner's process
+    """
+    if _get(config, "environment.simulator_map") is not None or not _get(config, "agent.async_training"):
+        return 0
+    return _get(config, "agent.num_actors") or 1
+
+
+@dataclass
+class Probe:
+    samples: int #environment steps of the probed rollout
+    environment: dict[int, float] #torch threads: seconds of the rollout collection
+    learner: dict[int, float] #torch threads: seconds of the advantages and of all learning epochs
+
+    def rollout_seconds(self, threads: int, num_actors: int = 1, async_training: bool = False) -> float:
+        #async actors collect while the learner updates, the slower side sets the pace
+        if async_training:
+            return max(self.environment[threads] / num_actors, self.learner[threads])
+        return self.environment[threads] + self.learner[threads]
+
+
+def pick_threads(probe: Probe, config: dict, max_cores: int, num_runs: int = 1) -> int:
+    """
+    Torch thread count of the most samples per second of the box if `num_runs` runs like this one share `max_cores`:
+    as many as fit (player cores included) run at once. More threads have to be 5% better to be picked
+    """
+    async_training = bool(_get(config, "agent.async_training"))
+    num_actors = (_get(config, "agent.num_actors") or 1) if async_training else 1
+    best, best_rate = 1, 0.0
+    for threads in sorted(probe.environment):
+        cores = threads + player_cores(config)
+        if cores > max_cores:
+            break
+        concurrent = min(num_runs, max_cores // cores)
+        rate = concurrent * probe.samples * num_actors / probe.rollout_seconds(threads, num_actors, async_training)
+        if rate > best_rate * 1.05:
+            best, best_rate = threads, rate
+    return best
+
+
+class CorePacker:
+    def __init__(self, cores: list[int], base_worker_id: int = 0, worker_ids_per_run: int = 32) -> None:
+        """
+        Hands out disjoint core sets and worker id ranges [base_worker_id + i * worker_ids_per_run, ...) to concurrent runs.
+        A run that launches more players than `worker_ids_per_run` (e.g. replacements of crashed ones) spills into the next range
+        """
+        self.cores = list(cores)
+        self.base_worker_id = base_worker_id
+        self.worker_ids_per_run = worker_ids_per_run
+        self._free_cores = list(cores)
+        #a run occupies at least a core, so there are never more runs than cores
+        self._free_ranges = list(range(len(cores)))
+
+    def acquire(self, num_cores: int) -> tuple[list[int], int] | None:
+        """
+        `num_cores` cores (at most all of them) and the first worker id of a free range, None if they aren't free
+        """
+        num_cores = min(num_cores, len(self.cores))
+        if num_cores > len(self._free_cores):
+            return None
+        cores, self._free_cores = self._free_cores[:num_cores], self._free_cores[num_cores:]
+        return cores, self.base_worker_id + self._free_ranges.pop(0) * self.worker_ids_per_run
+
+    def release(self, cores: list[int], base_worker_id: int) -> None:
+        self._free_cores = sorted(self._free_cores + cores)
+        self._free_ranges = sorted(self._free_ranges + [(base_worker_id - self.base_worker_id) // self.worker_ids_per_run])
+
+
+def _pin(cores: list[int] | None, threads: int | None) -> None:
+    #before torch is imported, OpenMP and MKL read their thread counts once. Processes launched afterwards (players) inherit the affinity
+    if threads is not None:
+        os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+    if cores is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    if threads is not None:
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+
+def _count_steps(learner) -> dict[int, int]:
+    #an instance attribute shadowing _step_environment, like LatencyProfiler.instrument. Steps per thread (async actors
+    #step on their own), so that no count is lost to a race
+    counts: dict[int, int] = {}
+    step_environment = learner._step_environment
+
+    def counted(*args, **kwargs):
+        thread = threading.get_ident()
+        counts[thread] = counts.get(thread, 0) + 1
+        return step_environment(*args, **kwargs)
+    learner._step_environment = counted
+    return counts
+
+
+def _close(learner) -> None:
+    learner.metrics.close()
+    for environment in [learner.environment, *(learner.actor_environments or [])]:
+        environment.close()
+
+
+def _probe_process(config: dict, thread_counts: list[int], cores: list[int], results: mp.Queue) -> None:
+    try:
+        _pin(cores, max(thread_counts))
+        import torch
+        from omegaconf import OmegaConf
+        from clean_mappo_baseline import make_learner
+
+        #one synchronous rollout and one learning epoch, scaled to num_learning_epochs
+        epochs = _get(config, "agent.num_learning_epochs") or 1
+        config = json.loads(json.dumps(config))
+        for key, value in {"agent.total_timesteps": 1, "agent.num_learning_epochs": 1, "agent.async_training": False, "agent.num_actors": 1,
+                           "agent.profile_latency": False, "wandb.track_wandb": False, **dict.fromkeys(PER_RUN_PATHS)}.items():
+            _set(config, key, value)
+        learner = make_learner(OmegaConf.create(config))
+        learner.metrics.sinks = []
+        counts = _count_steps(learner)
+        rb = learner.rollout_buffer
+        environment, learner_seconds = {}, {}
+        #the first round (launch, optimizer state) isn't timed
+        for threads in [max(thread_counts), *thread_counts]:
+            torch.set_num_threads(threads)
+            counts.clear()
+            start = time.perf_counter()
+            next_obs, _ = learner._collect(rb, learner._policy(), learner.environment, log_steps=False)
+            collected = time.perf_counter()
+            learner._compute_advantages(rb, next_obs, learner._policy())
+            learner._update(rb, collected)
+            environment[threads], learner_seconds[threads] = collected - start, (time.perf_counter() - collected) * epochs
+        _close(learner)
+        results.put(Probe(sum(counts.values()), environment, learner_seconds))
+    except Exception:
+        results.put(traceback.format_exc())
+
+
+def probe(config: dict, thread_counts: list[int], cores: list[int]) -> Probe:
+    """
+    Times a rollout of `config` at every thread count in a process pinned to the first cores
+    """
+    results = mp.get_context("spawn").Queue()
+    process = mp.get_context("spawn").Process(target=_probe_process, args=(config, thread_counts, cores[:max(thread_counts)], results))
+    process.start()
+    result = results.get()
+    process.join()
+    if isinstance(result, str):
+        raise RuntimeError(f"The probe of a config failed:\n{result}")
+    return result
+
+
+def _train_process(index: int, config: dict, cores: list[int] | None, threads: int | None, events: mp.Queue, report_interval: float,
+                   log_path: str | None) -> None:
+    try:
+        if log_path is not None:
+            #the run's logs and its players' output, the sweep's terminal only shows throughput
+            log = open(log_path, "a")
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+        _pin(cores, threads)
+        from omegaconf import OmegaConf
+        from clean_mappo_baseline import make_learner
+
+        learner = make_learner(OmegaConf.create(config))
+        counts = _count_steps(learner)
+        start = time.perf_counter()
+        done = threading.Event()
+
+        def report():
+            while not done.wait(report_interval):
+                events.put(("progress", index, sum(counts.values()), time.perf_counter() - start))
+        reporter = threading.Thread(target=report, daemon=True)
+        reporter.start()
+        learner.learn()
+        elapsed = time.perf_counter() - start
+        done.set()
+        summary = learner.eval()
+        _close(learner)
+        events.put(("done", index, sum(counts.values()), elapsed, summary))
+    except Exception:
+        events.put(("failed", index, traceback.format_exc()))
+
+
+@dataclass
+class SweepRun:
+    index: int
+    overrides: list[str]
+    config: dict
+    threads: int | None = None #None: torch's default, with pin=False
+    num_cores: int = 1
+    cores: list[int] | None = None
+    base_worker_id: int | None = None
+    status: str = "pending" #running, done or failed
+    steps: int = 0
+    elapsed: float = 0.0
+    rate: float = 0.0 #samples per second since the previous report
+    summary: dict | None = None
+    error: str | None = None
+
+
+def sweep(runs: list[SweepRun], packer: CorePacker, pin: bool = True, report_interval: float = 10.0,
+          report=print, output: str | None = None, log_dir: str | None = None) -> list[SweepRun]:
+    """
+    Trains the runs, as many at once as their cores (`num_cores` each) fit into the packer's, in order with later runs filling
+    cores an earlier one doesn't fit into. Without `pin` every run gets the next worker id range only and all cores, as many at once
+    as the packer has cores. Progress is passed to `report` as lines and written to `output` as json lines,
+    the output of run i goes to "<log_dir>/run_<i>.log" (the terminal without `log_dir`)
+    """
+    context = mp.get_context("spawn")
+    events = context.Queue()
+    pending, running = list(runs), {}
+    start = time.perf_counter()
+    log = open(output, "a") if output is not None else None
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    def emit(event: dict, line: str) -> None:
+        report(line)
+        if log is not None:
+            log.write(json.dumps({"time": time.perf_counter() - start, **event}, default=float) + "\n")
+            log.flush()
+
+    def box_rate() -> float:
+        return sum(run.rate for run, _, _ in running.values())
+
+    try:
+        while pending or running:
+            for run in list(pending):
+                acquired = packer.acquire(run.num_cores if pin else 1)
+                if acquired is None:
+                    continue
+                cores, run.base_worker_id = acquired
+                run.cores = cores if pin else None
+                config = json.loads(json.dumps(run.config))
+                _set(config, "environment.base_worker_id", run.base_worker_id)
+                log_path = None if log_dir is None else os.path.join(log_dir, f"run_{run.index}.log")
+                process = context.Process(target=_train_process, args=(run.index, config, run.cores, run.threads if pin else None,
+                                                                       events, report_interval, log_path))
+                process.start()
+                pending.remove(run)
+                running[run.index] = (run, process, cores)
+                run.status = "running"
+                emit({"event": "start", "run": run.index, "overrides": run.overrides, "cores": run.cores, "threads": run.threads,
+                      "base_worker_id": run.base_worker_id},
+                     f"run {run.index} {' '.join(run.overrides)}: started on cores {run.cores if pin else 'any'}, "
+                     f"{run.threads if pin else 'default'} torch threads, worker ids from {run.base_worker_id}")
+            try:
+                event = events.get(timeout=1.0)
+            except queue.Empty:
+                #a process that died without a word (killed, out of memory)
+                for index, (run, process, cores) in list(running.items()):
+                    if not process.is_alive() and process.exitcode not in (0, None):
+                        event = ("failed", index, f"the process exited with {process.exitcode}")
+                        break
+                else:
+                    continue
+            kind, index = event[0], event[1]
+            if index not in running:
+                continue
+            run, process, cores = running[index]
+            if kind == "progress":
+                steps, elapsed = event[2], event[3]
+                run.rate = (steps - run.steps) / max(elapsed - run.elapsed, 1e-9)
+                run.steps, run.elapsed = steps, elapsed
+                emit({"event": "progress", "run": index, "steps": steps, "samples/s": run.rate, "box samples/s": box_rate()},
+                     f"run {index}: {run.rate:9.1f} samples/s, {steps} steps | box {box_rate():9.1f} samples/s, "
+                     f"{len(running)} running, {len(pending)} pending")
+                continue
+            if kind == "done":
+                run.steps, run.elapsed, run.summary, run.status = event[2], event[3], event[4], "done"
+            else:
+                run.error, run.status = event[2], "failed"
+            process.join()
+            packer.release(cores, run.base_worker_id)
+            del running[index]
+            run.rate = 0.0
+            samples_per_second = run.steps / run.elapsed if run.elapsed else 0.0
+            emit({"event": run.status, "run": index, "steps": run.steps, "samples/s": samples_per_second,
+                  "summary": run.summary, "error": run.error},
+                 f"run {index} {run.status}: {samples_per_second:.1f} samples/s over {run.elapsed:.1f} s"
+                 + (f"\n{run.error}" if run.error else ""))
+        total_steps, seconds = sum(run.steps for run in runs), time.perf_counter() - start
+        emit({"event": "sweep", "steps": total_steps, "seconds": seconds}, f"sweep: {total_steps / seconds:.1f} samples/s over {seconds:.1f} s")
+    finally:
+        for run, process, _ in running.values():
+            process.terminate()
+        if log is not None:
+            log.close()
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("overrides", nargs="*", help="hydra overrides of the config, comma-separated values are swept")
+    parser.add_argument("--config-dir", default=str(Path(__file__).resolve().parents[2] / "configs" / "python"))
+    parser.add_argument("--config-name", default="mappo_config")
+    parser.add_argument("--cores", type=int, nargs="+", default=None, help="cores to run on, the process' affinity by default")
+    parser.add_argument("--thread-counts", type=int, nargs="+", default=[1, 2, 4, 8], help="torch thread counts the probes try")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads of every run, skips the probes")
+    parser.add_argument("--no-pin", action="store_true", help="neither pin cores nor set threads, runs on all cores at once")
+    parser.add_argument("--base-worker-id", type=int, default=0)
+    parser.add_argument("--worker-ids-per-run", type=int, default=32)
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between throughput reports of a run")
+    parser.add_argument("--output", default=None, help="jsonl file of the progress and the results")
+    parser.add_argument("--log-dir", default="sweep_logs", help="directory of the runs' own output")
+    args = parser.parse_args()
+
+    from hydra import compose, initialize_config_dir
+    from omegaconf import OmegaConf
+
+    cores = args.cores or (sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count())))
+    if not args.no_pin and not hasattr(os, "sched_setaffinity"):
+        print("Notice: CPU affinity can't be set on this platform, runs are only given torch threads")
+    runs = []
+    grid = expand_grid(args.overrides)
+    #runs are named by the swept values
+    common = set.intersection(*(set(overrides) for overrides in grid))
+    with initialize_config_dir(config_dir=args.config_dir, version_base=None):
+        for index, overrides in enumerate(grid):
+            config = per_run_config(OmegaConf.to_container(compose(args.config_name, overrides=overrides), resolve=True), index)
+            swept = [override for override in overrides if override not in common]
+            if _get(config, "wandb.track_wandb"):
+                _set(config, "wandb.wandb_run_name", f"{_get(config, 'wandb.wandb_run_name') or 'sweep'} {' '.join(swept)}")
+            runs.append(SweepRun(index, swept, config))
+
+    thread_counts = sorted({threads for threads in args.thread_counts if threads <= len(cores)} or {1})
+    probes: dict[str, Probe] = {}
+    for run in runs:
+        if args.no_pin:
+            break
+        if args.threads is not None:
+            run.threads = min(args.threads, len(cores))
+        else:
+            key = probe_key(run.config)
+            if key not in probes:
+                probes[key] = probe(run.config, thread_counts, cores)
+                environment = ", ".join(f"{threads}: {seconds:.2f}" for threads, seconds in probes[key].environment.items())
+                learner = ", ".join(f"{threads}: {seconds:.2f}" for threads, seconds in probes[key].learner.items())
+                print(f"probe of run {run.index}: {probes[key].samples} steps, environment s by threads {{{environment}}}, "
+                      f"learner s {{{learner}}}")
+            run.threads = pick_threads(probes[key], run.config, len(cores), len(runs))
+        run.num_cores = run.threads + player_cores(run.config)
+
+    sweep(runs, CorePacker(cores, args.base_worker_id, args.worker_ids_per_run), pin=not args.no_pin,
+          report_interval=args.report_interval, output=args.output, log_dir=args.log_dir)
+    print(f"{'run':>4} | {'status':>7} {'cores':>5} {'threads':>7} {'samples/s':>10} {'return':>8} | overrides")
+    for run in runs:
+        samples_per_second = run.steps / run.elapsed if run.elapsed else 0.0
+        evaluation = "" if run.summary is None else f"{run.summary['return/mean']:8.3f}"
+        print(f"{run.index:4d} | {run.status:>7} {len(run.cores) if run.cores else '-':>5} {run.threads or '-':>7} "
+              f"{samples_per_second:10.1f} {evaluation:>8} | {' '.join(run.overrides)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Decision period k (an action repeated for k physics frames, one observation and one round trip per decision):
+environment throughput in decisions/sec and frames/sec, then wall-clock time for MAPPO to reach a return
+with the same frame budget and rollouts covering the same simulated time (num_steps = rollout frames / k).
+--executable measures a Unity build (PeekabooEnv(decision_period=k)) instead of the NumPy stand-in.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+
+
+def make_environment(args, decision_period: int, max_environment_steps: int, seed: int):
+    if args.executable is not None:
+        from peekaboo_environment import PeekabooEnv
+        return PeekabooEnv(executable_path=args.executable, worker_id=args.worker_id, seed=seed, array_mode=True,
+                           decision_period=decision_period)
+    settings = SimSettings(decision_period=decision_period, max_environment_steps=max_environment_steps)
+    return PeekabooSimEnv(args.map, seed=seed, settings=settings, array_mode=True)
+
+
+def bench_environment(args, decision_period: int) -> tuple[float, float]:
+    env = make_environment(args, decision_period, 1000, args.seed)
+    rng = np.random.default_rng(args.seed)
+    actions = rng.integers(0, ACTION_BRANCHES, (args.decisions, len(env.possible_agents), len(ACTION_BRANCHES)))
+    env.reset()
+    frames = 0
+    start = time.perf_counter()
+    for step_actions in actions:
+        frames_before = getattr(env, "step_count", 0)
+        _, _, _, terminated, truncated = env.step(step_actions)
+        #Unity builds don't report their frames, a decision is decision_period of them except at the end of an episode
+        frames += env.step_count - frames_before if hasattr(env, "step_count") else decision_period
+        if terminated.any() or truncated.any():
+            env.reset()
+    elapsed = time.perf_counter() - start
+    env.close()
+    return args.decisions / elapsed, frames / elapsed
+
+
+def time_to_return(args, decision_period: int) -> tuple[float | None, float, float]:
+    """
+    Seconds until the mean team return of the last --window rollouts first reaches --target-return (None if it doesn't),
+    the final windowed return and the total training time
+    """
+    num_steps = max(1, args.rollout_frames // decision_period)
+    config = dict(agent_hidden_dim=args.hidden_dim, shared_critic=False, shared_optimization=False, ent_coeff=0.01, vf_coeff=0.1,
+                  clip_coeff=0.1, gamma=0.99, gae=True, gae_lambda=0.95, clip_vloss=True, batch_size=num_steps,
+                  num_minibatches=4, stack_size=1, total_timesteps=args.frame_budget // args.rollout_frames,
+                  num_learning_epochs=args.epochs, num_steps=num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed,
+                  torch_deterministic=False, lr=3e-4, anneal_lr=True, device="cpu", max_grad_norm=10.0, target_kl=None,
+                  batched_agents=True)
+    torch.manual_seed(args.seed)
+    agent = MAPPOAgent(environment=make_environment(args, decision_period, args.rollout_frames, args.seed), config=config,
+                       track_wandb=False, **config)
+    mappo.print_dict = lambda logs: None
+
+    returns, reached = [], None
+    collect = agent._collect
+    start = time.perf_counter()
+
+    def timed_collect(*collect_args, **collect_kwargs):
+        nonlocal reached
+        next_obs, episodic_return = collect(*collect_args, **collect_kwargs)
+        returns.append(float(episodic_return.sum()))
+        if reached is None and len(returns) >= args.window and np.mean(returns[-args.window:]) >= args.target_return:
+            reached = time.perf_counter() - start
+        return next_obs, episodic_return
+
+    agent._collect = timed_collect
+    agent.learn()
+    elapsed = time.perf_counter() - start
+    agent.environment.close()
+    return reached, float(np.mean(returns[-args.window:])), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--executable", default=None, help="Unity build to measure instead of the stand-in")
+    parser.add_argument("--worker-id", type=int, default=0)
+    parser.add_argument("--decision-periods", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--decisions", type=int, default=5000, help="decisions per throughput measurement")
+    parser.add_argument("--rollout-frames", type=int, default=256, help="physics frames per rollout (and episode)")
+    parser.add_argument("--frame-budget", type=int, default=256 * 40, help="physics frames of a training run")
+    parser.add_argument("--target-return", type=float, default=-2.9, help="team return per episode")
+    parser.add_argument("--window", type=int, default=5, help="rollouts averaged for the return")
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--hidden-dim", type=int, default=64)
+    parser.add_argument("--skip-training", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for decision_period in args.decision_periods:
+        decisions, frames = bench_environment(args, decision_period)
+        print(f"{f'k = {decision_period}':>8}: {decisions:10.0f} decisions/sec {frames:10.0f} frames/sec")
+    if args.skip_training or args.executable is not None:
+        return
+    for decision_period in args.decision_periods:
+        reached, final, elapsed = time_to_return(args, decision_period)
+        reached_text = "not reached" if reached is None else f"{reached:6.2f} s"
+        print(f"{f'k = {decision_period}':>8}: return {args.target_return} {reached_text}, final {final:8.3f}, training {elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
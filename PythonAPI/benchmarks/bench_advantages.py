@@ -0,0 +1,73 @@
+"""
+GAE(lambda) over (num_steps, num_envs * num_agents) batches: the time loop MAPPOAgent used to run
+against the blockwise kernels of baselines/advantages.py (NumPy and torch).
+"""
+import sys
+sys.path.append("../baselines")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from advantages import compute_gae, reference_gae
+
+
+def torch_loop_gae(rewards, values, dones, next_value, next_done, gamma, gae_lambda):
+    #the loop of MAPPOAgent.learn before the kernel, dones[t] marks s_t as the first state of an episode
+    advantages = torch.zeros_like(rewards)
+    lastgaelam = 0
+    num_steps = len(rewards)
+    for t in reversed(range(num_steps)):
+        if t == num_steps - 1:
+            nextnonterminal = 1.0 - next_done
+            nextvalues = next_value
+        else:
+            nextnonterminal = 1.0 - dones[t + 1]
+            nextvalues = values[t + 1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advantages[t] = lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
+    return advantages
+
+
+def timed(fn, repeats: int) -> float:
+    fn()
+    start = perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-steps", type=int, nargs="+", default=[128, 300, 1024])
+    parser.add_argument("--batch", type=int, nargs="+", default=[3, 192, 3072], help="num_envs * num_agents")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    gamma, gae_lambda = 0.99, 0.95
+    print(f"{'T':>6} {'N':>6} | {'numpy loop':>10} {'torch loop':>10} | {'numpy':>8} {'torch':>8}   (ms per call)")
+    for num_steps in args.num_steps:
+        for batch in args.batch:
+            rewards = rng.normal(size=(num_steps, batch)).astype(np.float32)
+            values = rng.normal(size=(num_steps, batch)).astype(np.float32)
+            terminated = rng.random((num_steps, batch)) < 0.01
+            truncated = np.zeros_like(terminated)
+            last_values = rng.normal(size=batch).astype(np.float32)
+            tensors = [torch.from_numpy(x) for x in (rewards, values, terminated, truncated, last_values)]
+            dones = torch.from_numpy(np.concatenate([np.zeros((1, batch), bool), terminated[:-1]]).astype(np.float32))
+
+            times = [
+                timed(lambda: reference_gae(rewards, values, terminated, truncated, last_values, gamma, gae_lambda), args.repeats),
+                timed(lambda: torch_loop_gae(tensors[0], tensors[1], dones, tensors[4], torch.from_numpy(terminated[-1]).float(), gamma, gae_lambda), args.repeats),
+                timed(lambda: compute_gae(rewards, values, terminated, truncated, last_values, gamma, gae_lambda), args.repeats),
+                timed(lambda: compute_gae(*tensors[:4], tensors[4], gamma, gae_lambda), args.repeats),
+            ]
+            print(f"{num_steps:>6} {batch:>6} | {times[0] * 1e3:10.3f} {times[1] * 1e3:10.3f} | {times[2] * 1e3:8.3f} {times[3] * 1e3:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cost per environment step (µs) of the dict API plus the conversions the training loop needs
+(unpacking per-agent observations and masks, rewards, dones and infos) against array mode, where outputs come in preallocated arrays.
+Runs on PeekabooSimEnv, or on the Unity build with --executable.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+from peekaboo_vec_env import unpack_observation
+
+
+def make_env(args, array_mode: bool):
+    if args.executable is not None:
+        from peekaboo_environment import PeekabooEnv
+        return PeekabooEnv(args.executable, seed=args.seed, worker_id=args.worker_id + int(array_mode), array_mode=array_mode)
+    return PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.episode_steps), array_mode=array_mode)
+
+
+def bench_dicts(env, actions: np.ndarray) -> float:
+    agent_ids = env.possible_agents
+    env.reset()
+    start = perf_counter()
+    for step_actions in actions:
+        observations, rewards, dones, infos = env.step(dict(zip(agent_ids, step_actions)))
+        #what the training loop needs out of the dicts
+        unpacked = [unpack_observation(observations[agent_id]) for agent_id in agent_ids]
+        next_obs = torch.from_numpy(np.stack([obs for obs, _ in unpacked]))
+        next_action_mask = [mask for _, mask in unpacked]
+        reward = np.array(list(rewards.values()))
+        done = np.array(list(dones.values()))
+        interrupted = np.array([infos.get(agent_id, {}).get("interrupted", False) for agent_id in agent_ids])
+        if done.any():
+            env.reset()
+    return (perf_counter() - start) / len(actions)
+
+
+def bench_arrays(env, actions: np.ndarray) -> float:
+    env.reset()
+    start = perf_counter()
+    for step_actions in actions:
+        observations, action_mask, reward, terminated, truncated = env.step(step_actions)
+        next_obs = torch.from_numpy(observations)
+        next_action_mask = torch.from_numpy(action_mask)
+        if terminated.any() or truncated.any():
+            env.reset()
+    return (perf_counter() - start) / len(actions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--executable", default=None, help="a Peekaboo build, the NumPy stand-in is used otherwise")
+    parser.add_argument("--worker-id", type=int, default=0)
+    parser.add_argument("--num-steps", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5, help="runs are interleaved, the best one counts")
+    parser.add_argument("--episode-steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    modes = {"dicts": (make_env(args, False), bench_dicts), "arrays": (make_env(args, True), bench_arrays)}
+    num_agents = len(modes["dicts"][0].possible_agents)
+    actions = rng.integers(0, ACTION_BRANCHES, (args.num_steps, num_agents, len(ACTION_BRANCHES)))
+    results = {name: np.inf for name in modes}
+    for _ in range(args.repeats):
+        for name, (env, bench) in modes.items():
+            results[name] = min(results[name], bench(env, actions))
+    for env, _ in modes.values():
+        env.close()
+    for name, seconds in results.items():
+        print(f"{name:>8}: {seconds * 1e6:10.1f} us/step ({results['dicts'] / seconds:.2f}x)")
+    print(f"saved per step: {(results['dicts'] - results['arrays']) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Wall time of MAPPOAgent.learn for a fixed number of updates, synchronous against async_training,
+with actor/learner utilization. --step-latency-ms adds a sleep to every step of the NumPy stand-in
+to mimic the time a Unity build takes to answer over its socket.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import time
+
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+
+
+class SlowEnv:
+    def __init__(self, environment, step_latency: float) -> None:
+        self.environment, self.step_latency = environment, step_latency
+
+    def step(self, actions):
+        time.sleep(self.step_latency)
+        return self.environment.step(actions)
+
+    def __getattr__(self, name: str):
+        return getattr(self.environment, name)
+
+
+def run(args, **overrides) -> tuple[float, dict]:
+    def make_environment(seed: int):
+        environment = PeekabooSimEnv(args.map, seed=seed, settings=SimSettings(max_environment_steps=args.num_steps * 4), array_mode=True)
+        return SlowEnv(environment, args.step_latency_ms / 1e3)
+
+    config = dict(agent_hidden_dim=args.hidden_dim, shared_critic=False, shared_optimization=False, ent_coeff=0.01, vf_coeff=0.1,
+                  clip_coeff=0.1, gamma=0.99, gae=True, gae_lambda=0.95, clip_vloss=True, batch_size=args.num_steps,
+                  num_minibatches=4, stack_size=1, total_timesteps=args.updates, num_learning_epochs=args.epochs,
+                  num_steps=args.num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed, torch_deterministic=False,
+                  lr=3e-4, anneal_lr=True, device="cpu", max_grad_norm=10.0, target_kl=None, batched_agents=True, **overrides)
+    num_actors = config.get("num_actors", 1) if config.get("async_training") else 1
+    agent = MAPPOAgent(environment=make_environment(args.seed), config=config, track_wandb=False,
+                       actor_environments=[make_environment(args.seed + i) for i in range(1, num_actors)], **config)
+    logs = []
+    mappo.print_dict = logs.append
+    start = time.perf_counter()
+    agent.learn()
+    elapsed = time.perf_counter() - start
+    #the last per-update log, the metrics of the last window come after it
+    update_logs = [log for log in logs if "async/policy lag" in log] or [{}]
+    return elapsed, {key: value for key, value in update_logs[-1].items() if key.startswith("async")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--updates", type=int, default=10)
+    parser.add_argument("--num-steps", type=int, default=128)
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--hidden-dim", type=int, default=256)
+    parser.add_argument("--step-latency-ms", type=float, default=2.0)
+    parser.add_argument("--num-actors", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    reference, _ = run(args)
+    print(f"{'sync':>16}: {reference:7.2f} s")
+    for num_actors in args.num_actors:
+        for correction in ["ppo", "vtrace"]:
+            elapsed, stats = run(args, async_training=True, num_actors=num_actors, off_policy_correction=correction)
+            print(f"{f'async {num_actors} {correction}':>16}: {elapsed:7.2f} s ({reference / elapsed:.2f}x)  "
+                  f"actors {stats['async/actor utilization']:.0%}, learner {stats['async/learner utilization']:.0%}, "
+                  f"dropped {stats['async/dropped rollouts']}")
+
+
+if __name__ == "__main__":
+    main()
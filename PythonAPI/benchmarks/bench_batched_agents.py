@@ -0,0 +1,95 @@
+"""
+Time spent in MAPPOAgent's collection forward passes and PPO minibatch updates,
+the per-agent loop against BatchedActorCritic, for several agent counts and hidden sizes.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from peekaboo_sim_env import PeekabooSimEnv
+from mappo import ActorCriticAgent
+from batched_agents import BatchedActorCritic
+
+
+def timed(fn, repeats: int) -> float:
+    fn()
+    start = perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (perf_counter() - start) / repeats
+
+
+def bench(environment, num_agents: int, hidden_dim: int, minibatch_size: int, repeats: int) -> dict:
+    agent_id = environment.possible_agents[0]
+    agents = [ActorCriticAgent(agent_id, environment, hidden_dim) for _ in range(num_agents)]
+    batched = BatchedActorCritic(agents)
+    optimizers = [torch.optim.AdamW(agent.parameters(), lr=1e-4, eps=1e-5) for agent in agents]
+    batched_optimizer = torch.optim.AdamW(batched.parameters(), lr=1e-4, eps=1e-5)
+
+    obs_dim = environment.observation_space(agent_id).shape[0]
+    action_space = environment.action_space(agent_id).nvec
+    step_obs = torch.randn(num_agents, 1, obs_dim)
+    mb_obs = torch.randn(num_agents, minibatch_size, obs_dim)
+    mb_actions = torch.stack([torch.randint(0, n, (num_agents, minibatch_size)) for n in action_space], dim=-1)
+
+    @torch.no_grad()
+    def collect_loop():
+        for agent_ind, agent in enumerate(agents):
+            agent.get_action_and_value(step_obs[agent_ind])
+
+    @torch.no_grad()
+    def collect_batched():
+        batched.get_action_and_value(step_obs)
+
+    def update_loop():
+        for agent_ind, agent in enumerate(agents):
+            value, _, logprob, entropy = agent.get_action_and_value(mb_obs[agent_ind], action=mb_actions[agent_ind])
+            loss = -logprob.mean() - 0.01 * entropy.mean() + value.pow(2).mean()
+            optimizers[agent_ind].zero_grad()
+            loss.backward()
+            nn.utils.clip_grad_norm_(agent.parameters(), 10.0)
+            optimizers[agent_ind].step()
+
+    def update_batched():
+        value, _, logprob, entropy = batched.get_action_and_value(mb_obs, action=mb_actions)
+        loss = (-logprob.mean(1) - 0.01 * entropy.mean(1) + value.pow(2).mean(1)).sum()
+        batched_optimizer.zero_grad()
+        loss.backward()
+        batched.clip_grad_norm_(10.0)
+        batched_optimizer.step()
+
+    return {
+        "collect loop": timed(collect_loop, repeats),
+        "collect batched": timed(collect_batched, repeats),
+        "update loop": timed(update_loop, max(repeats // 10, 1)),
+        "update batched": timed(update_batched, max(repeats // 10, 1)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--num-agents", type=int, nargs="+", default=[2, 3, 8, 16])
+    parser.add_argument("--hidden-dims", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--minibatch-size", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    environment = PeekabooSimEnv(args.map)
+    print(f"{'agents':>6} {'hidden':>6} | {'collect loop':>12} {'batched':>10} | {'update loop':>12} {'batched':>10}   (ms per call)")
+    for hidden_dim in args.hidden_dims:
+        for num_agents in args.num_agents:
+            times = bench(environment, num_agents, hidden_dim, args.minibatch_size, args.repeats)
+            print(f"{num_agents:>6} {hidden_dim:>6} | {times['collect loop'] * 1e3:12.3f} {times['collect batched'] * 1e3:10.3f} | "
+                  f"{times['update loop'] * 1e3:12.3f} {times['update batched'] * 1e3:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
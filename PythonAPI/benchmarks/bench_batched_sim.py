@@ -0,0 +1,56 @@
+"""
+Throughput of the batched simulator (env-steps/sec, one env-step = one instance advanced once) as the batch grows,
+PeekabooSimEnv stepped instance by instance is the reference.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from peekaboo_sim_env import PeekabooSimEnv, ACTION_BRANCHES
+from peekaboo_batched_sim import BatchedPeekabooSim
+
+
+def bench_single(map_path: str, num_steps: int, seed: int) -> float:
+    env = PeekabooSimEnv(map_path, seed=seed)
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, ACTION_BRANCHES, (num_steps, env.n_agents, len(ACTION_BRANCHES)))
+    start = perf_counter()
+    for step_actions in actions:
+        _, _, dones, _ = env.step(dict(zip(env.possible_agents, step_actions)))
+        if any(dones.values()):
+            env.reset()
+    return num_steps / (perf_counter() - start)
+
+
+def bench_batched(map_path: str, num_envs: int, num_steps: int, seed: int) -> float:
+    env = BatchedPeekabooSim([map_path], num_envs, seed=seed)
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, ACTION_BRANCHES, (num_steps, num_envs, env.n_agents, len(ACTION_BRANCHES)))
+    env.step(actions[0])
+    start = perf_counter()
+    for step_actions in actions:
+        env.step(step_actions)
+    return num_envs * num_steps / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--num-envs", type=int, nargs="+", default=[1, 16, 64, 256, 1024, 4096])
+    parser.add_argument("--env-steps", type=int, default=20000, help="env-steps per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    reference = bench_single(args.map, min(args.env_steps, 5000), args.seed)
+    print(f"{'PeekabooSimEnv':>16}: {reference:12.0f} env-steps/sec")
+    for num_envs in args.num_envs:
+        throughput = bench_batched(args.map, num_envs, max(args.env_steps // num_envs, 5), args.seed)
+        print(f"{f'K = {num_envs}':>16}: {throughput:12.0f} env-steps/sec ({throughput / reference:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
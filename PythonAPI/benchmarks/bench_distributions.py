@@ -0,0 +1,90 @@
+"""
+Masked MultiDiscrete([5, 3, 2, 2]) actions: one CategoricalMasked per branch with masks converted from NumPy on every call,
+as MultiDiscreteActorNetwork used to do, against the fused MaskedMultiDiscrete of baselines/distributions.py.
+Sampling (collection) and log-prob + entropy with backward (PPO update) are timed separately, network excluded.
+"""
+import sys
+sys.path.append("../baselines")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from distributions import MaskedMultiDiscrete
+
+NVEC = [5, 3, 2, 2]
+
+
+class CategoricalMasked(torch.distributions.Categorical):
+    #the per-branch distribution MultiDiscreteActorNetwork used before (True = available there)
+    def __init__(self, logits, masks):
+        self.masks = masks.type(torch.BoolTensor).to(logits.device)
+        logits = torch.where(self.masks, logits, torch.tensor(-1e8).to(logits.device))
+        super().__init__(logits=logits)
+
+    def entropy(self):
+        p_log_p = self.logits * self.probs
+        p_log_p = torch.where(self.masks, p_log_p, torch.tensor(0.0).to(self.logits.device))
+        return -p_log_p.sum(-1)
+
+
+def per_branch(logits, numpy_masks, action=None):
+    masks = [torch.BoolTensor(mask) for mask in numpy_masks]
+    categoricals = [CategoricalMasked(branch, mask) for branch, mask in zip(torch.split(logits, NVEC, dim=-1), masks)]
+    if action is None:
+        action = torch.stack([categorical.sample() for categorical in categoricals])
+    logprob = torch.stack([categorical.log_prob(a) for a, categorical in zip(action, categoricals)])
+    entropy = torch.stack([categorical.entropy() for categorical in categoricals])
+    return action.T, logprob.sum(0), entropy.sum(0)
+
+
+def fused(logits, mask, action=None):
+    distribution = MaskedMultiDiscrete(logits, NVEC, mask)
+    if action is None:
+        action = distribution.sample()
+    return action, distribution.log_prob(action), distribution.entropy()
+
+
+def timed(fn, repeats: int) -> float:
+    fn()
+    start = perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"{'batch':>6} | {'sample':>20} | {'update':>20}   (us per call, per-branch / fused)")
+    for batch in args.batch:
+        numpy_mask = np.random.default_rng(0).random((batch, sum(NVEC))) < 0.2
+        numpy_mask[:, [0, 5, 8, 10]] = False
+        #the old path only supported one mask, branch by branch, of the "available" kind
+        numpy_branch_masks = np.split(~numpy_mask[0], np.cumsum(NVEC)[:-1])
+        mask = torch.from_numpy(numpy_mask).to(args.device)
+        logits = torch.randn(batch, sum(NVEC), device=args.device, requires_grad=True)
+        actions = fused(logits, mask)[0].detach()
+
+        def update(fn, *fn_args):
+            _, logprob, entropy = fn(*fn_args)
+            (logprob.mean() + entropy.mean()).backward()
+
+        with torch.no_grad():
+            sample = [timed(lambda: per_branch(logits, numpy_branch_masks), args.repeats),
+                      timed(lambda: fused(logits, mask), args.repeats)]
+        train = [timed(lambda: update(per_branch, logits, numpy_branch_masks, actions.T), args.repeats),
+                 timed(lambda: update(fused, logits, mask, actions), args.repeats)]
+        print(f"{batch:>6} | {sample[0] * 1e6:9.1f} {sample[1] * 1e6:9.1f}  | {train[0] * 1e6:9.1f} {train[1] * 1e6:9.1f} "
+              f"  ({sample[0] / sample[1]:.1f}x, {train[0] / train[1]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Loading a map library: parsing the json files with load_map and building the stand-in arrays out of them, against
+compile_maps with a cold cache (parse and write the .npz) and a warm one (hash the json files, memory-map the .npz),
+best of --repeats except for the cold cache.
+The library is --num-maps variants of --map with jittered walls, written to a temporary directory.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+import peekaboo_maps
+from peekaboo_maps import CompiledMap, compile_maps, load_map
+
+
+def write_library(source: str, directory: Path, num_maps: int, seed: int) -> list[Path]:
+    with open(source) as f:
+        config = json.load(f)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(num_maps):
+        for wall in config["Map"]["Walls"]:
+            wall["Position"] = (np.asarray(wall["Position"]) + rng.normal(0.0, 0.1, 3)).tolist()
+        paths.append(directory / f"map_{index:04d}.json")
+        with open(paths[-1], "w") as f:
+            json.dump(config, f, indent=4)
+    return paths
+
+
+def best_of(fn, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--num-maps", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'maps':>6} | {'json':>9} {'cold cache':>11} {'warm cache':>11}   (ms per library)")
+    for num_maps in args.num_maps:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_library(args.map, Path(directory), num_maps, args.seed)
+
+            parsed = best_of(lambda: [CompiledMap.from_config(load_map(path)) for path in paths], args.repeats)
+
+            start = perf_counter()
+            compile_maps(paths)
+            cold = perf_counter() - start
+
+            def warm_load():
+                #a fresh process only has the files
+                peekaboo_maps._compiled_maps.clear()
+                compile_maps(paths)
+
+            warm = best_of(warm_load, args.repeats)
+        print(f"{num_maps:>6} | {parsed * 1e3:9.2f} {cold * 1e3:11.2f} {warm * 1e3:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
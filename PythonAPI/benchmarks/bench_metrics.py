@@ -0,0 +1,70 @@
+"""
+Cost of logging the per-step metrics of MAPPOAgent's collection loop (episode length and per-agent returns):
+a dict built and printed / written as json on every step, as before, against MetricsAggregator
+(two array writes per step, reduced and written on its thread every --windows steps). Output goes to os.devnull.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import json
+import os
+from contextlib import redirect_stdout
+from time import perf_counter
+
+import numpy as np
+
+from mappo import array_to_dict, print_dict
+from metrics import JsonlSink, MetricsAggregator
+
+
+def per_step(steps: int, agent_ids: list[str], sink) -> float:
+    episodic_return = np.zeros(len(agent_ids))
+    start = perf_counter()
+    for step in range(steps):
+        episodic_return += 0.01
+        sink({"episode length": step, "episode return": array_to_dict(episodic_return, agent_ids)})
+    return (perf_counter() - start) / steps
+
+
+def aggregated(steps: int, agent_ids: list[str], sink, window: int) -> tuple[float, float]:
+    """
+    Seconds per step in the loop, and including the final flush
+    """
+    metrics = MetricsAggregator([sink], window=window)
+    length, returns = metrics.scalar("episode length", "last"), metrics.vector("episode return", agent_ids, "last")
+    episodic_return = np.zeros(len(agent_ids))
+    start = perf_counter()
+    for step in range(steps):
+        episodic_return += 0.01
+        metrics.record(length, step)
+        metrics.record(returns, episodic_return)
+        metrics.step()
+    loop = perf_counter() - start
+    metrics.close()
+    return loop / steps, (perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=100000)
+    parser.add_argument("--num-agents", type=int, default=3)
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    agent_ids = [f"agent_{i}" for i in range(args.num_agents)]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        sinks = {"print_dict": print_dict, "jsonl": lambda logs: devnull.write(json.dumps(logs, default=float) + "\n")}
+        results = {}
+        for name, sink in sinks.items():
+            results[f"dict per step, {name}"] = (per_step(args.steps, agent_ids, sink), None)
+            for window in args.windows:
+                results[f"aggregator {window}, {name}"] = aggregated(args.steps, agent_ids, sink, window)
+    print(f"{'':>28} | {'loop us/step':>12} {'with flush':>10}")
+    for name, (loop, total) in results.items():
+        print(f"{name:>28} | {loop * 1e6:12.2f} {'' if total is None else f'{total * 1e6:10.2f}'}")
+
+
+if __name__ == "__main__":
+    main()
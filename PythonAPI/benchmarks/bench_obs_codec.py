@@ -0,0 +1,131 @@
+"""
+Ray observations stored as float32 against RayObservationCodec codes (bit-packed flags, float16 or uint8 hit fractions):
+rollout buffer memory (obs and the centralised state), insert time per step, gather time of a minibatch
+(decoded when encoded), one MAPPOAgent update, and the size of trajectory files, all on the NumPy stand-in.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from peekaboo_obs_codec import RayObservationCodec
+from peekaboo_recorder import TrajectoryRecorder
+from peekaboo_sim_env import ACTION_BRANCHES, PeekabooSimEnv, SimSettings
+from rollout_buffer import RolloutBuffer
+
+FORMATS: tuple[str | None, ...] = (None, "float16", "uint8")
+
+
+def rollout(args) -> np.ndarray:
+    """
+    Observations (steps, n_agents, obs_dim) of random actions
+    """
+    environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.num_steps), array_mode=True)
+    rng = np.random.default_rng(args.seed)
+    observations = [environment.reset()[0].copy()]
+    for _ in range(args.num_steps - 1):
+        obs, _, _, terminated, truncated = environment.step(np.stack([rng.integers(ACTION_BRANCHES) for _ in range(environment.n_agents)]))
+        observations.append(obs.copy())
+        if (terminated | truncated).all():
+            observations[-1] = environment.reset()[0].copy()
+    return np.stack(observations)
+
+
+def buffer_bench(args, observations: np.ndarray, distances: str | None) -> dict:
+    num_steps, num_agents, obs_dim = observations.shape
+    codec = None if distances is None else RayObservationCodec.for_obs_dim(obs_dim, distances=distances)
+    rb = RolloutBuffer(num_steps=num_steps, num_envs=1, num_agents=num_agents, obs_dim=obs_dim, cent_obs_dim=None,
+                       mask_dim=sum(ACTION_BRANCHES), num_branches=len(ACTION_BRANCHES), stack_size=args.stack_size, obs_codec=codec)
+    start = perf_counter()
+    for step in range(num_steps):
+        rb.insert(step, obs=observations[step])
+    insert = (perf_counter() - start) / num_steps
+
+    views = rb.sample_major("obs"), rb.sample_major("cent_obs")
+    minibatch = num_steps * num_agents // args.num_minibatches
+    rng = np.random.default_rng(0)
+    times = []
+    for _ in range(args.repeats):
+        inds = rng.permutation(num_steps * num_agents)[:minibatch]
+        start = perf_counter()
+        rb.gather(views[0], inds)
+        rb.gather(views[1], inds // num_agents)
+        times.append(perf_counter() - start)
+    return {"obs bytes": rb.obs.nbytes, "insert": insert, "gather": float(np.median(times))}
+
+
+def update_bench(args, distances: str | None) -> float:
+    environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.num_steps), array_mode=True)
+    config = dict(agent_hidden_dim=args.hidden_dim, shared_critic=True, shared_optimization=False, ent_coeff=0.01, vf_coeff=0.1, clip_coeff=0.1, gamma=0.99, gae=True,
+                  gae_lambda=0.95, clip_vloss=True, batch_size=args.num_steps, num_minibatches=args.num_minibatches, stack_size=args.stack_size,
+                  total_timesteps=1, num_learning_epochs=1, num_steps=args.num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed,
+                  torch_deterministic=False, lr=3e-4, anneal_lr=False, device="cpu", max_grad_norm=10.0, target_kl=None,
+                  batched_agents=True, observation_codec=distances)
+    torch.manual_seed(args.seed)
+    agent = MAPPOAgent(environment=environment, config=config, track_wandb=False, **config)
+    mappo.print_dict = lambda logs: None
+    rb = agent.rollout_buffer
+    next_obs, _ = agent._collect(rb, agent._policy(), environment, log_steps=False)
+    agent._compute_advantages(rb, next_obs, agent._policy())
+    agent._update(rb, perf_counter())
+    times = []
+    for _ in range(3):
+        start = perf_counter()
+        agent._update(rb, start)
+        times.append(perf_counter() - start)
+    environment.close()
+    return min(times)
+
+
+def file_bench(args, distances: str | None, compression: str | None) -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trajectories.h5")
+        environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.num_steps), array_mode=True)
+        codec = None if distances is None else RayObservationCodec.for_environment(environment, distances)
+        rng = np.random.default_rng(args.seed)
+        with TrajectoryRecorder(environment, path, compression=compression, observation_codec=codec) as recorder:
+            recorder.reset()
+            for _ in range(args.record_steps):
+                _, _, _, terminated, truncated = recorder.step(np.stack([rng.integers(ACTION_BRANCHES) for _ in range(environment.n_agents)]))
+                if (terminated | truncated).all():
+                    recorder.reset()
+        return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--num-steps", type=int, default=300)
+    parser.add_argument("--num-minibatches", type=int, default=10)
+    parser.add_argument("--stack-size", type=int, default=1)
+    parser.add_argument("--hidden-dim", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--record-steps", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    observations = rollout(args)
+    #the centralised state used to be a float32 copy of the observations of all agents
+    before = 2 * observations.nbytes
+    print(f"{'storage':>8} | {'obs+cent KB':>11} {'ratio':>6} {'insert us':>9} {'gather us':>9} {'update s':>8} | "
+          f"{'file KB':>8} {'gzip KB':>8}")
+    for distances in FORMATS:
+        result = buffer_bench(args, observations, distances)
+        update = update_bench(args, distances)
+        files = [file_bench(args, distances, compression) / 1024 for compression in (None, "gzip")]
+        print(f"{distances or 'float32':>8} | {result['obs bytes'] / 1024:11.1f} {before / result['obs bytes']:6.1f} "
+              f"{result['insert'] * 1e6:9.1f} {result['gather'] * 1e6:9.1f} {update:8.3f} | {files[0]:8.1f} {files[1]:8.1f}")
+    print(f"float32 obs and cent_obs stored apart, as before: {before / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
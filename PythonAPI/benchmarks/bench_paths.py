@@ -0,0 +1,73 @@
+"""
+Shortest path index of a map: distance fields computed one by one against one batch, the all-cells table,
+lookups per position, and the overhead of path metrics on PeekabooSimEnv steps.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from peekaboo_maps import compile_map
+from peekaboo_paths import PathIndex, distance_fields
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+
+
+def best_of(fn, repeats: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def steps_per_second(args, path_metrics: bool) -> float:
+    environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=10 ** 6))
+    if path_metrics:
+        environment.enable_path_metrics(args.resolution)
+    agent_ids = environment.possible_agents
+    actions = [{agent_id: environment.action_space(agent_id).sample() for agent_id in agent_ids} for _ in range(args.num_steps)]
+
+    def run():
+        environment.reset()
+        for step_actions in actions:
+            environment.step(step_actions)
+
+    return args.num_steps / best_of(run, args.repeats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--resolution", type=float, default=5.0)
+    parser.add_argument("--num-fields", type=int, default=64)
+    parser.add_argument("--num-steps", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    index = PathIndex(compile_map(args.map), resolution=args.resolution)
+    sources = np.random.default_rng(args.seed).choice(np.flatnonzero(index.free), args.num_fields, replace=False)
+    single = best_of(lambda: [distance_fields(index.free, sources[i:i + 1]) for i in range(len(sources))], args.repeats)
+    batched = best_of(lambda: distance_fields(index.free, sources), args.repeats)
+    print(f"grid {index.shape}, {index.free.mean():.0%} free")
+    print(f"{args.num_fields} fields: one by one {single * 1e3:.1f} ms, batched {batched * 1e3:.1f} ms ({single / batched:.1f}x)")
+    start = perf_counter()
+    index.precompute()
+    print(f"table of all {index.free.sum()} free cells: {perf_counter() - start:.2f} s, {index._table.nbytes / 2 ** 20:.1f} MB")
+
+    positions = np.random.default_rng(args.seed).uniform(-index.map.map_size / 2.0, index.map.map_size / 2.0, (100000, 2))
+    goals = index.map.goal_positions
+    lookup = best_of(lambda: index.distance(positions, goals), args.repeats)
+    print(f"lookups: {lookup / len(positions) * 1e9:.0f} ns per position ({len(goals)} goals)")
+
+    plain, tracked = steps_per_second(args, False), steps_per_second(args, True)
+    print(f"PeekabooSimEnv: {plain:.0f} steps/s, with path metrics {tracked:.0f} steps/s ({1e6 / tracked - 1e6 / plain:+.1f} us per step)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Where the time of a MAPPO run goes: latency percentiles of every instrumented phase of a short MAPPOAgent.learn
+on the NumPy stand-in (or the Unity build with --executable), and the wall time with profiling on and off.
+Also the cost of the instrumentation itself per wrapped call.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import time
+from time import perf_counter
+
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from peekaboo_profiling import LatencyProfiler
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+
+
+class Noop:
+    def call(self):
+        pass
+
+
+def wrapper_overhead(repeats: int) -> float:
+    noop = Noop()
+    plain = noop.call
+    start = perf_counter()
+    for _ in range(repeats):
+        plain()
+    reference = perf_counter() - start
+    LatencyProfiler().instrument(noop, "call", "noop")
+    start = perf_counter()
+    for _ in range(repeats):
+        noop.call()
+    return (perf_counter() - start - reference) / repeats
+
+
+def run(args, profile_latency: bool) -> tuple[float, MAPPOAgent]:
+    if args.executable is not None:
+        from peekaboo_environment import PeekabooEnv
+        environment = PeekabooEnv(args.executable, seed=args.seed, worker_id=args.worker_id, array_mode=args.array_mode)
+    else:
+        environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.num_steps * 4),
+                                     array_mode=args.array_mode)
+    config = dict(agent_hidden_dim=args.hidden_dim, shared_critic=False, shared_optimization=False, ent_coeff=0.01, vf_coeff=0.1,
+                  clip_coeff=0.1, gamma=0.99, gae=True, gae_lambda=0.95, clip_vloss=True, batch_size=args.num_steps,
+                  num_minibatches=4, stack_size=1, total_timesteps=args.updates, num_learning_epochs=args.epochs,
+                  num_steps=args.num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed, torch_deterministic=False,
+                  lr=3e-4, anneal_lr=True, device="cpu", max_grad_norm=10.0, target_kl=None, batched_agents=True,
+                  profile_latency=profile_latency)
+    agent = MAPPOAgent(environment=environment, config=config, track_wandb=False, **config)
+    mappo.print_dict = lambda logs: None
+    start = perf_counter()
+    agent.learn()
+    return perf_counter() - start, agent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--executable", default=None)
+    parser.add_argument("--worker-id", type=int, default=0)
+    parser.add_argument("--array-mode", action="store_true")
+    parser.add_argument("--updates", type=int, default=5)
+    parser.add_argument("--num-steps", type=int, default=256)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--hidden-dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"instrumentation: {wrapper_overhead(200000) * 1e6:.2f} us per wrapped call")
+    torch.manual_seed(args.seed)
+    plain, _ = run(args, profile_latency=False)
+    profiled, agent = run(args, profile_latency=True)
+    print(f"learn: {plain:.2f} s without profiling, {profiled:.2f} s with it\n")
+    print(f"{'phase':>30} | {'count':>6} {'total s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'per s':>8}")
+    for phase, summary in agent.profiler.summary().items():
+        print(f"{phase:>30} | {summary['count']:6d} {summary['total s']:8.3f} {summary['p50 ms']:8.3f} "
+              f"{summary['p95 ms']:8.3f} {summary['p99 ms']:8.3f} {summary['per second']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
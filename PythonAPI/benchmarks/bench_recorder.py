@@ -0,0 +1,88 @@
+"""
+TrajectoryRecorder write overhead per step of the NumPy stand-in in array mode for a few compression settings,
+and read throughput (steps per second) of TrajectoryReader: uniform sample() on the chunked file, epoch-style minibatches(),
+and sample() on a memory-mapped contiguous copy.
+"""
+import sys
+sys.path.append("..")
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from peekaboo_recorder import TrajectoryRecorder, TrajectoryReader, export_contiguous
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+
+
+def run_steps(environment, num_steps: int, seed: int) -> float:
+    rng = np.random.default_rng(seed)
+    actions = np.stack([rng.integers(ACTION_BRANCHES, size=(num_steps, len(ACTION_BRANCHES)))
+                        for _ in environment.possible_agents], axis=1)
+    environment.reset()
+    start = perf_counter()
+    for step in range(num_steps):
+        _, _, _, terminated, truncated = environment.step(actions[step])
+        if (terminated | truncated).all():
+            environment.reset()
+    return (perf_counter() - start) / num_steps
+
+
+def read_rate(fn, repeats: int) -> float:
+    fn()
+    start = perf_counter()
+    steps = sum(len(batch["rewards"]) for _ in range(repeats) for batch in fn())
+    return steps / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--steps", type=int, default=20000)
+    parser.add_argument("--chunk-steps", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    def make_environment():
+        return PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=500), array_mode=True)
+
+    configurations = {"no recorder": None, "none": (None, None), "lzf": ("lzf", None), "gzip1": ("gzip", 1), "gzip4": ("gzip", 4)}
+    with tempfile.TemporaryDirectory() as directory:
+        #interleaved repeats, the best one counts: single runs on a busy machine are too noisy for a ~10% difference
+        times = {name: np.inf for name in configurations}
+        for _ in range(args.repeats):
+            for name, compression in configurations.items():
+                environment = make_environment()
+                if compression is not None:
+                    environment = TrajectoryRecorder(environment, os.path.join(directory, f"{name}.h5"), map_id="dev_map",
+                                                     chunk_steps=args.chunk_steps, compression=compression[0],
+                                                     compression_opts=compression[1], mode="w")
+                times[name] = min(times[name], run_steps(environment, args.steps, args.seed))
+                environment.close()
+        reference = times.pop("no recorder")
+        print(f"{'no recorder':>12}: {reference * 1e6:7.1f} us/step")
+        for name, elapsed in times.items():
+            path = os.path.join(directory, f"{name}.h5")
+            print(f"{name:>12}: {elapsed * 1e6:7.1f} us/step (+{(elapsed - reference) * 1e6:.1f}), "
+                  f"{os.path.getsize(path) / args.steps:.0f} bytes/step")
+
+        path = os.path.join(directory, "gzip4.h5")
+        contiguous = os.path.join(directory, "contiguous.h5")
+        export_contiguous(path, contiguous)
+        repeats = max(args.steps // args.batch_size // 4, 1)
+        with TrajectoryReader(path, seed=args.seed) as reader, TrajectoryReader(contiguous, seed=args.seed) as mapped:
+            rates = {
+                "sample, chunk cache": read_rate(lambda: [reader.sample(args.batch_size)], repeats),
+                "minibatches": read_rate(lambda: reader.minibatches(args.batch_size), 1),
+                "sample, mmap": read_rate(lambda: [mapped.sample(args.batch_size)], repeats),
+            }
+        for name, rate in rates.items():
+            print(f"{name:>20}: {rate:10.0f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Memory and PPO update time of MAPPOAgent's per-agent networks (a loop of agents with their own AdamW,
+or stacked with batched_agents) against shared_optimization (one network for all agents with agent id and team embeddings).
+Memory counts the parameters and the AdamW state, time is one _update (all epochs and minibatches) on the same rollout.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+from time import perf_counter
+
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+
+MODES = {
+    "per-agent loop": dict(batched_agents=False, shared_optimization=False),
+    "per-agent batched": dict(batched_agents=True, shared_optimization=False),
+    "shared": dict(batched_agents=False, shared_optimization=True),
+}
+
+
+def training_memory(agent: MAPPOAgent) -> tuple[int, int]:
+    """
+    Parameters and bytes of parameters and optimizer state
+    """
+    modules = agent.agents if agent.agents else [agent.batched_agent]
+    parameters = [param for module in modules for param in module.parameters()]
+    nbytes = sum(param.numel() * param.element_size() for param in parameters)
+    for optimizer in agent.optimizers:
+        for state in optimizer.state.values():
+            nbytes += sum(value.numel() * value.element_size() for value in state.values() if torch.is_tensor(value))
+    return sum(param.numel() for param in parameters), nbytes
+
+
+def bench(args, mode: dict) -> dict:
+    environment = PeekabooSimEnv(args.map, seed=args.seed, settings=SimSettings(max_environment_steps=args.num_steps), array_mode=True)
+    config = dict(agent_hidden_dim=args.hidden_dim, shared_critic=args.shared_critic, ent_coeff=0.01, vf_coeff=0.1, clip_coeff=0.1,
+                  gamma=0.99, gae=True, gae_lambda=0.95, clip_vloss=True, batch_size=args.num_steps,
+                  num_minibatches=args.num_minibatches, stack_size=1, total_timesteps=1, num_learning_epochs=args.epochs,
+                  num_steps=args.num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed, torch_deterministic=False,
+                  lr=3e-4, anneal_lr=False, device=args.device, max_grad_norm=10.0, target_kl=None, **mode)
+    torch.manual_seed(args.seed)
+    agent = MAPPOAgent(environment=environment, config=config, track_wandb=False, **config)
+    mappo.print_dict = lambda logs: None
+
+    rb = agent.rollout_buffer
+    next_obs, _ = agent._collect(rb, agent._policy(), environment, log_steps=False)
+    agent._compute_advantages(rb, next_obs, agent._policy())
+    #the first update allocates the optimizer state
+    agent._update(rb, perf_counter())
+    times = []
+    for _ in range(args.repeats):
+        if agent.device.type == "cuda":
+            torch.cuda.synchronize()
+        start = perf_counter()
+        agent._update(rb, start)
+        if agent.device.type == "cuda":
+            torch.cuda.synchronize()
+        times.append(perf_counter() - start)
+    environment.close()
+    parameters, nbytes = training_memory(agent)
+    return {"parameters": parameters, "memory": nbytes, "update": min(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--hidden-dim", type=int, default=1024)
+    parser.add_argument("--shared-critic", action="store_true")
+    parser.add_argument("--num-steps", type=int, default=300, help="rollout length, every step is a sample of each agent")
+    parser.add_argument("--num-minibatches", type=int, default=10)
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = {name: bench(args, mode) for name, mode in MODES.items()}
+    reference = results["per-agent loop"]
+    print(f"{'mode':>18} | {'parameters':>11} {'memory MB':>10} {'update s':>9} | {'memory':>7} {'update':>7}   (relative to the loop)")
+    for name, result in results.items():
+        print(f"{name:>18} | {result['parameters']:11d} {result['memory'] / 2 ** 20:10.1f} {result['update']:9.3f} | "
+              f"{result['memory'] / reference['memory']:7.2f} {result['update'] / reference['update']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Regression suite of the environment and training hot paths, on the NumPy stand-in (no Unity build, no GPU needed):
+stand-in step throughput (dict and array API) and reset latency, MAPPOAgent rollout collection,
+GAE, and PPO minibatch updates of MAPPOAgent, for several agent counts and agent_hidden_dims.
+
+    python bench_suite.py --save suite_baseline.json     #record the baseline of this machine
+    python bench_suite.py --compare suite_baseline.json  #exits with 1 when a metric is worse than the baseline by more than --tolerance
+
+Every metric is the best of --repeats runs, the baseline json keeps the values, units, and the settings they were measured with.
+"""
+import sys
+sys.path.append("..")
+sys.path.append("../baselines")
+
+import argparse
+import copy
+import fnmatch
+import json
+import platform
+import time
+from time import perf_counter
+
+import numpy as np
+import torch
+
+import mappo
+from mappo import MAPPOAgent
+from advantages import compute_gae
+from peekaboo_maps import load_map
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+
+# unit -> whether larger values are better
+UNITS: dict[str, bool] = {"steps/s": True, "ms": False}
+
+
+def best_of(fn, repeats: int) -> float:
+    """
+    Shortest of `repeats` runs of fn() (seconds), after a warm-up run
+    """
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def make_environment(args, num_agents: int, array_mode: bool) -> PeekabooSimEnv:
+    #agents of the map are repeated (or dropped) to get `num_agents`, spawn positions are randomized anyway
+    map_config = load_map(args.map)
+    map_config.agents = [copy.deepcopy(map_config.agents[i % len(map_config.agents)]) for i in range(num_agents)]
+    #one frame per step, as suite_baseline.json was measured
+    settings = SimSettings(max_environment_steps=10 ** 6, decision_period=1)
+    return PeekabooSimEnv(map_config, seed=args.seed, settings=settings, array_mode=array_mode)
+
+
+def make_agent(args, num_agents: int, hidden_dim: int) -> MAPPOAgent:
+    config = dict(agent_hidden_dim=hidden_dim, shared_critic=False, shared_optimization=False, ent_coeff=0.01, vf_coeff=0.1,
+                  clip_coeff=0.1, gamma=0.99, gae=True, gae_lambda=0.95, clip_vloss=True, batch_size=args.num_steps,
+                  num_minibatches=args.num_minibatches, stack_size=1, total_timesteps=1, num_learning_epochs=1,
+                  num_steps=args.num_steps, num_eval_steps=1, num_estimations=1, seed=args.seed, torch_deterministic=False,
+                  lr=3e-4, anneal_lr=False, device="cpu", max_grad_norm=10.0, target_kl=None, batched_agents=args.batched_agents)
+    return MAPPOAgent(environment=make_environment(args, num_agents, array_mode=True), config=config, track_wandb=False, **config)
+
+
+def bench_environment(args, num_agents: int) -> dict[str, tuple[float, str]]:
+    metrics = {}
+    for array_mode in (False, True):
+        environment = make_environment(args, num_agents, array_mode)
+        rng = np.random.default_rng(args.seed)
+        actions = rng.integers(0, ACTION_BRANCHES, (args.num_steps, num_agents, len(ACTION_BRANCHES)))
+        agent_ids = environment.possible_agents
+
+        def run():
+            environment.reset()
+            for step_actions in actions:
+                environment.step(step_actions if array_mode else dict(zip(agent_ids, step_actions)))
+
+        api = "array" if array_mode else "dict"
+        metrics[f"env step/{api}/agents={num_agents}"] = (args.num_steps / best_of(run, args.repeats), "steps/s")
+    metrics[f"env reset/agents={num_agents}"] = (best_of(environment.reset, args.repeats * 10) * 1e3, "ms")
+    return metrics
+
+
+def bench_training(args, num_agents: int, hidden_dim: int) -> dict[str, tuple[float, str]]:
+    agent = make_agent(args, num_agents, hidden_dim)
+    rb, policy = agent.rollout_buffer, agent._policy()
+    name = f"agents={num_agents},hidden={hidden_dim}"
+
+    #rollouts stop early at the end of an episode, so the rate of every run counts
+    rates = []
+    for _ in range(args.repeats + 1):
+        start = perf_counter()
+        agent._collect(rb, policy, agent.environment, log_steps=False)
+        rates.append(rb.length / (perf_counter() - start))
+    metrics = {f"collect/{name}": (max(rates[1:]), "steps/s")}
+
+    next_obs, _ = agent._collect(rb, policy, agent.environment, log_steps=False)
+    agent._compute_advantages(rb, next_obs, policy)
+    #one epoch of num_minibatches minibatches per call
+    update_time = best_of(lambda: agent._update(rb, time.time()), args.repeats)
+    metrics[f"ppo minibatch update/{name}"] = (update_time / args.num_minibatches * 1e3, "ms")
+    return metrics
+
+
+def bench_gae(args, num_agents: int) -> dict[str, tuple[float, str]]:
+    rng = np.random.default_rng(args.seed)
+    shape = (args.num_steps, args.num_envs, num_agents)
+    rewards, values = rng.standard_normal(shape), rng.standard_normal(shape)
+    terminated, truncated = rng.random(shape) < 0.01, rng.random(shape) < 0.01
+    last_values = rng.standard_normal(shape[1:])
+    tensors = [torch.from_numpy(array) for array in (rewards, values, terminated, truncated, last_values)]
+    elapsed = best_of(lambda: compute_gae(*tensors, 0.99, 0.95), args.repeats * 10)
+    return {f"gae/steps={args.num_steps},envs={args.num_envs},agents={num_agents}": (elapsed * 1e3, "ms")}
+
+
+def run_suite(args) -> dict[str, dict]:
+    mappo.print_dict = lambda logs: None
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.torch_threads)
+    metrics = {}
+    for num_agents in args.num_agents:
+        metrics.update(bench_environment(args, num_agents))
+        metrics.update(bench_gae(args, num_agents))
+        for hidden_dim in args.hidden_dims:
+            metrics.update(bench_training(args, num_agents, hidden_dim))
+    return {name: {"value": value, "unit": unit} for name, (value, unit) in metrics.items()}
+
+
+def tolerance_of(name: str, tolerance: float, overrides: dict[str, float]) -> float:
+    for pattern, value in overrides.items():
+        if fnmatch.fnmatch(name, pattern):
+            return value
+    return tolerance
+
+
+def compare(metrics: dict[str, dict], baseline: dict[str, dict], tolerance: float,
+            overrides: dict[str, float] | None = None) -> list[str]:
+    """
+    Descriptions of the metrics worse than their baseline by more than the relative tolerance
+    (the first matching fnmatch pattern of `overrides`, `tolerance` otherwise). Metrics missing on either side are skipped.
+    """
+    regressions = []
+    for name, metric in metrics.items():
+        if name not in baseline:
+            continue
+        reference, value = baseline[name]["value"], metric["value"]
+        allowed = tolerance_of(name, tolerance, overrides or {})
+        change = (value - reference) / reference
+        if not UNITS[metric["unit"]]:
+            change = -change
+        if change < -allowed:
+            regressions.append(f"{name}: {value:.4g} {metric['unit']} against {reference:.4g} ({change:+.0%}, tolerance {allowed:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--map", default="../../configs/maps/dev_map.json")
+    parser.add_argument("--num-agents", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--hidden-dims", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--num-steps", type=int, default=128)
+    parser.add_argument("--num-envs", type=int, default=16, help="environments of the GAE batch")
+    parser.add_argument("--num-minibatches", type=int, default=4)
+    parser.add_argument("--batched-agents", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--torch-threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", default=None, help="json file to write the results to")
+    parser.add_argument("--compare", default=None, help="baseline json to check the results against")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--metric-tolerance", nargs="*", default=[], metavar="PATTERN=TOLERANCE",
+                        help="tolerances of the metrics matching fnmatch patterns, e.g. 'env reset/*=0.5'")
+    args = parser.parse_args()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("save", "compare", "tolerance", "metric_tolerance")}
+    metrics = run_suite(args)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        baseline, saved_settings = saved["metrics"], saved["settings"]
+    for name, metric in metrics.items():
+        line = f"{name:>45}: {metric['value']:12.4g} {metric['unit']:<8}"
+        if baseline is not None and name in baseline:
+            line += f" baseline {baseline[name]['value']:12.4g}"
+        print(line)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({"machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(),
+                                   "torch": torch.__version__, "numpy": np.__version__},
+                       "settings": settings, "metrics": metrics}, f, indent=4)
+
+    if baseline is not None:
+        #repeats only make the measurements more stable
+        if {**saved_settings, "repeats": args.repeats} != settings:
+            print(f"\nNotice: the baseline was measured with other settings: {saved_settings}")
+        overrides = dict((pattern, float(value)) for pattern, value in (item.rsplit("=", 1) for item in args.metric_tolerance))
+        regressions = compare(metrics, baseline, args.tolerance, overrides)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from pathlib import Path
+
+import numpy as np
+
+from peekaboo_maps import CompiledMap, MapConfig, compile_maps
+from peekaboo_sim_env import (
+    ACTION_BRANCHES, GameEvent, MASK_RAY_ANGLES, MOVE_DIRECTIONS, ROTATE_DIRECTIONS, SimSettings, TAG_INDEX,
+    circle_box_overlap, encode_rays, heading, ray_angles, ray_box_distance, ray_bounds_distance, ray_circle_distance,
+)
+
+#
+# Struct-of-arrays version of PeekabooSimEnv: K independent episodes are stored in (K, ...) arrays
+# and advanced by a single `step` call. Rules are the same as in PeekabooSimEnv.
+
+# what a physics frame changes, kept for instances whose episode ended earlier in the decision
+_FRAME_STATE: tuple[str, ...] = ("wall_centers", "agent_positions", "agent_yaws", "agent_in_goal", "goal_completed", "collision_counter",
+                                 "touching_wall", "touching_agent", "touching_barrier", "step_count")
+
+
+def _pad(rows: list[np.ndarray], width: int, fill: float = 0.0) -> np.ndarray:
+    padded = np.full((len(rows), width) + rows[0].shape[1:], fill, dtype=rows[0].dtype)
+    for i, row in enumerate(rows):
+        padded[i, :len(row)] = row
+    return padded
+
+
+class BatchedPeekabooSim:
+    def __init__(self, maps: list[str | Path | dict | MapConfig | CompiledMap], num_envs: int, seed: int | None = None,
+                 settings: SimSettings | None = None, auto_reset: bool = True) -> None:
+        """
+        Steps `num_envs` Peekaboo episodes at once, instance i plays maps[i % len(maps)] (compiled with compile_maps).
+        Walls and goals of smaller maps are padded and masked out, all maps must have the same number of agents.
+
+        step(actions[K, n_agents, 4]) -> observations[K, n_agents, obs_dim], action_masks[K, n_agents, 12],
+                                         rewards[K, n_agents], terminated[K], truncated[K]
+        With `auto_reset` finished instances are reset inside the step,
+        their last observations are kept in `terminal_observations`.
+        """
+        self.settings = SimSettings() if settings is None else settings
+        self.num_envs = num_envs
+        self.auto_reset = auto_reset
+        self._rng = np.random.default_rng(seed)
+        settings = self.settings
+
+        self.maps = compiled = compile_maps(maps)
+        self.n_agents = compiled[0].n_agents
+        if any(item.n_agents != self.n_agents for item in compiled):
+            raise ValueError("All maps of a batch should have the same number of agents")
+        self.map_indices = np.arange(num_envs) % len(compiled)
+        chosen = [compiled[i] for i in self.map_indices]
+
+        num_walls = max(1, max(len(item.wall_centers) for item in compiled))
+        num_goals = max(len(item.goal_positions) for item in compiled)
+        self.wall_valid = _pad([np.ones(len(item.wall_centers), dtype=bool) for item in chosen], num_walls, False)
+        self.wall_start_centers = _pad([item.wall_centers for item in chosen], num_walls)
+        wall_yaws = _pad([item.wall_yaws for item in chosen], num_walls)
+        self.wall_cos, self.wall_sin = np.cos(wall_yaws), np.sin(wall_yaws)
+        self.wall_half_extents = _pad([item.wall_half_extents for item in chosen], num_walls)
+        self.wall_movable = _pad([item.is_type(item.wall_types, "Movable") for item in chosen], num_walls, False)
+        self.wall_tags = np.where(self.wall_movable, TAG_INDEX["MovableObstacle"], TAG_INDEX["Obstacle"])
+        self.half_size = np.stack([item.map_size / 2.0 for item in chosen])
+
+        self.agent_start_positions = np.stack([item.agent_positions for item in chosen])
+        self.agent_start_yaws = np.stack([item.agent_yaws for item in chosen])
+        self.agent_active = np.stack([item.is_type(item.agent_types, "Active") for item in chosen])
+        self.agent_tags = np.where(self.agent_active, TAG_INDEX["ActiveAgent"], TAG_INDEX["Agent"])
+        self.goal_valid = _pad([np.ones(len(item.goal_positions), dtype=bool) for item in chosen], num_goals, False)
+        self.goal_start_positions = _pad([item.goal_positions for item in chosen], num_goals)
+
+        self._circle_radii = np.concatenate([
+            np.full((num_envs, self.n_agents), settings.agent_radius), np.full((num_envs, num_goals), settings.goal_radius)
+        ], axis=1)
+        self._hit_tags = np.concatenate([
+            self.wall_tags, self.agent_tags, np.full((num_envs, num_goals), TAG_INDEX["Goal"]), np.full((num_envs, 1), TAG_INDEX["Barrier"])
+        ], axis=1)
+        self._invalid_hits = ~np.concatenate([
+            self.wall_valid, np.ones((num_envs, self.n_agents), dtype=bool), self.goal_valid, np.ones((num_envs, 1), dtype=bool)
+        ], axis=1)
+
+        self.ray_angles = ray_angles(settings.rays_per_direction, settings.max_ray_degrees)
+        self.observation_dim = len(self.ray_angles) * (settings.num_detectable_tags + 2)
+
+        shape = (num_envs, self.n_agents)
+        self.wall_centers = self.wall_start_centers.copy()
+        self.agent_positions = self.agent_start_positions.copy()
+        self.agent_yaws = self.agent_start_yaws.copy()
+        self.goal_positions = self.goal_start_positions.copy()
+        self.goal_completed = np.zeros((num_envs, num_goals), dtype=bool)
+        self.agent_in_goal = np.zeros(shape + (num_goals,), dtype=bool)
+        self.collision_counter = np.zeros(shape, dtype=np.int64)
+        self.touching_wall = np.zeros(shape, dtype=bool)
+        self.touching_agent = np.zeros(shape, dtype=bool)
+        self.touching_barrier = np.zeros(shape, dtype=bool)
+        self.step_count = np.zeros(num_envs, dtype=np.int64)
+        self.episode_returns = np.zeros(shape, dtype=np.float64)
+        self.group_rewards = np.zeros(num_envs, dtype=np.float64)
+        self.terminal_observations = np.zeros(shape + (self.observation_dim,), dtype=np.float32)
+        self.reset()
+
+    def _free_spawns(self, envs: np.ndarray, taken: list[np.ndarray], fallback: np.ndarray) -> np.ndarray:
+        """
+        Vectorised EnvController.GetRandomSpawnPos: all candidates of all instances are checked at once,
+        the first free one is taken, the fallback is used if there is none.
+        """
+        settings = self.settings
+        tries = settings.max_spawn_attempts
+        extents = self.half_size[envs] * settings.spawn_area_margin_multiplier
+        candidates = self._rng.uniform(-1.0, 1.0, (len(envs), tries, 2)) * extents[:, None, :]
+        blocked = (circle_box_overlap(candidates, settings.spawn_clearance, self.wall_centers[envs], self.wall_cos[envs],
+                                      self.wall_sin[envs], self.wall_half_extents[envs]) & self.wall_valid[envs][:, None, :]).any(-1)
+        for other in taken:
+            blocked |= np.linalg.norm(candidates - other[:, None, :], axis=-1) < settings.spawn_clearance
+        first_free = (~blocked).argmax(-1)
+        found = ~blocked[np.arange(len(envs)), first_free]
+        return np.where(found[:, None], candidates[np.arange(len(envs)), first_free], fallback)
+
+    def reset(self, envs: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Resets the given instances (all by default), returns observations and action masks of the whole batch
+        """
+        settings = self.settings
+        envs = np.arange(self.num_envs) if envs is None else np.asarray(envs)
+        if len(envs) > 0:
+            self.wall_centers[envs] = self.wall_start_centers[envs]
+            taken = []
+            for i in range(self.goal_positions.shape[1]):
+                start = self.goal_start_positions[envs, i]
+                self.goal_positions[envs, i] = self._free_spawns(envs, taken, start) if settings.randomize_goal_position else start
+                taken.append(self.goal_positions[envs, i])
+            for i in range(self.n_agents):
+                start = self.agent_start_positions[envs, i]
+                self.agent_positions[envs, i] = self._free_spawns(envs, taken, start) if settings.randomize_agent_position else start
+                taken.append(self.agent_positions[envs, i])
+            if settings.randomize_agent_rotation:
+                self.agent_yaws[envs] = self._rng.uniform(0.0, 2.0 * np.pi, (len(envs), self.n_agents))
+            else:
+                self.agent_yaws[envs] = self.agent_start_yaws[envs]
+
+            self.goal_completed[envs] = False
+            self.agent_in_goal[envs] = False
+            self.collision_counter[envs] = 0
+            self.touching_wall[envs] = False
+            self.touching_agent[envs] = False
+            self.touching_barrier[envs] = False
+            self.step_count[envs] = 0
+            self.episode_returns[envs] = 0.0
+        return self.sense()
+
+    def sense(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched PeekabooSimEnv.sense: observations (K, n_agents, obs_dim) and action masks (K, n_agents, 12)
+        """
+        settings = self.settings
+        num_envs, num_rays = self.num_envs, len(self.ray_angles)
+        angles = np.concatenate([self.ray_angles, MASK_RAY_ANGLES])
+        yaws = self.agent_yaws[:, :, None] + angles
+        directions, _ = heading(yaws.reshape(num_envs, -1))
+        origins = np.repeat(self.agent_positions, len(angles), axis=1)
+        source_agents = np.repeat(np.arange(self.n_agents), len(angles))
+
+        wall_distances = ray_box_distance(origins, directions, self.wall_centers, self.wall_cos, self.wall_sin, self.wall_half_extents)
+        circle_distances = ray_circle_distance(origins, directions, np.concatenate([self.agent_positions, self.goal_positions], axis=1),
+                                               self._circle_radii)
+        circle_distances[:, np.arange(len(source_agents)), source_agents] = np.inf
+        barrier_distances = ray_bounds_distance(origins, directions, self.half_size)
+        distances = np.concatenate([wall_distances, circle_distances, barrier_distances[..., None]], axis=-1)
+        distances[np.broadcast_to(self._invalid_hits[:, None, :], distances.shape)] = np.inf
+
+        nearest = distances.argmin(-1)
+        distances = np.take_along_axis(distances, nearest[..., None], axis=-1)[..., 0].reshape(yaws.shape)
+        tags = np.take_along_axis(self._hit_tags, nearest, axis=1).reshape(yaws.shape)
+
+        observations = encode_rays(distances[..., :num_rays], tags[..., :num_rays], settings.ray_length, settings.num_detectable_tags)
+        masks = np.zeros((num_envs, self.n_agents, sum(ACTION_BRANCHES)), dtype=bool)
+        if settings.mask_actions:
+            jump_offset, use_offset = sum(ACTION_BRANCHES[:2]), sum(ACTION_BRANCHES[:3])
+            masks[..., jump_offset + 1] = ~self.agent_active
+            masks[..., use_offset + 1] = ~self.agent_active
+            blocked = distances[..., num_rays:] <= settings.obstacle_avoidance_distance
+            pushable = self.agent_active[..., None] & (tags[..., num_rays:] == TAG_INDEX["MovableObstacle"])
+            masks[..., 1:5] = blocked & ~pushable
+        return observations, masks
+
+    def _move_agents(self, actions: np.ndarray, rewards: np.ndarray) -> None:
+        """
+        Agents of an instance move one after another (as in PeekabooSimEnv), every move is vectorised over instances
+        """
+        settings = self.settings
+        rewards_table = settings.individual_rewards
+        radius = settings.agent_radius
+        forward, right = heading(self.agent_yaws)
+        local_moves = MOVE_DIRECTIONS[actions[..., 0]]
+        displacements = (right * local_moves[..., :1] + forward * local_moves[..., 1:]) * settings.agent_moving_speed * settings.delta_time
+
+        for agent_ind in range(self.n_agents):
+            moving = actions[:, agent_ind, 0] > 0
+            active = self.agent_active[:, agent_ind]
+            position = self.agent_positions[:, agent_ind]
+            displacement = displacements[:, agent_ind]
+            candidate = position + displacement
+
+            wall_hits = circle_box_overlap(candidate[:, None], radius, self.wall_centers, self.wall_cos, self.wall_sin,
+                                           self.wall_half_extents)[:, 0] & self.wall_valid
+            others = np.arange(self.n_agents) != agent_ind
+            agent_hits = others & (np.linalg.norm(self.agent_positions - candidate[:, None], axis=-1) < 2.0 * radius)
+            barrier_hit = (np.abs(candidate) > self.half_size - radius).any(-1)
+
+            push = moving & active & (actions[:, agent_ind, 3] == 1) & wall_hits.any(-1) & ~(wall_hits & ~self.wall_movable).any(-1)
+            push_vector = displacement / (np.linalg.norm(displacement, axis=-1, keepdims=True) + 1e-12) \
+                * settings.movable_obstacle_speed * settings.delta_time
+            pushed_walls = push[:, None] & wall_hits
+            self.wall_centers = np.where(pushed_walls[..., None],
+                                         np.clip(self.wall_centers + push_vector[:, None], -self.half_size[:, None], self.half_size[:, None]),
+                                         self.wall_centers)
+            rewards[:, agent_ind] += push * rewards_table[GameEvent.ActiveAgentHitMovableObstacle]
+            candidate = np.where(push[:, None], position + push_vector, candidate)
+            wall_hits &= ~push[:, None]
+
+            hit_wall = moving & wall_hits.any(-1)
+            entered_wall = hit_wall & ~self.touching_wall[:, agent_ind]
+            self.collision_counter[:, agent_ind] += entered_wall
+            rewards[:, agent_ind] -= np.where(entered_wall, self.collision_counter[:, agent_ind] / 1000.0, 0.0)
+            rewards[:, agent_ind] += entered_wall * rewards_table[GameEvent.AgentHitObstacle] * np.where(active, 1.0, 5.0)
+            rewards[:, agent_ind] += (hit_wall & ~active) * rewards_table[GameEvent.AgentHitObstacle]
+
+            hit_agent = moving & agent_hits.any(-1)
+            rewards[:, agent_ind] += (hit_agent & ~self.touching_agent[:, agent_ind] & (agent_hits & self.agent_active).any(-1)) \
+                * rewards_table[GameEvent.AgentHitAgent]
+            hit_barrier = moving & barrier_hit
+            rewards[:, agent_ind] += (hit_barrier & ~self.touching_barrier[:, agent_ind]) * rewards_table[GameEvent.AgentOutOfBounds]
+
+            self.touching_wall[:, agent_ind] = np.where(moving, hit_wall, self.touching_wall[:, agent_ind])
+            self.touching_agent[:, agent_ind] = np.where(moving, hit_agent, self.touching_agent[:, agent_ind])
+            self.touching_barrier[:, agent_ind] = np.where(moving, hit_barrier, self.touching_barrier[:, agent_ind])
+            free = moving & ~(hit_wall | hit_agent | hit_barrier)
+            self.agent_positions[:, agent_ind] = np.where(free[:, None], candidate, position)
+
+    def _simulate(self, actions: np.ndarray, rewards: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        One physics frame of every instance, its rewards are added to `rewards`. Returns terminated, truncated and group rewards
+        """
+        settings = self.settings
+        rewards -= 1.0 / (settings.max_environment_steps + 1.0)
+        self.agent_yaws += ROTATE_DIRECTIONS[actions[..., 1]] * np.deg2rad(settings.agent_rotation_speed) * settings.delta_time
+        self._move_agents(actions, rewards)
+
+        in_goal = (np.linalg.norm(self.agent_positions[:, :, None] - self.goal_positions[:, None], axis=-1)
+                   < settings.agent_radius + settings.goal_radius) & self.goal_valid[:, None, :]
+        entered = in_goal & ~self.agent_in_goal
+        self.agent_in_goal = in_goal
+        rewards += entered.sum(-1) * settings.individual_rewards[GameEvent.ActiveAgentHitGoal]
+        self.goal_completed |= entered.any(1)
+
+        terminated = (self.goal_completed | ~self.goal_valid).all(-1)
+        group_rewards = np.where(terminated, self.goal_completed.sum(-1) * settings.individual_rewards[GameEvent.ActiveAgentHitGoal], 0.0)
+        self.step_count += 1
+        truncated = ~terminated & (settings.max_environment_steps > 0) & (self.step_count >= settings.max_environment_steps)
+        return terminated, truncated, group_rewards
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        actions = np.asarray(actions, dtype=np.int64)
+        rewards = np.zeros((self.num_envs, self.n_agents))
+        terminated = truncated = done = np.zeros(self.num_envs, dtype=bool)
+        self.group_rewards = np.zeros(self.num_envs)
+        #TakeActionsBetweenDecisions as in PeekabooSimEnv, an instance whose episode ended sits out the remaining frames
+        for _ in range(max(1, self.settings.decision_period)):
+            saved = {name: getattr(self, name).copy() for name in _FRAME_STATE} if done.any() else None
+            frame_rewards = np.zeros_like(rewards)
+            frame_terminated, frame_truncated, frame_group_rewards = self._simulate(actions, frame_rewards)
+            if saved is not None:
+                for name, values in saved.items():
+                    getattr(self, name)[done] = values[done]
+            running = ~done
+            rewards += np.where(running[:, None], frame_rewards, 0.0)
+            self.group_rewards = np.where(running, frame_group_rewards, self.group_rewards)
+            terminated = terminated | (running & frame_terminated)
+            truncated = truncated | (running & frame_truncated)
+            done = terminated | truncated
+            if done.all():
+                break
+        self.episode_returns += rewards
+
+        observations, masks = self.sense()
+        if self.auto_reset and done.any():
+            self.terminal_observations[done] = observations[done]
+            observations, masks = self.reset(np.flatnonzero(done))
+        return observations, masks, rewards.astype(np.float32), terminated, truncated
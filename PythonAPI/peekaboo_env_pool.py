@@ -0,0 +1,306 @@
+import atexit
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+import numpy as np
+
+from peekaboo_vec_env import allocate_worker_ids, release_worker_ids
+
+#
+# Warm players kept for the whole life of a process: experiments and evaluations lease them instead of launching
+# and closing their own, so only the first one pays the startup. A player that crashed or stopped answering
+# is replaced by a fresh one on a new port, without the lessee noticing more than an interrupted episode.
+
+
+def _restart_errors() -> tuple[type[BaseException], ...]:
+    #what a lost player raises: mlagents_envs' exceptions (communication, timeouts) or a broken connection
+    try:
+        from mlagents_envs.exception import UnityException
+    except ImportError:
+        return (ConnectionError, EOFError)
+    return (UnityException, ConnectionError, EOFError)
+
+
+def player_process(env: Any):
+    """
+    subprocess.Popen of the player of a PeekabooEnv, None for environments running in this process (PeekabooSimEnv)
+    """
+    return getattr(getattr(env, "_env", None), "_process", None)
+
+
+def is_alive(env: Any) -> bool:
+    process = player_process(env)
+    return process is None or process.poll() is None
+
+
+def call_with_timeout(fn: Callable[[], Any], timeout: float) -> Any:
+    """
+    fn() on a daemon thread, TimeoutError if it doesn't return within `timeout` seconds (the thread is left behind)
+    """
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"No answer within {timeout} s")
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
+
+
+@dataclass(eq=False)
+class PooledWorker:
+    factory: Callable
+    seed: int | None
+    worker_id: int
+    env: Any
+    restarts: int = 0
+    #what lessees changed, applied again to a replacement
+    map_config: Any = None
+    env_parameters: dict[str, float] = field(default_factory=dict)
+
+
+class EnvLease:
+    def __init__(self, pool: "EnvPool", worker: PooledWorker) -> None:
+        """
+        An environment of the pool, used as the environment itself (attributes are forwarded to it).
+        A reset that fails because the player is lost is retried on a replacement, a step returns the first observations
+        of the replacement with every agent truncated (dones in the dict API), as a time limit would.
+        close() hands the player back to the pool.
+        """
+        self._pool = pool
+        self._worker: PooledWorker | None = worker
+
+    def _leased_worker(self) -> PooledWorker:
+        if self._worker is None:
+            raise RuntimeError("The lease was returned to the pool")
+        return self._worker
+
+    @property
+    def env(self) -> Any:
+        return self._leased_worker().env
+
+    @property
+    def worker_id(self) -> int:
+        return self._leased_worker().worker_id
+
+    @property
+    def restarts(self) -> int:
+        """
+        Players lost during this lease
+        """
+        return self._leased_worker().restarts
+
+    def __getattr__(self, name: str) -> Any:
+        #only called for what the lease itself doesn't have
+        if name in ("_pool", "_worker"):
+            raise AttributeError(name)
+        return getattr(self.env, name)
+
+    def load_map(self, map_config: Any) -> None:
+        self.env.load_map(map_config)
+        self._leased_worker().map_config = map_config
+
+    def set_env_parameters(self, **parameters: float) -> None:
+        self.env.set_env_parameters(**parameters)
+        self._leased_worker().env_parameters.update(parameters)
+
+    def _recover(self, error: BaseException) -> None:
+        if not isinstance(error, _restart_errors()) and is_alive(self.env):
+            raise error
+        self._pool.restart(self._leased_worker(), error)
+
+    def reset(self):
+        try:
+            return self.env.reset()
+        except Exception as error:
+            self._recover(error)
+        return self.env.reset()
+
+    def step(self, actions):
+        try:
+            return self.env.step(actions)
+        except Exception as error:
+            self._recover(error)
+        env = self.env
+        n_agents = len(env.possible_agents)
+        if getattr(env, "array_mode", False):
+            observations, action_masks = env.reset()
+            return observations, action_masks, np.zeros(n_agents, dtype=np.float32), np.zeros(n_agents, dtype=bool), np.ones(n_agents, dtype=bool)
+        observations = env.reset()
+        agent_ids = env.possible_agents
+        return (observations, {agent_id: 0.0 for agent_id in agent_ids}, {agent_id: True for agent_id in agent_ids},
+                {agent_id: {"interrupted": True, "restarted": True} for agent_id in agent_ids})
+
+    def close(self) -> None:
+        if self._worker is not None:
+            self._pool.release(self._worker)
+            self._worker = None
+
+    def __enter__(self) -> "EnvLease":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class EnvPool:
+    def __init__(self, base_worker_id: int = 0, health_timeout: float = 60.0, close_timeout: float = 10.0,
+                 max_launch_attempts: int = 3, check_on_lease: bool = True) -> None:
+        """
+        Idle players by (factory, seed), where `factory(worker_id, seed)` launches one, e.g. PeekabooEnvFactory.
+        Worker ids (ports) are allocated as in PeekabooVecEnv, a replacement always gets a new one,
+        as the port of a crashed player may stay taken for a while.
+
+        With `check_on_lease` an idle player has to be alive and reset within `health_timeout` seconds to be leased again.
+        Notice: what a lessee changed through its lease (load_map, set_env_parameters) stays with the player for the next one,
+        a replacement of the player gets it as well.
+        """
+        self.base_worker_id = base_worker_id
+        self.health_timeout = health_timeout
+        self.close_timeout = close_timeout
+        self.max_launch_attempts = max_launch_attempts
+        self.check_on_lease = check_on_lease
+        self._idle: dict[tuple[Hashable, int | None], list[PooledWorker]] = {}
+        self._leased: list[PooledWorker] = []
+        self._lock = threading.Lock()
+        self.launches = 0
+        self.restarts = 0
+
+    def _launch(self, factory: Callable, seed: int | None) -> PooledWorker:
+        for attempt in range(self.max_launch_attempts):
+            worker_id = allocate_worker_ids(1, self.base_worker_id)[0]
+            try:
+                env = factory(worker_id, seed)
+            except Exception:
+                release_worker_ids([worker_id])
+                if attempt + 1 == self.max_launch_attempts:
+                    raise
+                continue
+            with self._lock:
+                self.launches += 1
+            return PooledWorker(factory, seed, worker_id, env)
+
+    def _shutdown(self, worker: PooledWorker) -> None:
+        #a hung player doesn't answer the close request, its process is killed then
+        try:
+            call_with_timeout(worker.env.close, self.close_timeout)
+        except Exception:
+            process = player_process(worker.env)
+            if process is not None and process.poll() is None:
+                process.kill()
+        release_worker_ids([worker.worker_id])
+
+    def healthy(self, worker: PooledWorker) -> bool:
+        if not is_alive(worker.env):
+            return False
+        try:
+            call_with_timeout(worker.env.reset, self.health_timeout)
+        except Exception:
+            return False
+        return True
+
+    def restart(self, worker: PooledWorker, reason: BaseException | str) -> None:
+        """
+        Replaces the player of `worker` in place with one launched by the same factory on a new worker id,
+        the map and environment parameters set through leases are set again (applied at its first reset)
+        """
+        old_worker_id, profiler = worker.worker_id, getattr(worker.env, "profiler", None)
+        replacement = self._launch(worker.factory, worker.seed)
+        self._shutdown(worker)
+        #a warning, not a print, callers filter or capture crash recovery with the warnings module
+        warnings.warn(f"Worker {old_worker_id} was lost ({reason!r}), restarted as worker {replacement.worker_id}", RuntimeWarning)
+        worker.worker_id, worker.env = replacement.worker_id, replacement.env
+        worker.restarts += 1
+        with self._lock:
+            self.restarts += 1
+        if profiler is not None and hasattr(worker.env, "enable_profiling"):
+            worker.env.enable_profiling(profiler)
+        if worker.map_config is not None:
+            worker.env.load_map(worker.map_config)
+        if worker.env_parameters:
+            worker.env.set_env_parameters(**worker.env_parameters)
+
+    def warm(self, factory: Callable, seeds: list[int | None]) -> None:
+        """
+        Launches one idle player per seed, all at once
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(seeds))) as executor:
+            workers = list(executor.map(lambda seed: self._launch(factory, seed), seeds))
+        with self._lock:
+            for worker in workers:
+                self._idle.setdefault((factory, worker.seed), []).append(worker)
+
+    def lease(self, factory: Callable, seed: int | None = None) -> EnvLease:
+        """
+        An idle player of `factory` launched with `seed` (health-checked), a new one if there is none
+        """
+        with self._lock:
+            idle = self._idle.get((factory, seed), [])
+            worker = idle.pop() if idle else None
+        if worker is None:
+            worker = self._launch(factory, seed)
+        elif self.check_on_lease and not self.healthy(worker):
+            self.restart(worker, "failed health check")
+        with self._lock:
+            self._leased.append(worker)
+        return EnvLease(self, worker)
+
+    def release(self, worker: PooledWorker) -> None:
+        with self._lock:
+            self._leased.remove(worker)
+        if not is_alive(worker.env):
+            self._shutdown(worker)
+            return
+        worker.restarts = 0
+        with self._lock:
+            self._idle.setdefault((worker.factory, worker.seed), []).append(worker)
+
+    @property
+    def num_idle(self) -> int:
+        return sum(len(workers) for workers in self._idle.values())
+
+    def close(self) -> None:
+        """
+        Closes every player, the leased ones as well
+        """
+        with self._lock:
+            workers = [worker for idle in self._idle.values() for worker in idle] + self._leased
+            self._idle.clear()
+            self._leased = []
+        for worker in workers:
+            self._shutdown(worker)
+
+    def __enter__(self) -> "EnvPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+# pool of the process, see default_pool
+_default_pool: EnvPool | None = None
+
+
+def default_pool(base_worker_id: int | None = None) -> EnvPool:
+    """
+    Pool shared by everything the process runs (back-to-back experiments, hydra multiruns, evaluations), closed at exit.
+    `base_worker_id` moves the ids of the players launched from now on, e.g. to the range a sweep gave this process
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = EnvPool()
+        atexit.register(_default_pool.close)
+    if base_worker_id is not None:
+        _default_pool.base_worker_id = base_worker_id
+    return _default_pool
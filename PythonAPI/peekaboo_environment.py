@@ -1,28 +1,183 @@
-from mlagents_envs.environment import UnityEnvironment
-from mlagents_envs.envs.unity_parallel_env import UnityParallelEnv
+import hashlib
+import json
 import os
+from dataclasses import asdict, dataclass
 from pathlib import Path
 
+import numpy as np
+from gym import spaces
 
 #
-# This wrapper is designed only for parallel pettingZoo API to satisfy POSG
+# Behavior specs of Unity players cached on disk, so that spaces (and networks) can be built without launching one,
+# e.g. on CI nodes. PeekabooEnv itself lives in peekaboo_unity_env.py and is imported on first use:
+# importing this module doesn't load mlagents_envs.
+
+# bumped whenever EnvSpec changes, so that stale caches are not picked up
+ENV_SPEC_VERSION: int = 1
+# cache directory of save_spec/load_spec, PEEKABOO_SPEC_CACHE overrides it
+SPEC_CACHE_DIR: str = os.environ.get("PEEKABOO_SPEC_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "peekaboo", "specs"))
+
+
+def __getattr__(name: str):
+    if name == "PeekabooEnv":
+        from peekaboo_unity_env import PeekabooEnv
+        return PeekabooEnv
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@dataclass
+class EnvSpec:
+    """
+    What the behavior of a player tells Python: the agent ids, the shapes of its observations,
+    the sizes of its discrete action branches and whether decision steps carry action masks
+    """
+    possible_agents: list[str]
+    observation_shapes: list[list[int]]
+    action_branches: list[int]
+    action_mask: bool
+
+    def observation_space(self) -> spaces.Space:
+        #as UnityParallelEnv builds them: a Box per observation, a Tuple of them for several
+        boxes = [spaces.Box(low=-np.float32(np.inf), high=np.float32(np.inf), shape=tuple(shape), dtype=np.float32)
+                 for shape in self.observation_shapes]
+        return boxes[0] if len(boxes) == 1 else spaces.Tuple(boxes)
+
+    def action_space(self) -> spaces.MultiDiscrete:
+        return spaces.MultiDiscrete(self.action_branches)
+
+
+# digests by resolved path: [size, modification time, sha1], a file is only hashed again when it changes.
+# Saved to FILE_HASHES next to the specs, so that relaunching a build in another process only stats its files
+_file_hashes: dict[str, list] = {}
+_loaded_hash_files: set[Path] = set()
+FILE_HASHES: str = "file_hashes.json"
+
+
+def _hash_files(paths: list[Path], cache_dir: str | Path | None = None) -> str:
+    index_path = Path(SPEC_CACHE_DIR if cache_dir is None else cache_dir) / FILE_HASHES
+    if index_path not in _loaded_hash_files:
+        _loaded_hash_files.add(index_path)
+        try:
+            _file_hashes.update({path: entry for path, entry in json.loads(index_path.read_text()).items() if path not in _file_hashes})
+        except (OSError, ValueError):
+            pass
+    digest = hashlib.sha1()
+    hashed = False
+    for path in paths:
+        stat = path.stat()
+        resolved = str(path.resolve())
+        entry = _file_hashes.get(resolved)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            file_digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    file_digest.update(chunk)
+            _file_hashes[resolved] = entry = [stat.st_size, stat.st_mtime_ns, file_digest.hexdigest()]
+            hashed = True
+        digest.update(f"{path.name}:{entry[2]}\n".encode())
+    if hashed:
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            partial = index_path.with_suffix(f".{os.getpid()}.tmp")
+            partial.write_text(json.dumps(_file_hashes))
+            partial.replace(index_path)
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def build_files(executable_path: str | Path) -> list[Path]:
+    """
+    The executable and the files of its "<name>_Data" directory (scenes, assemblies), next to it in Unity builds
+    """
+    executable_path = Path(executable_path)
+    data_dir = executable_path.with_name(f"{executable_path.stem}_Data")
+    data_files = sorted(path for path in data_dir.rglob("*") if path.is_file()) if data_dir.is_dir() else []
+    return [executable_path, *data_files]
 
-class PeekabooEnv(UnityParallelEnv):
-    def __init__(self, executable_path: Path, seed: int | None = None, no_grahics: bool = True, worker_id: int |None = None):
-        """
-        Notice: Currently communication between Unity and Python takes place over an open socket without authentication. 
-        Ensure that the network where training takes place is secure.
 
-        Notice: development build only //TODO: fix
+def spec_key(executable_path: str | Path, map_path: str | Path | None = None, cache_dir: str | Path | None = None) -> str:
+    """
+    Hash of the build's files and of the map json (None: the scene's own map).
+    The digests of unchanged files are read from `cache_dir` (SPEC_CACHE_DIR by default)
+    """
+    files = build_files(executable_path) + ([] if map_path is None else [Path(map_path)])
+    return hashlib.sha1(f"{_hash_files(files, cache_dir)}:{map_path is not None}#env spec v{ENV_SPEC_VERSION}".encode()).hexdigest()
+
+
+def save_spec(spec: EnvSpec, executable_path: str | Path, map_path: str | Path | None = None,
+              cache_dir: str | Path | None = None) -> Path | None:
+    """
+    Writes `spec` to "<spec_key>.json" in `cache_dir` (SPEC_CACHE_DIR by default), None if it can't be written
+    """
+    path = Path(SPEC_CACHE_DIR if cache_dir is None else cache_dir) / f"{spec_key(executable_path, map_path, cache_dir)}.json"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        #written aside and renamed, players launched at once don't read half a file
+        partial = path.with_suffix(f".{os.getpid()}.tmp")
+        partial.write_text(json.dumps({"executable_path": str(executable_path), "map_path": None if map_path is None else str(map_path),
+                                       **asdict(spec)}, indent=4))
+        partial.replace(path)
+    except OSError:
+        #read-only homes work, just without the cache
+        return None
+    return path
+
+
+def load_spec(executable_path: str | Path, map_path: str | Path | None = None, cache_dir: str | Path | None = None) -> EnvSpec | None:
+    """
+    The spec saved for this build and map, None if it was never launched with them
+    """
+    path = Path(SPEC_CACHE_DIR if cache_dir is None else cache_dir) / f"{spec_key(executable_path, map_path, cache_dir)}.json"
+    if not path.exists():
+        return None
+    content = json.loads(path.read_text())
+    return EnvSpec(possible_agents=content["possible_agents"], observation_shapes=content["observation_shapes"],
+                   action_branches=content["action_branches"], action_mask=content["action_mask"])
+
+
+class SpecEnv:
+    def __init__(self, spec: EnvSpec) -> None:
+        """
+        The agents and spaces of a player without the player: enough to build ActorCriticAgent, MAPPOAgent
+        or load_checkpoint, not to step. See spec_env
         """
-        self._worker_id: int = 0 if worker_id is None else worker_id
-        unity_env = UnityEnvironment(file_name=executable_path, 
-                               worker_id=self._worker_id, 
-                               seed=seed,
-                               no_graphics=no_grahics)
-        
-        super().__init__(unity_env, seed)
+        self.spec = spec
+        self.possible_agents = list(spec.possible_agents)
+        self.agents = list(spec.possible_agents)
+        self._observation_space = spec.observation_space()
+        self._action_space = spec.action_space()
+
+    @property
+    def observation_spaces(self) -> dict:
+        return {agent_id: self._observation_space for agent_id in self.possible_agents}
+
+    @property
+    def action_spaces(self) -> dict:
+        return {agent_id: self._action_space for agent_id in self.possible_agents}
+
+    def observation_space(self, agent: str) -> spaces.Space:
+        return self._observation_space
+
+    def action_space(self, agent: str) -> spaces.MultiDiscrete:
+        return self._action_space
+
+    def reset(self):
+        raise RuntimeError("A SpecEnv has no player to reset, launch a PeekabooEnv")
+
+    def step(self, actions):
+        raise RuntimeError("A SpecEnv has no player to step, launch a PeekabooEnv")
 
-        #TODO: auxillary stuff to work with python training more smoothly
+    def close(self) -> None:
+        pass
 
 
+def spec_env(executable_path: str | Path, map_path: str | Path | None = None, cache_dir: str | Path | None = None) -> SpecEnv:
+    """
+    SpecEnv of the spec cached when PeekabooEnv last launched this build with this map
+    """
+    spec = load_spec(executable_path, map_path, cache_dir)
+    if spec is None:
+        raise FileNotFoundError(f"No cached spec of {executable_path} with map {map_path}: launch PeekabooEnv(executable_path, map_path=...) "
+                                f"once where Unity runs and copy {SPEC_CACHE_DIR if cache_dir is None else cache_dir} over")
+    return SpecEnv(spec)
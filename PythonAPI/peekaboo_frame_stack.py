@@ -0,0 +1,124 @@
+from typing import Any
+
+import numpy as np
+from gym import spaces
+
+from peekaboo_vec_env import unpack_observation
+
+#
+# Observation stacking on the Python side, instead of the Observation Stacks of the agents' BehaviorParameters
+# that send every frame stack_size times over the socket. Each agent has a circular buffer of its last frames,
+# stacked observations are strided views into it: a step writes one frame, nothing is concatenated.
+
+
+class FrameStack:
+    def __init__(self, n_agents: int, frame_dim: int, stack_size: int, dtype: np.dtype = np.float32) -> None:
+        """
+        Last `stack_size` frames of `n_agents` agents. The ring holds 2 * stack_size - 1 frames per agent and every frame
+        is written to slot i and to its mirror i + stack_size, so the window of the last frames is always contiguous
+        and observations() is a view (n_agents, stack_size * frame_dim), oldest frame first.
+        Views change with the next push, copy them to keep them.
+        """
+        if stack_size < 1:
+            raise ValueError(f"stack_size has to be positive, got {stack_size}")
+        self.n_agents, self.frame_dim, self.stack_size = n_agents, frame_dim, stack_size
+        self._frames = np.zeros((n_agents, 2 * stack_size - 1, frame_dim), dtype=dtype)
+        #slot of the last frame
+        self._last = stack_size - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self._frames.nbytes
+
+    def observations(self) -> np.ndarray:
+        start = (self._last + 1) % self.stack_size
+        return self._frames[:, start:start + self.stack_size].reshape(self.n_agents, -1)
+
+    def reset(self, frames: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        Fills the stacks of all agents (or of the `rows` mask) with their first frame, as at the beginning of an episode
+        """
+        frames = np.asarray(frames).reshape(self.n_agents, 1, self.frame_dim)
+        if rows is None:
+            self._frames[:] = frames
+        else:
+            self._frames[rows] = frames[rows]
+        return self.observations()
+
+    def push(self, frames: np.ndarray, restart: np.ndarray | None = None) -> np.ndarray:
+        """
+        Appends frames (n_agents, frame_dim), agents of the `restart` mask begin a new stack with them
+        """
+        self._last = (self._last + 1) % self.stack_size
+        self._frames[:, self._last] = frames
+        if self._last + self.stack_size < self._frames.shape[1]:
+            self._frames[:, self._last + self.stack_size] = frames
+        if restart is not None and restart.any():
+            self.reset(frames, restart)
+        return self.observations()
+
+
+class FrameStackEnv:
+    def __init__(self, env: Any, stack_size: int) -> None:
+        """
+        `env` (PeekabooEnv, PeekabooSimEnv or an EnvLease) with the last `stack_size` observations of every agent,
+        oldest first, in place of the current one. Attributes are forwarded to it.
+        An agent whose episode ended starts a new stack with its next observation, reset() starts all of them.
+        In array mode the observations are views into the ring, like the other outputs they change with the next call,
+        the dict API gets copies.
+        """
+        self.env = env
+        self.stack_size = stack_size
+        frame_space = env.observation_space(env.possible_agents[0])
+        self._observation_space = spaces.Box(low=np.tile(frame_space.low, stack_size), high=np.tile(frame_space.high, stack_size),
+                                             dtype=frame_space.dtype)
+        self.frames = FrameStack(len(env.possible_agents), frame_space.shape[0], stack_size)
+        self._rows = {agent_id: row for row, agent_id in enumerate(env.possible_agents)}
+        self._latest = np.zeros((len(env.possible_agents), frame_space.shape[0]), dtype=np.float32)
+        self._restart = np.zeros(len(env.possible_agents), dtype=bool)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "env":
+            raise AttributeError(name)
+        return getattr(self.env, name)
+
+    @property
+    def observation_spaces(self) -> dict:
+        return {agent_id: self._observation_space for agent_id in self.possible_agents}
+
+    def observation_space(self, agent: str):
+        return self._observation_space
+
+    def _stacked_dict(self, observations: dict) -> dict:
+        #agents missing from the dict repeat their last frame, their restart waits until they are back
+        present = np.zeros(len(self._rows), dtype=bool)
+        for agent_id, observation in observations.items():
+            self._latest[self._rows[agent_id]] = unpack_observation(observation)[0]
+            present[self._rows[agent_id]] = True
+        stacked = self.frames.push(self._latest, self._restart & present)
+        self._restart &= ~present
+        return {
+            agent_id: {**observation, "observation": stacked[self._rows[agent_id]].copy()} if isinstance(observation, dict)
+            else stacked[self._rows[agent_id]].copy()
+            for agent_id, observation in observations.items()
+        }
+
+    def reset(self):
+        if getattr(self.env, "array_mode", False):
+            observations, action_masks = self.env.reset()
+            self._restart[:] = False
+            return self.frames.reset(observations), action_masks
+        self._restart[:] = True
+        return self._stacked_dict(self.env.reset())
+
+    def step(self, actions):
+        if getattr(self.env, "array_mode", False):
+            observations, action_masks, rewards, terminated, truncated = self.env.step(actions)
+            stacked = self.frames.push(observations, self._restart)
+            np.logical_or(terminated, truncated, out=self._restart)
+            return stacked, action_masks, rewards, terminated, truncated
+        observations, rewards, dones, infos = self.env.step(actions)
+        stacked = self._stacked_dict(observations)
+        for agent_id, done in dones.items():
+            self._restart[self._rows[agent_id]] |= done
+        return stacked, rewards, dones, infos
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import struct
+import zipfile
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+
+import numpy as np
+
+#
+# Python side of MazeConfigParser.cs: maps are stored as json with the "Agents"/"Goals"/"Map" structure.
+# CompiledMap is the same map as flat arrays, cached in .npz files keyed by the hash of the json.
+
+# bumped whenever CompiledMap changes, so that stale caches are not picked up
+COMPILED_MAP_VERSION: int = 1
+# cache directory of compile_map, next to the json files by default
+MAP_CACHE_DIR: str = ".map_cache"
+
+
+@dataclass
+class BuildingBlock:
+    position: np.ndarray #Vector3
+    rotation: np.ndarray #Quaternion (x, y, z, w), only around Yth axis actually
+    type: str
+
+    @classmethod
+    def from_json(cls, item: dict) -> "BuildingBlock":
+        return cls(
+            position=np.asarray(item["Position"], dtype=np.float64),
+            rotation=np.asarray(item["Rotation"], dtype=np.float64),
+            type=item["Type"],
+        )
+
+    def to_json(self) -> dict:
+        return {"Position": self.position.tolist(), "Rotation": self.rotation.tolist(), "Type": self.type}
+
+    @property
+    def yaw(self) -> float:
+        return quaternion_to_yaw(self.rotation)
+
+
+@dataclass
+class MapConfig:
+    map_size: np.ndarray #(x, z) sizes of the area
+    base_building_block_size: np.ndarray #x, y, z = width, height, depth of a wall
+    agents: list[BuildingBlock] = field(default_factory=list)
+    goals: list[BuildingBlock] = field(default_factory=list)
+    walls: list[BuildingBlock] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, config: dict) -> "MapConfig":
+        map_description = config["Map"]
+        return cls(
+            map_size=np.asarray(map_description["mapSize"], dtype=np.float64),
+            base_building_block_size=np.asarray(map_description["baseBuildingBlockSize"], dtype=np.float64),
+            agents=[BuildingBlock.from_json(item) for item in config["Agents"]],
+            goals=[BuildingBlock.from_json(item) for item in config["Goals"]],
+            walls=[BuildingBlock.from_json(item) for item in map_description["Walls"]],
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "Agents": [item.to_json() for item in self.agents],
+            "Goals": [item.to_json() for item in self.goals],
+            "Map": {
+                "mapSize": [int(size) for size in self.map_size],
+                "baseBuildingBlockSize": self.base_building_block_size.tolist(),
+                "Walls": [item.to_json() for item in self.walls],
+            },
+        }
+
+
+def quaternion_to_yaw(rotation: np.ndarray) -> np.ndarray:
+    """
+    Rotation around the Yth axis (radians) of Unity's (x, y, z, w) quaternions
+    """
+    rotation = np.asarray(rotation)
+    return 2.0 * np.arctan2(rotation[..., 1], rotation[..., 3])
+
+
+def yaw_to_quaternion(yaw: np.ndarray) -> np.ndarray:
+    yaw = np.asarray(yaw, dtype=np.float64)
+    zeros = np.zeros_like(yaw)
+    return np.stack([zeros, np.sin(yaw / 2.0), zeros, np.cos(yaw / 2.0)], axis=-1)
+
+
+def load_map(source: str | Path | dict) -> MapConfig:
+    """
+    Reads a map written by MazeBuilder.DumpMaze, `source` is a path or an already parsed json
+    """
+    if isinstance(source, dict):
+        return MapConfig.from_json(source)
+    with open(source, "r") as f:
+        return MapConfig.from_json(json.load(f))
+
+
+def dump_map(config: MapConfig, target: str | Path) -> None:
+    with open(target, "w") as f:
+        json.dump(config.to_json(), f, indent=4)
+
+
+@dataclass
+class CompiledMap:
+    """
+    Structure of arrays form of a map, (x, z) plane only as the stand-ins need it.
+    Type codes index `type_names` (the Type strings of the json, sorted).
+    """
+    map_size: np.ndarray #(2,)
+    block_size: np.ndarray #(3,) baseBuildingBlockSize
+    wall_centers: np.ndarray #(W, 2)
+    wall_yaws: np.ndarray #(W,)
+    wall_half_extents: np.ndarray #(W, 2) half width and depth
+    wall_types: np.ndarray #(W,) int8
+    agent_positions: np.ndarray #(A, 2)
+    agent_yaws: np.ndarray #(A,)
+    agent_types: np.ndarray #(A,) int8
+    goal_positions: np.ndarray #(G, 2)
+    goal_yaws: np.ndarray #(G,)
+    goal_types: np.ndarray #(G,) int8
+    type_names: np.ndarray #(T,) str
+    content_hash: str = ""
+
+    @classmethod
+    def from_config(cls, config: MapConfig, content_hash: str = "") -> "CompiledMap":
+        type_names = sorted({item.type for item in [*config.walls, *config.agents, *config.goals]})
+        codes = {name: code for code, name in enumerate(type_names)}
+
+        def blocks(items: list[BuildingBlock]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+            positions = np.array([item.position[[0, 2]] for item in items], dtype=np.float64).reshape(-1, 2)
+            rotations = np.array([item.rotation for item in items], dtype=np.float64).reshape(-1, 4)
+            return positions, quaternion_to_yaw(rotations), np.array([codes[item.type] for item in items], dtype=np.int8)
+
+        wall_centers, wall_yaws, wall_types = blocks(config.walls)
+        agent_positions, agent_yaws, agent_types = blocks(config.agents)
+        goal_positions, goal_yaws, goal_types = blocks(config.goals)
+        block_size = np.asarray(config.base_building_block_size, dtype=np.float64)
+        return cls(
+            map_size=np.asarray(config.map_size, dtype=np.float64),
+            block_size=block_size,
+            wall_centers=wall_centers,
+            wall_yaws=wall_yaws,
+            wall_half_extents=np.tile(block_size[[0, 2]] / 2.0, (len(config.walls), 1)),
+            wall_types=wall_types,
+            agent_positions=agent_positions,
+            agent_yaws=agent_yaws,
+            agent_types=agent_types,
+            goal_positions=goal_positions,
+            goal_yaws=goal_yaws,
+            goal_types=goal_types,
+            type_names=np.array(type_names, dtype=str),
+            content_hash=content_hash,
+        )
+
+    @property
+    def n_agents(self) -> int:
+        return len(self.agent_positions)
+
+    def is_type(self, codes: np.ndarray, name: str) -> np.ndarray:
+        """
+        Mask of `codes` (e.g. wall_types) equal to the Type string `name`
+        """
+        matches = np.flatnonzero(self.type_names == name)
+        return np.isin(codes, matches)
+
+
+
+# per-block arrays of CompiledMap, a map library stores them concatenated over its maps
+BLOCK_ARRAYS: dict[str, tuple[str, ...]] = {
+    "wall": ("wall_centers", "wall_yaws", "wall_half_extents", "wall_types"),
+    "agent": ("agent_positions", "agent_yaws", "agent_types"),
+    "goal": ("goal_positions", "goal_yaws", "goal_types"),
+}
+
+
+def save_map_library(maps: list[CompiledMap], path: str | Path) -> None:
+    """
+    Maps in one uncompressed .npz: block arrays concatenated with "<block>_offsets" (M + 1,), per-map arrays stacked,
+    type codes rebased on the union of the type names. Written atomically, concurrent workers never read half a file.
+    """
+    type_names = sorted({str(name) for compiled in maps for name in compiled.type_names})
+    codes = {name: code for code, name in enumerate(type_names)}
+    arrays = {
+        "map_size": np.stack([compiled.map_size for compiled in maps]),
+        "block_size": np.stack([compiled.block_size for compiled in maps]),
+        "content_hash": np.array([compiled.content_hash for compiled in maps], dtype=str),
+        "type_names": np.array(type_names, dtype=str),
+    }
+    for block, names in BLOCK_ARRAYS.items():
+        lengths = [len(getattr(compiled, names[0])) for compiled in maps]
+        arrays[f"{block}_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        for name in names:
+            parts = [getattr(compiled, name) for compiled in maps]
+            if name.endswith("_types"):
+                parts = [np.array([codes[str(name)] for name in compiled.type_names], dtype=np.int8)[part] if len(part) else part
+                         for compiled, part in zip(maps, parts)]
+            arrays[name] = np.concatenate(parts)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def load_map_library(path: str | Path, mmap: bool = True) -> list[CompiledMap]:
+    """
+    Maps of save_map_library. With `mmap` their arrays are read-only views of one memory map of the file,
+    shared with every other process that maps it through the page cache
+    """
+    arrays = _mmap_npz(path) if mmap else dict(np.load(path))
+    maps = []
+    for index, content_hash in enumerate(arrays["content_hash"]):
+        blocks = {}
+        for block, names in BLOCK_ARRAYS.items():
+            start, stop = arrays[f"{block}_offsets"][index:index + 2]
+            blocks.update({name: arrays[name][start:stop] for name in names})
+        maps.append(CompiledMap(map_size=arrays["map_size"][index], block_size=arrays["block_size"][index],
+                                type_names=arrays["type_names"], content_hash=str(content_hash), **blocks))
+    return maps
+
+
+def _mmap_npz(path: str | Path) -> dict[str, np.ndarray]:
+    #np.load ignores mmap_mode for .npz, but members of an uncompressed archive are plain .npy files at known offsets
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as archive:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed and can't be memory-mapped")
+            #local file header: 30 bytes, then the file name and the extra field
+            name_length, extra_length = struct.unpack("<HH", buffer[info.header_offset + 26:info.header_offset + 30].tobytes())
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            major, _ = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: {info.filename} holds Python objects")
+            arrays[info.filename[:-len(".npy")]] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=f.tell(),
+                                                              order="F" if fortran_order else "C")
+    return arrays
+
+
+def map_hash(content: bytes) -> str:
+    return hashlib.sha1(content + f"#compiled map v{COMPILED_MAP_VERSION}".encode()).hexdigest()
+
+
+# compiled maps of this process by content hash
+_compiled_maps: dict[str, CompiledMap] = {}
+
+
+def compile_maps(sources: list, cache_dir: str | Path | None = None, mmap: bool = True) -> list[CompiledMap]:
+    """
+    CompiledMaps of a map library, e.g. sorted(Path("configs/maps").glob("*.json")).
+    The json files are hashed, not parsed: maps already compiled by this process are reused, the others are looked up
+    in the "<hash of the hashes>.npz" cache of the whole library in `cache_dir` (MAP_CACHE_DIR next to the first json by default),
+    and only parsed when it is missing. Already parsed maps (dict, MapConfig) are compiled without caching, CompiledMaps are kept.
+    """
+    compiled: list[CompiledMap | None] = [None] * len(sources)
+    paths, hashes = {}, {}
+    for index, source in enumerate(sources):
+        if isinstance(source, CompiledMap):
+            compiled[index] = source
+        elif isinstance(source, MapConfig):
+            compiled[index] = CompiledMap.from_config(source)
+        elif isinstance(source, dict):
+            compiled[index] = CompiledMap.from_config(MapConfig.from_json(source))
+        else:
+            paths[index] = Path(source)
+            content = paths[index].read_bytes()
+            hashes[index] = map_hash(content)
+            compiled[index] = _compiled_maps.get(hashes[index])
+    missing = [index for index in paths if compiled[index] is None]
+    if missing:
+        cache_dir = paths[missing[0]].parent / MAP_CACHE_DIR if cache_dir is None else Path(cache_dir)
+        library_hash = hashlib.sha1("\n".join(hashes[index] for index in missing).encode()).hexdigest()
+        cache_path = cache_dir / f"{library_hash}.npz"
+        if cache_path.exists():
+            library = load_map_library(cache_path, mmap=mmap)
+        else:
+            library = [CompiledMap.from_config(load_map(paths[index]), hashes[index]) for index in missing]
+            try:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                save_map_library(library, cache_path)
+                library = load_map_library(cache_path, mmap=mmap)
+            except OSError:
+                #read-only map directories work, just without the cache
+                pass
+        for index, item in zip(missing, library):
+            compiled[index] = _compiled_maps[hashes[index]] = item
+    return compiled
+
+
+def compile_map(source: str | Path | dict | MapConfig, cache_dir: str | Path | None = None, mmap: bool = True) -> CompiledMap:
+    """
+    compile_maps of a single map
+    """
+    return compile_maps([source], cache_dir, mmap)[0]
@@ -0,0 +1,247 @@
+import argparse
+import json
+import multiprocessing as mp
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from peekaboo_maps import yaw_to_quaternion
+
+#
+# Procedural maps in the json format of MazeConfigParser.cs. Walls are laid on the edges of a grid of
+# wall-long cells (like the dev maps), agents and goals are put into distinct cells.
+# Candidates are generated in batches: the layouts are sampled, rasterized to occupancy grids and flood-filled
+# as whole arrays, and the ones where some goal can't be reached by an Active agent are thrown away.
+
+
+@dataclass
+class MazeSettings:
+    """
+    Parameters of the generated maps
+    """
+    map_size: tuple[int, int] = (200, 200) #(x, z)
+    base_building_block_size: tuple[float, float, float] = (5.0, 20.0, 20.0) #width, height, depth (= the cell size) of a wall
+    wall_density: float = 0.4 #fraction of the inner cell edges with a wall
+    movable_ratio: float = 0.2 #fraction of the walls that are Movable
+    num_active_agents: int = 1
+    num_passive_agents: int = 2
+    num_goals: int = 2
+    goal_type: str = "Sphere"
+    #Active agents push movable walls out of the way, so they only block the Passive ones
+    movable_walls_block: bool = False
+    #a batch without a single valid map this many times in a row means the settings can't be satisfied
+    max_empty_batches: int = 20
+
+    @property
+    def grid_shape(self) -> tuple[int, int]:
+        cell = self.base_building_block_size[2]
+        return int(self.map_size[0] // cell), int(self.map_size[1] // cell)
+
+
+@dataclass
+class MazeLayouts:
+    """
+    Batch of layouts on a (nx, nz) grid of cells
+    """
+    x_walls: np.ndarray #(B, nx - 1, nz) walls between cells (i, j) and (i + 1, j)
+    z_walls: np.ndarray #(B, nx, nz - 1) walls between cells (i, j) and (i, j + 1)
+    x_movable: np.ndarray #same shapes, movable ones among the walls
+    z_movable: np.ndarray
+    cells: np.ndarray #(B, agents + goals, 2) cells of the agents (active first), then of the goals
+    settings: MazeSettings = field(default_factory=MazeSettings)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def select(self, keep: np.ndarray) -> "MazeLayouts":
+        return MazeLayouts(self.x_walls[keep], self.z_walls[keep], self.x_movable[keep], self.z_movable[keep], self.cells[keep], self.settings)
+
+
+def sample_layouts(settings: MazeSettings, batch_size: int, rng: np.random.Generator) -> MazeLayouts:
+    nx, nz = settings.grid_shape
+    num_items = settings.num_active_agents + settings.num_passive_agents + settings.num_goals
+    if num_items > nx * nz:
+        raise ValueError(f"{num_items} agents and goals don't fit into {nx}x{nz} cells")
+    x_walls = rng.random((batch_size, nx - 1, nz)) < settings.wall_density
+    z_walls = rng.random((batch_size, nx, nz - 1)) < settings.wall_density
+    x_movable = x_walls & (rng.random(x_walls.shape) < settings.movable_ratio)
+    z_movable = z_walls & (rng.random(z_walls.shape) < settings.movable_ratio)
+    #distinct cells: the first items of a random permutation of every map
+    flat = np.argpartition(rng.random((batch_size, nx * nz)), num_items - 1, axis=1)[:, :num_items]
+    cells = np.stack([flat // nz, flat % nz], axis=-1)
+    return MazeLayouts(x_walls, z_walls, x_movable, z_movable, cells, settings)
+
+
+def occupancy_grids(layouts: MazeLayouts, movable_walls_block: bool = True) -> np.ndarray:
+    """
+    (B, 2 nx + 1, 2 nz + 1) free space of the layouts: cell (i, j) is pixel (2 i + 1, 2 j + 1),
+    the edges between cells are the pixels between them, corners and the border are blocked
+    """
+    nx, nz = layouts.settings.grid_shape
+    x_blocked = layouts.x_walls if movable_walls_block else layouts.x_walls & ~layouts.x_movable
+    z_blocked = layouts.z_walls if movable_walls_block else layouts.z_walls & ~layouts.z_movable
+    free = np.zeros((len(layouts), 2 * nx + 1, 2 * nz + 1), dtype=bool)
+    free[:, 1::2, 1::2] = True
+    free[:, 2:-1:2, 1::2] = ~x_blocked
+    free[:, 1::2, 2:-1:2] = ~z_blocked
+    return free
+
+
+def flood_fill(free: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    """
+    Pixels of `free` (B, H, W) 4-connected to the `seeds` (B, H, W) of their grid.
+    All grids grow by one pixel per iteration, the ones that stopped growing are dropped from the working set.
+    """
+    reached = seeds & free
+    active = np.arange(len(free))
+    frontier, region = reached, free
+    while len(active):
+        grown = frontier.copy()
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        grown[:, :, 1:] |= frontier[:, :, :-1]
+        grown[:, :, :-1] |= frontier[:, :, 1:]
+        grown &= region
+        changed = (grown != frontier).any(axis=(1, 2))
+        reached[active] = grown
+        active, frontier, region = active[changed], grown[changed], region[changed]
+    return reached
+
+
+def reachable(layouts: MazeLayouts) -> np.ndarray:
+    """
+    (B,) whether every goal of a layout is reachable by an Active agent
+    """
+    settings = layouts.settings
+    free = occupancy_grids(layouts, settings.movable_walls_block)
+    pixels = 2 * layouts.cells + 1
+    batch = np.arange(len(layouts))[:, None]
+    num_active, num_agents = settings.num_active_agents, settings.num_active_agents + settings.num_passive_agents
+    seeds = np.zeros_like(free)
+    seeds[batch, pixels[:, :num_active, 0], pixels[:, :num_active, 1]] = True
+    reached = flood_fill(free, seeds)
+    return reached[batch, pixels[:, num_agents:, 0], pixels[:, num_agents:, 1]].all(axis=1)
+
+
+def _blocks(positions: np.ndarray, yaws: np.ndarray, types: list[str]) -> list[dict]:
+    xyz = np.zeros((len(positions), 3))
+    xyz[:, [0, 2]] = positions
+    return [{"Position": position, "Rotation": rotation, "Type": type_name}
+            for position, rotation, type_name in zip(xyz.tolist(), yaw_to_quaternion(yaws).tolist(), types)]
+
+
+def layout_to_json(layouts: MazeLayouts, index: int) -> dict:
+    """
+    Map json of one layout, walls along z at yaw 0 and along x at 90 degrees as in the dev maps
+    """
+    settings = layouts.settings
+    cell = settings.base_building_block_size[2]
+    origin = -np.asarray(settings.map_size, dtype=np.float64) / 2.0
+    walls = []
+    for edges, movable, offset, yaw in ((layouts.x_walls[index], layouts.x_movable[index], (1.0, 0.5), 0.0),
+                                        (layouts.z_walls[index], layouts.z_movable[index], (0.5, 1.0), np.pi / 2.0)):
+        ij = np.argwhere(edges)
+        types = np.where(movable[edges], "Movable", "Immovable").tolist()
+        walls += _blocks(origin + (ij + offset) * cell, np.full(len(ij), yaw), types)
+
+    centers = origin + (layouts.cells[index] + 0.5) * cell
+    num_agents = settings.num_active_agents + settings.num_passive_agents
+    agent_types = ["Active"] * settings.num_active_agents + ["Passive"] * settings.num_passive_agents
+    return {
+        "Agents": _blocks(centers[:num_agents], np.zeros(num_agents), agent_types),
+        "Goals": _blocks(centers[num_agents:], np.zeros(settings.num_goals), [settings.goal_type] * settings.num_goals),
+        "Map": {
+            "mapSize": [int(size) for size in settings.map_size],
+            "baseBuildingBlockSize": [float(size) for size in settings.base_building_block_size],
+            "Walls": walls,
+        },
+    }
+
+
+def _generate(settings: MazeSettings, seed: np.random.SeedSequence, count: int, batch_size: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    maps, empty_batches = [], 0
+    while len(maps) < count:
+        layouts = sample_layouts(settings, batch_size, rng)
+        valid = layouts.select(reachable(layouts))
+        maps += [layout_to_json(valid, index) for index in range(min(len(valid), count - len(maps)))]
+        empty_batches = 0 if len(valid) else empty_batches + 1
+        if empty_batches == settings.max_empty_batches:
+            raise RuntimeError(f"No valid map in {empty_batches * batch_size} candidates, lower the wall density: {settings}")
+    return maps
+
+
+def _generate_job(job: tuple) -> list[dict] | list[str]:
+    settings, seed, count, batch_size, output_dir, start = job
+    maps = _generate(settings, seed, count, batch_size)
+    if output_dir is None:
+        return maps
+    paths = []
+    for index, config in enumerate(maps, start):
+        path = Path(output_dir) / f"maze_{index:06d}.json"
+        with open(path, "w") as f:
+            json.dump(config, f)
+        paths.append(str(path))
+    return paths
+
+
+def _run(count: int, settings: MazeSettings | None, seed: int | None, processes: int | None, batch_size: int,
+         maps_per_job: int, output_dir: str | Path | None, start_method: str) -> list:
+    settings = MazeSettings() if settings is None else settings
+    counts = [min(maps_per_job, count - start) for start in range(0, count, maps_per_job)]
+    #one child seed per job, the maps only depend on the seed and maps_per_job, not on the number of processes
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    jobs = [(settings, job_seed, job_count, batch_size, output_dir, job * maps_per_job)
+            for job, (job_seed, job_count) in enumerate(zip(seeds, counts))]
+    processes = mp.cpu_count() if processes is None else processes
+    if processes <= 1 or len(jobs) == 1:
+        results = map(_generate_job, jobs)
+        return [item for result in results for item in result]
+    with mp.get_context(start_method).Pool(min(processes, len(jobs))) as pool:
+        return [item for result in pool.imap(_generate_job, jobs) for item in result]
+
+
+def generate_maps(count: int, settings: MazeSettings | None = None, seed: int | None = None, processes: int | None = None,
+                  batch_size: int = 256, maps_per_job: int = 1024, start_method: str = "spawn") -> list[dict]:
+    """
+    `count` valid map jsons (load_map/compile_maps take them as they are), generated by a pool of `processes`
+    (all cores by default, in this process with 1)
+    """
+    return _run(count, settings, seed, processes, batch_size, maps_per_job, None, start_method)
+
+
+def write_maps(output_dir: str | Path, count: int, settings: MazeSettings | None = None, seed: int | None = None,
+               processes: int | None = None, batch_size: int = 256, maps_per_job: int = 1024, start_method: str = "spawn") -> list[Path]:
+    """
+    generate_maps written by the workers themselves to output_dir/maze_XXXXXX.json, with a settings.json of the parameters
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / "settings.json", "w") as f:
+        json.dump({"seed": seed, "maps_per_job": maps_per_job, **asdict(MazeSettings() if settings is None else settings)}, f, indent=4)
+    return [Path(path) for path in _run(count, settings, seed, processes, batch_size, maps_per_job, output_dir, start_method)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes procedural maps whose goals are all reachable by an Active agent")
+    parser.add_argument("output_dir")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--map-size", type=int, nargs=2, default=[200, 200])
+    parser.add_argument("--wall-density", type=float, default=0.4)
+    parser.add_argument("--movable-ratio", type=float, default=0.2)
+    parser.add_argument("--active-agents", type=int, default=1)
+    parser.add_argument("--passive-agents", type=int, default=2)
+    parser.add_argument("--goals", type=int, default=2)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = MazeSettings(map_size=tuple(args.map_size), wall_density=args.wall_density, movable_ratio=args.movable_ratio,
+                            num_active_agents=args.active_agents, num_passive_agents=args.passive_agents, num_goals=args.goals)
+    paths = write_maps(args.output_dir, args.count, settings, seed=args.seed, processes=args.processes)
+    print(f"{len(paths)} maps written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
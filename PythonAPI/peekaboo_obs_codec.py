@@ -0,0 +1,142 @@
+import json
+from typing import Any
+
+import numpy as np
+
+from peekaboo_sim_env import NUM_DETECTABLE_TAGS
+
+#
+# Compact codes of ray-cast observations for rollout buffers and trajectory files. RayPerceptionOutput sends
+# (tags + 2) float32 per ray, all but one of them 0/1 flags: a code keeps the flags as bits and the hit fraction
+# as a float16 or uint8. The NumPy methods serve the recorder and the reader, the tensor ones (torch is imported
+# by them only) the rollout buffer, where codes are decoded on the training device once a minibatch is gathered.
+
+# storage dtype of the hit fractions, and the largest error of a decoded fraction in [0, 1]: half of the float16 spacing
+# below 1, half a quantization step of uint8
+DISTANCE_FORMATS: dict[str, tuple[type, float]] = {"float16": (np.float16, 2.0 ** -12), "uint8": (np.uint8, 0.5 / 255)}
+
+
+class RayObservationCodec:
+    def __init__(self, num_rays: int, num_tags: int = NUM_DETECTABLE_TAGS, distances: str = "float16") -> None:
+        """
+        Observations of `num_rays` rays, (num_tags + 2) values each as in peekaboo_sim_env.encode_rays: a one-hot
+        of the hit tag, a "no hit" flag and the hit fraction. The code of one observation is a row of code_dim bytes:
+        the hit fractions (`distances`: "float16" or "uint8", round(fraction * 255)), then the num_rays * (num_tags + 1)
+        flags packed 8 to a byte, padded to the size of a fraction.
+        Flags are exact if they are 0 or 1 (a flag is set if it is above 0.5), fractions in [0, 1] come back within
+        max_distance_error. uint8 clips fractions into [0, 1], float16 keeps others with a relative error of 2^-11.
+        Encoding and decoding take any number of observations concatenated along the last axis
+        (e.g. the centralised state of all agents)
+        """
+        if distances not in DISTANCE_FORMATS:
+            raise ValueError(f"Unknown distance format {distances}, use one of {tuple(DISTANCE_FORMATS)}")
+        self.num_rays, self.num_tags, self.distances = num_rays, num_tags, distances
+        self.distance_dtype, self.max_distance_error = DISTANCE_FORMATS[distances]
+        self.obs_dim = num_rays * (num_tags + 2)
+        self.num_flags = num_rays * (num_tags + 1)
+        itemsize = np.dtype(self.distance_dtype).itemsize
+        self.distance_bytes = num_rays * itemsize
+        self.flag_bytes = -(-self.num_flags // 8)
+        #rows stay aligned to the fractions, so that float16 codes can be viewed in place
+        self.code_dim = -(-(self.distance_bytes + self.flag_bytes) // itemsize) * itemsize
+        self._shifts: dict[Any, Any] = {}
+
+    @classmethod
+    def for_obs_dim(cls, obs_dim: int, num_tags: int = NUM_DETECTABLE_TAGS, distances: str = "float16") -> "RayObservationCodec":
+        if obs_dim % (num_tags + 2):
+            raise ValueError(f"Observations of {obs_dim} values are not rays of {num_tags} tags ({num_tags + 2} values per ray)")
+        return cls(obs_dim // (num_tags + 2), num_tags, distances)
+
+    @classmethod
+    def for_environment(cls, environment, distances: str = "float16") -> "RayObservationCodec":
+        """
+        Codec of the observations of an environment: the stand-in's num_detectable_tags, the dev build's otherwise
+        """
+        obs_dim = environment.observation_space(environment.possible_agents[0]).shape[0]
+        settings = getattr(environment, "settings", None)
+        return cls.for_obs_dim(obs_dim, getattr(settings, "num_detectable_tags", NUM_DETECTABLE_TAGS), distances)
+
+    def to_json(self) -> str:
+        return json.dumps({"num_rays": self.num_rays, "num_tags": self.num_tags, "distances": self.distances})
+
+    @classmethod
+    def from_json(cls, text: str) -> "RayObservationCodec":
+        return cls(**json.loads(text))
+
+    def nbytes(self, num_observations: int) -> int:
+        return num_observations * self.code_dim
+
+    def _rays(self, observations):
+        #(..., k * obs_dim) -> (..., k, num_rays, num_tags + 2)
+        return observations.reshape(*observations.shape[:-1], -1, self.num_rays, self.num_tags + 2)
+
+    def encode(self, observations: np.ndarray) -> np.ndarray:
+        """
+        (..., k * obs_dim) -> (..., k * code_dim) uint8
+        """
+        rays = self._rays(np.asarray(observations, dtype=np.float32))
+        codes = np.zeros((*rays.shape[:-2], self.code_dim), dtype=np.uint8)
+        if self.distances == "uint8":
+            codes[..., :self.distance_bytes] = np.rint(np.clip(rays[..., -1], 0.0, 1.0) * 255.0)
+        else:
+            codes[..., :self.distance_bytes] = rays[..., -1].astype(np.float16).view(np.uint8)
+        flags = (rays[..., :-1] > 0.5).reshape(*rays.shape[:-2], self.num_flags)
+        codes[..., self.distance_bytes:self.distance_bytes + self.flag_bytes] = np.packbits(flags, axis=-1)
+        return codes.reshape(*codes.shape[:-2], -1)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """
+        (..., k * code_dim) uint8 -> (..., k * obs_dim) float32
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        codes = codes.reshape(*codes.shape[:-1], -1, self.code_dim)
+        observations = np.empty((*codes.shape[:-1], self.num_rays, self.num_tags + 2), dtype=np.float32)
+        flags = np.unpackbits(codes[..., self.distance_bytes:self.distance_bytes + self.flag_bytes], axis=-1, count=self.num_flags)
+        observations[..., :-1] = flags.reshape(*codes.shape[:-1], self.num_rays, self.num_tags + 1)
+        distances = codes[..., :self.distance_bytes]
+        if self.distances == "uint8":
+            observations[..., -1] = distances / np.float32(255.0)
+        else:
+            observations[..., -1] = np.ascontiguousarray(distances).view(np.float16)
+        return observations.reshape(*codes.shape[:-2], -1)
+
+    def encode_tensor(self, observations):
+        """
+        encode() of a tensor, on its device
+        """
+        import torch
+        rays = self._rays(observations.float())
+        codes = torch.zeros((*rays.shape[:-2], self.code_dim), dtype=torch.uint8, device=rays.device)
+        if self.distances == "uint8":
+            codes[..., :self.distance_bytes] = torch.round(rays[..., -1].clamp(0.0, 1.0) * 255.0).to(torch.uint8)
+        else:
+            codes[..., :self.distance_bytes] = rays[..., -1].to(torch.float16).contiguous().view(torch.uint8)
+        flags = (rays[..., :-1] > 0.5).reshape(*rays.shape[:-2], self.num_flags).to(torch.uint8)
+        flags = torch.nn.functional.pad(flags, (0, self.flag_bytes * 8 - self.num_flags))
+        packed = (flags.reshape(*flags.shape[:-1], self.flag_bytes, 8) << self._bit_shifts(rays.device)).sum(-1)
+        codes[..., self.distance_bytes:self.distance_bytes + self.flag_bytes] = packed.to(torch.uint8)
+        return codes.reshape(*codes.shape[:-2], -1)
+
+    def decode_tensor(self, codes):
+        """
+        decode() of a tensor, on its device
+        """
+        import torch
+        codes = codes.reshape(*codes.shape[:-1], -1, self.code_dim)
+        flag_bytes = codes[..., self.distance_bytes:self.distance_bytes + self.flag_bytes]
+        flags = (flag_bytes.unsqueeze(-1) >> self._bit_shifts(codes.device)) & 1
+        flags = flags.flatten(-2)[..., :self.num_flags].reshape(*codes.shape[:-1], self.num_rays, self.num_tags + 1)
+        distances = codes[..., :self.distance_bytes]
+        if self.distances == "uint8":
+            distances = distances.float() / 255.0
+        else:
+            distances = distances.contiguous().view(torch.float16).float()
+        observations = torch.cat([flags.float(), distances.unsqueeze(-1)], dim=-1)
+        return observations.reshape(*codes.shape[:-2], -1)
+
+    def _bit_shifts(self, device):
+        #most significant bit first, as np.packbits
+        if device not in self._shifts:
+            import torch
+            self._shifts[device] = torch.arange(7, -1, -1, dtype=torch.uint8, device=device)
+        return self._shifts[device]
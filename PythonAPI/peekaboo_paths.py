@@ -0,0 +1,249 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from peekaboo_maps import CompiledMap
+from peekaboo_sim_env import circle_box_overlap
+
+#
+# Shortest paths of a map on its occupancy grid: distance fields towards goal cells (8-connected, no corner cutting),
+# computed for many goals at once by relaxing whole arrays, then looked up per position in O(1).
+# On top of them, per agent path length, success weighted by path length (SPL, Anderson et al. 2018)
+# and optimality gap of an episode.
+
+# moves of the 8-connected grid: (dx, dz, length in cells)
+GRID_MOVES: tuple[tuple[int, int, float], ...] = tuple(
+    (dx, dz, float(np.hypot(dx, dz))) for dx in (-1, 0, 1) for dz in (-1, 0, 1) if dx or dz
+)
+
+
+def occupancy_grid(compiled: CompiledMap, resolution: float, clearance: float, movable_walls_block: bool = True) -> np.ndarray:
+    """
+    (H, W) free cells of `resolution` sized squares covering the map: the ones whose center a circle of radius
+    `clearance` (an agent) fits on without overlapping a wall. Cell (i, j) is centered at -map_size / 2 + (i + 0.5, j + 0.5) * resolution.
+    """
+    shape = np.ceil(compiled.map_size / resolution).astype(int)
+    x, z = ((np.arange(size) + 0.5) * resolution - half for size, half in zip(shape, compiled.map_size / 2.0))
+    centers = np.stack(np.meshgrid(x, z, indexing="ij"), axis=-1).reshape(-1, 2)
+    walls = np.ones(len(compiled.wall_centers), dtype=bool) if movable_walls_block else ~compiled.is_type(compiled.wall_types, "Movable")
+    blocked = circle_box_overlap(centers, clearance, compiled.wall_centers[walls], np.cos(compiled.wall_yaws[walls]),
+                                 np.sin(compiled.wall_yaws[walls]), compiled.wall_half_extents[walls]).any(-1)
+    return ~blocked.reshape(shape)
+
+
+def _shifted(array: np.ndarray, dx: int, dz: int, fill) -> np.ndarray:
+    #out[..., i, j] = array[..., i - dx, j - dz], `fill` outside
+    out = np.full_like(array, fill)
+    h, w = array.shape[-2:]
+    out[..., max(dx, 0):h + min(dx, 0), max(dz, 0):w + min(dz, 0)] = array[..., max(-dx, 0):h - max(dx, 0), max(-dz, 0):w - max(dz, 0)]
+    return out
+
+
+def move_costs(free: np.ndarray) -> list[np.ndarray]:
+    """
+    Per GRID_MOVES, (H, W) length of the move arriving at every cell, inf if it leaves the free space or cuts a corner
+    """
+    costs = []
+    for dx, dz, length in GRID_MOVES:
+        allowed = free & _shifted(free, dx, dz, False)
+        if dx and dz:
+            allowed &= _shifted(free, dx, 0, False) & _shifted(free, 0, dz, False)
+        costs.append(np.where(allowed, np.float32(length), np.float32(np.inf)))
+    return costs
+
+
+def distance_fields(free: np.ndarray, sources: np.ndarray, resolution: float = 1.0) -> np.ndarray:
+    """
+    (S, H, W) shortest path lengths from every free cell to the free cells `sources` (S,) (flat indices), inf where unreachable.
+    All fields are relaxed together, the ones that stopped changing are dropped from the working set.
+    """
+    costs = move_costs(free)
+    fields = np.full((len(sources), *free.shape), np.inf, dtype=np.float32)
+    fields.reshape(len(sources), -1)[np.arange(len(sources)), sources] = 0.0
+    active = np.arange(len(sources))
+    current = fields
+    while len(active):
+        relaxed = current.copy()
+        for (dx, dz, _), cost in zip(GRID_MOVES, costs):
+            np.minimum(relaxed, _shifted(current, dx, dz, np.inf) + cost, out=relaxed)
+        changed = (relaxed < current).any(axis=(1, 2))
+        fields[active] = relaxed
+        active, current = active[changed], relaxed[changed]
+    return fields * np.float32(resolution)
+
+
+def nearest_free(free: np.ndarray) -> np.ndarray:
+    """
+    (H * W,) flat index of a nearby free cell (4-connected steps) for every cell, -1 if the grid has none
+    """
+    snap = np.where(free.ravel(), np.arange(free.size), -1).reshape(free.shape)
+    while (snap < 0).any():
+        grown = snap.copy()
+        for dx, dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            grown = np.where(grown < 0, _shifted(snap, dx, dz, -1), grown)
+        if np.array_equal(grown, snap):
+            break
+        snap = grown
+    return snap.ravel()
+
+
+class PathIndex:
+    def __init__(self, compiled: CompiledMap, resolution: float = 5.0, clearance: float = 2.5,
+                 movable_walls_block: bool = False, max_fields: int = 4096) -> None:
+        """
+        Shortest path lengths of a map, at the granularity of `resolution`: positions are snapped to the nearest free cell
+        of the occupancy grid, distances are the ones between cell centers (off by less than a cell diagonal).
+        Movable walls don't block by default, as Active agents push them.
+
+        Fields towards goal cells are computed the first time they are asked for and the last `max_fields` are kept,
+        precompute() fills a table of all free cells (that can be saved to and memory-mapped from a .npy file).
+        """
+        self.map = compiled
+        self.resolution = resolution
+        self.free = occupancy_grid(compiled, resolution, clearance, movable_walls_block)
+        self.shape = self.free.shape
+        self._origin = -compiled.map_size / 2.0
+        self._snap = nearest_free(self.free)
+        self._fields: OrderedDict[int, np.ndarray] = OrderedDict()
+        self.max_fields = max_fields
+        self._table: np.ndarray | None = None
+
+    def cells(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Flat indices of the free cells of world (x, z) `positions` (..., 2)
+        """
+        ij = np.floor((np.asarray(positions) - self._origin) / self.resolution).astype(np.int64)
+        ij = np.clip(ij, 0, np.array(self.shape) - 1)
+        return self._snap[ij[..., 0] * self.shape[1] + ij[..., 1]]
+
+    def fields(self, goal_positions: np.ndarray) -> np.ndarray:
+        """
+        (G, H * W) flat distance fields towards `goal_positions` (G, 2), the missing ones are computed in one batch
+        """
+        goals = self.cells(np.asarray(goal_positions).reshape(-1, 2))
+        if self._table is not None:
+            return self._table[goals]
+        missing = np.array(sorted({int(cell) for cell in goals if cell not in self._fields}), dtype=np.int64)
+        if len(missing):
+            computed = distance_fields(self.free, missing, self.resolution).reshape(len(missing), -1)
+            for cell, field in zip(missing, computed):
+                self._fields[int(cell)] = field
+        for cell in goals:
+            self._fields.move_to_end(int(cell))
+        result = np.stack([self._fields[int(cell)] for cell in goals]) if len(goals) else np.empty((0, self.free.size), np.float32)
+        while len(self._fields) > self.max_fields:
+            self._fields.popitem(last=False)
+        return result
+
+    def distance(self, positions: np.ndarray, goal_positions: np.ndarray) -> np.ndarray:
+        """
+        Shortest path lengths (...,) from `positions` (..., 2) to the nearest of `goal_positions` (G, 2), inf without goals
+        """
+        fields = self.fields(goal_positions)
+        cells = self.cells(positions)
+        if not len(fields):
+            return np.full(cells.shape, np.inf, dtype=np.float32)
+        return fields[:, cells].min(axis=0)
+
+    def precompute(self, cache_path: str | Path | None = None) -> None:
+        """
+        Fields of all free cells at once, O(1) lookups from then on. With `cache_path` (.npy) the table is read from it
+        (memory-mapped) when it exists, written to it otherwise. (H * W)^2 float32, e.g. 10 MB for 200x200 maps at resolution 5.
+        """
+        if cache_path is not None and Path(cache_path).exists():
+            self._table = np.load(cache_path, mmap_mode="r")
+            return
+        table = np.full((self.free.size, self.free.size), np.inf, dtype=np.float32)
+        sources = np.flatnonzero(self.free)
+        table[sources] = distance_fields(self.free, sources, self.resolution).reshape(len(sources), -1)
+        self._table = table
+        if cache_path is not None:
+            temporary = f"{cache_path}.{os.getpid()}.tmp.npy"
+            np.save(temporary, table)
+            os.replace(temporary, cache_path)
+
+
+# path indices of this process by (content hash, resolution, clearance, movable_walls_block)
+_path_indices: dict[tuple, PathIndex] = {}
+
+
+def path_index(compiled: CompiledMap, resolution: float = 5.0, clearance: float = 2.5, movable_walls_block: bool = False) -> PathIndex:
+    """
+    PathIndex shared by all environments of the process on the same map, so fields outlive episodes and environments.
+    Maps without a content hash (compiled from dicts) get their own index.
+    """
+    if not compiled.content_hash:
+        return PathIndex(compiled, resolution, clearance, movable_walls_block)
+    key = (compiled.content_hash, resolution, clearance, movable_walls_block)
+    if key not in _path_indices:
+        _path_indices[key] = PathIndex(compiled, resolution, clearance, movable_walls_block)
+    return _path_indices[key]
+
+
+class PathTracker:
+    def __init__(self, index: PathIndex) -> None:
+        """
+        Path metrics of one episode, per agent: the shortest path length from the spawn to the nearest goal,
+        the length walked until entering a goal, and whether it did
+        """
+        self.index = index
+        self.optimal_distance = np.zeros(0, dtype=np.float32)
+        self.path_length = np.zeros(0)
+        self.success = np.zeros(0, dtype=bool)
+        self._last_positions = np.zeros((0, 2))
+        self._goal_fields = np.zeros((0, index.free.size), dtype=np.float32)
+
+    def reset(self, agent_positions: np.ndarray, goal_positions: np.ndarray) -> None:
+        #goals don't move during an episode, their fields are looked up once
+        self._goal_fields = self.index.fields(goal_positions)
+        self.optimal_distance = self.remaining_distance(agent_positions)
+        self.path_length = np.zeros(len(agent_positions))
+        self.success = np.zeros(len(agent_positions), dtype=bool)
+        self._last_positions = np.array(agent_positions, dtype=np.float64)
+
+    def step(self, agent_positions: np.ndarray, entered_goal: np.ndarray) -> None:
+        walking = ~self.success
+        self.path_length[walking] += np.linalg.norm(agent_positions - self._last_positions, axis=-1)[walking]
+        self.success |= entered_goal
+        self._last_positions[:] = agent_positions
+
+    def remaining_distance(self, agent_positions: np.ndarray, open_goals: np.ndarray | None = None) -> np.ndarray:
+        """
+        Shortest path lengths of `agent_positions` (N, 2) to the nearest goal of the episode (among the `open_goals` mask)
+        """
+        fields = self._goal_fields if open_goals is None else self._goal_fields[open_goals]
+        cells = self.index.cells(agent_positions)
+        return fields[:, cells].min(axis=0) if len(fields) else np.full(len(cells), np.inf, dtype=np.float32)
+
+    def spl(self) -> np.ndarray:
+        """
+        Per agent success * optimal / max(walked, optimal), nan for agents with no path to a goal
+        """
+        optimal = self.optimal_distance.astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            spl = np.where(optimal > 0, self.success * optimal / np.maximum(self.path_length, optimal), self.success.astype(np.float64))
+        return np.where(np.isfinite(optimal), spl, np.nan)
+
+    def optimality_gap(self) -> np.ndarray:
+        """
+        Per agent walked / optimal - 1, nan for the ones that didn't make it (or spawned in a goal cell)
+        """
+        optimal = self.optimal_distance.astype(np.float64)
+        valid = self.success & np.isfinite(optimal) & (optimal > 0)
+        return np.where(valid, self.path_length / np.where(valid, optimal, 1.0) - 1.0, np.nan)
+
+    def metrics(self) -> dict[str, float]:
+        """
+        Episode averages over agents, nan when no agent counts
+        """
+        spl, gap = self.spl(), self.optimality_gap()
+        finite = np.isfinite(self.optimal_distance)
+        return {
+            "success_rate": float(self.success.mean()) if len(self.success) else np.nan,
+            "spl": float(np.nanmean(spl)) if np.isfinite(spl).any() else np.nan,
+            "optimality_gap": float(np.nanmean(gap)) if np.isfinite(gap).any() else np.nan,
+            "optimal_distance": float(self.optimal_distance[finite].mean()) if finite.any() else np.nan,
+            "path_length": float(self.path_length.mean()) if len(self.path_length) else np.nan,
+        }
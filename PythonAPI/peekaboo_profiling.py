@@ -0,0 +1,117 @@
+import json
+import threading
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+from typing import Any
+
+import numpy as np
+
+#
+# Latency histograms of environment and training phases. Phases are timed by wrapping methods of live objects
+# (instance attributes shadow the class methods), so nothing is measured, nor paid for, until profiling is enabled.
+
+
+class LatencyHistogram:
+    def __init__(self, capacity: int) -> None:
+        """
+        Durations (ns) of the last `capacity`..2*`capacity` calls, count and total of all of them
+        """
+        self.capacity = capacity
+        self.samples: list[int] = []
+        self.dropped = 0
+        self.dropped_ns = 0
+        self._lock = threading.Lock()
+
+    def add(self, duration_ns: int) -> None:
+        #list.append is atomic under the GIL, trimming is rare and locked
+        self.samples.append(duration_ns)
+        if len(self.samples) > 2 * self.capacity:
+            with self._lock:
+                excess = len(self.samples) - self.capacity
+                if excess > self.capacity:
+                    self.dropped += excess
+                    self.dropped_ns += sum(self.samples[:excess])
+                    del self.samples[:excess]
+
+    @property
+    def count(self) -> int:
+        return self.dropped + len(self.samples)
+
+    def summary(self, elapsed: float) -> dict[str, float]:
+        samples = np.asarray(self.samples, dtype=np.float64) / 1e6
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (np.nan,) * 3
+        total = (self.dropped_ns + samples.sum() * 1e6) / 1e9
+        return {
+            "count": self.count,
+            "total s": total,
+            "mean ms": total * 1e3 / max(self.count, 1),
+            "p50 ms": float(p50),
+            "p95 ms": float(p95),
+            "p99 ms": float(p99),
+            "per second": self.count / elapsed if elapsed > 0 else np.nan,
+        }
+
+
+class LatencyProfiler:
+    def __init__(self, capacity: int = 10000) -> None:
+        """
+        Percentiles are taken over (at least) the last `capacity` calls of every phase
+        """
+        self.capacity = capacity
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self._local = threading.local()
+        self._start = perf_counter()
+
+    def histogram(self, phase: str) -> LatencyHistogram:
+        if phase not in self.histograms:
+            self.histograms[phase] = LatencyHistogram(self.capacity)
+        return self.histograms[phase]
+
+    def instrument(self, owner: Any, name: str, phase: str, self_time: bool = False) -> None:
+        """
+        Replaces `owner.name` with a wrapper recording every call under `phase`.
+        With `self_time` the duration minus the one of nested instrumented calls goes to f"{phase}/self" as well,
+        e.g. PeekabooEnv.step without the Unity round trip.
+        """
+        method = getattr(owner, name)
+        samples = self.histogram(phase)
+        own = self.histogram(f"{phase}/self") if self_time else None
+        local = self._local
+
+        def timed(*args, **kwargs):
+            outer = getattr(local, "nested", 0)
+            local.nested = 0
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                samples.add(elapsed)
+                if own is not None:
+                    own.add(elapsed - local.nested)
+                local.nested = outer + elapsed
+
+        timed.__wrapped__ = method
+        setattr(owner, name, timed)
+
+    def reset(self) -> None:
+        self.histograms = {phase: LatencyHistogram(self.capacity) for phase in self.histograms}
+        self._start = perf_counter()
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        {phase: {count, total s, mean/p50/p95/p99 ms, per second}}, calls per second are over the wall time
+        since the creation (or reset) of the profiler
+        """
+        elapsed = perf_counter() - self._start
+        return {phase: histogram.summary(elapsed) for phase, histogram in self.histograms.items() if histogram.count}
+
+    def logs(self, prefix: str = "latency/") -> dict[str, float]:
+        """
+        Flat summary for wandb.log
+        """
+        return {f"{prefix}{phase} {key}": value for phase, summary in self.summary().items() for key, value in summary.items()}
+
+    def save_json(self, path: str | Path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
@@ -0,0 +1,295 @@
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator
+
+import h5py
+import numpy as np
+
+from peekaboo_obs_codec import RayObservationCodec
+
+#
+# Trajectories of array mode environments on disk: a recorder that streams every step into chunked, compressed
+# HDF5 datasets, and a reader serving random minibatches out of such files without loading them.
+# Row t of every dataset is one environment step: the observation and mask the actions were chosen on,
+# the actions, and what the step returned.
+
+# datasets of a trajectory file, all (steps, ...) and resizable along the first axis
+TRAJECTORY_KEYS: tuple[str, ...] = ("observations", "action_masks", "actions", "rewards", "group_rewards", "terminated", "truncated", "map_ids")
+
+
+class TrajectoryRecorder:
+    def __init__(self, environment, path: str | Path, map_id: str = "", chunk_steps: int = 256,
+                 compression: str | None = "gzip", compression_opts: int | None = 4, mode: str = "a",
+                 observation_codec: RayObservationCodec | None = None) -> None:
+        """
+        Wraps an array mode environment (PeekabooEnv, PeekabooSimEnv), everything else is forwarded to it.
+        Steps are buffered in one chunk of `chunk_steps` rows and written to `path` when it fills up,
+        so memory does not grow with the episode length and every chunk is compressed once.
+        With mode="a" an existing file is appended to, it has to come from the same environment.
+
+        `map_id` names the map the steps are played on, stored per step as an index into attrs["map_names"],
+        call set_map when the environment switches maps.
+
+        With an `observation_codec` observations are stored as its codes (attrs["observation_codec"]), TrajectoryReader decodes them.
+        """
+        if not getattr(environment, "array_mode", False):
+            raise ValueError("TrajectoryRecorder needs an environment in array_mode")
+        self.environment = environment
+        self.path = Path(path)
+        self.chunk_steps = chunk_steps
+        self.observation_codec = observation_codec
+        self._file = h5py.File(self.path, mode)
+        self._obs, self._mask = None, None
+        self._pending = 0
+        self._buffers: dict[str, np.ndarray] = {}
+        self._map_names: list[str] = json.loads(self._file.attrs.get("map_names", "[]"))
+        self._compression = dict(compression=compression, compression_opts=compression_opts if compression == "gzip" else None,
+                                 shuffle=compression is not None)
+        self.set_map(map_id)
+
+    def __getattr__(self, name: str):
+        return getattr(self.environment, name)
+
+    def __enter__(self) -> "TrajectoryRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def num_steps(self) -> int:
+        """
+        Recorded steps, including the ones not flushed yet
+        """
+        stored = len(self._file["observations"]) if "observations" in self._file else 0
+        return stored + self._pending
+
+    def set_map(self, map_id: str) -> None:
+        if map_id not in self._map_names:
+            self._map_names.append(map_id)
+            self._file.attrs["map_names"] = json.dumps(self._map_names)
+        self._map_index = self._map_names.index(map_id)
+
+    def _allocate(self, actions: np.ndarray) -> None:
+        n_agents, n_branches = len(self._obs), actions.shape[-1]
+        codec = self.observation_codec
+        stored_codec = self._file.attrs.get("observation_codec") if "observations" in self._file else None
+        if "observations" in self._file and stored_codec != (None if codec is None else codec.to_json()):
+            raise ValueError(f"{self.path}: observations are stored with codec {stored_codec}, the recorder has {codec and codec.to_json()}")
+        shapes = {
+            "observations": (self._obs.shape[1:], np.float32) if codec is None else ((codec.code_dim,), np.uint8),
+            "action_masks": (self._mask.shape[1:], bool),
+            "actions": ((n_branches,), np.int16),
+            "rewards": ((), np.float32),
+            "group_rewards": ((), np.float32),
+            "terminated": ((), bool),
+            "truncated": ((), bool),
+        }
+        self._buffers = {key: np.zeros((self.chunk_steps, n_agents, *shape), dtype=dtype) for key, (shape, dtype) in shapes.items()}
+        self._buffers["map_ids"] = np.zeros(self.chunk_steps, dtype=np.int32)
+        for key, buffer in self._buffers.items():
+            if key in self._file:
+                if self._file[key].shape[1:] != buffer.shape[1:]:
+                    raise ValueError(f"{self.path}: {key} are shaped {self._file[key].shape[1:]}, the environment gives {buffer.shape[1:]}")
+                continue
+            self._file.create_dataset(key, shape=(0, *buffer.shape[1:]), maxshape=(None, *buffer.shape[1:]), dtype=buffer.dtype,
+                                      chunks=(self.chunk_steps, *buffer.shape[1:]), **self._compression)
+        self._file.attrs["agents"] = json.dumps(list(self.environment.possible_agents))
+        if codec is not None:
+            self._file.attrs["observation_codec"] = codec.to_json()
+
+    def reset(self):
+        self._obs, self._mask = self.environment.reset()
+        return self._obs, self._mask
+
+    def step(self, actions: np.ndarray):
+        actions = np.asarray(actions)
+        if self._obs is None:
+            raise RuntimeError("reset() the environment before recording steps")
+        if not self._buffers:
+            self._allocate(actions)
+        row = self._pending
+        #the environment overwrites its output arrays in place, so observations are copied before stepping
+        self._buffers["observations"][row] = self._obs if self.observation_codec is None else self.observation_codec.encode(self._obs)
+        self._buffers["action_masks"][row] = self._mask
+        self._buffers["actions"][row] = actions
+        result = self.environment.step(actions)
+        self._obs, self._mask, rewards, terminated, truncated = result
+        self._buffers["rewards"][row] = rewards
+        self._buffers["group_rewards"][row] = self.environment.group_rewards
+        self._buffers["terminated"][row] = terminated
+        self._buffers["truncated"][row] = truncated
+        self._buffers["map_ids"][row] = self._map_index
+        self._pending += 1
+        if self._pending == self.chunk_steps:
+            self.flush()
+        return result
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        for key, buffer in self._buffers.items():
+            dataset = self._file[key]
+            start = len(dataset)
+            dataset.resize(start + self._pending, axis=0)
+            dataset[start:] = buffer[:self._pending]
+        self._pending = 0
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Writes the last partial chunk and closes the file and the environment
+        """
+        if self._file:
+            self.flush()
+            self._file.close()
+        self.environment.close()
+
+
+def export_contiguous(source: str | Path, target: str | Path) -> None:
+    """
+    Copies a trajectory file into contiguous uncompressed datasets, which TrajectoryReader memory-maps
+    """
+    with h5py.File(source, "r") as src, h5py.File(target, "w") as dst:
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+        for key in TRAJECTORY_KEYS:
+            if key in src:
+                dst.create_dataset(key, data=src[key][:])
+
+
+class TrajectoryReader:
+    def __init__(self, paths: str | Path | list, keys: tuple[str, ...] = TRAJECTORY_KEYS, cache_chunks: int = 64,
+                 seed: int | None = None, mmap: bool = True, decode: bool = True) -> None:
+        """
+        Random access to the steps of one or more trajectory files, indexed as if they were concatenated.
+        Contiguous uncompressed datasets (see export_contiguous) are memory-mapped when `mmap` is set,
+        chunked ones are read a whole chunk at a time and the last `cache_chunks` decompressed chunks are kept.
+        Observations recorded with a codec are cached as codes and decoded in the batches, unless `decode` is off
+        """
+        paths = [paths] if isinstance(paths, (str, Path)) else list(paths)
+        self.keys = tuple(keys)
+        self.rng = np.random.default_rng(seed)
+        self._files = [h5py.File(path, "r") for path in paths]
+        self._sources: list[dict] = []
+        for file in self._files:
+            sources = {}
+            for key in self.keys:
+                dataset = file[key]
+                offset = dataset.id.get_offset() if mmap and dataset.chunks is None and dataset.compression is None else None
+                if offset is not None:
+                    sources[key] = np.memmap(file.filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+                else:
+                    sources[key] = dataset
+            self._sources.append(sources)
+        lengths = [len(file[self.keys[0]]) for file in self._files]
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._cache: OrderedDict = OrderedDict()
+        self.cache_chunks = cache_chunks
+        self.map_names = [json.loads(file.attrs.get("map_names", "[]")) for file in self._files]
+        self.codecs = [RayObservationCodec.from_json(file.attrs["observation_codec"]) if "observation_codec" in file.attrs else None
+                       for file in self._files]
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _chunk(self, file_index: int, key: str, chunk_index: int) -> np.ndarray:
+        cache_key = (file_index, key, chunk_index)
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            return self._cache[cache_key]
+        dataset = self._sources[file_index][key]
+        size = dataset.chunks[0]
+        chunk = dataset[chunk_index * size:(chunk_index + 1) * size]
+        self._cache[cache_key] = chunk
+        if len(self._cache) > self.cache_chunks * len(self.keys):
+            self._cache.popitem(last=False)
+        return chunk
+
+    def _decoded(self, file_index: int, key: str, values: np.ndarray) -> np.ndarray:
+        codec = self.codecs[file_index]
+        return codec.decode(values) if self.decode and codec is not None and key == "observations" else values
+
+    def _gather(self, file_index: int, key: str, rows: np.ndarray) -> np.ndarray:
+        source = self._sources[file_index][key]
+        if isinstance(source, np.ndarray):
+            return source[rows]
+        if source.chunks is None:
+            #h5py wants increasing indices
+            order = np.argsort(rows)
+            out = np.empty((len(rows), *source.shape[1:]), dtype=source.dtype)
+            out[order] = source[rows[order]]
+            return out
+        size = source.chunks[0]
+        chunk_ids = rows // size
+        out = np.empty((len(rows), *source.shape[1:]), dtype=source.dtype)
+        for chunk_index in np.unique(chunk_ids):
+            selected = chunk_ids == chunk_index
+            out[selected] = self._chunk(file_index, key, int(chunk_index))[rows[selected] - chunk_index * size]
+        return out
+
+    def read(self, indices: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Steps at global `indices`, in that order
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        file_ids = np.searchsorted(self._offsets, indices, side="right") - 1
+        batch = {}
+        for key in self.keys:
+            out = None
+            for file_index in np.unique(file_ids):
+                selected = file_ids == file_index
+                values = self._decoded(int(file_index), key, self._gather(int(file_index), key, indices[selected] - self._offsets[file_index]))
+                if out is None:
+                    out = np.empty((len(indices), *values.shape[1:]), dtype=values.dtype)
+                out[selected] = values
+            batch[key] = out
+        return batch
+
+    def sample(self, batch_size: int) -> dict[str, np.ndarray]:
+        """
+        Uniformly random steps
+        """
+        return self.read(self.rng.integers(0, len(self), batch_size))
+
+    def minibatches(self, batch_size: int, blocks_per_shuffle: int = 8, block_steps: int | None = None) -> Iterator[dict[str, np.ndarray]]:
+        """
+        One epoch over all steps in random order, approximately: blocks of `block_steps` consecutive steps
+        (the chunk size by default) are visited in random order, `blocks_per_shuffle` of them are read with sequential
+        reads and their steps shuffled together. Much faster than sample() on compressed files.
+        """
+        blocks = []
+        for file_index, file in enumerate(self._files):
+            dataset = file[self.keys[0]]
+            steps = block_steps or (dataset.chunks[0] if dataset.chunks else 1024)
+            blocks += [(file_index, start, min(start + steps, len(dataset))) for start in range(0, len(dataset), steps)]
+        order = self.rng.permutation(len(blocks))
+        pool: dict[str, np.ndarray] | None = None
+        for group in range(0, len(order), blocks_per_shuffle):
+            parts = [blocks[i] for i in order[group:group + blocks_per_shuffle]]
+            loaded = {key: np.concatenate([self._decoded(file_index, key, self._sources[file_index][key][start:stop])
+                                           for file_index, start, stop in parts])
+                      for key in self.keys}
+            if pool is not None:
+                loaded = {key: np.concatenate([pool[key], loaded[key]]) for key in self.keys}
+            permutation = self.rng.permutation(len(loaded[self.keys[0]]))
+            full = len(permutation) // batch_size * batch_size
+            for start in range(0, full, batch_size):
+                yield {key: values[permutation[start:start + batch_size]] for key, values in loaded.items()}
+            pool = {key: values[permutation[full:]] for key, values in loaded.items()}
+        if pool is not None and len(pool[self.keys[0]]):
+            yield pool
+
+    def close(self) -> None:
+        self._sources.clear()
+        self._cache.clear()
+        for file in self._files:
+            file.close()
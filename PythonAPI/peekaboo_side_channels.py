@@ -0,0 +1,35 @@
+import json
+import uuid
+
+from mlagents_envs.side_channel.side_channel import IncomingMessage, OutgoingMessage, SideChannel
+
+#
+# Python side of MapSideChannel.cs: map jsons pushed into a running player, EnvController swaps the scene
+# to the last one received at its next reset and answers with a status string.
+
+# MapSideChannel.ChannelId
+MAP_CHANNEL_ID: uuid.UUID = uuid.UUID("0669b698-526e-43f4-a019-4be7780b8e12")
+# status MapSideChannel sends back after a successful swap, anything else is an error message
+MAP_LOADED: str = "ok"
+
+
+class MapSideChannel(SideChannel):
+    def __init__(self) -> None:
+        super().__init__(MAP_CHANNEL_ID)
+        self.statuses: list[str] = []
+
+    def on_message_received(self, msg: IncomingMessage) -> None:
+        self.statuses.append(msg.read_string())
+
+    def send_map(self, config: dict) -> None:
+        """
+        Queues a map json (the "Agents"/"Goals"/"Map" structure), it goes out with the next step or reset
+        """
+        msg = OutgoingMessage()
+        msg.write_string(json.dumps(config))
+        self.queue_message_to_send(msg)
+
+    def pop_errors(self) -> list[str]:
+        errors = [status for status in self.statuses if status != MAP_LOADED]
+        self.statuses.clear()
+        return errors
@@ -0,0 +1,650 @@
+from dataclasses import dataclass, field, replace
+from enum import IntEnum
+from pathlib import Path
+
+import numpy as np
+from gym import spaces
+
+from peekaboo_maps import CompiledMap, MapConfig, compile_map
+from peekaboo_profiling import LatencyProfiler
+
+#
+# Headless stand-in for the Unity build: a top-down (x, z) NumPy simulation of the same maps,
+# observations, actions and rewards, exposing PeekabooEnv's parallel PettingZoo API.
+# It is not a physics engine, it is meant for tests, profiling and debugging of the training stack.
+
+
+class GameEvent(IntEnum):
+    """
+    Mirrors EnvironmentConfiguration.GameEvent
+    """
+    ActiveAgentHitGoal = 0
+    AgentHitGoal = 1
+    AgentOutOfBounds = 2
+    AgentHitObstacle = 3
+    ActiveAgentHitMovableObstacle = 4
+    AgentHitAgent = 5
+    AllGoalsCompleted = 6
+
+
+#EnvSettings.invdividualRewards
+INDIVIDUAL_REWARDS: dict[GameEvent, float] = {
+    GameEvent.AgentHitObstacle: -0.01,
+    GameEvent.ActiveAgentHitMovableObstacle: 0.01,
+    GameEvent.AgentHitAgent: -0.1,
+    GameEvent.AgentOutOfBounds: -1.0,
+    GameEvent.ActiveAgentHitGoal: 1.0,
+}
+
+#EnvironmentParameters MAPFAgent.OnEpisodeBegin reads, with their EnvSettings defaults (see PeekabooEnv.set_env_parameters)
+ENV_PARAMETERS: dict[str, float] = {
+    "agent_moving_speed": 69.0,
+    "agent_rotation_speed": 99.5,
+    "agent_jump_force": 300.0,
+    "agent_falling_force": 400.0,
+    "obstacle_avoidance_distance": 15.1,
+    "movable_obstacle_speed": 20.0,
+    "decision_period": 3.0, #DecisionRequester of the dev scene
+    **{f"reward/{event.name}": value for event, value in INDIVIDUAL_REWARDS.items()},
+}
+
+#the dev build detects 9 tags, the ones the stand-in can produce go first, the rest stay zero
+DETECTABLE_TAGS: tuple[str, ...] = ("Agent", "ActiveAgent", "Obstacle", "MovableObstacle", "Surface", "Barrier", "Goal")
+NUM_DETECTABLE_TAGS: int = 9
+TAG_INDEX: dict[str, int] = {tag: index for index, tag in enumerate(DETECTABLE_TAGS)}
+
+#moving arrow keys (noop, W, S, A, D), rotations, jump, use
+ACTION_BRANCHES: tuple[int, ...] = (5, 3, 2, 2)
+#local (right, forward) direction of every moving action, see MAPFAgent.MoveAgentDiscrete
+MOVE_DIRECTIONS = np.array([[0.0, 0.0], [0.0, 1.0], [0.0, -1.0], [-0.75, 0.0], [0.75, 0.0]])
+ROTATE_DIRECTIONS = np.array([0.0, 1.0, -1.0])
+#masking rays of the moving actions: forward, backward, left, right
+MASK_RAY_ANGLES = np.array([0.0, np.pi, -np.pi / 2.0, np.pi / 2.0])
+
+BEHAVIOR_NAME: str = "Peekaboo"
+
+
+@dataclass
+class SimSettings:
+    """
+    Constants of EnvSettings.cs and of the agent prefab of the dev build
+    """
+    max_environment_steps: int = 1000 #physics frames
+    delta_time: float = 0.02 #Unity's fixed timestep
+    #DecisionRequester.DecisionPeriod of the dev scene: frames an action is repeated for, with summed rewards and one observation per step
+    decision_period: int = 3
+
+    agent_moving_speed: float = 69.0
+    agent_rotation_speed: float = 99.5 #degrees per second
+    obstacle_avoidance_distance: float = 15.1
+    movable_obstacle_speed: float = 20.0
+    agent_radius: float = 2.5
+    goal_radius: float = 2.5
+
+    #RayPerceptionSensorComponent3D
+    rays_per_direction: int = 4
+    max_ray_degrees: float = 45.0
+    ray_length: float = 100.0
+    num_detectable_tags: int = NUM_DETECTABLE_TAGS
+
+    mask_actions: bool = True
+    randomize_agent_position: bool = True
+    randomize_agent_rotation: bool = True
+    randomize_goal_position: bool = True
+    spawn_area_margin_multiplier: float = 0.9
+    spawn_clearance: float = 10.1
+    max_spawn_attempts: int = 100
+
+    individual_rewards: dict = field(default_factory=lambda: dict(INDIVIDUAL_REWARDS))
+
+
+def check_env_parameters(parameters: dict) -> dict[str, float]:
+    """
+    `parameters` as floats, ValueError for names MAPFAgent doesn't read
+    """
+    unknown = sorted(set(parameters) - set(ENV_PARAMETERS))
+    if unknown:
+        raise ValueError(f"Unknown environment parameters {unknown}, known ones are {list(ENV_PARAMETERS)}")
+    return {key: float(value) for key, value in parameters.items()}
+
+
+def ray_angles(rays_per_direction: int, max_ray_degrees: float) -> np.ndarray:
+    """
+    Ray order of RayPerceptionSensor: center, then right/left pairs going outwards (radians, relative to forward)
+    """
+    delta = max_ray_degrees / max(rays_per_direction, 1)
+    angles = [0.0]
+    for i in range(1, rays_per_direction + 1):
+        angles += [i * delta, -i * delta]
+    return np.deg2rad(np.asarray(angles))
+
+
+def heading(yaw: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    World (x, z) forward and right vectors of a rotation around the Yth axis
+    """
+    sin, cos = np.sin(yaw), np.cos(yaw)
+    return np.stack([sin, cos], axis=-1), np.stack([cos, -sin], axis=-1)
+
+
+def to_box_frame(points: np.ndarray, centers: np.ndarray, cos: np.ndarray, sin: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    points (..., P, 2), box centers (..., B, 2), box rotation cos/sin (..., B) -> local x, z coordinates (..., P, B)
+    """
+    offset = points[..., :, None, :] - centers[..., None, :, :]
+    cos, sin = cos[..., None, :], sin[..., None, :]
+    return offset[..., 0] * cos - offset[..., 1] * sin, offset[..., 0] * sin + offset[..., 1] * cos
+
+
+def circle_box_overlap(points: np.ndarray, radius: float, centers: np.ndarray, cos: np.ndarray, sin: np.ndarray,
+                       half_extents: np.ndarray) -> np.ndarray:
+    """
+    Whether circles at points (..., P, 2) overlap oriented boxes (..., B) -> (..., P, B)
+    """
+    local_x, local_z = to_box_frame(points, centers, cos, sin)
+    dx = local_x - np.clip(local_x, -half_extents[..., None, :, 0], half_extents[..., None, :, 0])
+    dz = local_z - np.clip(local_z, -half_extents[..., None, :, 1], half_extents[..., None, :, 1])
+    return dx * dx + dz * dz < radius * radius
+
+
+def ray_box_distance(origins: np.ndarray, directions: np.ndarray, centers: np.ndarray, cos: np.ndarray, sin: np.ndarray,
+                     half_extents: np.ndarray) -> np.ndarray:
+    """
+    Slab test of rays (..., R, 2) with unit directions against oriented boxes (..., B) -> hit distances (..., R, B), inf if missed
+    """
+    local_x, local_z = to_box_frame(origins, centers, cos, sin)
+    cos, sin = cos[..., None, :], sin[..., None, :]
+    dir_x = directions[..., :, None, 0] * cos - directions[..., :, None, 1] * sin
+    dir_z = directions[..., :, None, 0] * sin + directions[..., :, None, 1] * cos
+    dir_x = np.where(np.abs(dir_x) < 1e-12, 1e-12, dir_x)
+    dir_z = np.where(np.abs(dir_z) < 1e-12, 1e-12, dir_z)
+
+    #each slab is entered at mid - span and left at mid + span
+    inv_x, inv_z = 1.0 / dir_x, 1.0 / dir_z
+    mid_x, mid_z = -local_x * inv_x, -local_z * inv_z
+    span_x = half_extents[..., None, :, 0] * np.abs(inv_x)
+    span_z = half_extents[..., None, :, 1] * np.abs(inv_z)
+    t_near = np.maximum(mid_x - span_x, mid_z - span_z)
+    t_far = np.minimum(mid_x + span_x, mid_z + span_z)
+
+    hit = (t_far >= t_near) & (t_far >= 0.0)
+    return np.where(hit, np.maximum(t_near, 0.0), np.inf)
+
+
+def ray_circle_distance(origins: np.ndarray, directions: np.ndarray, centers: np.ndarray, radii: float | np.ndarray) -> np.ndarray:
+    """
+    Rays (..., R, 2) with unit directions against circles (..., C, 2) of radii (..., C) -> hit distances (..., R, C), inf if missed
+    """
+    offset = origins[..., :, None, :] - centers[..., None, :, :]
+    b = (offset * directions[..., :, None, :]).sum(-1)
+    radii = np.asarray(radii)[..., None, :] if np.ndim(radii) else radii
+    c = (offset * offset).sum(-1) - radii * radii
+    discriminant = b * b - c
+    t = -b - np.sqrt(np.maximum(discriminant, 0.0))
+    hit = (discriminant >= 0.0) & (t >= 0.0)
+    return np.where(c < 0.0, 0.0, np.where(hit, t, np.inf))
+
+
+def ray_bounds_distance(origins: np.ndarray, directions: np.ndarray, half_size: np.ndarray) -> np.ndarray:
+    """
+    Distance from points inside the area (..., R, 2) to its border along unit directions (..., R, 2)
+    """
+    safe = np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+    t = (np.sign(safe) * half_size[..., None, :] - origins) / safe
+    return np.maximum(t.min(-1), 0.0)
+
+
+def encode_rays(distances: np.ndarray, tags: np.ndarray, ray_length: float, num_detectable_tags: int) -> np.ndarray:
+    """
+    RayPerceptionOutput layout: per ray a one-hot of the hit tag, a "no hit" flag and the hit fraction
+    distances/tags (..., R) -> (..., R * (num_detectable_tags + 2))
+    """
+    hit = distances <= ray_length
+    encoded = np.zeros(distances.shape + (num_detectable_tags + 2,), dtype=np.float32)
+    encoded[..., :num_detectable_tags] = (tags[..., None] == np.arange(num_detectable_tags)) & hit[..., None]
+    encoded[..., num_detectable_tags] = ~hit
+    encoded[..., num_detectable_tags + 1] = np.where(hit, distances / ray_length, 1.0)
+    return encoded.reshape(distances.shape[:-1] + (-1,))
+
+
+class PeekabooSimEnv:
+    def __init__(self, map_config: str | Path | dict | MapConfig | CompiledMap, seed: int | None = None,
+                 settings: SimSettings | None = None, worker_id: int | None = None, array_mode: bool = False):
+        """
+        Pure NumPy stand-in for PeekabooEnv built from a map json (see configs/maps), compiled with compile_map.
+        Same agent ids format, spaces and (observation, reward, done, info) dicts as UnityParallelEnv,
+        or the arrays of PeekabooEnv's `array_mode`.
+
+        Notice: agents move on the (x, z) plane only, jumps are no-ops and can't let anyone fall off the map,
+        movable walls are pushed without wall-to-wall collisions.
+        `worker_id` is accepted for compatibility with PeekabooEnv factories and ignored.
+        """
+        self.settings = SimSettings() if settings is None else settings
+        self._rng = np.random.default_rng(seed)
+        self.path_tracker = None
+        self._pending_map: CompiledMap | None = None
+        self._pending_parameters: dict[str, float] = {}
+        self._set_map(map_config if isinstance(map_config, CompiledMap) else compile_map(map_config))
+        settings = self.settings
+
+        self.n_agents = self.map.n_agents
+        self._possible_agents = [f"{BEHAVIOR_NAME}?team=0?agent_id={i}" for i in range(self.n_agents)]
+        self._agent_index = {agent_id: i for i, agent_id in enumerate(self._possible_agents)}
+
+        self.ray_angles = ray_angles(settings.rays_per_direction, settings.max_ray_degrees)
+        obs_dim = len(self.ray_angles) * (settings.num_detectable_tags + 2)
+        self._observation_space = spaces.Box(low=-np.float32(np.inf), high=np.float32(np.inf), shape=(obs_dim,), dtype=np.float32)
+        self._action_space = spaces.MultiDiscrete(ACTION_BRANCHES)
+        self._action_space.seed(seed)
+
+        self._live_agents: list[str] = []
+        self._observations: dict = {}
+        self._rewards: dict[str, float] = {}
+        self._dones: dict[str, bool] = {}
+        self._infos: dict[str, dict] = {}
+
+        self.array_mode = array_mode
+        #rows follow possible_agents (string sorted), overwritten in place by every step/reset in array mode
+        self._array_rows = np.array([self._agent_index[agent_id] for agent_id in self.possible_agents])
+        self._array_obs = np.zeros((self.n_agents, obs_dim), dtype=np.float32)
+        self._array_mask = np.zeros((self.n_agents, sum(ACTION_BRANCHES)), dtype=bool)
+        self._array_reward = np.zeros(self.n_agents, dtype=np.float32)
+        self._array_terminated = np.zeros(self.n_agents, dtype=bool)
+        self._array_truncated = np.zeros(self.n_agents, dtype=bool)
+        self.group_rewards = np.zeros(self.n_agents, dtype=np.float32)
+        self.profiler: LatencyProfiler | None = None
+        self.reset()
+
+    def _set_map(self, compiled: CompiledMap) -> None:
+        self.map, settings = compiled, self.settings
+        self.half_size = compiled.map_size / 2.0
+
+        #read-only arrays of the compiled map (possibly memory-mapped), copied into the episode state on reset
+        self.wall_start_centers = compiled.wall_centers
+        self.wall_cos, self.wall_sin = np.cos(compiled.wall_yaws), np.sin(compiled.wall_yaws)
+        self.wall_half_extents = compiled.wall_half_extents
+        self.wall_movable = compiled.is_type(compiled.wall_types, "Movable")
+        self.wall_tags = np.where(self.wall_movable, TAG_INDEX["MovableObstacle"], TAG_INDEX["Obstacle"])
+
+        self.agent_start_positions = compiled.agent_positions
+        self.agent_start_yaws = compiled.agent_yaws
+        self.agent_active = compiled.is_type(compiled.agent_types, "Active")
+        self.agent_tags = np.where(self.agent_active, TAG_INDEX["ActiveAgent"], TAG_INDEX["Agent"])
+        self.goal_start_positions = compiled.goal_positions
+        num_goals = len(compiled.goal_positions)
+        self._circle_radii = np.concatenate([np.full(compiled.n_agents, settings.agent_radius), np.full(num_goals, settings.goal_radius)])
+        self._hit_tags = np.concatenate([
+            self.wall_tags, self.agent_tags, np.full(num_goals, TAG_INDEX["Goal"]), [TAG_INDEX["Barrier"]]
+        ])
+
+    @property
+    def possible_agents(self) -> list[str]:
+        return sorted(self._possible_agents)
+
+    @property
+    def agents(self) -> list[str]:
+        return sorted(self._live_agents)
+
+    @property
+    def num_agents(self) -> int:
+        return len(self._live_agents)
+
+    @property
+    def observation_spaces(self) -> dict:
+        return {agent_id: self._observation_space for agent_id in self.possible_agents}
+
+    def observation_space(self, agent: str):
+        return self._observation_space
+
+    @property
+    def action_spaces(self) -> dict:
+        return {agent_id: self._action_space for agent_id in self.possible_agents}
+
+    def action_space(self, agent: str):
+        return self._action_space
+
+    @property
+    def dones(self) -> dict[str, bool]:
+        return dict(self._dones)
+
+    @property
+    def rewards(self) -> dict[str, float]:
+        return dict(self._rewards)
+
+    @property
+    def infos(self) -> dict[str, dict]:
+        return dict(self._infos)
+
+    def seed(self, seed: int | None = None) -> None:
+        self._rng = np.random.default_rng(seed)
+        self._action_space.seed(seed)
+
+    def render(self, mode: str = "human") -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def enable_profiling(self, profiler: LatencyProfiler | None = None) -> LatencyProfiler:
+        """
+        Times step/reset/close from now on, under the "env/..." phases of PeekabooEnv.enable_profiling
+        """
+        if self.profiler is None:
+            self.profiler = LatencyProfiler() if profiler is None else profiler
+            for name in ("step", "reset", "close"):
+                self.profiler.instrument(self, name, f"env/{name}")
+        return self.profiler
+
+    def enable_path_metrics(self, resolution: float = 5.0):
+        """
+        Tracks shortest path metrics (peekaboo_paths.PathTracker) from the current episode on: the per agent dict infos get
+        "optimal_distance" (spawn to the nearest goal), "remaining_distance" (to the nearest open goal) and "path_length",
+        plus "spl" and "optimality_gap" at the end of the episode. In array mode read them from `path_tracker`.
+        """
+        from peekaboo_paths import PathTracker, path_index
+        if self.path_tracker is None:
+            self.path_tracker = PathTracker(path_index(self.map, resolution, self.settings.agent_radius))
+            self.path_tracker.reset(self.agent_positions, self.goal_positions)
+            self._remaining_distance = self.path_tracker.optimal_distance
+            if not self.array_mode:
+                self._infos = {agent_id: self._info(i, 0.0) for i, agent_id in enumerate(self._possible_agents)}
+        return self.path_tracker
+
+    def load_map(self, map_config: str | Path | dict | MapConfig | CompiledMap) -> None:
+        """
+        As PeekabooEnv.load_map: the map replaces the current one at the next reset, agents stay the same
+        """
+        compiled = map_config if isinstance(map_config, CompiledMap) else compile_map(map_config)
+        if compiled.n_agents != self.n_agents:
+            raise ValueError(f"The map has {compiled.n_agents} agents, the environment was created with {self.n_agents}")
+        self._pending_map = compiled
+
+    def set_env_parameters(self, **parameters: float) -> None:
+        """
+        As PeekabooEnv.set_env_parameters, applied at the next reset. Jump and falling forces are accepted and ignored.
+        """
+        self._pending_parameters.update(check_env_parameters(parameters))
+
+    def _apply_pending(self) -> None:
+        if self._pending_parameters:
+            settings = replace(self.settings, individual_rewards=dict(self.settings.individual_rewards))
+            for key, value in self._pending_parameters.items():
+                if key.startswith("reward/"):
+                    settings.individual_rewards[GameEvent[key[len("reward/"):]]] = value
+                elif hasattr(settings, key):
+                    setattr(settings, key, type(getattr(settings, key))(value))
+            self.settings = settings
+            self._pending_parameters = {}
+        if self._pending_map is not None:
+            self._set_map(self._pending_map)
+            self._pending_map = None
+            if self.path_tracker is not None:
+                from peekaboo_paths import path_index
+                index = self.path_tracker.index
+                self.path_tracker.index = path_index(self.map, index.resolution, self.settings.agent_radius)
+
+    def _free_spawn(self, taken: list[np.ndarray], fallback: np.ndarray) -> np.ndarray:
+        """
+        EnvController.GetRandomSpawnPos: a random point of the area with nothing around
+        """
+        settings = self.settings
+        extents = self.half_size * settings.spawn_area_margin_multiplier
+        for _ in range(settings.max_spawn_attempts):
+            position = self._rng.uniform(-extents, extents)
+            if circle_box_overlap(position[None], settings.spawn_clearance, self.wall_centers,
+                                  self.wall_cos, self.wall_sin, self.wall_half_extents).any():
+                continue
+            if any(np.linalg.norm(position - other) < settings.spawn_clearance for other in taken):
+                continue
+            return position
+        return fallback.copy()
+
+    def reset(self) -> dict | tuple[np.ndarray, np.ndarray]:
+        self._apply_pending()
+        settings = self.settings
+        self.wall_centers = self.wall_start_centers.copy()
+        taken = []
+        self.goal_positions = np.empty_like(self.goal_start_positions)
+        for i, start in enumerate(self.goal_start_positions):
+            self.goal_positions[i] = self._free_spawn(taken, start) if settings.randomize_goal_position else start
+            taken.append(self.goal_positions[i])
+        self.agent_positions = np.empty_like(self.agent_start_positions)
+        for i, start in enumerate(self.agent_start_positions):
+            self.agent_positions[i] = self._free_spawn(taken, start) if settings.randomize_agent_position else start
+            taken.append(self.agent_positions[i])
+        if settings.randomize_agent_rotation:
+            self.agent_yaws = self._rng.uniform(0.0, 2.0 * np.pi, self.n_agents)
+        else:
+            self.agent_yaws = self.agent_start_yaws.copy()
+
+        self.goal_completed = np.zeros(len(self.goal_positions), dtype=bool)
+        self.agent_in_goal = np.zeros((self.n_agents, len(self.goal_positions)), dtype=bool)
+        self.collision_counter = np.zeros(self.n_agents, dtype=np.int64)
+        self.touching_wall = np.zeros(self.n_agents, dtype=bool)
+        self.touching_agent = np.zeros(self.n_agents, dtype=bool)
+        self.touching_barrier = np.zeros(self.n_agents, dtype=bool)
+        self.step_count = 0
+        if self.path_tracker is not None:
+            self.path_tracker.reset(self.agent_positions, self.goal_positions)
+
+        self._live_agents = list(self._possible_agents)
+        if self.array_mode:
+            self._write_arrays(np.zeros(self.n_agents), False, False, 0.0)
+            return self._array_obs, self._array_mask
+
+        self._rewards = {agent_id: 0.0 for agent_id in self._possible_agents}
+        self._dones = {agent_id: False for agent_id in self._possible_agents}
+        if self.path_tracker is not None:
+            self._remaining_distance = self.path_tracker.optimal_distance
+        self._infos = {agent_id: self._info(i, 0.0) for i, agent_id in enumerate(self._possible_agents)}
+        self._observations = self._collect_observations(np.zeros(self.n_agents, dtype=bool))
+        return self._observations
+
+    def _write_arrays(self, rewards: np.ndarray, terminated: bool, truncated: bool, group_reward: float) -> None:
+        observations, masks = self.sense()
+        rows = self._array_rows
+        self._array_obs[:] = observations[rows]
+        self._array_mask[:] = masks[rows]
+        self._array_reward[:] = rewards[rows]
+        self._array_terminated[:] = terminated
+        self._array_truncated[:] = truncated
+        self.group_rewards[:] = group_reward
+
+    def _info(self, agent_ind: int, group_reward: float, interrupted: bool | None = None) -> dict:
+        info = {"behavior_name": BEHAVIOR_NAME, "group_id": 0, "group_reward": group_reward}
+        if interrupted is not None:
+            info["interrupted"] = interrupted
+        tracker = self.path_tracker
+        if tracker is not None:
+            info["optimal_distance"] = float(tracker.optimal_distance[agent_ind])
+            info["remaining_distance"] = float(self._remaining_distance[agent_ind])
+            info["path_length"] = float(tracker.path_length[agent_ind])
+            if interrupted is not None:
+                info["spl"] = float(tracker.spl()[agent_ind])
+                info["optimality_gap"] = float(tracker.optimality_gap()[agent_ind])
+        return info
+
+    def cast_rays(self, origins: np.ndarray, directions: np.ndarray, source_agents: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest hit of every ray (R, 2) and its tag, rays don't see the agents they're cast from
+        """
+        settings = self.settings
+        wall_distances = ray_box_distance(origins, directions, self.wall_centers, self.wall_cos, self.wall_sin, self.wall_half_extents)
+        #agents and goals are both round
+        circle_distances = ray_circle_distance(origins, directions, np.concatenate([self.agent_positions, self.goal_positions]),
+                                               self._circle_radii)
+        circle_distances[np.arange(len(origins)), source_agents] = np.inf
+        barrier_distances = ray_bounds_distance(origins, directions, self.half_size)
+
+        distances = np.concatenate([wall_distances, circle_distances, barrier_distances[:, None]], axis=-1)
+        nearest = distances.argmin(-1)
+        return distances[np.arange(len(origins)), nearest], self._hit_tags[nearest]
+
+    def sense(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Ray observations (n_agents, obs_dim) and action masks (n_agents, sum(branches)) of all agents,
+        both come from a single batch of rays.
+        Masks follow MAPFAgent.WriteDiscreteActionMask, True marks an unavailable action as in mlagents_envs.
+        """
+        settings = self.settings
+        num_rays = len(self.ray_angles)
+        yaws = self.agent_yaws[:, None] + np.concatenate([self.ray_angles, MASK_RAY_ANGLES])[None, :]
+        directions, _ = heading(yaws.reshape(-1))
+        origins = np.repeat(self.agent_positions, yaws.shape[1], axis=0)
+        source_agents = np.repeat(np.arange(self.n_agents), yaws.shape[1])
+        distances, tags = self.cast_rays(origins, directions, source_agents)
+        distances, tags = distances.reshape(yaws.shape), tags.reshape(yaws.shape)
+
+        observations = encode_rays(distances[:, :num_rays], tags[:, :num_rays], settings.ray_length, settings.num_detectable_tags)
+        masks = np.zeros((self.n_agents, sum(ACTION_BRANCHES)), dtype=bool)
+        if settings.mask_actions:
+            jump_offset, use_offset = sum(ACTION_BRANCHES[:2]), sum(ACTION_BRANCHES[:3])
+            masks[~self.agent_active, jump_offset + 1] = True
+            masks[~self.agent_active, use_offset + 1] = True
+            blocked = distances[:, num_rays:] <= settings.obstacle_avoidance_distance
+            pushable = self.agent_active[:, None] & (tags[:, num_rays:] == TAG_INDEX["MovableObstacle"])
+            masks[:, 1:5] = blocked & ~pushable
+        return observations, masks
+
+    def _collect_observations(self, dones: np.ndarray) -> dict:
+        observations, masks = self.sense()
+        masks = np.split(masks, np.cumsum(ACTION_BRANCHES)[:-1], axis=-1)
+        result = {}
+        for i, agent_id in enumerate(self._possible_agents):
+            if dones[i]:
+                result[agent_id] = observations[i]
+            else:
+                result[agent_id] = {"observation": [observations[i]], "action_mask": [mask[i] for mask in masks]}
+        return result
+
+    def _move_agent(self, agent_ind: int, displacement: np.ndarray, use_requested: bool, rewards: np.ndarray) -> None:
+        settings = self.settings
+        rewards_table = settings.individual_rewards
+        active = self.agent_active[agent_ind]
+        candidate = self.agent_positions[agent_ind] + displacement
+
+        wall_hits = circle_box_overlap(candidate[None], settings.agent_radius, self.wall_centers,
+                                       self.wall_cos, self.wall_sin, self.wall_half_extents)[0]
+        others = np.arange(self.n_agents) != agent_ind
+        agent_hits = others & (np.linalg.norm(self.agent_positions - candidate, axis=-1) < 2.0 * settings.agent_radius)
+        barrier_hit = bool((np.abs(candidate) > self.half_size - settings.agent_radius).any())
+
+        if wall_hits.any() and active and use_requested and not (wall_hits & ~self.wall_movable).any():
+            #Obstacle.OnCollisionStay: an active agent pushes unlocked movable walls
+            push = displacement / (np.linalg.norm(displacement) + 1e-12) * settings.movable_obstacle_speed * settings.delta_time
+            self.wall_centers[wall_hits] = np.clip(self.wall_centers[wall_hits] + push, -self.half_size, self.half_size)
+            rewards[agent_ind] += rewards_table[GameEvent.ActiveAgentHitMovableObstacle]
+            displacement = push
+            wall_hits[:] = False
+            candidate = self.agent_positions[agent_ind] + displacement
+
+        if wall_hits.any():
+            if not self.touching_wall[agent_ind]:
+                #MAPFAgent.OnCollisionEnter
+                self.collision_counter[agent_ind] += 1
+                rewards[agent_ind] -= self.collision_counter[agent_ind] / 1000.0
+                rewards[agent_ind] += rewards_table[GameEvent.AgentHitObstacle] * (1.0 if active else 5.0)
+            if not active:
+                #MAPFAgent.OnCollisionStay of a passive agent
+                rewards[agent_ind] += rewards_table[GameEvent.AgentHitObstacle]
+        if agent_hits.any() and not self.touching_agent[agent_ind] and self.agent_active[agent_hits].any():
+            rewards[agent_ind] += rewards_table[GameEvent.AgentHitAgent]
+        if barrier_hit and not self.touching_barrier[agent_ind]:
+            rewards[agent_ind] += rewards_table[GameEvent.AgentOutOfBounds]
+
+        self.touching_wall[agent_ind] = wall_hits.any()
+        self.touching_agent[agent_ind] = agent_hits.any()
+        self.touching_barrier[agent_ind] = barrier_hit
+        if not (wall_hits.any() or agent_hits.any() or barrier_hit):
+            self.agent_positions[agent_ind] = candidate
+
+    def _simulate(self, action_array: np.ndarray, rewards: np.ndarray) -> tuple[bool, bool, float]:
+        """
+        One physics frame, its rewards are added to `rewards`. Returns terminated, truncated and the group reward.
+        """
+        settings = self.settings
+        dt = settings.delta_time
+        #MAPFAgent.OnActionReceived: the per step fine, then rotation and movement
+        rewards -= 1.0 / (settings.max_environment_steps + 1.0)
+        self.agent_yaws += ROTATE_DIRECTIONS[action_array[:, 1]] * np.deg2rad(settings.agent_rotation_speed) * dt
+        forward, right = heading(self.agent_yaws)
+        local_moves = MOVE_DIRECTIONS[action_array[:, 0]]
+        displacements = (right * local_moves[:, :1] + forward * local_moves[:, 1:]) * settings.agent_moving_speed * dt
+        use_requested = action_array[:, 3] == 1
+        for agent_ind in range(self.n_agents):
+            if action_array[agent_ind, 0] > 0:
+                self._move_agent(agent_ind, displacements[agent_ind], use_requested[agent_ind], rewards)
+
+        #MAPFAgent.OnTriggerEnter/GoalInstance.OnTriggerEnter, any agent completes a goal it enters
+        in_goal = np.linalg.norm(self.agent_positions[:, None] - self.goal_positions[None], axis=-1) < settings.agent_radius + settings.goal_radius
+        entered = in_goal & ~self.agent_in_goal
+        self.agent_in_goal = in_goal
+        rewards += entered.sum(-1) * settings.individual_rewards[GameEvent.ActiveAgentHitGoal]
+        self.goal_completed |= entered.any(0)
+        if self.path_tracker is not None:
+            self.path_tracker.step(self.agent_positions, entered.any(-1))
+
+        #EnvController.UpdateStatistics/FixedUpdate, group rewards are reported in infos as mlagents_envs does
+        terminated = bool(self.goal_completed.all())
+        group_reward = self.goal_completed.sum() * settings.individual_rewards[GameEvent.ActiveAgentHitGoal] if terminated else 0.0
+        self.step_count += 1
+        truncated = not terminated and settings.max_environment_steps > 0 and self.step_count >= settings.max_environment_steps
+        return terminated, truncated, group_reward
+
+    def step(self, actions: dict | np.ndarray) -> tuple:
+        """
+        actions: {agent_id: action} -> (observations, rewards, dones, infos) dicts,
+        or in array mode an int array (n_agents, 4) -> (observations, action_mask, reward, terminated, truncated) arrays
+        """
+        if len(self._live_agents) == 0:
+            raise RuntimeError("You must reset the environment before you can perform a step.")
+        settings = self.settings
+
+        if self.array_mode:
+            action_array = np.empty((self.n_agents, len(ACTION_BRANCHES)), dtype=np.int64)
+            action_array[self._array_rows] = actions
+        else:
+            action_array = np.zeros((self.n_agents, len(ACTION_BRANCHES)), dtype=np.int64)
+            for agent_id, action in actions.items():
+                action_array[self._agent_index[agent_id]] = action
+
+        #TakeActionsBetweenDecisions: the action is applied every frame until the next decision or the end of the episode
+        rewards = np.zeros(self.n_agents)
+        for _ in range(max(1, settings.decision_period)):
+            terminated, truncated, group_reward = self._simulate(action_array, rewards)
+            if terminated or truncated:
+                break
+        done = terminated or truncated
+
+        if self.array_mode:
+            self._write_arrays(rewards, terminated, truncated, group_reward)
+            if done:
+                self._live_agents = []
+            return self._array_obs, self._array_mask, self._array_reward, self._array_terminated, self._array_truncated
+
+        dones = np.full(self.n_agents, done)
+        if self.path_tracker is not None:
+            self._remaining_distance = self.path_tracker.remaining_distance(self.agent_positions, ~self.goal_completed)
+        self._observations = self._collect_observations(dones)
+        self._rewards = {agent_id: float(rewards[i]) for i, agent_id in enumerate(self._possible_agents)}
+        self._dones = {agent_id: done for agent_id in self._possible_agents}
+        self._infos = {
+            agent_id: self._info(i, group_reward, truncated if done else None) for i, agent_id in enumerate(self._possible_agents)
+        }
+        if done:
+            self._live_agents = []
+        return self._observations, self._rewards, self._dones, self._infos
+
+
+@dataclass(frozen=True)
+class PeekabooSimEnvFactory:
+    """
+    Picklable constructor of PeekabooSimEnv for PeekabooVecEnv.
+    Hashable like PeekabooEnvFactory, for EnvPool, settings are compared but not hashed (SimSettings is mutable)
+    """
+    map_path: Path
+    settings: SimSettings | None = field(default=None, hash=False)
+    array_mode: bool = True
+
+    def __call__(self, worker_id: int, seed: int | None) -> PeekabooSimEnv:
+        return PeekabooSimEnv(self.map_path, seed=seed, settings=self.settings, worker_id=worker_id, array_mode=self.array_mode)
@@ -0,0 +1,216 @@
+from mlagents_envs.environment import UnityEnvironment
+from mlagents_envs.envs.unity_parallel_env import UnityParallelEnv
+from mlagents_envs.base_env import ActionTuple
+from mlagents_envs.side_channel.environment_parameters_channel import EnvironmentParametersChannel
+from peekaboo_environment import EnvSpec, load_spec, save_spec
+from peekaboo_maps import MapConfig, load_map
+from peekaboo_profiling import LatencyProfiler
+from peekaboo_side_channels import MapSideChannel
+from peekaboo_sim_env import check_env_parameters
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+#
+# This wrapper is designed only for parallel pettingZoo API to satisfy POSG.
+# Import it from peekaboo_environment, which loads this module (and mlagents_envs) on first use.
+
+class PeekabooEnv(UnityParallelEnv):
+    def __init__(self, executable_path: Path, seed: int | None = None, no_grahics: bool = True, worker_id: int |None = None,
+                 array_mode: bool = False, side_channels: list | None = None, timeout_wait: int = 60,
+                 decision_period: int | None = None, map_path: str | Path | None = None, cache_spec: bool = True):
+        """
+        Notice: Currently communication between Unity and Python takes place over an open socket without authentication.
+        Ensure that the network where training takes place is secure.
+
+        Notice: development build only //TODO: fix
+
+        With `array_mode` reset() and step() skip the PettingZoo dicts and talk to UnityEnvironment directly:
+        actions are an int array (n_agents, 4), outputs are arrays with rows ordered as `possible_agents`,
+        reused between calls (copy them to keep them). The dict API (dones, rewards, ...) is not updated in this mode.
+
+        load_map/set_env_parameters go through side channels, `side_channels` are registered next to them.
+        A player that doesn't answer within `timeout_wait` seconds raises UnityTimeOutException.
+
+        `decision_period` (the scene's DecisionRequester by default) is the number of physics frames an action is repeated for
+        inside the player: rewards are summed over them and episodes end early, one round trip per step.
+
+        `map_path` is loaded before the first reset (see load_map). With `cache_spec` the behavior spec is saved
+        keyed by the build and `map_path`, so that peekaboo_environment.spec_env gives the spaces without launching the player.
+        """
+        self._worker_id: int = 0 if worker_id is None else worker_id
+        self.map_channel = MapSideChannel()
+        self.parameters_channel = EnvironmentParametersChannel()
+        self._pending_map: dict | None = None
+        self._pending_parameters: dict[str, float] = {}
+        if decision_period is not None:
+            self.set_env_parameters(decision_period=decision_period)
+        unity_env = UnityEnvironment(file_name=executable_path,
+                               worker_id=self._worker_id,
+                               seed=seed,
+                               no_graphics=no_grahics,
+                               timeout_wait=timeout_wait,
+                               side_channels=[self.map_channel, self.parameters_channel, *(side_channels or [])])
+
+        #UnityParallelEnv.__init__ may reset, which has to go the PettingZoo way
+        self.array_mode = False
+        super().__init__(unity_env, seed)
+        self.array_mode = array_mode
+        if array_mode:
+            self._init_arrays()
+        self.profiler: LatencyProfiler | None = None
+        if map_path is not None:
+            self.load_map(map_path)
+        if cache_spec and executable_path is not None:
+            #written once per build and map, relaunches only compare it
+            spec = self.env_spec()
+            if load_spec(executable_path, map_path) != spec:
+                save_spec(spec, executable_path, map_path)
+
+        #TODO: auxillary stuff to work with python training more smoothly
+
+    def env_spec(self) -> EnvSpec:
+        """
+        Agent ids, observation shapes, action branches and action mask presence of the player's behavior
+        """
+        if len(self._env.behavior_specs) != 1:
+            raise ValueError(f"A spec describes a single behavior, got {list(self._env.behavior_specs)}")
+        behavior_name, spec = next(iter(self._env.behavior_specs.items()))
+        decision_steps, _ = self._env.get_steps(behavior_name)
+        return EnvSpec(possible_agents=list(self.possible_agents),
+                       observation_shapes=[[int(size) for size in observation_spec.shape] for observation_spec in spec.observation_specs],
+                       action_branches=[int(branch) for branch in spec.action_spec.discrete_branches],
+                       action_mask=decision_steps.action_mask is not None)
+
+    def enable_profiling(self, profiler: LatencyProfiler | None = None) -> LatencyProfiler:
+        """
+        Times step/reset/close from now on ("env/..."), and inside them the communicator round trips of UnityEnvironment
+        ("unity/..."). "env/step/self" is what is left without the round trip: conversion of decision/terminal steps
+        into the PettingZoo dicts (or the arrays). Nothing is timed until this is called.
+        """
+        if self.profiler is not None:
+            return self.profiler
+        self.profiler = LatencyProfiler() if profiler is None else profiler
+        for name in ("step", "reset", "get_steps", "set_actions", "close"):
+            self.profiler.instrument(self._env, name, f"unity/{name}")
+        for name in ("step", "reset"):
+            self.profiler.instrument(self, name, f"env/{name}", self_time=True)
+        self.profiler.instrument(self, "close", "env/close")
+        return self.profiler
+
+    def load_map(self, map_config: str | Path | dict | MapConfig) -> None:
+        """
+        Swaps the map of the running player at the next reset, instead of relaunching it with another config.
+        The number of agents can't change: they are registered once, and so are the PettingZoo agent ids.
+        """
+        config = map_config if isinstance(map_config, MapConfig) else load_map(map_config)
+        if len(config.agents) != len(self.possible_agents):
+            raise ValueError(f"The map has {len(config.agents)} agents, the player runs {len(self.possible_agents)}")
+        self._pending_map = config.to_json()
+
+    def set_env_parameters(self, **parameters: float) -> None:
+        """
+        Sets EnvironmentParameters MAPFAgent reads at the beginning of every episode (see peekaboo_sim_env.ENV_PARAMETERS),
+        e.g. set_env_parameters(agent_moving_speed=50.0, **{"reward/AgentHitObstacle": -0.05}). Applied at the next reset.
+        """
+        self._pending_parameters.update(check_env_parameters(parameters))
+
+    def _send_pending(self) -> bool:
+        #queued right before the reset, so that they travel with it and nothing changes mid-episode
+        for key, value in self._pending_parameters.items():
+            self.parameters_channel.set_float_parameter(key, value)
+        self._pending_parameters = {}
+        if self._pending_map is None:
+            return False
+        self.map_channel.send_map(self._pending_map)
+        self._pending_map = None
+        return True
+
+    def _check_map_loaded(self) -> None:
+        errors = self.map_channel.pop_errors()
+        if errors:
+            raise RuntimeError(f"The player could not load the map: {errors}")
+
+    def _init_arrays(self) -> None:
+        if len(self._env.behavior_specs) != 1:
+            raise ValueError(f"array mode expects a single behavior, got {list(self._env.behavior_specs)}")
+        self._behavior_name = next(iter(self._env.behavior_specs))
+        spec = self._env.behavior_specs[self._behavior_name]
+        n_agents = len(self.possible_agents)
+
+        #agent ids are f"{behavior_name}?agent_id={unity id}" in mlagents_envs
+        self._array_rows = {agent_id: row for row, agent_id in enumerate(self.possible_agents)}
+        self._obs_slices, offset = [], 0
+        for observation_spec in spec.observation_specs:
+            size = int(np.prod(observation_spec.shape))
+            self._obs_slices.append(slice(offset, offset + size))
+            offset += size
+        self._mask_slices, mask_offset = [], 0
+        for branch in spec.action_spec.discrete_branches:
+            self._mask_slices.append(slice(mask_offset, mask_offset + branch))
+            mask_offset += branch
+
+        self._array_obs = np.zeros((n_agents, offset), dtype=np.float32)
+        self._array_mask = np.zeros((n_agents, mask_offset), dtype=bool)
+        self._array_reward = np.zeros(n_agents, dtype=np.float32)
+        self._array_terminated = np.zeros(n_agents, dtype=bool)
+        self._array_truncated = np.zeros(n_agents, dtype=bool)
+        self.group_rewards = np.zeros(n_agents, dtype=np.float32)
+        self._decision_rows = np.zeros(0, dtype=np.int64)
+
+    def _rows(self, unity_agent_ids: np.ndarray) -> np.ndarray:
+        return np.array([self._array_rows[f"{self._behavior_name}?agent_id={unity_id}"] for unity_id in unity_agent_ids], dtype=np.int64)
+
+    def _write_steps(self, steps, rows: np.ndarray) -> None:
+        for obs_slice, obs in zip(self._obs_slices, steps.obs):
+            self._array_obs[rows, obs_slice] = obs.reshape(len(rows), -1)
+        self._array_reward[rows] = steps.reward
+        self.group_rewards[rows] = steps.group_reward
+
+    def _read_arrays(self) -> None:
+        decision_steps, terminal_steps = self._env.get_steps(self._behavior_name)
+        self._array_reward[:] = 0.0
+        self.group_rewards[:] = 0.0
+        self._array_terminated[:] = False
+        self._array_truncated[:] = False
+
+        self._decision_rows = self._rows(decision_steps.agent_id)
+        if len(self._decision_rows):
+            self._write_steps(decision_steps, self._decision_rows)
+            for mask_slice, mask in zip(self._mask_slices, decision_steps.action_mask or []):
+                self._array_mask[self._decision_rows, mask_slice] = mask
+
+        #as in UnityParallelEnv, an agent that ended and restarted within the step reports its terminal state
+        terminal_rows = self._rows(terminal_steps.agent_id)
+        if len(terminal_rows):
+            self._write_steps(terminal_steps, terminal_rows)
+            self._array_truncated[terminal_rows] = terminal_steps.interrupted
+            self._array_terminated[terminal_rows] = ~terminal_steps.interrupted
+
+    def reset(self):
+        map_sent = self._send_pending()
+        if not self.array_mode:
+            observations = super().reset()
+        else:
+            self._env.reset()
+            self._read_arrays()
+            observations = self._array_obs, self._array_mask
+        if map_sent:
+            self._check_map_loaded()
+        return observations
+
+    def step(self, actions):
+        """
+        In array mode actions are an int array (n_agents, 4) and the result is
+        (observations, action_mask, reward, terminated, truncated); group rewards are in `group_rewards`
+        """
+        if not self.array_mode:
+            return super().step(actions)
+        if len(self._decision_rows):
+            discrete = np.asarray(actions, dtype=np.int32)[self._decision_rows]
+            self._env.set_actions(self._behavior_name, ActionTuple(discrete=discrete))
+        self._env.step()
+        self._read_arrays()
+        return self._array_obs, self._array_mask, self._array_reward, self._array_terminated, self._array_truncated
@@ -0,0 +1,415 @@
+import socket
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+#
+# Vectorised pool of Peekaboo environments: every environment lives in its own subprocess
+# and writes its outputs straight into shared memory, so the main process only sends tiny commands.
+
+# mlagents_envs.environment.UnityEnvironment.BASE_ENVIRONMENT_PORT, a worker listens on BASE + worker_id
+UNITY_BASE_PORT: int = 5005
+
+# worker ids handed out by this process and not released yet
+_reserved_worker_ids: set[int] = set()
+
+
+def _port_is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("localhost", port))
+        except OSError:
+            return False
+    return True
+
+
+def allocate_worker_ids(num_envs: int, base_worker_id: int = 0) -> list[int]:
+    """
+    Picks `num_envs` worker ids whose communicator ports are free on this host
+    and were not handed out to another pool of this process.
+
+    Notice: a port could be taken by someone else between the check and the executable launch
+    """
+    worker_ids = []
+    worker_id = base_worker_id
+    while len(worker_ids) < num_envs:
+        if UNITY_BASE_PORT + worker_id > 65535:
+            raise RuntimeError(f"Could not find {num_envs} free ports starting from worker id {base_worker_id}")
+        if worker_id not in _reserved_worker_ids and _port_is_free(UNITY_BASE_PORT + worker_id):
+            worker_ids.append(worker_id)
+        worker_id += 1
+
+    _reserved_worker_ids.update(worker_ids)
+    return worker_ids
+
+
+def release_worker_ids(worker_ids: list[int]) -> None:
+    _reserved_worker_ids.difference_update(worker_ids)
+
+
+def unpack_observation(observation: Any) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    UnityParallelEnv returns either a raw observation
+    or {'observation': ..., 'action_mask': [branch masks]} if actions are masked
+    """
+    if isinstance(observation, dict):
+        action_mask = np.concatenate([np.asarray(mask).reshape(-1) for mask in observation["action_mask"]])
+        return np.asarray(observation["observation"], dtype=np.float32).reshape(-1), action_mask
+    return np.asarray(observation, dtype=np.float32).reshape(-1), None
+
+
+def unpack_observations(observations: dict, agent_ids: list[str]) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Observations (n_agents, obs_dim) and action masks (n_agents, sum(branches)) or None of a PettingZoo dict, rows follow `agent_ids`
+    """
+    unpacked = [unpack_observation(observations[agent_id]) for agent_id in agent_ids]
+    masks = [mask for _, mask in unpacked if mask is not None]
+    action_masks = None
+    if masks:
+        #terminal observations come without masks
+        action_masks = np.stack([np.zeros_like(masks[0]) if mask is None else mask for _, mask in unpacked]).astype(bool)
+    return np.stack([obs for obs, _ in unpacked]), action_masks
+
+
+def reset_arrays(env: Any) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    reset() of an environment of either API as arrays: observations and action masks (or None), rows follow possible_agents
+    """
+    if getattr(env, "array_mode", False):
+        return env.reset()
+    return unpack_observations(env.reset(), env.possible_agents)
+
+
+def step_arrays(env: Any, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray | None, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    step() of an environment of either API as arrays: actions (n_agents, num_branches) ->
+    observations, action masks, rewards, terminated, truncated. Array mode environments reuse their output buffers
+    """
+    if getattr(env, "array_mode", False):
+        return env.step(actions)
+    agent_ids = env.possible_agents
+    observations, rewards, dones, infos = env.step(dict(zip(agent_ids, actions)))
+    next_obs, next_action_mask = unpack_observations(observations, agent_ids)
+    rewards = np.array([rewards.get(agent_id, 0.0) for agent_id in agent_ids], dtype=np.float32)
+    dones = np.array([dones.get(agent_id, False) for agent_id in agent_ids], dtype=bool)
+    interrupted = np.array([infos.get(agent_id, {}).get("interrupted", False) for agent_id in agent_ids], dtype=bool)
+    return next_obs, next_action_mask, rewards, dones & ~interrupted, dones & interrupted
+
+
+@dataclass(frozen=True)
+class PeekabooEnvFactory:
+    """
+    Picklable constructor of PeekabooEnv, a worker passes its own worker id and seed.
+    Hashable, so that EnvPool can keep players by the factory that launched them.
+    """
+    executable_path: Path
+    no_graphics: bool = True
+    array_mode: bool = True
+    timeout_wait: int = 60
+    decision_period: int | None = None
+
+    def __call__(self, worker_id: int, seed: int | None):
+        from peekaboo_environment import PeekabooEnv
+        return PeekabooEnv(self.executable_path, seed=seed, no_grahics=self.no_graphics, worker_id=worker_id,
+                           array_mode=self.array_mode, timeout_wait=self.timeout_wait, decision_period=self.decision_period)
+
+
+class SharedBuffers:
+    """
+    Preallocated arrays of the whole pool backed by named shared memory blocks.
+    Rows are indexed by environment, then by agent.
+    """
+    def __init__(self, num_envs: int, num_agents: int, obs_dim: int, mask_dim: int, num_branches: int,
+                 names: dict[str, str] | None = None) -> None:
+        self.layout = {
+            "observations": ((num_envs, num_agents, obs_dim), np.float32),
+            "action_masks": ((num_envs, num_agents, mask_dim), np.bool_),
+            "rewards": ((num_envs, num_agents), np.float32),
+            "dones": ((num_envs, num_agents), np.bool_),
+            "actions": ((num_envs, num_agents, num_branches), np.int64),
+        }
+        self._owner = names is None
+        self._blocks: dict[str, SharedMemory] = {}
+        for key, (shape, dtype) in self.layout.items():
+            nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            if self._owner:
+                block = SharedMemory(create=True, size=nbytes)
+            else:
+                block = SharedMemory(name=names[key])
+            self._blocks[key] = block
+            setattr(self, key, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        if self._owner:
+            #as in mlagents_envs, True marks an unavailable action, so nothing is masked by default
+            self.action_masks[:] = False
+
+    @property
+    def names(self) -> dict[str, str]:
+        return {key: block.name for key, block in self._blocks.items()}
+
+    def close(self) -> None:
+        for key in self.layout:
+            #views must be dropped before the memory is unmapped
+            setattr(self, key, None)
+        for block in self._blocks.values():
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks.clear()
+
+
+def _worker(conn: Connection, env_fn: Callable, env_index: int, worker_id: int, seed: int | None, auto_reset: bool) -> None:
+    env = None
+    buffers = None
+    try:
+        env = env_fn(worker_id, seed)
+        agent_ids = list(env.possible_agents)
+        #array mode envs (PeekabooEnv, PeekabooSimEnv) write rows in possible_agents order, no dicts to unpack
+        array_mode = getattr(env, "array_mode", False)
+        observations = env.reset()
+        conn.send(("spec", {
+            "agent_ids": agent_ids,
+            "observation_spaces": {agent_id: env.observation_space(agent_id) for agent_id in agent_ids},
+            "action_spaces": {agent_id: env.action_space(agent_id) for agent_id in agent_ids},
+            "has_action_mask": observations[1].shape[-1] > 0 if array_mode else isinstance(observations[agent_ids[0]], dict),
+        }))
+        cmd, data = conn.recv()
+        if cmd != "buffers":
+            return
+        shapes, names = data
+        buffers = SharedBuffers(*shapes, names=names)
+
+        episode_return = np.zeros(len(agent_ids), dtype=np.float64)
+        episode_length = 0
+
+        def write_arrays(observations, action_masks, rewards=0.0, dones=False):
+            buffers.observations[env_index] = observations
+            buffers.action_masks[env_index] = action_masks
+            buffers.rewards[env_index] = rewards
+            buffers.dones[env_index] = dones
+
+        def write(observations, rewards=None, dones=None):
+            for agent_ind, agent_id in enumerate(agent_ids):
+                obs, action_mask = unpack_observation(observations[agent_id])
+                buffers.observations[env_index, agent_ind] = obs
+                if action_mask is not None:
+                    buffers.action_masks[env_index, agent_ind] = action_mask
+                buffers.rewards[env_index, agent_ind] = 0.0 if rewards is None else rewards.get(agent_id, 0.0)
+                buffers.dones[env_index, agent_ind] = False if dones is None else dones.get(agent_id, False)
+
+        while True:
+            cmd, _ = conn.recv()
+            if cmd == "step":
+                actions = buffers.actions[env_index]
+                info = {}
+                if array_mode:
+                    observations, action_masks, rewards, terminated, truncated = env.step(actions)
+                    dones = terminated | truncated
+                    write_arrays(observations, action_masks, rewards, dones)
+                    if dones.any():
+                        info["truncated"] = truncated.copy()
+                else:
+                    live_agents = set(env.agents)
+                    observations, rewards, dones, _ = env.step({
+                        agent_id: actions[agent_ind] for agent_ind, agent_id in enumerate(agent_ids) if agent_id in live_agents
+                    })
+                    write(observations, rewards, dones)
+                episode_return += buffers.rewards[env_index]
+                episode_length += 1
+
+                if buffers.dones[env_index].any():
+                    info["episode"] = {"return": episode_return.copy(), "length": episode_length}
+                    episode_return[:] = 0.0
+                    episode_length = 0
+                    if auto_reset:
+                        info["terminal_observation"] = buffers.observations[env_index].copy()
+                        #rewards and dones of the terminal step stay, observations are replaced with the new episode's.
+                        #They are copied first, array mode envs zero their reused reward buffer on reset
+                        rewards, dones = buffers.rewards[env_index].copy(), buffers.dones[env_index].copy()
+                        if array_mode:
+                            write_arrays(*env.reset(), rewards, dones)
+                        else:
+                            write(env.reset())
+                            buffers.rewards[env_index] = rewards
+                            buffers.dones[env_index] = dones
+                conn.send(("step", info))
+            elif cmd == "reset":
+                if array_mode:
+                    write_arrays(*env.reset())
+                else:
+                    write(env.reset())
+                episode_return[:] = 0.0
+                episode_length = 0
+                conn.send(("reset", None))
+            elif cmd == "close":
+                conn.send(("close", None))
+                break
+            else:
+                raise ValueError(f"Unknown command {cmd}")
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        if buffers is not None:
+            buffers.close()
+        if env is not None:
+            env.close()
+
+
+class PeekabooVecEnv:
+    def __init__(self,
+                 env_fn: Callable,
+                 num_envs: int,
+                 seed: int | None = None,
+                 base_worker_id: int = 0,
+                 auto_reset: bool = True,
+                 start_method: str = "spawn") -> None:
+        """
+        Runs `num_envs` environments in subprocesses and steps them in parallel.
+        `env_fn(worker_id, seed)` should build a PettingZoo parallel environment, e.g. PeekabooEnvFactory.
+
+        Observations, action masks, rewards and dones are shared memory arrays shaped (num_envs, num_agents, ...),
+        they are overwritten in place on every step/reset, so copy them if you want to keep them.
+
+        Notice: with `auto_reset` an environment that is done is reset right away,
+        its terminal observation and episode statistics are put into the step infos.
+        Environments in array mode also report which agents were `truncated` (time limit) rather than terminated.
+        """
+        self.num_envs = num_envs
+        self.auto_reset = auto_reset
+        self.worker_ids = allocate_worker_ids(num_envs, base_worker_id)
+        self._waiting = False
+        self._closed = False
+
+        ctx = mp.get_context(start_method)
+        self._remotes, self._processes = [], []
+        for env_index, worker_id in enumerate(self.worker_ids):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, env_fn, env_index, worker_id, None if seed is None else seed + env_index, auto_reset),
+                daemon=True,
+            )
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        spec = [self._receive(remote) for remote in self._remotes][0]
+        self.possible_agents: list[str] = spec["agent_ids"]
+        self.num_agents = len(self.possible_agents)
+        self.observation_spaces = spec["observation_spaces"]
+        self.action_spaces = spec["action_spaces"]
+        self.has_action_mask: bool = spec["has_action_mask"]
+
+        first_agent = self.possible_agents[0]
+        self.observation_dim = int(np.prod(self.observation_spaces[first_agent].shape))
+        self.action_nvec = np.asarray(self.action_spaces[first_agent].nvec)
+
+        shapes = (num_envs, self.num_agents, self.observation_dim, int(self.action_nvec.sum()), len(self.action_nvec))
+        self._buffers = SharedBuffers(*shapes)
+        for remote in self._remotes:
+            remote.send(("buffers", (shapes, self._buffers.names)))
+
+    @classmethod
+    def from_executable(cls, executable_path: Path, num_envs: int, seed: int | None = None,
+                        no_graphics: bool = True, **kwargs) -> "PeekabooVecEnv":
+        return cls(PeekabooEnvFactory(executable_path, no_graphics), num_envs, seed=seed, **kwargs)
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self._buffers.observations
+
+    @property
+    def action_masks(self) -> np.ndarray:
+        return self._buffers.action_masks
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self._buffers.rewards
+
+    @property
+    def dones(self) -> np.ndarray:
+        return self._buffers.dones
+
+    def observation_space(self, agent: str):
+        return self.observation_spaces[agent]
+
+    def action_space(self, agent: str):
+        return self.action_spaces[agent]
+
+    def _receive(self, remote: Connection) -> Any:
+        cmd, data = remote.recv()
+        if cmd == "error":
+            self.close()
+            raise RuntimeError(f"A Peekaboo worker failed:\n{data}")
+        return data
+
+    def reset(self) -> np.ndarray:
+        for remote in self._remotes:
+            remote.send(("reset", None))
+        for remote in self._remotes:
+            self._receive(remote)
+        return self.observations
+
+    def step_async(self, actions: np.ndarray) -> None:
+        """
+        actions: integer array shaped (num_envs, num_agents, num_branches)
+        """
+        self._buffers.actions[:] = actions
+        for remote in self._remotes:
+            remote.send(("step", None))
+        self._waiting = True
+
+    def step_wait(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        infos = [self._receive(remote) for remote in self._remotes]
+        self._waiting = False
+        return self.observations, self.rewards, self.dones, infos
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        #pipes of failed workers raise OSError (reset, broken) or EOFError, which must not replace the error close() runs for
+        if self._waiting:
+            for remote in self._remotes:
+                try:
+                    if remote.poll(timeout=10):
+                        remote.recv()
+                except (OSError, EOFError):
+                    pass
+        for remote in self._remotes:
+            try:
+                remote.send(("close", None))
+                if remote.poll(timeout=10):
+                    remote.recv()
+            except (OSError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for remote in self._remotes:
+            remote.close()
+        if hasattr(self, "_buffers"):
+            self._buffers.close()
+        release_worker_ids(self.worker_ids)
+
+    def __enter__(self) -> "PeekabooVecEnv":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.num_envs
@@ -0,0 +1,91 @@
+import sys
+sys.path.append("baselines")
+
+import numpy as np
+import torch
+
+from advantages import compute_gae, compute_returns, compute_vtrace, reference_gae, reference_returns, reference_vtrace
+
+GAMMA, GAE_LAMBDA = 0.99, 0.95
+
+def random_rollout(rng, num_steps, batch_shape):
+    shape = (num_steps, *batch_shape)
+    lengths = rng.integers(1, num_steps + 1, size=batch_shape)
+    return {
+        "rewards": rng.normal(size=shape),
+        "values": rng.normal(size=shape),
+        "terminated": rng.random(shape) < 0.05,
+        "truncated": rng.random(shape) < 0.05,
+        "last_values": rng.normal(size=batch_shape),
+        "valid": np.arange(num_steps).reshape(-1, *[1] * len(batch_shape)) < lengths,
+    }
+
+def test_matches_reference_loop():
+    rng = np.random.default_rng(0)
+    for num_steps, batch_shape in [(1, (1,)), (7, (3,)), (300, (1, 3)), (129, (4, 2))]:
+        rollout = random_rollout(rng, num_steps, batch_shape)
+        expected_advantages = reference_gae(**rollout, gamma=GAMMA, gae_lambda=GAE_LAMBDA)
+        expected_returns = reference_returns(**{k: v for k, v in rollout.items() if k != "values"}, gamma=GAMMA)
+        for block_size in [None, 1, 5, num_steps]:
+            advantages = compute_gae(**rollout, gamma=GAMMA, gae_lambda=GAE_LAMBDA, block_size=block_size)
+            returns = compute_returns(**{k: v for k, v in rollout.items() if k != "values"}, gamma=GAMMA, block_size=block_size)
+            assert advantages.shape == expected_advantages.shape
+            assert np.allclose(advantages, expected_advantages)
+            assert np.allclose(returns, expected_returns)
+
+        tensors = {k: torch.as_tensor(v, dtype=torch.float32) for k, v in rollout.items()}
+        assert np.allclose(compute_gae(**tensors, gamma=GAMMA, gae_lambda=GAE_LAMBDA).numpy(), expected_advantages, atol=1e-4)
+
+def test_termination_and_truncation():
+    rewards, values = np.ones((3, 1)), np.full((3, 1), 10.0)
+    ends = np.array([[False], [True], [False]])
+
+    #terminated: nothing after the step counts, the last step is bootstrapped with last_values
+    returns = compute_returns(rewards, terminated=ends, truncated=False, last_values=np.array([5.0]), gamma=0.5)
+    assert np.allclose(returns[:, 0], [1.5, 1.0, 1.0 + 0.5 * 5.0])
+
+    #truncated: s_2 is not terminal, next_values[1] = V(s_2) is bootstrapped but the returns do not flow across the cut
+    next_values = np.array([[10.0], [4.0], [5.0]])
+    returns = compute_returns(rewards, terminated=False, truncated=ends, last_values=np.array([5.0]), gamma=0.5, next_values=next_values)
+    assert np.allclose(returns[:, 0], [1.0 + 0.5 * 3.0, 1.0 + 0.5 * 4.0, 3.5])
+
+    #lambda = 1 advantages are returns minus values
+    advantages = compute_gae(rewards, values, terminated=False, truncated=ends, last_values=np.array([5.0]),
+                             gamma=0.5, gae_lambda=1.0, next_values=next_values)
+    assert np.allclose(advantages + values, returns)
+
+def test_valid_mask():
+    rewards, values = np.ones((4, 2)), np.zeros((4, 2))
+    valid = np.array([[True, True], [True, True], [False, True], [False, True]])
+    returns = compute_returns(rewards, terminated=False, truncated=False, last_values=np.array([2.0, 0.0]), gamma=1.0, valid=valid)
+    assert np.allclose(returns[:, 0], [4.0, 3.0, 0.0, 0.0])
+    assert np.allclose(returns[:, 1], [4.0, 3.0, 2.0, 1.0])
+    advantages = compute_gae(rewards, values, terminated=False, truncated=False, last_values=np.array([2.0, 0.0]),
+                             gamma=1.0, gae_lambda=1.0, valid=valid)
+    assert np.allclose(advantages, returns)
+
+def test_vtrace():
+    rng = np.random.default_rng(1)
+    rollout = random_rollout(rng, 40, (3, 2))
+    log_rhos = rng.normal(scale=0.5, size=rollout["rewards"].shape)
+    expected_vs, expected_pg = reference_vtrace(**rollout, log_rhos=log_rhos, gamma=GAMMA, gae_lambda=GAE_LAMBDA, rho_clip=1.0, c_clip=0.9)
+    for block_size in [None, 1, 7]:
+        vs, pg_advantages = compute_vtrace(**rollout, log_rhos=log_rhos, gamma=GAMMA, gae_lambda=GAE_LAMBDA,
+                                           rho_clip=1.0, c_clip=0.9, block_size=block_size)
+        assert np.allclose(vs, expected_vs) and np.allclose(pg_advantages, expected_pg)
+
+    #on-policy V-trace targets are lambda-returns
+    vs, _ = compute_vtrace(**rollout, log_rhos=np.zeros_like(log_rhos), gamma=GAMMA, gae_lambda=GAE_LAMBDA)
+    advantages = compute_gae(**rollout, gamma=GAMMA, gae_lambda=GAE_LAMBDA)
+    assert np.allclose(vs, (advantages + rollout["values"]) * rollout["valid"])
+
+    tensors = {k: torch.as_tensor(v, dtype=torch.float32) for k, v in rollout.items()}
+    vs, _ = compute_vtrace(**tensors, log_rhos=torch.as_tensor(log_rhos, dtype=torch.float32), gamma=GAMMA, gae_lambda=GAE_LAMBDA, c_clip=0.9)
+    assert np.allclose(vs.numpy(), expected_vs, atol=1e-4)
+
+
+if __name__ == "__main__":
+    test_matches_reference_loop()
+    test_termination_and_truncation()
+    test_valid_mask()
+    test_vtrace()
@@ -0,0 +1,65 @@
+import sys
+sys.path.append("baselines")
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from async_pipeline import AsyncRollouts
+
+def make_pipeline(collect_fn, num_actors=2, queue_size=2):
+    policy = nn.Linear(2, 1)
+    buffers = [{} for _ in range(num_actors + queue_size)]
+    return policy, AsyncRollouts(collect_fn, policy, [f"env {i}" for i in range(num_actors)], buffers, queue_size)
+
+def test_rollouts_and_policy_versions():
+    def collect(buffer, policy, environment):
+        #actors see the parameters published before they started the rollout
+        buffer["weight"] = policy.weight.detach().clone()
+        buffer["environment"] = environment
+        return np.zeros(2), np.ones(3)
+
+    policy, pipeline = make_pipeline(collect)
+    try:
+        seen_environments = set()
+        for update in range(6):
+            rollout = pipeline.get()
+            #a slow actor can hold a buffer for many updates, the learner drops rollouts that are too stale
+            assert pipeline.version - rollout.policy_version >= 0
+            assert rollout.buffer["environment"] == f"env {rollout.actor_index}"
+            seen_environments.add(rollout.actor_index)
+            with torch.no_grad():
+                policy.weight.fill_(update + 1.0)
+            with pipeline.learning():
+                pipeline.publish(policy)
+            pipeline.release(rollout)
+        #the queue is bounded: actors wait for free buffers instead of running ahead
+        assert pipeline.utilization()["async/queued rollouts"] <= 2
+        #a slow actor may still deliver a rollout of the initial policy, newer ones carry the published parameters
+        rollout = pipeline.get()
+        while rollout.policy_version == 1:
+            pipeline.release(rollout)
+            rollout = pipeline.get()
+        assert torch.all(rollout.buffer["weight"] == rollout.policy_version - 1)
+        assert seen_environments == {0, 1}
+    finally:
+        pipeline.close()
+
+def test_actor_errors_reach_the_learner():
+    def collect(buffer, policy, environment):
+        raise ValueError("environment crashed")
+
+    _, pipeline = make_pipeline(collect, num_actors=1)
+    try:
+        pipeline.get()
+        assert False, "expected the actor's error"
+    except RuntimeError as error:
+        assert "environment crashed" in str(error)
+    finally:
+        pipeline.close()
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+
+
+if __name__ == "__main__":
+    test_rollouts_and_policy_versions()
+    test_actor_errors_reach_the_learner()
@@ -0,0 +1,120 @@
+import sys
+sys.path.append("baselines")
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from batched_agents import BatchedActorCritic, MultiAgentActorCritic, SharedActorCritic
+
+ACTION_SPACE = np.array([5, 3, 2, 2])
+OBS_DIM, HIDDEN_DIM, NUM_AGENTS, EMBEDDING_DIM = 99, 32, 3, 4
+
+def make_agents(num_agents=NUM_AGENTS, embedding_dim=0):
+    #mirrors the networks of mappo.ActorCriticAgent without importing the training script
+    def mlp(in_features, out_features):
+        return nn.Sequential(nn.Linear(in_features, HIDDEN_DIM), nn.ReLU(),
+                             nn.Linear(HIDDEN_DIM, HIDDEN_DIM), nn.ReLU(),
+                             nn.Linear(HIDDEN_DIM, out_features))
+    return [
+        SimpleNamespace(
+            actor_network=SimpleNamespace(actor_network=mlp(OBS_DIM + embedding_dim, ACTION_SPACE.sum()), action_space=ACTION_SPACE),
+            critic_network=SimpleNamespace(critic_network=mlp(OBS_DIM + embedding_dim, 1)),
+            shared_critic=False,
+        )
+        for _ in range(num_agents)
+    ]
+
+def per_agent_logprob(agent, state, action):
+    logits = torch.split(agent.actor_network.actor_network(state), ACTION_SPACE.tolist(), dim=-1)
+    return sum(torch.distributions.Categorical(logits=l).log_prob(action[:, i]) for i, l in enumerate(logits))
+
+def test_forward_matches_loop():
+    torch.manual_seed(0)
+    agents = make_agents()
+    batched = BatchedActorCritic(agents)
+    states = torch.randn(NUM_AGENTS, 7, OBS_DIM)
+
+    value, action, logprob, entropy = batched.get_action_and_value(states)
+    assert value.shape == logprob.shape == entropy.shape == (NUM_AGENTS, 7)
+    assert action.shape == (NUM_AGENTS, 7, len(ACTION_SPACE))
+    for agent_ind, agent in enumerate(agents):
+        expected_value = agent.critic_network.critic_network(states[agent_ind]).squeeze(-1)
+        assert torch.allclose(value[agent_ind], expected_value, atol=1e-5)
+        assert torch.allclose(logprob[agent_ind], per_agent_logprob(agent, states[agent_ind], action[agent_ind]), atol=1e-5)
+
+def test_action_mask():
+    torch.manual_seed(0)
+    batched = BatchedActorCritic(make_agents())
+    mask = torch.zeros(NUM_AGENTS, 50, ACTION_SPACE.sum(), dtype=torch.bool)
+    mask[..., 1:5] = True #only the first move is available
+    _, action, _, _ = batched.get_action_and_value(torch.randn(NUM_AGENTS, 50, OBS_DIM), action_mask=mask)
+    assert (action[..., 0] == 0).all()
+
+def test_update_matches_per_agent_optimizers():
+    torch.manual_seed(0)
+    agents = make_agents()
+    batched = BatchedActorCritic(agents)
+    optimizers = [torch.optim.AdamW(list(agent.actor_network.actor_network.parameters()) + list(agent.critic_network.critic_network.parameters()), lr=1e-2)
+                  for agent in agents]
+    batched_optimizer = torch.optim.AdamW(batched.parameters(), lr=1e-2)
+    states = torch.randn(NUM_AGENTS, 16, OBS_DIM)
+    actions = torch.stack([torch.randint(0, n, (NUM_AGENTS, 16)) for n in ACTION_SPACE], dim=-1)
+
+    for _ in range(3):
+        for agent_ind, (agent, optimizer) in enumerate(zip(agents, optimizers)):
+            loss = -per_agent_logprob(agent, states[agent_ind], actions[agent_ind]).mean() \
+                   + agent.critic_network.critic_network(states[agent_ind]).pow(2).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            nn.utils.clip_grad_norm_(optimizer.param_groups[0]["params"], 0.5)
+            optimizer.step()
+
+        value, _, logprob, _ = batched.get_action_and_value(states, action=actions)
+        loss = (-logprob.mean(1) + value.pow(2).mean(1)).sum()
+        batched_optimizer.zero_grad()
+        loss.backward()
+        batched.clip_grad_norm_(0.5)
+        batched_optimizer.step()
+
+    expected = make_agents()
+    batched.unstack_into(expected)
+    for agent, unstacked in zip(agents, expected):
+        for param, expected_param in zip(agent.actor_network.actor_network.parameters(), unstacked.actor_network.actor_network.parameters()):
+            assert torch.allclose(param, expected_param, atol=1e-5)
+
+def test_shared_actor_critic():
+    torch.manual_seed(0)
+    [body] = make_agents(1, EMBEDDING_DIM)
+    shared = SharedActorCritic(body, teams=[1, 0, 0], embedding_dim=EMBEDDING_DIM)
+    states = torch.randn(1, 8, OBS_DIM).expand(NUM_AGENTS, -1, -1)
+    #the forward passes of the stacked agents, nothing to unstack into per-agent networks
+    assert isinstance(shared, MultiAgentActorCritic) and not hasattr(shared, "unstack_into")
+
+    value, action, logprob, _ = shared.get_action_and_value(states)
+    assert value.shape == logprob.shape == (NUM_AGENTS, 8) and action.shape == (NUM_AGENTS, 8, len(ACTION_SPACE))
+    #one network, every agent sees its state next to its id and team embeddings
+    for agent_ind in range(NUM_AGENTS):
+        embedding = shared.agent_embedding.weight[agent_ind] + shared.team_embedding.weight[int(agent_ind == 0)]
+        embedded = torch.cat([states[agent_ind], embedding.expand(8, -1)], dim=-1)
+        assert torch.allclose(value[agent_ind], body.critic_network.critic_network(embedded).squeeze(-1), atol=1e-5)
+        assert torch.allclose(logprob[agent_ind], per_agent_logprob(body, embedded, action[agent_ind]), atol=1e-5)
+    assert not torch.allclose(value[1], value[2])
+
+    #a single step over the samples of all agents, with a fraction of the stacked parameters
+    optimizer = torch.optim.AdamW(shared.parameters(), lr=1e-2)
+    loss = (-logprob + value.pow(2)).mean()
+    optimizer.zero_grad()
+    loss.backward()
+    assert shared.clip_grad_norm_(0.5).shape == (1,) and shared.member_grad_norms().item() <= 0.5 + 1e-5
+    optimizer.step()
+    stacked = BatchedActorCritic(make_agents())
+    assert sum(p.numel() for p in shared.parameters()) < sum(p.numel() for p in stacked.parameters()) / 2
+
+
+if __name__ == "__main__":
+    test_forward_matches_loop()
+    test_action_mask()
+    test_update_matches_per_agent_optimizers()
+    test_shared_actor_critic()
@@ -0,0 +1,31 @@
+import sys
+sys.path.append("benchmarks")
+sys.path.append("baselines")
+
+from argparse import Namespace
+
+from bench_suite import compare, run_suite
+
+def test_compare():
+    baseline = {"env step": {"value": 1000.0, "unit": "steps/s"}, "gae": {"value": 1.0, "unit": "ms"},
+                "env reset": {"value": 1.0, "unit": "ms"}}
+    metrics = {"env step": {"value": 850.0, "unit": "steps/s"}, "gae": {"value": 1.1, "unit": "ms"},
+               "env reset": {"value": 1.4, "unit": "ms"}, "new metric": {"value": 1.0, "unit": "ms"}}
+    regressions = compare(metrics, baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("env reset")
+    assert compare(metrics, baseline, tolerance=0.2, overrides={"env *": 0.5}) == []
+    #lower throughput and higher latency are regressions, the opposite is not
+    assert len(compare(metrics, baseline, tolerance=0.05)) == 3
+    assert compare(baseline, metrics, tolerance=0.05) == []
+
+def test_suite_runs():
+    args = Namespace(map="../configs/maps/dev_map.json", num_agents=[2], hidden_dims=[16], num_steps=16, num_envs=2,
+                     num_minibatches=2, batched_agents=True, repeats=1, torch_threads=1, seed=0)
+    metrics = run_suite(args)
+    assert {name.split("/")[0] for name in metrics} == {"env step", "env reset", "gae", "collect", "ppo minibatch update"}
+    assert all(metric["value"] > 0 for metric in metrics.values())
+
+
+if __name__ == "__main__":
+    test_compare()
+    test_suite_runs()
@@ -0,0 +1,76 @@
+import sys
+sys.path.append("baselines")
+
+import torch
+
+from distributions import MaskedMultiDiscrete
+
+NVEC = [5, 3, 2, 2]
+
+def per_branch(logits, mask):
+    logits = logits.masked_fill(mask, -1e8)
+    return [torch.distributions.Categorical(logits=branch) for branch in torch.split(logits, NVEC, dim=-1)]
+
+def test_matches_per_branch_categoricals():
+    torch.manual_seed(0)
+    logits = torch.randn(3, 7, sum(NVEC))
+    mask = torch.rand(3, 7, sum(NVEC)) < 0.3
+    mask[..., [0, 5, 8, 10]] = False #at least one available action per branch
+    distribution = MaskedMultiDiscrete(logits, NVEC, mask)
+    categoricals = per_branch(logits, mask)
+
+    action = distribution.sample()
+    assert action.shape == (3, 7, len(NVEC))
+    expected_logprob = sum(categorical.log_prob(action[..., i]) for i, categorical in enumerate(categoricals))
+    expected_entropy = sum(categorical.entropy() for categorical in categoricals)
+    assert torch.allclose(distribution.log_prob(action), expected_logprob, atol=1e-5)
+    assert torch.allclose(distribution.entropy(), expected_entropy, atol=1e-5)
+
+def test_masks_and_sampling():
+    torch.manual_seed(0)
+    #one mask broadcast over the batch, True marks unavailable actions
+    mask = torch.zeros(sum(NVEC), dtype=torch.bool)
+    mask[[0, 2, 3, 9]] = True
+    logits = torch.zeros(20000, sum(NVEC))
+    action = MaskedMultiDiscrete(logits, NVEC, mask).sample()
+    assert set(action[:, 0].tolist()) == {1, 4}
+    assert set(action[:, 2].tolist()) == {0}
+    #Gumbel-max samples follow the probabilities
+    frequencies = torch.bincount(action[:, 1], minlength=3).float() / len(action)
+    assert torch.allclose(frequencies, torch.full((3,), 1.0 / 3.0), atol=0.02)
+
+    unmasked = MaskedMultiDiscrete(logits[:1], NVEC)
+    assert torch.allclose(unmasked.entropy(), torch.log(torch.tensor(NVEC, dtype=torch.float32)).sum())
+
+    #greedy actions skip unavailable ones however large their logits
+    greedy_logits = torch.zeros(sum(NVEC))
+    greedy_logits[[0, 3]] = 5.0
+    assert MaskedMultiDiscrete(greedy_logits, NVEC, mask).mode()[0].item() == 1
+
+def test_fully_masked_branch():
+    torch.manual_seed(0)
+    #padding slots stay unavailable when every action of a shorter branch is masked
+    nvec = [3, 2, 2, 2]
+    mask = torch.zeros(sum(nvec), dtype=torch.bool)
+    mask[[3, 4]] = True
+    distribution = MaskedMultiDiscrete(torch.zeros(20000, sum(nvec)), nvec, mask)
+    action = distribution.sample()
+    assert set(action[:, 1].tolist()) == {0, 1}
+    assert distribution.mode()[0, 1].item() in (0, 1)
+    assert torch.isfinite(distribution.entropy()).all() and torch.isfinite(distribution.log_prob(action)).all()
+
+def test_gradients():
+    logits = torch.randn(4, sum(NVEC), requires_grad=True)
+    mask = torch.zeros(4, sum(NVEC), dtype=torch.bool)
+    mask[:, 1] = True
+    distribution = MaskedMultiDiscrete(logits, NVEC, mask)
+    (distribution.log_prob(torch.zeros(4, len(NVEC), dtype=torch.long)) + distribution.entropy()).sum().backward()
+    assert torch.isfinite(logits.grad).all()
+    assert (logits.grad[:, 1] == 0).all()
+
+
+if __name__ == "__main__":
+    test_matches_per_branch_categoricals()
+    test_masks_and_sampling()
+    test_fully_masked_branch()
+    test_gradients()
@@ -0,0 +1,71 @@
+import sys
+sys.path.append("baselines")
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from batched_agents import BatchedActorCritic
+from evaluation import EvalTask, evaluate, summarize, wilson_interval, confidence_interval
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def make_policy(obs_dim, num_agents=3, hidden_dim=16):
+    #the networks of mappo.ActorCriticAgent without importing the training script
+    torch.manual_seed(0)
+    def mlp(in_features, out_features):
+        return nn.Sequential(nn.Linear(in_features, hidden_dim), nn.ReLU(), nn.Linear(hidden_dim, out_features))
+    return BatchedActorCritic([
+        SimpleNamespace(actor_network=SimpleNamespace(actor_network=mlp(obs_dim, int(np.sum(ACTION_BRANCHES))), action_space=ACTION_BRANCHES),
+                        critic_network=SimpleNamespace(critic_network=mlp(obs_dim, 1)), shared_critic=False)
+        for _ in range(num_agents)
+    ])
+
+#episodes of 15 decisions of 3 frames
+def make_acquire(array_mode=True, max_environment_steps=45):
+    environments = []
+    def acquire(task):
+        environments.append(PeekabooSimEnv(task.map_path, seed=task.seed, settings=SimSettings(max_environment_steps=max_environment_steps),
+                                           array_mode=array_mode))
+        return environments[-1]
+    return acquire, environments
+
+def test_concurrent_matches_serial():
+    obs_dim = PeekabooSimEnv(MAP_PATH).observation_space(None).shape[0]
+    policy = make_policy(2 * obs_dim)
+    tasks = [EvalTask(seed, MAP_PATH, 2) for seed in range(5)]
+    acquire, environments = make_acquire()
+    serial, _ = evaluate(policy, tasks, acquire, num_envs=1, stack_size=2)
+    acquire, _ = make_acquire(array_mode=False)
+    concurrent, elapsed = evaluate(policy, tasks, acquire, num_envs=3, stack_size=2)
+    assert len(serial) == len(concurrent) == 10 and len(environments) == 5
+    #greedy actions: an environment seeded alike plays the same episodes wherever and with whichever API it runs
+    key = lambda result: (result.seed, result.team_return)
+    assert sorted(serial, key=key) == sorted(concurrent, key=key)
+    assert all(result.length == 15 and not result.success for result in serial)
+
+    #max_steps cuts episodes
+    acquire, _ = make_acquire()
+    results, _ = evaluate(policy, tasks[:2], acquire, num_envs=2, stack_size=2, deterministic=False, max_steps=4)
+    assert len(results) == 4 and all(result.length == 4 for result in results)
+
+    summary = summarize(concurrent, elapsed)
+    assert summary["episodes"] == 10 and summary["episodes per minute"] > 0
+    assert summary["return/ci low"] <= summary["return/mean"] <= summary["return/ci high"]
+    assert summary["episode length/ci low"] == summary["episode length/ci high"] == 15
+    assert summary["success rate/mean"] == 0.0 and summary["success rate/ci low"] == 0.0 < summary["success rate/ci high"]
+
+def test_intervals():
+    low, high = wilson_interval(50, 100)
+    assert abs(low - 0.4038) < 1e-3 and abs(high - 0.5962) < 1e-3
+    assert wilson_interval(10, 10)[1] == 1.0 and np.isnan(wilson_interval(0, 0)[0])
+    values = np.random.default_rng(0).normal(1.0, 2.0, 400)
+    low, high = confidence_interval(values)
+    #about 1.96 standard errors on either side
+    assert low < values.mean() < high and abs((high - low) / 2 - 1.96 * values.std() / 20) < 0.03
+
+if __name__ == "__main__":
+    test_concurrent_matches_serial()
+    test_intervals()
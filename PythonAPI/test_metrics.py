@@ -0,0 +1,69 @@
+import sys
+sys.path.append("baselines")
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from metrics import JsonlSink, MetricsAggregator
+
+AGENT_IDS = ["agent_0", "agent_1", "agent_2"]
+
+def test_window_reductions():
+    logs = []
+    metrics = MetricsAggregator([logs.append], window=4)
+    length = metrics.scalar("episode length", "last")
+    returns = metrics.vector("episode return", AGENT_IDS, "max")
+    loss = metrics.scalar("loss")
+    lowest = metrics.scalar("lowest", "min")
+
+    for step in range(10):
+        metrics.record(length, step)
+        metrics.record(returns, np.array([step, -step, 0.5]))
+        metrics.step()
+    metrics.log({"evaluation/return": 1.0})
+    for value in [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]:
+        #more values than the window: the last `window` of them count
+        metrics.record(loss, value)
+        metrics.record(lowest, value)
+    metrics.flush()
+
+    assert logs[0] == {"episode length": 3.0, "episode return": {"agent_0": 3.0, "agent_1": 0.0, "agent_2": 0.5}}
+    assert logs[1]["episode length"] == 7.0 and logs[1]["episode return"]["agent_1"] == -4.0
+    #windows and ready dicts reach the sinks in order, the partial window comes with the flush
+    assert logs[2] == {"evaluation/return": 1.0}
+    assert logs[3] == {"episode length": 9.0, "episode return": {"agent_0": 9.0, "agent_1": -8.0, "agent_2": 0.5},
+                       "loss": 4.5, "lowest": 3.0}
+    metrics.flush()
+    assert len(logs) == 4
+    metrics.close()
+
+def test_jsonl_sink_and_errors():
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "metrics.jsonl"
+        metrics = MetricsAggregator([JsonlSink(str(path))], window=2)
+        returns = metrics.vector("episode return", AGENT_IDS)
+        for step in range(4):
+            metrics.record(returns, np.full(3, step, dtype=np.float32))
+            metrics.step()
+        metrics.log({"lr": np.float32(0.5)})
+        metrics.close()
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert lines == [{"episode return": dict.fromkeys(AGENT_IDS, 0.5)}, {"episode return": dict.fromkeys(AGENT_IDS, 2.5)}, {"lr": 0.5}]
+
+    def broken(logs):
+        raise ValueError("the sink is gone")
+    metrics = MetricsAggregator([broken])
+    metrics.log({"lr": 1.0})
+    try:
+        metrics.flush()
+        assert False, "the sink's error should be raised"
+    except RuntimeError as error:
+        assert "the sink is gone" in str(error)
+    metrics.close()
+
+
+if __name__ == "__main__":
+    test_window_reductions()
+    test_jsonl_sink_and_errors()
@@ -0,0 +1,50 @@
+import numpy as np
+
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+from peekaboo_batched_sim import BatchedPeekabooSim
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def test_matches_single_env():
+    for decision_period in (1, 3):
+        check_matches_single_env(decision_period)
+
+def check_matches_single_env(decision_period: int):
+    #without random spawns both simulators should play exactly the same episodes,
+    #100 frames aren't a whole number of decisions of 3: an instance sits out the rest of its last one while the others go on
+    settings = SimSettings(randomize_agent_position=False, randomize_agent_rotation=False, randomize_goal_position=False,
+                           max_environment_steps=100, decision_period=decision_period)
+    num_envs = 3
+    batched = BatchedPeekabooSim([MAP_PATH], num_envs, settings=settings)
+    singles = [PeekabooSimEnv(MAP_PATH, settings=settings) for _ in range(num_envs)]
+    rng = np.random.default_rng(0)
+
+    for iter in range(250):
+        if iter == 10:
+            batched.reset(np.array([0]))
+            singles[0].reset()
+        actions = rng.integers(0, ACTION_BRANCHES, (num_envs, batched.n_agents, len(ACTION_BRANCHES)))
+        observations, masks, rewards, terminated, truncated = batched.step(actions)
+        for env_ind, env in enumerate(singles):
+            _, reward, dones, _ = env.step(dict(zip(env.possible_agents, actions[env_ind])))
+            assert np.allclose(list(reward.values()), rewards[env_ind], atol=1e-6)
+            assert all(dones.values()) == (terminated[env_ind] or truncated[env_ind])
+            if all(dones.values()):
+                assert np.allclose(env.sense()[0], batched.terminal_observations[env_ind], atol=1e-6)
+                env.reset()
+            expected_observations, expected_masks = env.sense()
+            assert np.allclose(expected_observations, observations[env_ind], atol=1e-6)
+            assert (expected_masks == masks[env_ind]).all()
+
+def test_auto_reset():
+    #30 frames, 10 decisions of 3
+    batched = BatchedPeekabooSim([MAP_PATH], 4, seed=0, settings=SimSettings(max_environment_steps=30))
+    actions = np.zeros((4, batched.n_agents, len(ACTION_BRANCHES)), dtype=np.int64)
+    for iter in range(10):
+        observations, masks, rewards, terminated, truncated = batched.step(actions)
+    assert truncated.all() and (batched.step_count == 0).all()
+    assert observations.shape == batched.terminal_observations.shape == (4, batched.n_agents, batched.observation_dim)
+
+if __name__ == "__main__":
+    test_matches_single_env()
+    test_auto_reset()
@@ -0,0 +1,158 @@
+import time
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+
+from peekaboo_env_pool import EnvPool, EnvLease, is_alive
+from peekaboo_maps import load_map
+from peekaboo_sim_env import PeekabooSimEnvFactory, SimSettings
+from peekaboo_vec_env import _reserved_worker_ids
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+class FakeProcess:
+    def __init__(self):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+class FakeUnityEnvironment:
+    def __init__(self):
+        self._process = FakeProcess()
+
+class FakePlayer:
+    """
+    Array mode environment with a player process that can crash or hang
+    """
+    def __init__(self, worker_id: int, seed: int | None, no_graphics: bool):
+        self.worker_id, self.seed, self.no_graphics = worker_id, seed, no_graphics
+        self._env = FakeUnityEnvironment()
+        self.possible_agents = ["agent_0", "agent_1"]
+        self.array_mode = True
+        self.hang = False
+        self.closed = False
+        self.steps = 0
+
+    def reset(self):
+        if self.hang:
+            time.sleep(1.0)
+        if self._env._process.poll() is not None:
+            raise ConnectionError("the player is gone")
+        return np.zeros((2, 3), dtype=np.float32), np.zeros((2, 5), dtype=bool)
+
+    def step(self, actions):
+        if self._env._process.poll() is not None:
+            raise ConnectionError("the player is gone")
+        if actions is None:
+            raise ValueError("a bug of the caller")
+        self.steps += 1
+        return np.ones((2, 3), dtype=np.float32), np.zeros((2, 5), dtype=bool), np.ones(2, dtype=np.float32), np.zeros(2, dtype=bool), np.zeros(2, dtype=bool)
+
+    def close(self):
+        if self.hang:
+            time.sleep(1.0)
+        self.closed = True
+        self._env._process.returncode = 0
+
+@dataclass(frozen=True)
+class FakeFactory:
+    no_graphics: bool = True
+
+    def __call__(self, worker_id: int, seed: int | None):
+        return FakePlayer(worker_id, seed, self.no_graphics)
+
+def test_leases_reuse_warm_players():
+    with EnvPool(base_worker_id=300) as pool:
+        pool.warm(FakeFactory(), seeds=[1, 1])
+        assert pool.launches == 2 and pool.num_idle == 2
+        first = pool.lease(FakeFactory(), seed=1)
+        player = first.env
+        assert isinstance(first, EnvLease) and first.array_mode and first.possible_agents == ["agent_0", "agent_1"]
+        first.step(np.zeros((2, 4), dtype=np.int64))
+        first.close()
+        first.close()
+        #back to the pool, and leased again without a launch
+        second = pool.lease(FakeFactory(), seed=1)
+        third = pool.lease(FakeFactory(), seed=1)
+        assert pool.launches == 2 and {second.env, third.env} >= {player} and second.env is not third.env
+        #other keys get their own players
+        other = pool.lease(FakeFactory(no_graphics=False), seed=1)
+        unseeded = pool.lease(FakeFactory())
+        assert pool.launches == 4 and not other.env.no_graphics and unseeded.env.seed is None
+        worker_ids = {lease.worker_id for lease in (second, third, other, unseeded)}
+        assert len(worker_ids) == 4 and worker_ids <= _reserved_worker_ids
+        players = [lease.env for lease in (second, third, other, unseeded)]
+    #closing the pool closes the leased players too and frees their ports
+    assert all(player.closed for player in players) and not worker_ids & _reserved_worker_ids
+
+def test_crashed_player_is_replaced():
+    with EnvPool(base_worker_id=310) as pool:
+        lease = pool.lease(FakeFactory(), seed=7)
+        lost, lost_worker_id = lease.env, lease.worker_id
+        lease.reset()
+        lost._env._process.returncode = 1
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            observations, masks, rewards, terminated, truncated = lease.step(np.zeros((2, 4), dtype=np.int64))
+        #the restart is reported as a warning callers can filter, not printed
+        messages = [str(warning.message) for warning in caught if warning.category is RuntimeWarning]
+        assert len(messages) == 1 and messages[0].startswith(f"Worker {lost_worker_id} was lost")
+        assert messages[0].endswith(f"restarted as worker {lease.worker_id}")
+        #the episode is cut as by a time limit, the replacement runs on another port with the same seed
+        assert truncated.all() and not terminated.any() and not rewards.any() and not observations.any()
+        assert lease.env is not lost and lease.env.seed == 7 and lease.worker_id != lost_worker_id
+        assert lost_worker_id not in _reserved_worker_ids and lease.restarts == 1 and pool.restarts == 1
+        lease.step(np.zeros((2, 4), dtype=np.int64))
+
+        lease.env._env._process.returncode = 1
+        lease.reset()
+        assert is_alive(lease.env) and pool.restarts == 2
+
+        #errors of the caller aren't taken for a lost player
+        try:
+            lease.step(None)
+            assert False, "the ValueError should be raised"
+        except ValueError:
+            pass
+        assert pool.restarts == 2
+
+def test_health_check_on_lease():
+    with EnvPool(base_worker_id=320, health_timeout=0.1, close_timeout=0.1) as pool:
+        lease = pool.lease(FakeFactory())
+        hung = lease.env
+        lease.close()
+        hung.hang = True
+        lease = pool.lease(FakeFactory())
+        #the hung player is killed, as it doesn't answer the close request either
+        assert lease.env is not hung and hung._env._process.returncode == -9 and pool.restarts == 1
+        lease.env._env._process.returncode = 1
+        lease.close()
+        assert pool.num_idle == 0
+
+def test_replacement_keeps_map_and_parameters():
+    factory = PeekabooSimEnvFactory(MAP_PATH, SimSettings(max_environment_steps=50))
+    assert factory == PeekabooSimEnvFactory(MAP_PATH, SimSettings(max_environment_steps=50)) and hash(factory) == hash(PeekabooSimEnvFactory(MAP_PATH))
+    with EnvPool(base_worker_id=330) as pool:
+        pool.warm(factory, seeds=[0])
+        lease = pool.lease(PeekabooSimEnvFactory(MAP_PATH, SimSettings(max_environment_steps=50)), seed=0)
+        assert pool.launches == 1
+        config = load_map(MAP_PATH)
+        config.walls = config.walls[:3]
+        lease.load_map(config)
+        lease.set_env_parameters(agent_moving_speed=10.0)
+        lease.reset()
+        lost = lease.env
+        pool.restart(lease._leased_worker(), "test")
+        lease.reset()
+        assert lease.env is not lost and len(lease.env.wall_centers) == 3 and lease.env.settings.agent_moving_speed == 10.0
+
+if __name__ == "__main__":
+    test_leases_reuse_warm_players()
+    test_crashed_player_is_replaced()
+    test_health_check_on_lease()
+    test_replacement_keeps_map_and_parameters()
@@ -0,0 +1,99 @@
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from gym import spaces
+
+import peekaboo_environment
+from peekaboo_environment import EnvSpec, SpecEnv, load_spec, save_spec, spec_env, spec_key
+
+SPEC = EnvSpec(possible_agents=["PeekabooAgent?team=0?agent_id=0", "PeekabooAgent?team=0?agent_id=1"],
+               observation_shapes=[[42]], action_branches=[3, 3, 2], action_mask=True)
+
+def fake_build(directory: Path) -> Path:
+    executable_path = directory / "dev_release.x86_64"
+    executable_path.write_bytes(b"player")
+    (directory / "dev_release_Data").mkdir()
+    (directory / "dev_release_Data" / "level0").write_bytes(b"scene")
+    return executable_path
+
+def test_spec_roundtrip():
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        executable_path, cache_dir = fake_build(directory), directory / "specs"
+        map_path = directory / "map.json"
+        map_path.write_text('{"Types": [0, 1]}')
+
+        assert load_spec(executable_path, map_path, cache_dir) is None
+        assert save_spec(SPEC, executable_path, map_path, cache_dir).parent == cache_dir
+        assert load_spec(executable_path, map_path, cache_dir) == SPEC
+        #the scene's own map is another spec
+        assert load_spec(executable_path, None, cache_dir) is None
+
+        key = spec_key(executable_path, map_path, cache_dir)
+        map_path.write_text('{"Types": [0, 1, 1]}')
+        assert spec_key(executable_path, map_path, cache_dir) != key
+        key = spec_key(executable_path, map_path, cache_dir)
+        (directory / "dev_release_Data" / "level0").write_bytes(b"another scene")
+        assert spec_key(executable_path, map_path, cache_dir) != key
+        assert load_spec(executable_path, map_path, cache_dir) is None
+
+def test_file_hashes_saved():
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        executable_path, cache_dir = fake_build(directory), directory / "specs"
+        key = spec_key(executable_path, None, cache_dir)
+        assert (cache_dir / peekaboo_environment.FILE_HASHES).exists()
+        #another process reads the digests of the unchanged files instead of hashing them
+        peekaboo_environment._file_hashes.clear()
+        peekaboo_environment._loaded_hash_files.clear()
+        def no_hashing(*args, **kwargs):
+            raise AssertionError("an unchanged file was hashed again")
+        peekaboo_environment.open = no_hashing
+        try:
+            assert spec_key(executable_path, None, cache_dir) == key
+        finally:
+            del peekaboo_environment.open
+
+def test_spec_env():
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        executable_path = fake_build(directory)
+        try:
+            spec_env(executable_path, cache_dir=directory)
+            assert False, "a missing spec should raise"
+        except FileNotFoundError:
+            pass
+        save_spec(SPEC, executable_path, cache_dir=directory)
+        env = spec_env(executable_path, cache_dir=directory)
+
+    assert isinstance(env, SpecEnv) and env.possible_agents == SPEC.possible_agents
+    observation_space = env.observation_space(env.possible_agents[0])
+    assert isinstance(observation_space, spaces.Box) and observation_space.shape == (42,) and observation_space.dtype == np.float32
+    assert list(env.action_spaces[env.possible_agents[1]].nvec) == [3, 3, 2]
+    two_observations = EnvSpec(SPEC.possible_agents, [[42], [4, 4]], [3], False).observation_space()
+    assert isinstance(two_observations, spaces.Tuple) and two_observations[1].shape == (4, 4)
+    try:
+        env.reset()
+        assert False, "a SpecEnv can't be reset"
+    except RuntimeError:
+        pass
+
+def test_light_import():
+    #the spec module (and so PeekabooEnv's module attribute) doesn't load the player's dependencies until used
+    code = "import sys, peekaboo_environment; print('mlagents_envs' in sys.modules, 'torch' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
+    #nor does the training entry point load torch (mappo) and h5py (peekaboo_recorder) before it runs
+    code = "import sys, clean_mappo_baseline; print('torch' in sys.modules, 'h5py' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent / "baselines", capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
+
+
+if __name__ == "__main__":
+    test_spec_roundtrip()
+    test_file_hashes_saved()
+    test_spec_env()
+    test_light_import()
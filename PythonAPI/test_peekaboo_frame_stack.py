@@ -0,0 +1,56 @@
+from collections import deque
+
+import numpy as np
+
+from peekaboo_frame_stack import FrameStack, FrameStackEnv
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+from peekaboo_vec_env import unpack_observation
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def test_ring_matches_concatenated_frames():
+    rng = np.random.default_rng(0)
+    for stack_size in (1, 2, 5):
+        frames = FrameStack(n_agents=3, frame_dim=4, stack_size=stack_size)
+        first = rng.normal(size=(3, 4)).astype(np.float32)
+        stacked = frames.reset(first)
+        reference = [deque([row] * stack_size, maxlen=stack_size) for row in first]
+        for step in range(12):
+            frame = rng.normal(size=(3, 4)).astype(np.float32)
+            restart = np.array([step == 7, False, step % 5 == 0])
+            stacked = frames.push(frame, restart)
+            for agent, row in enumerate(frame):
+                if restart[agent]:
+                    reference[agent].extend([row] * stack_size)
+                reference[agent].append(row)
+            assert np.array_equal(stacked, np.stack([np.concatenate(stack) for stack in reference]))
+            #a view into the ring, nothing is concatenated
+            assert np.shares_memory(stacked, frames._frames)
+        assert frames.nbytes == 3 * (2 * stack_size - 1) * 4 * 4
+
+def test_env_wrapper():
+    #10 decisions of 3 frames
+    settings = SimSettings(max_environment_steps=30)
+    env = FrameStackEnv(PeekabooSimEnv(MAP_PATH, seed=1, settings=settings, array_mode=True), stack_size=4)
+    dict_env = FrameStackEnv(PeekabooSimEnv(MAP_PATH, seed=1, settings=settings), stack_size=4)
+    obs_dim = env.env.observation_space(env.possible_agents[0]).shape[0]
+    assert env.observation_space(env.possible_agents[0]).shape == (4 * obs_dim,) and env.n_agents == 3
+
+    obs, _ = env.reset()
+    dict_obs = dict_env.reset()
+    first = obs[:, -obs_dim:].copy()
+    assert np.array_equal(obs, np.tile(first, 4))
+    rng = np.random.default_rng(1)
+    for step in range(10):
+        actions = rng.integers(0, ACTION_BRANCHES, (env.n_agents, len(ACTION_BRANCHES)))
+        obs, _, _, _, truncated = env.step(actions)
+        dict_obs, _, dones, _ = dict_env.step(dict(zip(env.possible_agents, actions)))
+        assert np.array_equal(obs, np.stack([unpack_observation(dict_obs[agent_id])[0] for agent_id in env.possible_agents]))
+        if step == 1:
+            #oldest first
+            assert np.array_equal(obs[:, :2 * obs_dim], np.tile(first, 2))
+    assert truncated.all() and all(dones.values())
+
+if __name__ == "__main__":
+    test_ring_matches_concatenated_frames()
+    test_env_wrapper()
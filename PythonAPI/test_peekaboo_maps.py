@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import peekaboo_maps
+from peekaboo_maps import CompiledMap, compile_map, compile_maps, load_map
+
+MAP_PATHS = ["../configs/maps/dev_map.json", "../configs/maps/dev_map2.json"]
+
+def test_compiled_map_matches_config():
+    config = load_map(MAP_PATHS[1])
+    compiled = CompiledMap.from_config(config)
+    assert np.allclose(compiled.wall_centers, [wall.position[[0, 2]] for wall in config.walls])
+    assert np.allclose(compiled.wall_yaws, [wall.yaw for wall in config.walls])
+    assert np.allclose(compiled.wall_half_extents, config.base_building_block_size[[0, 2]] / 2.0)
+    assert (compiled.is_type(compiled.wall_types, "Movable") == [wall.type == "Movable" for wall in config.walls]).all()
+    assert (compiled.is_type(compiled.agent_types, "Active") == [agent.type == "Active" for agent in config.agents]).all()
+    assert not compiled.is_type(compiled.agent_types, "Unknown").any()
+    assert np.allclose(compiled.goal_positions, [goal.position[[0, 2]] for goal in config.goals])
+
+def test_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        peekaboo_maps._compiled_maps.clear()
+        first = compile_maps(MAP_PATHS, cache_dir=directory)
+        assert len(os.listdir(directory)) == 1
+        #the same maps come from the memory of the process, then from the memory-mapped cache of a "new process"
+        assert compile_map(MAP_PATHS[0], cache_dir=directory) is first[0]
+        peekaboo_maps._compiled_maps.clear()
+        cached = compile_maps(MAP_PATHS, cache_dir=directory)
+        for compiled, reference in zip(cached, first):
+            assert not compiled.wall_centers.flags.writeable
+            assert compiled.content_hash == reference.content_hash
+            assert list(compiled.type_names[compiled.wall_types]) == list(reference.type_names[reference.wall_types])
+            assert np.array_equal(compiled.agent_positions, reference.agent_positions)
+            assert np.array_equal(compiled.wall_yaws, reference.wall_yaws)
+
+        #edited maps get a new hash
+        with open(MAP_PATHS[0]) as f:
+            config = json.load(f)
+        config["Map"]["Walls"] = config["Map"]["Walls"][:-1]
+        edited = os.path.join(directory, "edited.json")
+        with open(edited, "w") as f:
+            json.dump(config, f)
+        compiled = compile_map(edited, cache_dir=directory)
+        assert compiled.content_hash != first[0].content_hash
+        assert len(compiled.wall_centers) == len(first[0].wall_centers) - 1
+
+
+if __name__ == "__main__":
+    test_compiled_map_matches_config()
+    test_cache()
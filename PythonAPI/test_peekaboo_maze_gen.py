@@ -0,0 +1,79 @@
+import os
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from peekaboo_maps import compile_map, load_map
+from peekaboo_maze_gen import MazeLayouts, MazeSettings, flood_fill, generate_maps, reachable, sample_layouts, write_maps
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, circle_box_overlap
+
+def bfs(free: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    reached = np.zeros_like(free)
+    queue = deque(map(tuple, np.argwhere(seeds & free)))
+    for pixel in queue:
+        reached[pixel] = True
+    while queue:
+        x, z = queue.popleft()
+        for dx, dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            neighbour = (x + dx, z + dz)
+            if 0 <= neighbour[0] < free.shape[0] and 0 <= neighbour[1] < free.shape[1] and free[neighbour] and not reached[neighbour]:
+                reached[neighbour] = True
+                queue.append(neighbour)
+    return reached
+
+def test_flood_fill():
+    rng = np.random.default_rng(0)
+    free = rng.random((32, 15, 23)) < 0.6
+    seeds = rng.random(free.shape) < 0.01
+    reached = flood_fill(free, seeds)
+    for grid, grid_seeds, grid_reached in zip(free, seeds, reached):
+        assert np.array_equal(grid_reached, bfs(grid, grid_seeds))
+
+def test_generated_maps():
+    settings = MazeSettings(wall_density=0.5, movable_ratio=0.3)
+    maps = generate_maps(20, settings, seed=1, processes=1, batch_size=16)
+    assert len(maps) == 20
+    sim_settings = SimSettings()
+    for config in maps:
+        compiled = compile_map(config)
+        assert compiled.n_agents == 3 and len(compiled.goal_positions) == 2
+        assert set(load_map(config).to_json()["Map"]) == {"mapSize", "baseBuildingBlockSize", "Walls"}
+        #agents and goals sit in the middle of their cells, clear of the walls
+        for points in (compiled.agent_positions, compiled.goal_positions):
+            hits = circle_box_overlap(points, sim_settings.agent_radius, compiled.wall_centers, np.cos(compiled.wall_yaws),
+                                      np.sin(compiled.wall_yaws), compiled.wall_half_extents)
+            assert not hits.any()
+        assert np.abs(compiled.wall_centers).max() <= 100.0
+    assert any(compiled.is_type(compile_map(config).wall_types, "Movable").any() for config in maps)
+    PeekabooSimEnv(maps[0], seed=0).reset()
+
+def test_unreachable_goals_are_rejected():
+    settings = MazeSettings(map_size=(60, 60), num_active_agents=1, num_passive_agents=0, num_goals=1)
+    x_walls, z_walls = np.zeros((1, 2, 3), dtype=bool), np.zeros((1, 3, 2), dtype=bool)
+    #goal in the corner cell (2, 2), walled in on both inner sides
+    x_walls[0, 1, 2] = z_walls[0, 2, 1] = True
+    cells = np.array([[[0, 0], [2, 2]]])
+    walled = MazeLayouts(x_walls, z_walls, np.zeros_like(x_walls), np.zeros_like(z_walls), cells, settings)
+    assert not reachable(walled)[0]
+    #the Active agent pushes movable walls away
+    movable = MazeLayouts(x_walls, z_walls, x_walls.copy(), z_walls.copy(), cells, settings)
+    assert reachable(movable)[0]
+    settings.movable_walls_block = True
+    assert not reachable(movable)[0]
+    assert reachable(sample_layouts(MazeSettings(wall_density=0.0), 8, np.random.default_rng(0))).all()
+
+def test_pool_and_files():
+    reference = generate_maps(6, seed=3, processes=1, maps_per_job=2)
+    assert generate_maps(6, seed=3, processes=2, maps_per_job=2) == reference
+    assert generate_maps(6, seed=4, processes=1, maps_per_job=2) != reference
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_maps(directory, 6, seed=3, processes=1, maps_per_job=2)
+        assert len(paths) == 6 and "settings.json" in os.listdir(directory)
+        assert [load_map(path).to_json() for path in paths] == [load_map(config).to_json() for config in reference]
+
+if __name__ == "__main__":
+    test_flood_fill()
+    test_generated_maps()
+    test_unreachable_goals_are_rejected()
+    test_pool_and_files()
@@ -0,0 +1,66 @@
+import numpy as np
+import torch
+
+from peekaboo_obs_codec import RayObservationCodec
+from peekaboo_sim_env import PeekabooSimEnv, ACTION_BRANCHES, NUM_DETECTABLE_TAGS
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def random_rays(rng, shape, num_rays, num_tags=NUM_DETECTABLE_TAGS):
+    #any flag pattern (not only one-hots), fractions over the whole [0, 1] including both ends
+    rays = np.zeros((*shape, num_rays, num_tags + 2), dtype=np.float32)
+    rays[..., :-1] = rng.random((*shape, num_rays, num_tags + 1)) < 0.3
+    rays[..., -1] = rng.random((*shape, num_rays))
+    rays[..., 0, -1], rays[..., -1, -1] = 0.0, 1.0
+    return rays.reshape(*shape, -1)
+
+def test_error_bounds():
+    rng = np.random.default_rng(0)
+    for num_rays in (2, 9, 13):
+        observations = random_rays(rng, (64, 3), num_rays)
+        for distances in ("float16", "uint8"):
+            codec = RayObservationCodec(num_rays, distances=distances)
+            codes = codec.encode(observations)
+            assert codes.dtype == np.uint8 and codes.shape == (64, 3, codec.code_dim)
+            decoded = codec.decode(codes)
+            error = np.abs(decoded - observations).reshape(64, 3, num_rays, -1)
+            #flags are exact, fractions within the bound
+            assert (error[..., :-1] == 0).all()
+            assert error[..., -1].max() <= codec.max_distance_error
+            fractions = decoded.reshape(64, 3, num_rays, -1)[..., -1]
+            assert (fractions[..., 0] == 0.0).all() and (fractions[..., -1] == 1.0).all()
+            #the tensor methods write the same codes and read the same values
+            assert torch.equal(codec.encode_tensor(torch.from_numpy(observations)), torch.from_numpy(codes))
+            assert torch.equal(codec.decode_tensor(torch.from_numpy(codes)), torch.from_numpy(decoded))
+            #a concatenation of observations encodes as the concatenation of their codes
+            assert np.array_equal(codec.encode(observations.reshape(64, -1)), codes.reshape(64, -1))
+            assert codec.decode(codes.reshape(64, -1)).shape == (64, 3 * codec.obs_dim)
+
+    codec = RayObservationCodec(9, distances="uint8")
+    assert codec.decode(codec.encode(np.full(codec.obs_dim, 2.0, dtype=np.float32)))[-1] == 1.0
+    assert RayObservationCodec.from_json(codec.to_json()).code_dim == codec.code_dim
+    try:
+        RayObservationCodec.for_obs_dim(100)
+        assert False, "100 values are not rays of 9 tags"
+    except ValueError:
+        pass
+
+def test_sim_observations():
+    env = PeekabooSimEnv(MAP_PATH, seed=0, array_mode=True)
+    rng = np.random.default_rng(1)
+    for distances, min_ratio in (("float16", 8), ("uint8", 12)):
+        codec = RayObservationCodec.for_environment(env, distances)
+        obs, _ = env.reset()
+        for _ in range(20):
+            codes = codec.encode(obs)
+            assert obs.nbytes / codes.nbytes >= min_ratio
+            decoded = codec.decode(codes)
+            assert np.abs(decoded - obs).max() <= codec.max_distance_error
+            assert np.array_equal(decoded.reshape(len(obs), codec.num_rays, -1)[..., :-1],
+                                  obs.reshape(len(obs), codec.num_rays, -1)[..., :-1])
+            obs, *_ = env.step(np.stack([rng.integers(ACTION_BRANCHES) for _ in range(env.n_agents)]))
+
+
+if __name__ == "__main__":
+    test_error_bounds()
+    test_sim_observations()
@@ -0,0 +1,103 @@
+import heapq
+import os
+import tempfile
+
+import numpy as np
+
+from peekaboo_maps import compile_map
+from peekaboo_paths import GRID_MOVES, PathIndex, PathTracker, distance_fields, occupancy_grid
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings
+
+def dijkstra(free: np.ndarray, source: tuple[int, int]) -> np.ndarray:
+    distances = np.full(free.shape, np.inf)
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, (x, z) = heapq.heappop(heap)
+        if distance > distances[x, z]:
+            continue
+        for dx, dz, length in GRID_MOVES:
+            i, j = x + dx, z + dz
+            if not (0 <= i < free.shape[0] and 0 <= j < free.shape[1]) or not free[i, j]:
+                continue
+            if dx and dz and not (free[x + dx, z] and free[x, z + dz]):
+                continue
+            if distance + length < distances[i, j]:
+                distances[i, j] = distance + length
+                heapq.heappush(heap, (distance + length, (i, j)))
+    return distances
+
+def test_distance_fields():
+    rng = np.random.default_rng(0)
+    free = rng.random((17, 23)) < 0.7
+    sources = rng.choice(np.flatnonzero(free), 5, replace=False)
+    fields = distance_fields(free, sources, resolution=2.0)
+    for source, field in zip(sources, fields):
+        reference = dijkstra(free, np.unravel_index(source, free.shape)) * 2.0
+        assert np.allclose(field, reference, rtol=1e-5)
+
+def test_path_index():
+    compiled = compile_map("../configs/maps/dev_map.json")
+    index = PathIndex(compiled, resolution=5.0, clearance=2.5)
+    assert index.free.shape == (40, 40)
+    assert not occupancy_grid(compiled, 5.0, 2.5)[[7, 8], 24].any() #the wall at x = -60.1, z = 20
+    #open space: straight and diagonal lines
+    assert np.isclose(index.distance(np.array([[2.5, -77.5]]), np.array([[2.5, -57.5]]))[0], 20.0)
+    assert np.isclose(index.distance(np.array([[2.5, -77.5]]), np.array([[22.5, -57.5]]))[0], 20.0 * np.sqrt(2.0))
+    #around a wall is longer than through it
+    start, goal = np.array([-67.5, 22.5]), np.array([-52.5, 22.5])
+    assert index.distance(start, goal[None]) > np.linalg.norm(start - goal) + 5.0
+    #nearest goal, lookups of many positions, table of all cells
+    positions = np.random.default_rng(0).uniform(-100.0, 100.0, (100, 2))
+    goals = np.array([[50.0, 50.0], [-50.0, -50.0]])
+    nearest = index.distance(positions, goals)
+    assert np.allclose(nearest, np.minimum(index.distance(positions, goals[:1]), index.distance(positions, goals[1:])))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "paths.npy")
+        index.precompute(path)
+        assert np.allclose(index.distance(positions, goals), nearest)
+        cached = PathIndex(compiled, resolution=5.0, clearance=2.5)
+        cached.precompute(path)
+        assert isinstance(cached._table, np.memmap)
+        assert np.allclose(cached.distance(positions, goals), nearest)
+
+def test_tracker():
+    index = PathIndex(compile_map("../configs/maps/dev_map.json"))
+    tracker = PathTracker(index)
+    goals = np.array([[2.5, -57.5]])
+    tracker.reset(np.array([[2.5, -77.5], [2.5, -97.5]]), goals)
+    assert np.allclose(tracker.optimal_distance, [20.0, 40.0])
+    #the first agent walks a detour of 40 to the goal, the second one 20 without getting there
+    steps = [([[12.5, -77.5], [2.5, -87.5]], [False, False]),
+             ([[12.5, -57.5], [2.5, -77.5]], [False, False]),
+             ([[2.5, -57.5], [2.5, -77.5]], [True, False]),
+             ([[2.5, -47.5], [2.5, -77.5]], [False, False])]
+    for positions, entered in steps:
+        tracker.step(np.array(positions), np.array(entered))
+    assert np.allclose(tracker.path_length, [40.0, 20.0])
+    assert np.allclose(tracker.spl(), [0.5, 0.0])
+    assert np.allclose(tracker.optimality_gap()[0], 1.0) and np.isnan(tracker.optimality_gap()[1])
+    metrics = tracker.metrics()
+    assert metrics["success_rate"] == 0.5 and np.isclose(metrics["spl"], 0.25)
+
+def test_sim_env_infos():
+    env = PeekabooSimEnv("../configs/maps/dev_map.json", seed=0, settings=SimSettings(max_environment_steps=20))
+    tracker = env.enable_path_metrics()
+    info = env.infos[env.possible_agents[0]]
+    assert info["optimal_distance"] == info["remaining_distance"] > 0 and info["path_length"] == 0.0
+    done = False
+    while not done:
+        _, _, dones, infos = env.step({agent_id: env.action_space(agent_id).sample() for agent_id in env.agents})
+        done = all(dones.values())
+    assert all("spl" in info and "optimality_gap" in info for info in infos.values())
+    assert tracker.path_length.max() > 0
+    env.reset()
+    assert tracker.path_length.max() == 0.0
+    array_env = PeekabooSimEnv("../configs/maps/dev_map.json", seed=0, array_mode=True)
+    assert array_env.enable_path_metrics().index is tracker.index
+
+if __name__ == "__main__":
+    test_distance_fields()
+    test_path_index()
+    test_tracker()
+    test_sim_env_infos()
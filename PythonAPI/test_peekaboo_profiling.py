@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from peekaboo_profiling import LatencyProfiler
+from peekaboo_sim_env import PeekabooSimEnv, ACTION_BRANCHES
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+class Communicator:
+    def step(self):
+        time.sleep(0.002)
+
+class Wrapper:
+    def __init__(self):
+        self._env = Communicator()
+
+    def step(self):
+        self._env.step()
+        time.sleep(0.001)
+        return "stepped"
+
+def test_phases_and_self_time():
+    wrapper = Wrapper()
+    profiler = LatencyProfiler(capacity=4)
+    profiler.instrument(wrapper._env, "step", "unity/step")
+    profiler.instrument(wrapper, "step", "env/step", self_time=True)
+    for _ in range(10):
+        assert wrapper.step() == "stepped"
+    summary = profiler.summary()
+    assert {phase: summary[phase]["count"] for phase in summary} == {"unity/step": 10, "env/step": 10, "env/step/self": 10}
+    assert summary["unity/step"]["p50 ms"] >= 2.0 and summary["env/step"]["p50 ms"] >= 3.0
+    #the nested round trip is excluded from the self time
+    assert 1.0 <= summary["env/step/self"]["p50 ms"] < summary["unity/step"]["p50 ms"]
+    #only the latest samples are kept for percentiles, totals cover every call
+    assert len(profiler.histograms["env/step"].samples) <= 8
+    assert np.isclose(summary["env/step"]["mean ms"] * 10, summary["env/step"]["total s"] * 1e3)
+
+    logs = profiler.logs()
+    assert logs["latency/env/step count"] == 10 and "latency/unity/step p99 ms" in logs
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "latency.json")
+        profiler.save_json(path)
+        with open(path) as f:
+            assert json.load(f)["env/step"]["count"] == 10
+
+def test_environment_profiling():
+    env = PeekabooSimEnv(MAP_PATH, seed=0, array_mode=True)
+    #nothing is wrapped until profiling is enabled
+    assert "step" not in vars(env)
+    profiler = env.enable_profiling()
+    assert env.enable_profiling() is profiler
+    env.reset()
+    for _ in range(5):
+        env.step(np.zeros((env.num_agents, len(ACTION_BRANCHES)), dtype=np.int64))
+    env.close()
+    counts = {phase: summary["count"] for phase, summary in profiler.summary().items()}
+    assert counts == {"env/step": 5, "env/reset": 1, "env/close": 1}
+
+
+if __name__ == "__main__":
+    test_phases_and_self_time()
+    test_environment_profiling()
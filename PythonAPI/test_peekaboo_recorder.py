@@ -0,0 +1,97 @@
+import os
+import tempfile
+
+import numpy as np
+
+from peekaboo_obs_codec import RayObservationCodec
+from peekaboo_recorder import TrajectoryRecorder, TrajectoryReader, export_contiguous
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, ACTION_BRANCHES
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def record(path, steps, chunk_steps=16, seed=3, codec=None):
+    env = PeekabooSimEnv(MAP_PATH, seed=seed, settings=SimSettings(max_environment_steps=30), array_mode=True)
+    rng = np.random.default_rng(0)
+    expected = {"observations": [], "actions": [], "rewards": [], "terminated": [], "truncated": []}
+    codec = None if codec is None else RayObservationCodec.for_environment(env, codec)
+    with TrajectoryRecorder(env, path, map_id="dev_map", chunk_steps=chunk_steps, observation_codec=codec) as recorder:
+        recorded = recorder.num_steps
+        obs, mask = recorder.reset()
+        for _ in range(steps):
+            actions = np.stack([rng.integers(ACTION_BRANCHES) for _ in recorder.possible_agents])
+            expected["observations"].append(obs.copy())
+            expected["actions"].append(actions)
+            obs, mask, rewards, terminated, truncated = recorder.step(actions)
+            expected["rewards"].append(rewards.copy())
+            expected["terminated"].append(terminated.copy())
+            expected["truncated"].append(truncated.copy())
+            if (terminated | truncated).all():
+                obs, mask = recorder.reset()
+        assert recorder.num_steps == recorded + steps
+    return {key: np.stack(values) for key, values in expected.items()}
+
+def test_record_and_read():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trajectories.h5")
+        #a partial last chunk and an appended second recording
+        first = record(path, 40)
+        second = record(path, 10, seed=4)
+        expected = {key: np.concatenate([first[key], second[key]]) for key in first}
+
+        contiguous = os.path.join(directory, "contiguous.h5")
+        export_contiguous(path, contiguous)
+        for source, memory_mapped in [(path, False), (contiguous, True)]:
+            with TrajectoryReader(source, cache_chunks=2, seed=0) as reader:
+                assert len(reader) == 50
+                assert isinstance(reader._sources[0]["observations"], np.memmap) == memory_mapped
+                assert reader.map_names == [["dev_map"]]
+                indices = np.array([49, 3, 17, 3, 32])
+                batch = reader.read(indices)
+                for key, values in expected.items():
+                    assert np.array_equal(batch[key], values[indices]), key
+                assert (batch["map_ids"] == 0).all()
+
+                seen = np.concatenate([batch["observations"] for batch in reader.minibatches(8, blocks_per_shuffle=2)])
+                #every step exactly once per epoch
+                assert len(seen) == 50
+                assert np.array_equal(np.unique(seen, axis=0), np.unique(expected["observations"], axis=0))
+
+def test_multiple_files():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"worker_{i}.h5") for i in range(2)]
+        expected = [record(path, 20, seed=i) for i, path in enumerate(paths)]
+        with TrajectoryReader(paths) as reader:
+            assert len(reader) == 40
+            batch = reader.read(np.array([25, 5]))
+            assert np.array_equal(batch["actions"][0], expected[1]["actions"][5])
+            assert np.array_equal(batch["actions"][1], expected[0]["actions"][5])
+            assert reader.sample(7)["rewards"].shape == (7, 3)
+
+def test_encoded_observations():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"worker_{i}.h5") for i in range(2)]
+        #files with and without a codec read together
+        expected = [record(paths[0], 20, codec="uint8"), record(paths[1], 20)]
+        try:
+            record(paths[0], 5, codec="float16")
+            assert False, "appending with another codec should raise"
+        except ValueError:
+            pass
+        with TrajectoryReader(paths, seed=0) as reader:
+            assert reader.codecs[0].distances == "uint8" and reader.codecs[1] is None
+            batch = reader.read(np.array([3, 25, 19]))
+            observations = np.stack([expected[0]["observations"][3], expected[1]["observations"][5], expected[0]["observations"][19]])
+            assert batch["observations"].dtype == np.float32
+            assert np.abs(batch["observations"] - observations).max() <= reader.codecs[0].max_distance_error
+            assert np.array_equal(batch["observations"][1], observations[1])
+            seen = np.concatenate([batch["observations"] for batch in reader.minibatches(8)])
+            assert seen.shape == (40, 3, reader.codecs[0].obs_dim)
+        with TrajectoryReader(paths[0], decode=False) as reader:
+            codes = reader.read(np.array([3]))["observations"]
+            assert codes.dtype == np.uint8 and codes.shape == (1, 3, reader.codecs[0].code_dim)
+
+
+if __name__ == "__main__":
+    test_record_and_read()
+    test_multiple_files()
+    test_encoded_observations()
@@ -0,0 +1,132 @@
+import json
+import struct
+import uuid
+from unittest import mock
+
+import numpy as np
+import pytest
+
+#the player is mocked with the communicator of mlagents_envs, skipped without it
+pytest.importorskip("mlagents_envs")
+from mlagents_envs.environment import UnityEnvironment
+from mlagents_envs.mock_communicator import MockCommunicator
+from mlagents_envs.side_channel.incoming_message import IncomingMessage
+from mlagents_envs.side_channel.outgoing_message import OutgoingMessage
+
+from peekaboo_environment import PeekabooEnv
+from peekaboo_maps import load_map
+from peekaboo_side_channels import MAP_CHANNEL_ID, MAP_LOADED
+
+MAP_PATH = "../configs/maps/dev_map.json"
+TWO_AGENTS_MAP_PATH = "../configs/maps/dev_map2.json"
+PARAMETERS_CHANNEL_ID = uuid.UUID("534c891e-810f-11ea-a9d0-822485860400")
+
+class SideChannelCommunicator(MockCommunicator):
+    """
+    Stands in for the player: records the side channel bytes of every exchange and answers with the queued `replies`
+    """
+    def __init__(self):
+        super().__init__(discrete_action=True, num_agents=3)
+        self.sent: list[bytes] = []
+        self.replies: list[bytes] = []
+
+    def _get_agent_infos(self):
+        #three live agents like dev_map.json, the mock ends agent 2 at every step
+        infos = super()._get_agent_infos()
+        for info in infos["RealFakeBrain"].value:
+            info.done = False
+        return infos
+
+    def exchange(self, inputs, poll_callback=None):
+        self.sent.append(inputs.rl_input.side_channel)
+        output = super().exchange(inputs, poll_callback)
+        if self.replies:
+            output.rl_output.side_channel = self.replies.pop(0)
+        return output
+
+def messages(data: bytes, channel_id: uuid.UUID) -> list[IncomingMessage]:
+    #wire format of SideChannelManager: channel uuid, int32 length, payload
+    found, offset = [], 0
+    while offset < len(data):
+        channel = uuid.UUID(bytes_le=data[offset:offset + 16])
+        length, = struct.unpack_from("<i", data, offset + 16)
+        payload = data[offset + 20:offset + 20 + length]
+        offset += 20 + length
+        if channel == channel_id:
+            found.append(IncomingMessage(payload))
+    return found
+
+def status_reply(status: str) -> bytes:
+    msg = OutgoingMessage()
+    msg.write_string(status)
+    return MAP_CHANNEL_ID.bytes_le + struct.pack("<i", len(msg.buffer)) + bytes(msg.buffer)
+
+def make_env(array_mode: bool = True) -> tuple[PeekabooEnv, SideChannelCommunicator]:
+    communicator = SideChannelCommunicator()
+    with mock.patch.object(UnityEnvironment, "_get_communicator", lambda *args: communicator):
+        env = PeekabooEnv(executable_path=None, seed=42, array_mode=array_mode)
+    return env, communicator
+
+def test_map_and_parameters_travel_with_reset():
+    env, communicator = make_env()
+    config = load_map(MAP_PATH).to_json()
+    env.load_map(config)
+    env.set_env_parameters(agent_moving_speed=50.0, **{"reward/AgentHitObstacle": -0.05})
+    sent = len(communicator.sent)
+    env.step(np.zeros((3, 2), dtype=np.int64))
+    #nothing goes out before the reset
+    assert all(not messages(data, MAP_CHANNEL_ID) and not messages(data, PARAMETERS_CHANNEL_ID) for data in communicator.sent)
+
+    communicator.replies.append(status_reply(MAP_LOADED))
+    obs, mask = env.reset()
+    assert obs.shape[0] == 3 and mask.shape == (3, 5)
+    reset_data = communicator.sent[-1]
+    assert len(communicator.sent) == sent + 2
+    maps = messages(reset_data, MAP_CHANNEL_ID)
+    assert len(maps) == 1 and json.loads(maps[0].read_string()) == config
+    parameters = {}
+    for msg in messages(reset_data, PARAMETERS_CHANNEL_ID):
+        key, kind, value = msg.read_string(), msg.read_int32(), msg.read_float32()
+        assert kind == 0
+        parameters[key] = value
+    assert parameters == {"agent_moving_speed": 50.0, "reward/AgentHitObstacle": np.float32(-0.05)}
+
+    #sent once
+    env.reset()
+    assert not messages(communicator.sent[-1], MAP_CHANNEL_ID) and not messages(communicator.sent[-1], PARAMETERS_CHANNEL_ID)
+    env.close()
+
+def test_rejected_map_raises():
+    env, communicator = make_env()
+    env.load_map(MAP_PATH)
+    communicator.replies.append(status_reply("the scene has no wall to build the map from"))
+    try:
+        env.reset()
+        assert False, "the player's error should be raised"
+    except RuntimeError as error:
+        assert "no wall" in str(error)
+    env.close()
+
+def test_invalid_requests():
+    env, _ = make_env()
+    for request in (lambda: env.load_map(TWO_AGENTS_MAP_PATH), lambda: env.set_env_parameters(agent_flying_speed=1.0)):
+        try:
+            request()
+            assert False, "a ValueError is expected"
+        except ValueError:
+            pass
+    env.close()
+
+def test_env_spec():
+    env, _ = make_env()
+    spec = env.env_spec()
+    assert spec.possible_agents == env.possible_agents and spec.observation_shapes == [[3]]
+    assert spec.action_branches == [3, 2] and spec.action_mask
+    assert list(spec.action_space().nvec) == [3, 2]
+    env.close()
+
+if __name__ == "__main__":
+    test_map_and_parameters_travel_with_reset()
+    test_rejected_map_raises()
+    test_invalid_requests()
+    test_env_spec()
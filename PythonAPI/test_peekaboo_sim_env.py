@@ -0,0 +1,136 @@
+import numpy as np
+
+from peekaboo_maps import load_map
+from peekaboo_sim_env import PeekabooSimEnv, SimSettings, GameEvent, ray_box_distance, ACTION_BRANCHES
+
+MAP_PATH = "../configs/maps/dev_map.json"
+
+def test_spaces_and_observations():
+    env = PeekabooSimEnv(MAP_PATH, seed=42)
+    agent = env.possible_agents[0]
+    assert env.observation_space(agent).shape == (99,)
+    assert env.action_space(agent).nvec.tolist() == list(ACTION_BRANCHES)
+
+    observations = env.reset()
+    rays = np.asarray(observations[agent]["observation"]).reshape(9, 11)
+    #every ray either hits a single tag or reports "no hit"
+    assert np.allclose(rays[:, :10].sum(-1), 1.0)
+    assert ((rays[:, -1] >= 0.0) & (rays[:, -1] <= 1.0)).all()
+
+    for i, agent in enumerate(env.possible_agents):
+        jump_mask, use_mask = observations[agent]["action_mask"][2:]
+        assert jump_mask[1] == use_mask[1] == (not env.agent_active[i])
+
+def test_episode():
+    #50 decisions of 3 frames
+    env = PeekabooSimEnv(MAP_PATH, seed=42, settings=SimSettings(max_environment_steps=150))
+    env.reset()
+    for iter in range(50):
+        actions = {agent: env.action_space(agent).sample() for agent in env.agents}
+        observations, rewards, dones, infos = env.step(actions)
+        assert set(rewards) == set(env.possible_agents)
+    assert all(dones.values()) and env.agents == []
+    assert all(infos[agent]["interrupted"] for agent in env.possible_agents)
+
+def test_determinism():
+    trajectories = []
+    for _ in range(2):
+        env = PeekabooSimEnv(MAP_PATH, seed=1)
+        rng = np.random.default_rng(0)
+        rewards = []
+        for iter in range(100):
+            _, reward, _, _ = env.step({agent: rng.integers(0, ACTION_BRANCHES) for agent in env.agents})
+            rewards.append(list(reward.values()))
+        trajectories.append((np.array(rewards), env.agent_positions.copy()))
+    assert np.array_equal(trajectories[0][0], trajectories[1][0])
+    assert np.array_equal(trajectories[0][1], trajectories[1][1])
+
+def test_ray_box_distance():
+    origins = np.array([[0.0, 0.0], [0.0, 0.0]])
+    directions = np.array([[1.0, 0.0], [0.0, 1.0]])
+    centers, half_extents = np.array([[10.0, 0.0]]), np.array([[1.0, 2.0]])
+    distances = ray_box_distance(origins, directions, centers, np.ones(1), np.zeros(1), half_extents)
+    assert np.isclose(distances[0, 0], 9.0) and np.isinf(distances[1, 0])
+
+def test_array_mode_matches_dicts():
+    settings = SimSettings(max_environment_steps=20)
+    dict_env = PeekabooSimEnv(MAP_PATH, seed=7, settings=settings)
+    array_env = PeekabooSimEnv(MAP_PATH, seed=7, settings=settings, array_mode=True)
+    agents = dict_env.possible_agents
+    observations = dict_env.reset()
+    array_obs, array_mask = array_env.reset()
+    rng = np.random.default_rng(0)
+    for iter in range(20):
+        for row, agent in enumerate(agents):
+            assert np.allclose(np.asarray(observations[agent]["observation"]).reshape(-1), array_obs[row])
+            assert (np.concatenate(observations[agent]["action_mask"]) == array_mask[row]).all()
+        actions = np.stack([rng.integers(ACTION_BRANCHES) for _ in agents])
+        observations, rewards, dones, infos = dict_env.step(dict(zip(agents, actions)))
+        #outputs are written into the same arrays every step
+        step_obs, array_mask, reward, terminated, truncated = array_env.step(actions)
+        assert step_obs is array_obs
+        assert np.allclose([rewards[agent] for agent in agents], reward)
+        assert ((terminated | truncated) == [dones[agent] for agent in agents]).all()
+        if dones[agents[0]]:
+            assert truncated.all() == infos[agents[0]]["interrupted"]
+            break
+
+def test_decision_period():
+    #a step of k frames is k steps of one frame with the same action, rewards summed, stopping at the end of the episode
+    rng = np.random.default_rng(3)
+    repeated = PeekabooSimEnv(MAP_PATH, seed=5, settings=SimSettings(decision_period=4, max_environment_steps=30), array_mode=True)
+    single = PeekabooSimEnv(MAP_PATH, seed=5, settings=SimSettings(decision_period=1, max_environment_steps=30), array_mode=True)
+    repeated.reset()
+    single.reset()
+    for _ in range(8):
+        actions = rng.integers(0, ACTION_BRANCHES, (repeated.n_agents, len(ACTION_BRANCHES)))
+        obs, mask, reward, terminated, truncated = repeated.step(actions)
+        total = np.zeros(single.n_agents)
+        for _ in range(4):
+            single_obs, single_mask, single_reward, single_terminated, single_truncated = single.step(actions)
+            total += single_reward
+            if single_terminated.any() or single_truncated.any():
+                break
+        assert np.allclose(reward, total, atol=1e-5) and np.array_equal(obs, single_obs) and np.array_equal(mask, single_mask)
+        assert repeated.step_count == single.step_count
+        if truncated.any():
+            break
+    #30 frames: 7 full decisions, then 2 frames
+    assert truncated.all() and repeated.step_count == 30
+
+    #as an EnvironmentParameter, applied at the next reset
+    single.set_env_parameters(decision_period=2)
+    single.reset()
+    assert single.settings.decision_period == 2 and isinstance(single.settings.decision_period, int)
+    single.step(np.zeros((single.n_agents, len(ACTION_BRANCHES)), dtype=np.int64))
+    assert single.step_count == 2
+
+def test_sim_env_applies_at_reset():
+    env = PeekabooSimEnv(MAP_PATH, seed=0, array_mode=True)
+    config = load_map(MAP_PATH)
+    for agent in config.agents:
+        agent.position = agent.position + [10.0, 0.0, 0.0]
+    config.walls = config.walls[:3]
+    env.load_map(config)
+    env.set_env_parameters(agent_moving_speed=10.0, **{"reward/AgentHitObstacle": -1.0})
+    assert env.settings.agent_moving_speed == 69.0 and len(env.wall_start_centers) != 3
+
+    env.reset()
+    assert len(env.wall_start_centers) == 3 and len(env.wall_centers) == 3
+    assert env.settings.agent_moving_speed == 10.0 and env.settings.individual_rewards[GameEvent.AgentHitObstacle] == -1.0
+    env.step(np.zeros((env.n_agents, 4), dtype=np.int64))
+
+    try:
+        env.set_env_parameters(agent_flying_speed=1.0)
+        assert False, "a ValueError is expected"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    test_spaces_and_observations()
+    test_episode()
+    test_determinism()
+    test_ray_box_distance()
+    test_array_mode_matches_dicts()
+    test_decision_period()
+    test_sim_env_applies_at_reset()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from peekaboo_sim_env import PeekabooSimEnvFactory, SimSettings
+from peekaboo_vec_env import PeekabooVecEnv, _reserved_worker_ids
+
+def failing_env(worker_id: int, seed: int | None):
+    raise ValueError("no map at map.json")
+
+def test_worker_error():
+    #the traceback of a worker reaches the caller, not the error of the pipes closed after it
+    try:
+        PeekabooVecEnv(failing_env, num_envs=2, base_worker_id=900)
+        assert False, "a failing factory should raise"
+    except RuntimeError as error:
+        assert "ValueError: no map at map.json" in str(error)
+    assert not _reserved_worker_ids
+
+def test_terminal_rewards():
+    #the rewards of the step ending an episode are kept through the auto-reset
+    env = PeekabooVecEnv(PeekabooSimEnvFactory("../configs/maps/dev_map.json", SimSettings(max_environment_steps=30)),
+                         num_envs=2, seed=0, base_worker_id=910)
+    env.reset()
+    returns = np.zeros((env.num_envs, env.num_agents))
+    for _ in range(10):
+        _, rewards, dones, infos = env.step(np.zeros((env.num_envs, env.num_agents, 4), dtype=np.int64))
+        returns += rewards
+    assert dones.all() and (rewards != 0).all()
+    for env_index, info in enumerate(infos):
+        assert np.allclose(info["episode"]["return"], returns[env_index])
+    env.close()
+
+def test():
+    executable_path = "../Executables/DevRelease/dev_release.x86_64"
+
+    env = PeekabooVecEnv.from_executable(executable_path=executable_path, num_envs=2, seed=42, no_graphics=True)
+    print("Worker ids:", env.worker_ids)
+    print("Observations:", env.observations.shape)
+    observations = env.reset()
+    assert observations.shape == (env.num_envs, env.num_agents, env.observation_dim)
+
+    for iter in range(env.num_agents * 10):
+        actions = np.stack([
+            np.stack([env.action_space(agent).sample() for agent in env.possible_agents])
+            for _ in range(env.num_envs)
+        ])
+        observations, rewards, dones, infos = env.step(actions)
+        assert rewards.shape == dones.shape == (env.num_envs, env.num_agents)
+
+    env.close()
+
+if __name__ == "__main__":
+    test_worker_error()
+    test_terminal_rewards()
+    test()
@@ -0,0 +1,99 @@
+import sys
+sys.path.append("baselines")
+
+import numpy as np
+import torch
+
+from peekaboo_obs_codec import RayObservationCodec
+from rollout_buffer import RolloutBuffer
+
+NUM_STEPS, NUM_AGENTS, OBS_DIM = 6, 3, 4
+
+def make_buffer(stack_size=1):
+    return RolloutBuffer(num_steps=NUM_STEPS, num_envs=1, num_agents=NUM_AGENTS, obs_dim=OBS_DIM,
+                         cent_obs_dim=NUM_AGENTS * OBS_DIM, mask_dim=12, num_branches=4, stack_size=stack_size)
+
+def test_insert_and_views():
+    rb = make_buffer()
+    obs = torch.arange(NUM_STEPS * NUM_AGENTS * OBS_DIM, dtype=torch.float32).reshape(NUM_STEPS, NUM_AGENTS, OBS_DIM)
+    for step in range(4):
+        rb.insert(step, obs=obs[step], cent_obs=obs[step], rewards=np.full(NUM_AGENTS, step, dtype=np.float64))
+    assert rb.length == 4
+
+    #rows are ordered as the old flattened lists: step-major, agent-minor
+    assert torch.equal(rb.sample_major("obs"), obs[:4].reshape(-1, OBS_DIM))
+    assert torch.equal(rb.sample_major("cent_obs"), obs[:4].reshape(4, -1))
+    assert rb.agent_major("obs").shape == (NUM_AGENTS, 4, OBS_DIM)
+    assert torch.equal(rb.agent_major("rewards")[1], torch.arange(4, dtype=torch.float32))
+
+    #views share the storage, nothing is copied until a minibatch is gathered
+    assert rb.sample_major("obs").data_ptr() == rb.obs.data_ptr()
+    assert rb.agent_major("obs").data_ptr() == rb.obs.data_ptr()
+    inds = np.array([5, 0, 7])
+    assert torch.equal(rb.gather(rb.sample_major("obs"), inds), obs[:4].reshape(-1, OBS_DIM)[inds])
+    assert torch.equal(rb.gather(rb.agent_major("obs"), np.array([1, 0]), dim=1), obs[[1, 0]].transpose(0, 1))
+
+def test_reset_keeps_storage():
+    rb = make_buffer()
+    storage, nbytes = rb.obs.data_ptr(), rb.nbytes
+    rb.insert(0, obs=torch.ones(NUM_AGENTS, OBS_DIM))
+    rb.reset()
+    assert rb.length == 0
+    assert rb.obs.data_ptr() == storage and rb.nbytes == nbytes
+
+def test_stacked_views():
+    stack_size = 3
+    rb = make_buffer(stack_size)
+    #frames are stored once, whatever the stack size
+    assert rb.nbytes == make_buffer().nbytes
+    obs = torch.randn(NUM_STEPS, NUM_AGENTS, OBS_DIM)
+    for step in range(NUM_STEPS):
+        #an episode ends at step 2, the next one begins at step 3
+        rb.insert(step, obs=obs[step], cent_obs=obs[step], terminations=np.full(NUM_AGENTS, step == 2, dtype=np.float32))
+
+    #frames of the steps before, within the episode, the first one repeated
+    frame_steps = [[0, 0, 0], [0, 0, 1], [0, 1, 2], [3, 3, 3], [3, 3, 4], [3, 4, 5]]
+    assert rb.frame_steps().squeeze(1).tolist() == frame_steps
+    expected = torch.stack([obs[steps].transpose(0, 1).reshape(NUM_AGENTS, -1) for steps in frame_steps])
+    inds = np.array([17, 4, 9])
+    assert torch.equal(rb.gather(rb.sample_major("obs"), inds), expected.reshape(-1, stack_size * OBS_DIM)[inds])
+    assert torch.equal(rb.gather(rb.agent_major("obs"), np.array([5, 1]), dim=1), expected[[5, 1]].transpose(0, 1))
+    assert torch.equal(rb.gather(rb.agent_major("obs")), expected.transpose(0, 1))
+    #centralised states: the frames of all agents, oldest first
+    assert torch.equal(rb.gather(rb.sample_major("cent_obs"), [4]), obs[frame_steps[4]].reshape(1, -1))
+    assert len(rb.sample_major("obs")) == NUM_STEPS * NUM_AGENTS
+
+def test_encoded_observations():
+    codec = RayObservationCodec(num_rays=5, distances="uint8")
+    rng = np.random.default_rng(0)
+    rays = np.zeros((NUM_STEPS, NUM_AGENTS, 5, codec.num_tags + 2), dtype=np.float32)
+    rays[..., :-1] = rng.random(rays[..., :-1].shape) < 0.2
+    rays[..., -1] = rng.random(rays.shape[:-1])
+    obs = rays.reshape(NUM_STEPS, NUM_AGENTS, -1)
+    for stack_size in (1, 2):
+        plain = RolloutBuffer(num_steps=NUM_STEPS, num_envs=1, num_agents=NUM_AGENTS, obs_dim=codec.obs_dim,
+                              cent_obs_dim=NUM_AGENTS * codec.obs_dim, mask_dim=12, num_branches=4, stack_size=stack_size)
+        #the centralised state is a view of the observations
+        rb = RolloutBuffer(num_steps=NUM_STEPS, num_envs=1, num_agents=NUM_AGENTS, obs_dim=codec.obs_dim,
+                           cent_obs_dim=None, mask_dim=12, num_branches=4, stack_size=stack_size, obs_codec=codec)
+        assert rb.cent_obs.data_ptr() == rb.obs.data_ptr()
+        assert plain.nbytes - rb.nbytes == plain.obs.nbytes + plain.cent_obs.nbytes - rb.obs.nbytes
+        assert plain.obs.nbytes // rb.obs.nbytes >= 4
+        for step in range(NUM_STEPS):
+            #NumPy values and tensors are encoded the same way
+            rb.insert(step, obs=obs[step] if step % 2 else torch.from_numpy(obs[step]), terminations=np.full(NUM_AGENTS, step == 2))
+            plain.insert(step, obs=obs[step], cent_obs=obs[step], terminations=np.full(NUM_AGENTS, step == 2))
+
+        for key, inds in [("obs", np.array([7, 0, 16])), ("cent_obs", np.array([5, 0]))]:
+            decoded, expected = rb.gather(rb.sample_major(key), inds), plain.gather(plain.sample_major(key), inds)
+            assert expected.shape == decoded.shape and (decoded - expected).abs().max() <= codec.max_distance_error
+        decoded, expected = rb.gather(rb.agent_major("obs"), np.array([4, 1]), dim=1), plain.gather(plain.agent_major("obs"), np.array([4, 1]), dim=1)
+        assert expected.shape == decoded.shape and (decoded - expected).abs().max() <= codec.max_distance_error
+        assert len(rb.sample_major("obs")) == NUM_STEPS * NUM_AGENTS
+
+
+if __name__ == "__main__":
+    test_insert_and_views()
+    test_reset_keeps_storage()
+    test_stacked_views()
+    test_encoded_observations()
@@ -0,0 +1,55 @@
+import sys
+sys.path.append("baselines")
+
+from sweep_mappo import CorePacker, Probe, expand_grid, per_run_config, pick_threads, player_cores, probe_key
+
+def test_grid_and_run_configs():
+    grid = expand_grid(["agent.lr=1e-3,3e-3", "agent.seed=range(0,3)", "environment.simulator_map=map.json"])
+    assert len(grid) == 6
+    assert grid[0] == ["agent.lr=0.001", "agent.seed=0", "environment.simulator_map=map.json"]
+    assert grid[-1] == ["agent.lr=0.003", "agent.seed=2", "environment.simulator_map=map.json"]
+
+    config = {"agent": {"lr": 1e-3, "seed": 0, "agent_hidden_dim": 64, "checkpoint_path": "out/mappo.pt", "metrics_path": None},
+              "environment": {"record_dir": "records", "seed": 42}}
+    run = per_run_config(config, 3)
+    assert run["agent"]["checkpoint_path"] == "out/mappo_run3.pt" and run["agent"]["metrics_path"] is None
+    assert run["environment"]["record_dir"] == "records/run_3"
+    assert config["agent"]["checkpoint_path"] == "out/mappo.pt"
+    #learning rates and seeds don't change the cost of a rollout, the network size does
+    other_lr = per_run_config({**config, "agent": {**config["agent"], "lr": 3e-3, "seed": 1}}, 4)
+    bigger = per_run_config({**config, "agent": {**config["agent"], "agent_hidden_dim": 1024}}, 5)
+    assert probe_key(run) == probe_key(other_lr) != probe_key(bigger)
+
+def test_pick_threads():
+    sync = {"agent": {"async_training": False}, "environment": {"simulator_map": None}}
+    #the learner halves with 2 threads, barely improves with 4
+    probe = Probe(samples=300, environment={1: 1.0, 2: 1.0, 4: 1.0}, learner={1: 8.0, 2: 4.0, 4: 3.5})
+    assert pick_threads(probe, sync, max_cores=8, num_runs=4) == 2
+    #enough runs to fill the cores: one thread each is the most samples per core
+    assert pick_threads(probe, sync, max_cores=8, num_runs=8) == 1
+    assert pick_threads(probe, sync, max_cores=1) == 1
+    #an environment-bound run gains nothing from threads
+    assert pick_threads(Probe(300, {1: 5.0, 2: 5.0}, {1: 0.5, 2: 0.3}), sync, max_cores=8) == 1
+
+    unity_async = {"agent": {"async_training": True, "num_actors": 3}, "environment": {"simulator_map": None}}
+    assert player_cores(unity_async) == 3 and player_cores(sync) == 0
+    assert player_cores({**unity_async, "environment": {"simulator_map": "map.json"}}) == 0
+    assert pick_threads(probe, unity_async, max_cores=4) == 1
+
+def test_core_packer():
+    packer = CorePacker([0, 1, 2, 3], base_worker_id=100, worker_ids_per_run=10)
+    first = packer.acquire(2)
+    second = packer.acquire(1)
+    assert first == ([0, 1], 100) and second == ([2], 110)
+    assert packer.acquire(2) is None
+    assert packer.acquire(1) == ([3], 120)
+    packer.release(*first)
+    #freed ranges and cores are handed out again, never two runs on the same range
+    assert packer.acquire(8) is None
+    assert packer.acquire(2) == ([0, 1], 100)
+
+
+if __name__ == "__main__":
+    test_grid_and_run_configs()
+    test_pick_threads()
+    test_core_packer()